@@ -1,95 +1,186 @@
 """
 LanguageMentor HuggingFace Space 应用
 使用 Gradio 构建 Web 界面
+
+启动时只导入轻量模块：LangChain、场景模块和 ConversationAgent 在第一次对话时才导入和创建，
+缩短容器冷启动时间
 """
 import os
 import gradio as gr
 from src.scenario_manager import ScenarioManager
-from src.agents.conversation_agent import ConversationAgent
 from src.config import get_config
+from src.instrumentation import get_turn_instrumentation
+from src.metrics import get_metrics_registry
+from src.session_store import SessionStore
 
 
 # 初始化组件
 config = get_config()
 scenario_manager = ScenarioManager()
-conversation_agent = ConversationAgent()
+streaming_enabled = config.get_llm_config().get("streaming", True)
+
+# 按 Gradio 会话保存对话历史，场景实例在所有会话之间共享
+session_config = config.get_session_config()
+session_store = SessionStore(
+    ttl_seconds=session_config["ttl_seconds"],
+    max_sessions=session_config["max_sessions"],
+    max_history_messages=session_config["max_history_messages"],
+    archive_history=session_config["archive_history"]
+)
+
+# 自由对话在会话存储中使用的历史名称（与场景历史并列，按会话各保存一份）
+FREE_CHAT_HISTORY = "free_chat"
+
+# 每轮对话的耗时和 token 统计（通过 /metrics 端点导出）
+instrumentation = get_turn_instrumentation()
+
+def get_conversation_agent():
+    """
+    获取 ConversationAgent（由场景管理器按需创建，与场景共享调用器和 LLM 客户端，更新 LLM 配置后重建）
+    
+    Returns:
+        ConversationAgent: 对话教学智能体
+    """
+    return scenario_manager.get_conversation_agent()
 
 
-def chat_with_agent(message, history):
-    """与 ConversationAgent 对话"""
+async def chat_with_agent(message, history, request: gr.Request):
+    """与 ConversationAgent 对话（异步处理，开启流式输出时逐步刷新回复）"""
     if not message.strip():
-        return history, ""
+        yield history, ""
+        return
     
+    pending = False
     try:
-        # 转换 Gradio 历史格式为对话历史
-        conversation_history = []
-        for user_msg, bot_msg in history:
-            if user_msg:
-                conversation_history.append({"role": "user", "content": user_msg})
-            if bot_msg:
-                conversation_history.append({"role": "assistant", "content": bot_msg})
-        
-        # 生成回复
-        response = conversation_agent.generate_response(message, conversation_history)
-        
-        # 格式化显示
-        formatted_response = conversation_agent.format_response_for_display(response)
+        conversation_agent = get_conversation_agent()
         
-        # 更新历史
-        history.append((message, formatted_response))
-        
-        return history, ""
+        with instrumentation.turn(conversation_agent.PARSE_SOURCE, conversation_agent.model_name) as turn:
+            # 会话自己的对话历史：每轮只追加新的一轮，assistant 保存 bot_reply 而不是格式化后的显示内容
+            # （界面上的对话为空时说明是新对话，同步清空；会话已过期而界面上仍有对话时从界面记录重建）
+            if not history:
+                session_store.reset_history(request.session_hash, FREE_CHAT_HISTORY)
+            conversation_history = session_store.get_history(request.session_hash, FREE_CHAT_HISTORY, history,
+                                                             conversation_agent.bot_reply_from_display)
+            
+            if streaming_enabled:
+                # 流式输出：先显示 bot_reply，教学点评和例句生成完后补充
+                history.append((message, ""))
+                pending = True
+                async for partial in conversation_agent.astream_response(message, conversation_history,
+                                                                        session_id=request.session_hash, turn=turn):
+                    with turn.stage("format"):
+                        formatted_response = conversation_agent.format_response_for_display(partial, partial=True)
+                    history[-1] = (message, formatted_response)
+                    yield history, ""
+                return
+            
+            # 生成回复
+            response = await conversation_agent.agenerate_response(message, conversation_history,
+                                                                     session_id=request.session_hash, turn=turn)
+            
+            # 格式化显示
+            with turn.stage("format"):
+                formatted_response = conversation_agent.format_response_for_display(response)
+            
+            # 更新历史
+            history.append((message, formatted_response))
+            
+            yield history, ""
     except Exception as e:
         error_msg = f"错误: {str(e)}"
-        history.append((message, error_msg))
-        return history, ""
+        if pending:
+            history[-1] = (message, error_msg)
+        else:
+            history.append((message, error_msg))
+        yield history, ""
 
 
-def chat_with_scenario(message, history, scenario_name):
-    """与场景对话"""
+async def chat_with_scenario(message, history, scenario_name, request: gr.Request):
+    """与场景对话（异步处理，开启流式输出时逐步刷新回复）"""
     if not message.strip():
-        return history, ""
+        yield history, ""
+        return
     
     if not scenario_name:
         history.append((message, "Please select a scenario first!"))
-        return history, ""
+        yield history, ""
+        return
     
+    pending = False
     try:
         # 获取场景
         scenario = scenario_manager.get_scenario(scenario_name)
         
         if not scenario:
             history.append((message, f"Scenario {scenario_name} does not exist!"))
-            return history, ""
-        
-        # 生成回复
-        response = scenario.generate_response(message)
+            yield history, ""
+            return
         
-        # 格式化显示
-        formatted_response = conversation_agent.format_response_for_display(response)
+        conversation_agent = get_conversation_agent()
         
-        # 更新历史
-        history.append((message, formatted_response))
-        
-        return history, ""
+        with instrumentation.turn(scenario_name, scenario.model_name) as turn:
+            # 当前会话在该场景下的对话历史（会话已过期而界面上仍有对话时从界面记录重建）
+            session_history = session_store.get_history(request.session_hash, scenario_name, history,
+                                                        conversation_agent.bot_reply_from_display)
+            
+            if streaming_enabled:
+                # 流式输出：先显示 bot_reply，教学点评和例句生成完后补充
+                history.append((message, ""))
+                pending = True
+                async for partial in scenario.astream_response(message, session_history,
+                                                               session_id=request.session_hash, turn=turn):
+                    with turn.stage("format"):
+                        formatted_response = conversation_agent.format_response_for_display(partial, partial=True)
+                    history[-1] = (message, formatted_response)
+                    yield history, ""
+                return
+            
+            # 生成回复
+            response = await scenario.agenerate_response(message, session_history,
+                                                         session_id=request.session_hash, turn=turn)
+            
+            # 格式化显示
+            with turn.stage("format"):
+                formatted_response = conversation_agent.format_response_for_display(response)
+            
+            # 更新历史
+            history.append((message, formatted_response))
+            
+            yield history, ""
     except Exception as e:
         error_msg = f"Error: {str(e)}"
-        history.append((message, error_msg))
-        return history, ""
+        if pending:
+            history[-1] = (message, error_msg)
+        else:
+            history.append((message, error_msg))
+        yield history, ""
 
 
-def start_scenario(scenario_name):
-    """开始场景对话"""
+def start_scenario(scenario_name, request: gr.Request):
+    """开始场景对话（清空当前会话在该场景下的历史）"""
     if not scenario_name:
         return "", []
     
     scenario = scenario_manager.get_scenario(scenario_name)
     if scenario:
+        session_store.reset_history(request.session_hash, scenario_name)
         welcome_message = scenario.get_welcome_message()
         return welcome_message, [(welcome_message, None)]
     return "", []
 
 
+def release_session(request: gr.Request):
+    """浏览器断开连接时释放会话状态"""
+    session_store.remove(request.session_hash)
+
+
+def metrics_endpoint():
+    """以 Prometheus 文本格式返回所有运行指标"""
+    from fastapi.responses import PlainTextResponse
+    return PlainTextResponse(get_metrics_registry().render_prometheus(),
+                             media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 # 创建 Gradio 界面
 with gr.Blocks(title="LanguageMentor - English Conversation Tutor", theme=gr.themes.Soft()) as app:
     gr.Markdown("""
@@ -220,6 +311,9 @@ with gr.Blocks(title="LanguageMentor - English Conversation Tutor", theme=gr.the
             v0.5 - Production Ready with Unit Tests and Docker Support
             """)
     
+    # 会话结束时释放状态
+    app.unload(release_session)
+    
     # 页脚
     gr.Markdown("""
     ---
@@ -227,14 +321,24 @@ with gr.Blocks(title="LanguageMentor - English Conversation Tutor", theme=gr.the
     """)
 
 
+def create_server():
+    """
+    创建同时提供 Gradio 界面和 /metrics 端点的 FastAPI 应用
+    
+    Returns:
+        FastAPI: 挂载了 Gradio 界面的应用
+    """
+    from fastapi import FastAPI
+    server = FastAPI()
+    server.add_api_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
+    return gr.mount_gradio_app(server, app, path="/")
+
+
 if __name__ == "__main__":
     # 获取端口（HuggingFace Space 会设置 PORT 环境变量）
     port = int(os.getenv("PORT", 7860))
     
-    # 启动应用
-    app.launch(
-        server_name="0.0.0.0",
-        server_port=port,
-        share=False
-    )
+    # 启动应用（Gradio 界面挂载在根路径，旁边提供 Prometheus 抓取用的 /metrics 端点）
+    import uvicorn
+    uvicorn.run(create_server(), host="0.0.0.0", port=port)
 
@@ -0,0 +1,4 @@
+"""
+性能基准
+热点路径的微基准测试和离线负载测试，在仓库根目录以 python -m benchmarks.<模块名> 运行
+"""
@@ -0,0 +1,335 @@
+"""
+模拟的 OpenAI 兼容服务
+在本地实现 /v1/chat/completions（包括流式输出），按配置的延迟分布、token 输出速率、
+错误率和非法 JSON 比例返回教学回复，用于负载测试时不消耗真实 API 额度
+
+运行：python -m benchmarks.fake_openai [--port 8100] [--latency lognormal:0.8,0.5] [--tokens-per-second 50]
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+TEACHING_RESPONSE = {
+    "bot_reply": "That makes sense. Could you tell me a little more about what you have in mind?",
+    "teaching_feedback": {
+        "grammar_corrections": ["'I want discuss' should be 'I want to discuss'."],
+        "vocabulary_suggestions": ["Try 'flexible' instead of 'free' when talking about schedules."],
+        "pronunciation_tips": [],
+        "overall_comment": "Clear and polite. Add a reason to make your request stronger."
+    },
+    "example_sentences": [
+        "I was hoping we could discuss this in a bit more detail.",
+        "Would it be possible to find a time that works for both of us?",
+        "Thank you for taking the time to talk with me today."
+    ]
+}
+
+# 非法输出：截断的 JSON、不含 JSON 的自然语言、代码块不闭合
+MALFORMED_RESPONSES = (
+    json.dumps(TEACHING_RESPONSE)[:120],
+    "Sure! That sounds great. Let me know if you have any other questions.",
+    "```json\n" + json.dumps(TEACHING_RESPONSE, indent=2)[:200]
+)
+
+
+class LatencyDistribution:
+    """首 token 延迟的分布（秒）"""
+    
+    KINDS = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+    
+    def __init__(self, kind: str = "fixed", params: Tuple[float, ...] = (0.0,)):
+        """
+        初始化延迟分布
+        
+        Args:
+            kind: fixed（固定值）、uniform（下限, 上限）、normal（均值, 标准差）或 lognormal（中位数, sigma）
+            params: 分布参数
+        """
+        if kind not in self.KINDS:
+            raise ValueError(f"未知的延迟分布: {kind}")
+        if len(params) != self.KINDS[kind]:
+            raise ValueError(f"{kind} 分布需要 {self.KINDS[kind]} 个参数")
+        self.kind = kind
+        self.params = tuple(params)
+    
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyDistribution":
+        """
+        解析 kind:参数1,参数2 格式的分布描述
+        
+        Args:
+            spec: 例如 fixed:0.5、uniform:0.2,1.5、lognormal:0.8,0.5
+            
+        Returns:
+            LatencyDistribution: 延迟分布
+        """
+        kind, _, params = spec.partition(":")
+        return cls(kind.strip(), tuple(float(value) for value in params.split(",") if value.strip()))
+    
+    def sample(self, rng: random.Random) -> float:
+        """
+        抽取一个延迟
+        
+        Args:
+            rng: 随机数生成器
+            
+        Returns:
+            float: 延迟秒数（不小于 0）
+        """
+        if self.kind == "fixed":
+            value = self.params[0]
+        elif self.kind == "uniform":
+            value = rng.uniform(*self.params)
+        elif self.kind == "normal":
+            value = rng.gauss(*self.params)
+        else:
+            median, sigma = self.params
+            value = rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+        return max(value, 0.0)
+    
+    def __str__(self) -> str:
+        return f"{self.kind}:{','.join(str(value) for value in self.params)}"
+
+
+def split_tokens(content: str) -> List[str]:
+    """
+    把回复切分成流式输出的片段（按单词近似 token）
+    
+    Args:
+        content: 回复内容
+        
+    Returns:
+        list: 片段列表
+    """
+    return re.findall(r"\S+\s*|\s+", content)
+
+
+class FakeOpenAIServer:
+    """
+    模拟的 OpenAI 兼容服务
+    在后台线程中运行，每个请求一个线程
+    """
+    
+    def __init__(self, latency: Optional[LatencyDistribution] = None, tokens_per_second: float = 0.0,
+                 error_rate: float = 0.0, malformed_rate: float = 0.0, error_status: int = 500,
+                 seed: Optional[int] = None, host: str = "127.0.0.1", port: int = 0):
+        """
+        初始化模拟服务
+        
+        Args:
+            latency: 首 token 延迟分布（默认无延迟）
+            tokens_per_second: 每秒输出的片段数（为 0 时不限速）
+            error_rate: 返回错误状态码的请求比例
+            malformed_rate: 返回非法 JSON 的请求比例
+            error_status: 出错时返回的 HTTP 状态码
+            seed: 随机数种子
+            host: 监听地址
+            port: 监听端口（为 0 时自动分配）
+        """
+        self.latency = latency or LatencyDistribution()
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.error_status = error_status
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "streams": 0, "errors": 0, "malformed": 0, "disconnects": 0}
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.owner = self
+        self._thread: Optional[threading.Thread] = None
+    
+    @property
+    def base_url(self) -> str:
+        """客户端使用的 Base URL"""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+    
+    def start(self) -> "FakeOpenAIServer":
+        """在后台线程中开始监听"""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+    
+    def serve_forever(self):
+        """在当前线程中监听，直到收到 KeyboardInterrupt"""
+        try:
+            self._httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._httpd.server_close()
+    
+    def stop(self):
+        """停止监听"""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+    
+    def __enter__(self) -> "FakeOpenAIServer":
+        return self.start()
+    
+    def __exit__(self, *exc_info):
+        self.stop()
+    
+    def count(self, name: str):
+        """累加一项统计"""
+        with self._stats_lock:
+            self.stats[name] += 1
+    
+    def plan(self) -> Tuple[float, Optional[str]]:
+        """
+        决定一个请求的延迟和结果
+        
+        Returns:
+            tuple: (首 token 延迟秒数, 回复内容；为 None 时返回错误状态码)
+        """
+        with self._rng_lock:
+            delay = self.latency.sample(self._rng)
+            roll = self._rng.random()
+            malformed = self._rng.choice(MALFORMED_RESPONSES)
+        if roll < self.error_rate:
+            return delay, None
+        if roll < self.error_rate + self.malformed_rate:
+            self.count("malformed")
+            return delay, malformed
+        return delay, json.dumps(TEACHING_RESPONSE, ensure_ascii=False)
+    
+    def token_delay(self) -> float:
+        """每个片段之间的间隔秒数"""
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """处理 /v1/chat/completions 请求"""
+    
+    protocol_version = "HTTP/1.1"
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def do_POST(self):
+        owner: FakeOpenAIServer = self.server.owner
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"未知路径: {self.path}", "type": "invalid_request_error"}})
+            return
+        
+        owner.count("requests")
+        delay, content = owner.plan()
+        time.sleep(delay)
+        if content is None:
+            owner.count("errors")
+            self._send_json(owner.error_status, {"error": {"message": "模拟的服务端错误", "type": "server_error"}})
+            return
+        
+        model = body.get("model", "fake-model")
+        prompt_tokens = sum(len(str(message.get("content", ""))) for message in body.get("messages", [])) // 4
+        pieces = split_tokens(content)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(pieces),
+                 "total_tokens": prompt_tokens + len(pieces)}
+        try:
+            if body.get("stream"):
+                owner.count("streams")
+                include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+                self._stream(model, pieces, usage if include_usage else None, owner.token_delay())
+            else:
+                time.sleep(owner.token_delay() * len(pieces))
+                self._send_json(200, {
+                    "id": f"chatcmpl-{uuid.uuid4().hex}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                 "finish_reason": "stop"}],
+                    "usage": usage
+                })
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端取消（例如对冲请求落败）
+            owner.count("disconnects")
+            self.close_connection = True
+    
+    def _send_json(self, status: int, payload: Dict):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def _stream(self, model: str, pieces: List[str], usage: Optional[Dict], token_delay: float):
+        """按 SSE 分块逐个片段输出"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        
+        def chunk(choices: List[Dict], **extra) -> Dict:
+            return {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                    "model": model, "choices": choices, **extra}
+        
+        for index, piece in enumerate(pieces):
+            if index:
+                time.sleep(token_delay)
+            delta = {"role": "assistant", "content": piece} if index == 0 else {"content": piece}
+            self._write_event(chunk([{"index": 0, "delta": delta, "finish_reason": None}]))
+        self._write_event(chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+        if usage is not None:
+            self._write_event(chunk([], usage=usage))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+    
+    def _write_event(self, payload: Dict):
+        self._write_chunk(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+    
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+def add_server_arguments(parser: argparse.ArgumentParser):
+    """添加模拟服务的命令行参数（负载测试共用）"""
+    parser.add_argument("--latency", type=LatencyDistribution.parse,
+                        default=LatencyDistribution("lognormal", (0.8, 0.5)),
+                        help="首 token 延迟分布：fixed:秒、uniform:下限,上限、normal:均值,标准差、lognormal:中位数,sigma")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="每秒输出的片段数（0 为不限速）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回错误状态码的请求比例")
+    parser.add_argument("--error-status", type=int, default=500, help="出错时返回的 HTTP 状态码")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="返回非法 JSON 的请求比例")
+    parser.add_argument("--seed", type=int, default=None, help="随机数种子")
+
+
+def server_from_args(args: argparse.Namespace, port: int = 0) -> FakeOpenAIServer:
+    """根据命令行参数创建模拟服务"""
+    return FakeOpenAIServer(latency=args.latency, tokens_per_second=args.tokens_per_second,
+                            error_rate=args.error_rate, malformed_rate=args.malformed_rate,
+                            error_status=args.error_status, seed=args.seed, port=port)
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="模拟的 OpenAI 兼容服务")
+    parser.add_argument("--port", type=int, default=8100, help="监听端口")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    
+    server = server_from_args(args, args.port)
+    print(f"模拟服务已启动: {server.base_url}（延迟 {server.latency}，{args.tokens_per_second} 片段/秒）")
+    server.serve_forever()
+    print(json.dumps(server.stats, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
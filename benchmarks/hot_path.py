@@ -0,0 +1,339 @@
+"""
+每轮对话非 LLM 热点路径的微基准
+覆盖 _parse_json_response、_validate_response、format_response_for_display、
+自由对话每轮的历史处理（追加到会话历史并按 token 预算构建消息列表）和场景的消息列表构建，每项都包括正常输入和病态输入
+（50 轮以上的长历史、非常大的 LLM 输出、需要修复或回退的非法输出）；
+legacy_baseline/ 开头的用例是改为按会话增量保存历史之前、每轮从 Gradio 记录全量转换的旧路径，只作为对比基线
+
+运行：python -m benchmarks.hot_path                  与基线比较（超过 --max-ratio 倍时返回非零退出码）
+      python -m benchmarks.hot_path --record         重新记录基线
+      python -m benchmarks.hot_path --only parse     只运行名称以 parse 开头的用例
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import timeit
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+BASELINE_PATH = Path(__file__).parent / "hot_path_baseline.json"
+
+TYPICAL_RESPONSE = {
+    "bot_reply": "That sounds like a great plan! What salary range did you have in mind for this role?",
+    "teaching_feedback": {
+        "grammar_corrections": ["'I want discuss' should be 'I want to discuss'."],
+        "vocabulary_suggestions": ["Try 'compensation package' instead of 'money'."],
+        "pronunciation_tips": [],
+        "overall_comment": "Clear and polite. Add a reason to make your request stronger."
+    },
+    "example_sentences": [
+        "I'd like to discuss my compensation package.",
+        "Based on my research, the market rate is around $90,000.",
+        "Could we talk about performance-based bonuses as well?"
+    ]
+}
+
+
+def large_response(size: int) -> Dict:
+    """
+    构造一个很大的回复（长 bot_reply 和大量点评条目）
+    
+    Args:
+        size: 规模（重复单元个数）
+        
+    Returns:
+        dict: 回复
+    """
+    return {
+        "bot_reply": "I understand your point, and I think we can work something out. " * size,
+        "teaching_feedback": {
+            "grammar_corrections": [f"Correction {i}: use 'have been' instead of 'was'." for i in range(size)],
+            "vocabulary_suggestions": [f"Suggestion {i}: try 'negotiate' instead of 'talk'." for i in range(size)],
+            "pronunciation_tips": [f"Tip {i}: stress the second syllable." for i in range(size)],
+            "overall_comment": "Good effort. " * size
+        },
+        "example_sentences": [f"Example sentence number {i}." for i in range(size)]
+    }
+
+
+def chat_pairs(turns: int, formatted: Callable[[Dict], str]) -> List[Tuple[str, str]]:
+    """
+    构造 Gradio Chatbot 格式的对话记录（回复是格式化后的 Markdown）
+    
+    Args:
+        turns: 轮数
+        formatted: 格式化函数
+        
+    Returns:
+        list: [(用户消息, 回复), ...]
+    """
+    reply = formatted(TYPICAL_RESPONSE)
+    return [(f"This is my message number {i}, could you check my grammar?", reply) for i in range(turns)]
+
+
+def chat_pairs_to_dicts(pairs: List[Tuple[Optional[str], Optional[str]]]) -> List[Dict]:
+    """
+    把 Gradio Chatbot 的对话记录转换为对话历史（自由对话原先每轮都要做的全量转换，只用于对比基线）
+    
+    Args:
+        pairs: [(用户消息, 回复), ...]（空的一侧跳过）
+        
+    Returns:
+        List[Dict]: [{"role": ..., "content": ...}, ...]
+    """
+    messages = []
+    for user_msg, bot_msg in pairs:
+        if user_msg:
+            messages.append({"role": "user", "content": user_msg})
+        if bot_msg:
+            messages.append({"role": "assistant", "content": bot_msg})
+    return messages
+
+
+def fresh(response: Dict) -> Dict:
+    """复制 _validate_response 会原地修改的部分（比 deepcopy 便宜得多，避免复制耗时掩盖被测代码）"""
+    copied = dict(response)
+    if isinstance(copied.get("teaching_feedback"), dict):
+        copied["teaching_feedback"] = dict(copied["teaching_feedback"])
+    if isinstance(copied.get("example_sentences"), list):
+        copied["example_sentences"] = list(copied["example_sentences"])
+    return copied
+
+
+def build_cases() -> List[Tuple[str, Callable[[], object]]]:
+    """
+    构造所有用例（在仓库根目录运行，创建 ConversationAgent 和场景时不会发出网络请求）
+    
+    Returns:
+        list: (用例名称, 被测调用)
+    """
+    from src.agents.conversation_agent import ConversationAgent
+    from src.history import ConversationHistory
+    from src.scenarios.salary_negotiation_scenario import SalaryNegotiationScenario
+    
+    agent = ConversationAgent(api_key="benchmark")
+    scenario = SalaryNegotiationScenario(api_key="benchmark")
+    
+    typical_text = json.dumps(TYPICAL_RESPONSE, indent=4)
+    large_text = json.dumps(large_response(2000))
+    parse_inputs = {
+        "typical": typical_text,
+        "fenced_with_prose": f"Here is my answer:\n```json\n{typical_text}\n```\nHope this helps!",
+        "large_output": large_text,
+        # 截断的输出走本地修复
+        "truncated": typical_text[:len(typical_text) * 2 // 3],
+        # 没有 JSON 的输出走默认结构
+        "prose_only": "Sure! That sounds great. Let me know if you have any other questions. " * 50,
+        "large_prose_only": "Sure! That sounds great. Let me know if you have any other questions. " * 2000
+    }
+    
+    missing_fields = {"bot_reply": "Hi", "teaching_feedback": {"overall_comment": "Good"}}
+    validate_inputs = {
+        "typical": TYPICAL_RESPONSE,
+        "missing_fields": missing_fields,
+        "non_dict_feedback": {"bot_reply": "", "teaching_feedback": "Good job", "example_sentences": "none"},
+        "large_output": large_response(2000)
+    }
+    
+    bot_reply_only = {"bot_reply": TYPICAL_RESPONSE["bot_reply"]}
+    format_inputs = {
+        "typical": (TYPICAL_RESPONSE, False),
+        "partial_bot_reply": (bot_reply_only, True),
+        "large_output": (large_response(2000), False)
+    }
+    
+    pairs_50 = chat_pairs(50, agent.format_response_for_display)
+    pairs_200 = chat_pairs(200, agent.format_response_for_display)
+    history_50 = ConversationHistory.from_dicts(
+        [{"role": "user" if i % 2 == 0 else "assistant", "content": f"Message {i} about the salary offer."}
+         for i in range(100)],
+        max_messages=100
+    )
+    
+    # 自由对话按会话保存的历史：assistant 只保存 bot_reply，条数上限与会话配置的默认值相同
+    session_histories = {}
+    for turns in (50, 200):
+        session_history = ConversationHistory(max_messages=20)
+        for i in range(turns):
+            session_history.add_turn(f"This is my message number {i}, could you check my grammar?",
+                                     TYPICAL_RESPONSE["bot_reply"])
+        session_histories[turns] = session_history
+    
+    def free_chat_turn(history: ConversationHistory) -> List:
+        """自由对话每轮的历史处理：上一轮追加到会话历史，再构建本轮发送给 LLM 的消息列表"""
+        history.add_turn("This is my next message, could you check my grammar?", TYPICAL_RESPONSE["bot_reply"])
+        return agent._build_messages("Hello", history)
+    
+    cases: List[Tuple[str, Callable[[], object]]] = []
+    for name, text in parse_inputs.items():
+        cases.append((f"parse_json_response/{name}", lambda text=text: agent._parse_json_response(text)))
+    for name, response in validate_inputs.items():
+        cases.append((f"validate_response/{name}",
+                      lambda response=response: agent._validate_response(fresh(response))))
+    for name, (response, partial) in format_inputs.items():
+        cases.append((f"format_response_for_display/{name}",
+                      lambda response=response, partial=partial: agent.format_response_for_display(response,
+                                                                                                    partial)))
+    cases += [
+        ("free_chat_turn/50_turns", lambda: free_chat_turn(session_histories[50])),
+        ("free_chat_turn/200_turns", lambda: free_chat_turn(session_histories[200])),
+        ("build_messages/agent_empty", lambda: agent._build_messages("Hello", [])),
+        ("build_messages/scenario_50_turns", lambda: scenario._build_messages("Hello", history_50)),
+        ("legacy_baseline/free_chat_turn_50_turns",
+         lambda: agent._build_messages("Hello", chat_pairs_to_dicts(pairs_50))),
+        ("legacy_baseline/free_chat_turn_200_turns",
+         lambda: agent._build_messages("Hello", chat_pairs_to_dicts(pairs_200)))
+    ]
+    return cases
+
+
+def measure(func: Callable[[], object], repeat: int = 5, min_time: float = 0.2) -> Tuple[float, int]:
+    """
+    测量单次调用耗时
+    
+    Args:
+        func: 被测调用
+        repeat: 重复轮数
+        min_time: 每轮的最短总耗时（秒），据此确定每轮调用次数
+        
+    Returns:
+        tuple: (各轮中最快一轮的平均单次耗时（微秒）, 每轮调用次数)
+    """
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9)))
+    timings = timer.repeat(repeat=repeat, number=number)
+    return min(timings) / number * 1e6, number
+
+
+def run(only: Optional[str] = None, repeat: int = 5, min_time: float = 0.2) -> Dict[str, Dict]:
+    """
+    运行基准测试
+    
+    Args:
+        only: 只运行名称以该前缀开头的用例
+        repeat: 重复轮数
+        min_time: 每轮的最短总耗时（秒）
+        
+    Returns:
+        dict: 用例名称 -> {"us": 单次耗时微秒数, "number": 每轮调用次数}
+    """
+    results = {}
+    for name, func in build_cases():
+        if only and not name.startswith(only):
+            continue
+        us, number = measure(func, repeat, min_time)
+        results[name] = {"us": round(us, 3), "number": number}
+    return results
+
+
+def git_commit() -> Optional[str]:
+    """当前提交（不在 git 仓库中时为 None）"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_baseline(path: Path) -> Optional[Dict]:
+    """读取基线（不存在时返回 None）"""
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def record(results: Dict[str, Dict], path: Path):
+    """
+    把结果写入基线文件
+    
+    Args:
+        results: run 的结果
+        path: 基线文件路径
+    """
+    baseline = {
+        "description": "非 LLM 热点路径的单次调用耗时（微秒）。用 python -m benchmarks.hot_path --record 重新记录，"
+                       "不同机器之间的绝对值不可比，只用于同一台机器上前后提交的对比",
+        "commit": git_commit(),
+        "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+
+def compare(results: Dict[str, Dict], baseline: Dict, max_ratio: float) -> List[Dict]:
+    """
+    与基线比较
+    
+    Args:
+        results: run 的结果
+        baseline: 基线文件内容
+        max_ratio: 允许的最大耗时倍数
+        
+    Returns:
+        list: 每个用例的比较结果（ratio 超过 max_ratio 时 regressed 为 True）
+    """
+    rows = []
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        ratio = result["us"] / base["us"] if base and base["us"] else None
+        rows.append({
+            "case": name,
+            "us": result["us"],
+            "baseline_us": base["us"] if base else None,
+            "ratio": ratio,
+            "regressed": ratio is not None and ratio > max_ratio
+        })
+    return rows
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="非 LLM 热点路径微基准")
+    parser.add_argument("--record", action="store_true", help="重新记录基线")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="基线文件路径")
+    parser.add_argument("--only", default=None, help="只运行名称以该前缀开头的用例")
+    parser.add_argument("--repeat", type=int, default=5, help="重复轮数（取最快一轮）")
+    parser.add_argument("--min-time", type=float, default=0.2, help="每轮的最短总耗时（秒）")
+    parser.add_argument("--max-ratio", type=float, default=1.5, help="超过基线多少倍视为性能回退")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+    
+    results = run(args.only, args.repeat, args.min_time)
+    if args.record:
+        record(results, args.baseline)
+        print(f"已记录 {len(results)} 个用例的基线: {args.baseline}")
+        return
+    
+    baseline = load_baseline(args.baseline)
+    rows = compare(results, baseline or {}, args.max_ratio)
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+    else:
+        print(f"{'case':<45}{'us':>12}{'baseline':>12}{'ratio':>8}")
+        for row in rows:
+            baseline_us = f"{row['baseline_us']:.3f}" if row["baseline_us"] is not None else "-"
+            ratio = f"{row['ratio']:.2f}" if row["ratio"] is not None else "-"
+            flag = "  回退" if row["regressed"] else ""
+            print(f"{row['case']:<45}{row['us']:>12.3f}{baseline_us:>12}{ratio:>8}{flag}")
+        if baseline is None:
+            print(f"没有找到基线 {args.baseline}，用 --record 记录")
+    
+    if any(row["regressed"] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+JSON 提取微基准
+对比一次线性扫描的 extract_json_object 与原先基于正则的提取逻辑，
+包括正常回复和会让正则大量回溯的对抗输入
+
+运行：python -m benchmarks.json_extract [--number N]
+"""
+import argparse
+import json
+import re
+import timeit
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.llm.json_extract import extract_json_object
+
+TYPICAL_RESPONSE = json.dumps({
+    "bot_reply": "That sounds like a great plan! What salary range did you have in mind for this role?",
+    "teaching_feedback": {
+        "grammar_corrections": ["'I want discuss' should be 'I want to discuss'."],
+        "vocabulary_suggestions": ["Try 'compensation package' instead of 'money'."],
+        "pronunciation_tips": [],
+        "overall_comment": "Clear and polite. Add a reason to make your request stronger."
+    },
+    "example_sentences": [
+        "I'd like to discuss my compensation package.",
+        "Based on my research, the market rate is around $90,000.",
+        "Could we talk about performance-based bonuses as well?"
+    ]
+}, indent=4)
+
+
+def legacy_extract_json(content: str) -> Optional[Dict]:
+    """原先 ConversationAgent._parse_json_response 中的正则提取逻辑（对照组）"""
+    try:
+        if "```json" in content:
+            json_match = re.search(r'```json\s*(.*?)\s*```', content, re.DOTALL)
+            if json_match:
+                return json.loads(json_match.group(1))
+        elif "```" in content:
+            json_match = re.search(r'```\s*(.*?)\s*```', content, re.DOTALL)
+            if json_match:
+                return json.loads(json_match.group(1))
+        
+        if content.strip().startswith('{'):
+            json_match = re.search(r'\{.*\}', content, re.DOTALL)
+            if json_match:
+                return json.loads(json_match.group(0))
+        return None
+    except json.JSONDecodeError:
+        return None
+
+
+def build_cases(size: int) -> List[Tuple[str, str]]:
+    """
+    构造测试输入
+    
+    Args:
+        size: 对抗输入的规模（重复单元个数）
+        
+    Returns:
+        list: (用例名称, 输入文本)
+    """
+    long_reply = json.dumps({
+        "bot_reply": "Sure. " * size,
+        "teaching_feedback": {"overall_comment": "Good {work} " * (size // 10)},
+        "example_sentences": ["One.", "Two.", "Three."]
+    })
+    return [
+        ("typical", TYPICAL_RESPONSE),
+        ("fenced_with_prose", f"Here is my answer:\n```json\n{TYPICAL_RESPONSE}\n```\nHope this helps!"),
+        ("long_reply", long_reply),
+        # 以 '{' 开头但始终不闭合：正则在每个 '{' 处都扫到末尾再回溯
+        ("unclosed_braces", "{" + "{ " * size),
+        # 代码块不闭合且正文很长（截断的流式输出）
+        ("unclosed_fence", "```json\n{\"bot_reply\": \"" + "word " * size),
+        # 大量花括号都在字符串里：贪婪匹配后 json.loads 仍要处理整个文本
+        ("braces_in_strings", "{\"bot_reply\": \"" + "{}" * size + "\", \"x\": [" + "1," * size + "1]}")
+    ]
+
+
+def measure(func: Callable[[str], Optional[Dict]], text: str, number: int) -> float:
+    """
+    测量单次调用耗时
+    
+    Args:
+        func: 提取函数
+        text: 输入文本
+        number: 每轮调用次数
+        
+    Returns:
+        float: 三轮中最快一轮的平均单次耗时（毫秒）
+    """
+    timings = timeit.repeat(lambda: func(text), number=number, repeat=3)
+    return min(timings) / number * 1000
+
+
+def run(sizes: List[int], number: int) -> List[Dict]:
+    """
+    运行基准测试
+    
+    Args:
+        sizes: 对抗输入规模列表
+        number: 每轮调用次数
+        
+    Returns:
+        list: 每个用例的结果
+    """
+    results = []
+    seen = set()
+    for size in sizes:
+        for name, text in build_cases(size):
+            # 与规模无关的用例只测一次
+            if (name, text) in seen:
+                continue
+            seen.add((name, text))
+            legacy_ms = measure(legacy_extract_json, text, number)
+            scanner_ms = measure(extract_json_object, text, number)
+            results.append({
+                "case": name,
+                "chars": len(text),
+                "regex_ms": legacy_ms,
+                "scanner_ms": scanner_ms,
+                "speedup": legacy_ms / scanner_ms if scanner_ms else float("inf")
+            })
+    return results
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="JSON 提取微基准")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 4000, 16000],
+                        help="对抗输入规模")
+    parser.add_argument("--number", type=int, default=5, help="每轮调用次数")
+    args = parser.parse_args()
+    
+    print(f"{'case':<20}{'chars':>10}{'regex ms':>12}{'scanner ms':>12}{'speedup':>10}")
+    for result in run(args.sizes, args.number):
+        print(f"{result['case']:<20}{result['chars']:>10}{result['regex_ms']:>12.3f}"
+              f"{result['scanner_ms']:>12.3f}{result['speedup']:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""
+离线负载测试
+启动模拟的 OpenAI 兼容服务（benchmarks.fake_openai），让 N 个并发的模拟学习者通过
+app.chat_with_scenario / app.chat_with_agent 多轮对话，报告吞吐量、每轮延迟的 p50/p95/p99 和内存增长，
+用于在不消耗真实 API 额度的情况下估算需要的副本数
+
+运行：python -m benchmarks.loadtest --learners 50 --turns 5 [--mode scenario|agent|mixed] [--json]
+
+配置取自 --config 指定的文件（默认使用内置默认配置），LLM 地址改为模拟服务，并关闭响应缓存，
+因此必须在导入 app 之前运行（不能与已经加载了配置的进程共用）
+"""
+import argparse
+import asyncio
+import gc
+import json
+import math
+import os
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+
+from benchmarks.fake_openai import add_server_arguments, server_from_args
+
+MESSAGES = (
+    "Hi, I would like to talk about {topic}.",
+    "Could you explain that in a bit more detail?",
+    "I think that works for me, but I have one more question.",
+    "What would you suggest I do next?",
+    "Thank you, that is really helpful."
+)
+# 以这些前缀开头的回复是 app 中处理函数捕获异常后显示的错误信息
+ERROR_PREFIXES = ("Error:", "错误:")
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """
+    计算百分位数（最近秩法）
+    
+    Args:
+        values: 样本
+        p: 百分位（0-100）
+        
+    Returns:
+        float: 百分位数（没有样本时为 None）
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))]
+
+
+def rss_bytes() -> Optional[int]:
+    """
+    当前进程的常驻内存
+    
+    Returns:
+        int: 字节数（无法获取时为 None）
+    """
+    try:
+        with open("/proc/self/statm", encoding="ascii") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        # ru_maxrss 是峰值：Linux 以 KB 为单位，macOS 以字节为单位
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if peak > 1 << 32 else peak * 1024
+    except ImportError:
+        return None
+
+
+def prepare_config(base_url: str, config_path: str, base_config: Optional[str] = None, streaming: bool = True):
+    """
+    生成指向模拟服务的配置文件并作为全局配置加载
+    
+    Args:
+        base_url: 模拟服务地址
+        config_path: 生成的配置文件路径
+        base_config: 作为基础的配置文件（为 None 时使用默认配置）
+        streaming: 是否开启流式输出
+    """
+    from src.config import Config, get_config
+    
+    if base_config and not os.path.exists(base_config):
+        raise FileNotFoundError(f"配置文件不存在: {base_config}")
+    config = Config(base_config or config_path)
+    data = config.config
+    data.setdefault("llm", {}).update({"provider": "openai", "api_key": "loadtest", "base_url": base_url,
+                                       "streaming": streaming})
+    for backend in data.get("routing", {}).get("backends", []):
+        backend.update({"base_url": base_url, "api_key": "loadtest"})
+        backend.pop("api_key_env", None)
+    # 模拟学习者的消息互不相同，但仍关闭缓存，保证每轮都真正调用 LLM
+    data.setdefault("cache", {})["enabled"] = False
+    data.setdefault("semantic_cache", {})["enabled"] = False
+    with open(config_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    
+    if get_config(config_path).config_path != Path(config_path):
+        raise RuntimeError("全局配置已经加载，负载测试需要在单独的进程中运行")
+
+
+async def run_learner(app, index: int, mode: str, turns: int, think_time: float, results: List[Dict]):
+    """
+    模拟一个学习者：依次进行多轮对话
+    
+    Args:
+        app: 已导入的 app 模块
+        index: 学习者编号
+        mode: scenario（场景练习）或 agent（自由对话）
+        turns: 对话轮数
+        think_time: 每轮之间的停顿秒数
+        results: 每轮结果写入的列表
+    """
+    request = SimpleNamespace(session_hash=f"loadtest-{mode}-{index}")
+    if mode == "scenario":
+        scenarios = app.scenario_manager.list_scenarios()
+        scenario_name = scenarios[index % len(scenarios)]
+        _, history = app.start_scenario(scenario_name, request)
+        topic = scenario_name.replace("_", " ")
+    else:
+        scenario_name = None
+        history = []
+        topic = "my weekend plans"
+    
+    for turn in range(turns):
+        # 每个学习者的消息互不相同，避免相同请求被合并
+        message = f"{MESSAGES[turn % len(MESSAGES)].format(topic=topic)} (learner {index}, turn {turn})"
+        if mode == "scenario":
+            updates = app.chat_with_scenario(message, history, scenario_name, request)
+        else:
+            updates = app.chat_with_agent(message, history, request)
+        
+        started = time.perf_counter()
+        first_update = None
+        async for history, _ in updates:
+            if first_update is None:
+                first_update = time.perf_counter() - started
+        elapsed = time.perf_counter() - started
+        reply = history[-1][1] or ""
+        results.append({
+            "mode": mode,
+            "latency": elapsed,
+            "first_update": first_update if first_update is not None else elapsed,
+            "error": reply.startswith(ERROR_PREFIXES)
+        })
+        if think_time:
+            await asyncio.sleep(think_time)
+
+
+async def drive(app, learners: int, turns: int, mode: str, think_time: float) -> List[Dict]:
+    """
+    并发运行所有模拟学习者
+    
+    Args:
+        app: 已导入的 app 模块
+        learners: 学习者人数
+        turns: 每人对话轮数
+        mode: scenario、agent 或 mixed（两种各一半）
+        think_time: 每轮之间的停顿秒数
+        
+    Returns:
+        list: 每轮结果
+    """
+    results: List[Dict] = []
+    modes = ("scenario", "agent")
+    await asyncio.gather(*(
+        run_learner(app, index, modes[index % 2] if mode == "mixed" else mode, turns, think_time, results)
+        for index in range(learners)
+    ))
+    return results
+
+
+def summarize(results: List[Dict], wall_seconds: float) -> Dict:
+    """
+    汇总每轮结果
+    
+    Args:
+        results: 每轮结果
+        wall_seconds: 总耗时
+        
+    Returns:
+        dict: 轮数、出错数、吞吐量和延迟分位数（毫秒）
+    """
+    latencies = [result["latency"] for result in results]
+    first_updates = [result["first_update"] for result in results]
+    
+    def quantiles(values: List[float]) -> Dict:
+        return {f"p{p}": round(percentile(values, p) * 1000, 1) if values else None for p in (50, 95, 99)}
+    
+    return {
+        "turns": len(results),
+        "errors": sum(result["error"] for result in results),
+        "wall_seconds": round(wall_seconds, 3),
+        "turns_per_second": round(len(results) / wall_seconds, 2) if wall_seconds else None,
+        "latency_ms": quantiles(latencies),
+        "first_update_ms": quantiles(first_updates)
+    }
+
+
+async def measure(app, args: argparse.Namespace) -> Tuple[List[Dict], float, Optional[int], Optional[int]]:
+    """
+    预热后运行所有模拟学习者，并记录前后的常驻内存
+    
+    Args:
+        app: 已导入的 app 模块
+        args: 命令行参数
+        
+    Returns:
+        tuple: (每轮结果, 总耗时, 开始前的常驻内存, 结束后的常驻内存)
+    """
+    # 预热：导入场景模块、创建客户端，不计入结果
+    await drive(app, 1, 1, "agent" if args.mode == "agent" else "scenario", 0)
+    gc.collect()
+    rss_before = rss_bytes()
+    
+    started = time.perf_counter()
+    results = await drive(app, args.learners, args.turns, args.mode, args.think_time)
+    wall_seconds = time.perf_counter() - started
+    
+    gc.collect()
+    return results, wall_seconds, rss_before, rss_bytes()
+
+
+def run(args: argparse.Namespace) -> Dict:
+    """
+    启动模拟服务并运行负载测试
+    
+    Args:
+        args: 命令行参数
+        
+    Returns:
+        dict: 测试报告
+    """
+    with server_from_args(args) as server, tempfile.TemporaryDirectory() as directory:
+        prepare_config(server.base_url, os.path.join(directory, "config.json"), args.config, not args.no_streaming)
+        import app
+        
+        # 预热和测量在同一个事件循环中进行（共享的异步 HTTP 客户端绑定在第一次使用它的事件循环上）
+        results, wall_seconds, rss_before, rss_after = asyncio.run(measure(app, args))
+        report = {
+            "learners": args.learners,
+            "mode": args.mode,
+            "streaming": not args.no_streaming,
+            "latency_distribution": str(server.latency),
+            **summarize(results, wall_seconds),
+            "rss_before_mb": round(rss_before / 2 ** 20, 1) if rss_before else None,
+            "rss_after_mb": round(rss_after / 2 ** 20, 1) if rss_after else None,
+            "rss_growth_mb": round((rss_after - rss_before) / 2 ** 20, 1) if rss_before and rss_after else None,
+            "sessions": len(app.session_store),
+            "server": dict(server.stats)
+        }
+    return report
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="离线负载测试（使用模拟的 OpenAI 兼容服务）")
+    parser.add_argument("--learners", type=int, default=20, help="并发的模拟学习者人数")
+    parser.add_argument("--turns", type=int, default=5, help="每个学习者的对话轮数")
+    parser.add_argument("--mode", choices=("scenario", "agent", "mixed"), default="scenario",
+                        help="scenario 走 chat_with_scenario，agent 走 chat_with_agent，mixed 各一半")
+    parser.add_argument("--think-time", type=float, default=0.0, help="每轮之间的停顿秒数")
+    parser.add_argument("--config", default=None, help="作为基础的配置文件（默认使用内置默认配置）")
+    parser.add_argument("--no-streaming", action="store_true", help="关闭流式输出")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出报告")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    
+    print(f"{report['learners']} 个学习者 × {args.turns} 轮（{report['mode']}，"
+          f"{'流式' if report['streaming'] else '非流式'}，延迟 {report['latency_distribution']}）")
+    print(f"完成 {report['turns']} 轮，出错 {report['errors']} 轮，用时 {report['wall_seconds']} 秒，"
+          f"吞吐量 {report['turns_per_second']} 轮/秒")
+    for name, label in (("latency_ms", "每轮延迟"), ("first_update_ms", "首次刷新")):
+        values = report[name]
+        print(f"{label:<8} p50 {values['p50']} ms  p95 {values['p95']} ms  p99 {values['p99']} ms")
+    print(f"内存 {report['rss_before_mb']} MB -> {report['rss_after_mb']} MB（增长 {report['rss_growth_mb']} MB），"
+          f"会话 {report['sessions']} 个")
+    print(f"模拟服务 {json.dumps(report['server'], ensure_ascii=False)}")
+
+
+if __name__ == "__main__":
+    main()
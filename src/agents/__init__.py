@@ -2,7 +2,22 @@
 Agents 模块
 包含所有智能体实现
 """
-from .conversation_agent import ConversationAgent
+import importlib
 
-__all__ = ['ConversationAgent']
+# 导出名称 -> 所在子模块（首次访问时才导入，避免启动时加载 LangChain）
+_EXPORTS = {
+    'ConversationAgent': '.conversation_agent'
+}
 
+
+def __getattr__(name):
+    """按需导入导出的类"""
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+__all__ = list(_EXPORTS)
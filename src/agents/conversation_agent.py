@@ -3,29 +3,89 @@ ConversationAgent - 英语对话教学智能体
 迭代优化后的 System Prompt，确保稳定返回教学指导、例句和格式化回复
 """
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from langchain_core.messages import HumanMessage, AIMessage
 from langchain_core.prompts import ChatPromptTemplate
-from typing import Dict, List, Optional
-import json
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Union
 import re
-import sys
-from pathlib import Path
-
-# 添加项目根目录到路径
-project_root = Path(__file__).parent.parent.parent
-sys.path.insert(0, str(project_root))
 
 from src.config import get_config
+from src.context_builder import ContextBuilder
+from src.history import ConversationHistory, HistoryMessage
+from src.instrumentation import TurnRecord, get_turn_instrumentation
+from src.llm.client_registry import LLMClientRegistry
+from src.llm.invoker import LLMInvoker
+from src.llm.json_extract import extract_json_object
+from src.llm.json_repair import JSONRepairer, repair_json
+from src.llm.json_stream import PartialJSONParser
+from src.llm.pool import LLMPool
+from src.llm.structured_output import StructuredOutput
+from src.llm.tutor_base import SystemMessageMixin, error_reply
+from src.prompts import get_prompt_registry
+
+# 对话历史：Gradio 传来的字典列表，或会话自己的 ConversationHistory（成功的回复会追加到其中）
+History = Union[List[Dict], ConversationHistory]
+
+
+# 导师角色说明
+AGENT_PROMPT_CONTEXT = """You are an experienced English conversation tutor. Your role is to help learners improve their English through natural conversation practice."""
+
+# 自由对话的补充规则和回复示例
+AGENT_PROMPT_SUFFIX = """**CONVERSATION RULES:**
+- Keep the bot_reply natural and conversational, not robotic, and show personality and engagement
+- Use the example sentences naturally in the bot_reply when appropriate
+- Keep teaching feedback constructive and encouraging
 
+**Example of a good response:**
+
+User: "I want to learn English better."
 
-class ConversationAgent:
+Your response (as JSON):
+{
+    "bot_reply": "That's wonderful! I'm here to help you improve your English. What would you like to practice today? We can work on conversation, grammar, vocabulary, or any specific topic you're interested in.",
+    "teaching_feedback": {
+        "grammar_corrections": [],
+        "vocabulary_suggestions": ["You could also say 'I want to improve my English' which sounds more natural."],
+        "pronunciation_tips": [],
+        "overall_comment": "Great! Your sentence is clear and grammatically correct. Using 'better' is fine, though 'improve' might sound slightly more natural in formal contexts."
+    },
+    "example_sentences": [
+        "I'm looking forward to improving my English skills through regular practice.",
+        "What specific areas of English would you like to focus on?",
+        "Let's start with some daily conversation practice to build your confidence."
+    ]
+}
+
+Remember: Always output valid JSON with these three components. Be encouraging, helpful, and make learning enjoyable!"""
+
+
+def build_agent_system_prompt() -> str:
+    """构建 ConversationAgent 的系统提示词（共享输出要求 + 自由对话规则和示例）"""
+    return get_prompt_registry().build(
+        "conversation_agent",
+        AGENT_PROMPT_CONTEXT,
+        suffix=AGENT_PROMPT_SUFFIX,
+        role="the ChatBot character",
+        topic="the conversation topic"
+    )
+
+
+class ConversationAgent(SystemMessageMixin):
     """
     对话教学智能体
     负责提供英语对话教学指导，包括教学点评、例句和角色回复
     """
     
+    # 解析路径指标中的来源名称
+    PARSE_SOURCE = "conversation_agent"
+    # 显示内容中 Bot 回复部分的标题（之后的内容就是 bot_reply）
+    BOT_REPLY_HEADING = "## 🤖 Bot 回复 (Bot Reply)\n"
+    
     def __init__(self, model_name: Optional[str] = None, temperature: Optional[float] = None,
-                 api_key: Optional[str] = None, base_url: Optional[str] = None):
+                 api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 context_builder: Optional[ContextBuilder] = None, invoker: Optional[LLMInvoker] = None,
+                 llm_registry: Optional[LLMClientRegistry] = None, structured_output: Optional[str] = None,
+                 model_repair: bool = False, repair_model: Optional[str] = None,
+                 llm_pool: Optional[LLMPool] = None):
         """
         初始化 Conversation Agent
         
@@ -34,6 +94,13 @@ class ConversationAgent:
             temperature: 温度参数（如果为 None，则从配置读取）
             api_key: API Key（如果为 None，则从配置读取）
             base_url: Base URL（如果为 None，则从配置读取）
+            context_builder: 上下文窗口构建器（如果为 None，则按配置创建）
+            invoker: LLM 调用器（处理响应缓存等，可与场景共享）
+            llm_registry: LLM 客户端注册表（传入时与场景共享客户端和连接池）
+            structured_output: 结构化输出模式（off、json_mode 或 json_schema，如果为 None，则从配置读取）
+            model_repair: 本地修复 JSON 失败时是否调用修复模型整理格式
+            repair_model: 修复模型名称（为 None 时使用主模型）
+            llm_pool: 多后端池（传入时与场景共享后端路由状态，不再创建单个模型）
         """
         # 从配置获取 LLM 设置
         config = get_config()
@@ -43,8 +110,45 @@ class ConversationAgent:
         temperature = temperature if temperature is not None else llm_config.get("temperature", 0.7)
         api_key = api_key or llm_config.get("api_key")
         base_url = base_url or llm_config.get("base_url")
+        structured_output = structured_output or llm_config.get("structured_output", "off")
+        
+        # 初始化 LLM（配置了多后端池时使用后端池）
+        if llm_pool is not None:
+            self.llm = llm_pool
+        else:
+            self.llm = self._create_llm(model_name, temperature, api_key, base_url, llm_registry)
+        self.model_name = model_name
+        self.temperature = temperature
+        self.invoker = invoker or LLMInvoker()
+        
+        # 生成回复时使用绑定了 response_format 的模型，正则提取只作为回退
+        self.structured_output = StructuredOutput(structured_output)
+        self.response_llm = self.structured_output.bind(self.llm)
+        
+        # 本地修复 JSON 失败时由修复模型整理格式（修复模型在第一次需要时才创建）
+        self.repairer: Optional[JSONRepairer] = None
+        if model_repair:
+            repair_model = repair_model or model_name
+            self.repairer = JSONRepairer(
+                lambda: self._create_llm(repair_model, 0.0, api_key, base_url, llm_registry),
+                repair_model,
+                invoker=self.invoker
+            )
+        
+        # 按 token 预算选择历史消息
+        self.context_builder = context_builder or ContextBuilder.from_config(config.get_context_config())
+        self.instrumentation = get_turn_instrumentation()
+        
+        # 迭代优化后的系统提示词（由共享片段构建，所有实例共用同一个字符串）
+        self.system_prompt = build_agent_system_prompt()
+    
+    @staticmethod
+    def _create_llm(model_name: str, temperature: float, api_key: Optional[str], base_url: Optional[str],
+                    llm_registry: Optional[LLMClientRegistry]):
+        """创建聊天模型（传入注册表时与场景共享客户端）"""
+        if llm_registry is not None:
+            return llm_registry.get(ChatOpenAI, model_name, temperature, api_key, base_url)
         
-        # 初始化 LLM
         llm_kwargs = {
             "model": model_name,
             "temperature": temperature
@@ -55,167 +159,264 @@ class ConversationAgent:
         if base_url:
             llm_kwargs["base_url"] = base_url
         
-        self.llm = ChatOpenAI(**llm_kwargs)
-        self.model_name = model_name
-        
-        # 迭代优化后的系统提示词
-        self.system_prompt = """You are an experienced English conversation tutor. Your role is to help learners improve their English through natural conversation practice.
-
-**CRITICAL OUTPUT REQUIREMENTS - You MUST follow this format strictly:**
-
-Every response you generate MUST include the following three components in JSON format:
-
-1. **Teaching Feedback (教学点评)**: Provide constructive feedback on the learner's message, including:
-   - Grammar corrections (if needed)
-   - Vocabulary suggestions
-   - Pronunciation tips (if applicable)
-   - Overall communication effectiveness
-
-2. **Three Example Sentences (3个英语例句)**: Provide exactly 3 English example sentences that:
-   - Are relevant to the conversation topic
-   - Help advance the conversation naturally
-   - Demonstrate proper grammar and vocabulary usage
-   - Are suitable for the learner's level
-   - Each sentence should be different and useful for practice
-
-3. **Bot Role Reply (Bot角色回复)**: Provide a natural, conversational response as the ChatBot character that:
-   - Responds to the learner's message appropriately
-   - Maintains the conversation flow
-   - Uses the example sentences naturally (if appropriate)
-   - Shows personality and engagement
-
-**OUTPUT FORMAT - You MUST use this exact JSON structure:**
-
-```json
-{
-    "teaching_feedback": {
-        "grammar_corrections": ["correction 1", "correction 2", ...],
-        "vocabulary_suggestions": ["suggestion 1", "suggestion 2", ...],
-        "pronunciation_tips": ["tip 1", "tip 2", ...],
-        "overall_comment": "Overall feedback on the learner's message"
-    },
-    "example_sentences": [
-        "First example sentence that helps advance the conversation.",
-        "Second example sentence that helps advance the conversation.",
-        "Third example sentence that helps advance the conversation."
-    ],
-    "bot_reply": "Your natural conversational response as the ChatBot character. This should be engaging and help continue the conversation."
-}
-```
-
-**IMPORTANT RULES:**
-1. ALWAYS return exactly 3 example sentences - no more, no less
-2. Example sentences must be relevant and help advance the conversation
-3. The bot_reply should be natural and conversational, not robotic
-4. Teaching feedback should be constructive and encouraging
-5. If the learner's message is perfect, still provide positive feedback and example sentences
-6. Format your response as valid JSON - do not include any text outside the JSON structure
-7. Ensure all strings in JSON are properly escaped
-
-**Example of a good response:**
-
-User: "I want to learn English better."
-
-Your response (as JSON):
-{
-    "teaching_feedback": {
-        "grammar_corrections": [],
-        "vocabulary_suggestions": ["You could also say 'I want to improve my English' which sounds more natural."],
-        "pronunciation_tips": [],
-        "overall_comment": "Great! Your sentence is clear and grammatically correct. Using 'better' is fine, though 'improve' might sound slightly more natural in formal contexts."
-    },
-    "example_sentences": [
-        "I'm looking forward to improving my English skills through regular practice.",
-        "What specific areas of English would you like to focus on?",
-        "Let's start with some daily conversation practice to build your confidence."
-    ],
-    "bot_reply": "That's wonderful! I'm here to help you improve your English. What would you like to practice today? We can work on conversation, grammar, vocabulary, or any specific topic you're interested in."
-}
-
-Remember: Always output valid JSON with these three components. Be encouraging, helpful, and make learning enjoyable!"""
+        return ChatOpenAI(**llm_kwargs)
     
-    def generate_response(self, user_message: str, conversation_history: Optional[List] = None) -> Dict:
+    def generate_response(self, user_message: str, conversation_history: Optional[History] = None,
+                          session_id: Optional[str] = None, turn: Optional[TurnRecord] = None) -> Dict:
         """
         生成教学回复
         
         Args:
             user_message: 用户消息
-            conversation_history: 对话历史（可选）
+            conversation_history: 对话历史（可选；传入 ConversationHistory 时把本轮追加到其中）
+            session_id: 会话标识（请求调度器按会话轮流放行排队的请求）
+            turn: 外层（Gradio 处理函数）已经开始的本轮统计（为 None 时单独统计本轮）
             
         Returns:
             dict: 包含教学点评、例句和Bot回复的字典
         """
-        # 构建消息列表
-        messages = [SystemMessage(content=self.system_prompt)]
+        with self.instrumentation.turn(self.PARSE_SOURCE, self.model_name, turn) as record:
+            with record.stage("history"):
+                messages = self._build_messages(user_message, conversation_history)
+            
+            # 调用 LLM
+            try:
+                with record.stage("llm"):
+                    content = self.invoker.invoke(self.response_llm, messages, self.model_name, self.temperature,
+                                                  session=session_id, turn=record)
+                record.mark_first_token()
+                response = self._process_content(content, record)
+                self._record_turn(user_message, response, conversation_history)
+                return response
+            except Exception as e:
+                # 如果解析失败，返回默认格式
+                record.outcome = "error"
+                return self._create_error_response(e)
+    
+    async def agenerate_response(self, user_message: str, conversation_history: Optional[History] = None,
+                                 session_id: Optional[str] = None,
+                                 turn: Optional[TurnRecord] = None) -> Dict:
+        """
+        异步生成教学回复（基于 ainvoke，不占用工作线程）
         
-        # 添加对话历史
-        if conversation_history:
-            for msg in conversation_history[-5:]:  # 只保留最近5轮对话
-                if isinstance(msg, dict):
-                    if msg.get("role") == "user":
-                        messages.append(HumanMessage(content=msg.get("content", "")))
-                    elif msg.get("role") == "assistant":
-                        messages.append(AIMessage(content=msg.get("content", "")))
+        Args:
+            user_message: 用户消息
+            conversation_history: 对话历史（可选；传入 ConversationHistory 时把本轮追加到其中）
+            session_id: 会话标识（请求调度器按会话轮流放行排队的请求）
+            turn: 外层（Gradio 处理函数）已经开始的本轮统计（为 None 时单独统计本轮）
+            
+        Returns:
+            dict: 包含教学点评、例句和Bot回复的字典
+        """
+        with self.instrumentation.turn(self.PARSE_SOURCE, self.model_name, turn) as record:
+            with record.stage("history"):
+                messages = self._build_messages(user_message, conversation_history)
+            
+            # 异步调用 LLM
+            try:
+                with record.stage("llm"):
+                    content = await self.invoker.ainvoke(self.response_llm, messages, self.model_name,
+                                                         self.temperature, session=session_id, turn=record)
+                record.mark_first_token()
+                response = await self._aprocess_content(content, record)
+                self._record_turn(user_message, response, conversation_history)
+                return response
+            except Exception as e:
+                record.outcome = "error"
+                return self._create_error_response(e)
+    
+    def stream_response(self, user_message: str, conversation_history: Optional[History] = None,
+                        session_id: Optional[str] = None,
+                        turn: Optional[TurnRecord] = None) -> Iterator[Dict]:
+        """
+        流式生成教学回复
         
-        # 添加当前用户消息
-        messages.append(HumanMessage(content=user_message))
+        边生成边解析 JSON：先产出 bot_reply（逐步增长），teaching_feedback 和
+        example_sentences 生成完毕后再补充，最后产出完整验证后的回复。
         
-        # 调用 LLM
-        try:
-            response = self.llm.invoke(messages)
-            content = response.content
+        Args:
+            user_message: 用户消息
+            conversation_history: 对话历史（可选；传入 ConversationHistory 时把本轮追加到其中）
+            session_id: 会话标识（请求调度器按会话轮流放行排队的请求）
+            turn: 外层（Gradio 处理函数）已经开始的本轮统计（为 None 时单独统计本轮）
             
-            # 解析 JSON 响应
-            parsed_response = self._parse_json_response(content)
+        Yields:
+            dict: 部分解析结果，最后一项为完整回复
+        """
+        with self.instrumentation.turn(self.PARSE_SOURCE, self.model_name, turn) as record:
+            with record.stage("history"):
+                messages = self._build_messages(user_message, conversation_history)
+            parser = PartialJSONParser()
+            last_snapshot = None
             
-            # 验证响应格式
-            validated_response = self._validate_response(parsed_response)
+            try:
+                chunks = self.invoker.stream(self.response_llm, messages, self.model_name, self.temperature,
+                                             session=session_id, turn=record)
+                for text in record.track(chunks):
+                    with record.timed("parse"):
+                        snapshot = parser.feed(text)
+                    if snapshot and snapshot != last_snapshot:
+                        last_snapshot = snapshot
+                        yield snapshot
+                response = self._process_content(parser.buffer, record)
+                self._record_turn(user_message, response, conversation_history)
+                yield response
+            except Exception as e:
+                record.outcome = "error"
+                yield self._create_error_response(e)
+    
+    async def astream_response(self, user_message: str,
+                               conversation_history: Optional[History] = None,
+                               session_id: Optional[str] = None,
+                               turn: Optional[TurnRecord] = None) -> AsyncIterator[Dict]:
+        """
+        异步流式生成教学回复（基于 astream）
+        
+        Args:
+            user_message: 用户消息
+            conversation_history: 对话历史（可选；传入 ConversationHistory 时把本轮追加到其中）
+            session_id: 会话标识（请求调度器按会话轮流放行排队的请求）
+            turn: 外层（Gradio 处理函数）已经开始的本轮统计（为 None 时单独统计本轮）
             
-            return validated_response
+        Yields:
+            dict: 部分解析结果，最后一项为完整回复
+        """
+        with self.instrumentation.turn(self.PARSE_SOURCE, self.model_name, turn) as record:
+            with record.stage("history"):
+                messages = self._build_messages(user_message, conversation_history)
+            parser = PartialJSONParser()
+            last_snapshot = None
             
-        except Exception as e:
-            # 如果解析失败，返回默认格式
-            return {
-                "teaching_feedback": {
-                    "grammar_corrections": [],
-                    "vocabulary_suggestions": [],
-                    "pronunciation_tips": [],
-                    "overall_comment": f"Error processing response: {str(e)}"
-                },
-                "example_sentences": [
-                    "Let's continue our conversation.",
-                    "I'm here to help you practice English.",
-                    "What would you like to talk about next?"
-                ],
-                "bot_reply": "I apologize, but I encountered an error. Let's continue our conversation!"
-            }
+            try:
+                chunks = self.invoker.astream(self.response_llm, messages, self.model_name, self.temperature,
+                                              session=session_id, turn=record)
+                async for text in record.atrack(chunks):
+                    with record.timed("parse"):
+                        snapshot = parser.feed(text)
+                    if snapshot and snapshot != last_snapshot:
+                        last_snapshot = snapshot
+                        yield snapshot
+                response = await self._aprocess_content(parser.buffer, record)
+                self._record_turn(user_message, response, conversation_history)
+                yield response
+            except Exception as e:
+                record.outcome = "error"
+                yield self._create_error_response(e)
     
-    def _parse_json_response(self, content: str) -> Dict:
-        """解析 JSON 响应"""
-        try:
-            # 尝试提取 JSON 部分
-            if "```json" in content:
-                json_match = re.search(r'```json\s*(.*?)\s*```', content, re.DOTALL)
-                if json_match:
-                    return json.loads(json_match.group(1))
-            elif "```" in content:
-                # 尝试提取代码块中的内容
-                json_match = re.search(r'```\s*(.*?)\s*```', content, re.DOTALL)
-                if json_match:
-                    return json.loads(json_match.group(1))
-            
-            # 尝试直接解析整个内容
-            if content.strip().startswith('{'):
-                json_match = re.search(r'\{.*\}', content, re.DOTALL)
-                if json_match:
-                    return json.loads(json_match.group(0))
+    def _build_messages(self, user_message: str, conversation_history: Optional[History] = None) -> List:
+        """
+        构建发送给 LLM 的消息列表
+        
+        Args:
+            user_message: 用户消息
+            conversation_history: 对话历史（可选，字典列表或 ConversationHistory）
             
+        Returns:
+            list: LangChain 消息列表
+        """
+        # 静态前缀（系统提示词）固定放在最前面，之后才是会变化的摘要、历史和当前消息
+        messages = [self._system_message()]
+        
+        # 添加对话历史（按 token 预算选择完整的对话轮次）
+        if conversation_history:
+            history = [msg for msg in conversation_history if isinstance(msg, (dict, HistoryMessage))]
+            for msg in self.context_builder.select(history):
+                if isinstance(msg, HistoryMessage):
+                    role, content = msg.role, msg.content
+                else:
+                    role, content = msg.get("role"), msg.get("content", "")
+                if role == "user":
+                    messages.append(HumanMessage(content=content))
+                elif role == "assistant":
+                    messages.append(AIMessage(content=content))
+        
+        # 添加当前用户消息
+        messages.append(HumanMessage(content=user_message))
+        return messages
+    
+    @staticmethod
+    def _record_turn(user_message: str, response: Dict, conversation_history: Optional[History]):
+        """会话自己的对话历史追加本轮（assistant 只保存 bot_reply 文本，不保存格式化后的显示内容）"""
+        if isinstance(conversation_history, ConversationHistory):
+            conversation_history.add_turn(user_message, response.get("bot_reply", ""))
+    
+    def _process_content(self, content: str, turn: TurnRecord) -> Dict:
+        """解析并验证 LLM 输出内容（解析和格式校验分别计入本轮的 parse、validate 阶段）"""
+        with turn.stage("parse"):
+            parsed_response = self._parse_content(content)
+            if parsed_response is None and self.repairer is not None:
+                parsed_response = self._record_model_repair(self.repairer.repair(content))
+        with turn.stage("validate"):
+            return self._finish_content(content, parsed_response)
+    
+    async def _aprocess_content(self, content: str, turn: TurnRecord) -> Dict:
+        """解析并验证 LLM 输出内容（需要模型修复时异步调用修复模型）"""
+        with turn.stage("parse"):
+            parsed_response = self._parse_content(content)
+            if parsed_response is None and self.repairer is not None:
+                parsed_response = self._record_model_repair(await self.repairer.arepair(content))
+        with turn.stage("validate"):
+            return self._finish_content(content, parsed_response)
+    
+    def _finish_content(self, content: str, parsed_response: Optional[Dict]) -> Dict:
+        """所有解析方式都失败时使用默认结构，然后验证响应格式"""
+        if parsed_response is None:
+            self.structured_output.record(self.PARSE_SOURCE, "default")
+            parsed_response = self._create_default_response(content)
+        
+        # 验证响应格式
+        return self._validate_response(parsed_response)
+    
+    def _record_model_repair(self, parsed_response: Optional[Dict]) -> Optional[Dict]:
+        """记录模型修复成功"""
+        if parsed_response is not None:
+            self.structured_output.record(self.PARSE_SOURCE, "model_repair")
+        return parsed_response
+    
+    def _create_error_response(self, error: Exception) -> Dict:
+        """创建出错时的默认响应（限流或排队已满时提示稍后再试）"""
+        return {
+            "teaching_feedback": {
+                "grammar_corrections": [],
+                "vocabulary_suggestions": [],
+                "pronunciation_tips": [],
+                "overall_comment": f"Error processing response: {str(error)}"
+            },
+            "example_sentences": [
+                "Let's continue our conversation.",
+                "I'm here to help you practice English.",
+                "What would you like to talk about next?"
+            ],
+            "bot_reply": error_reply(error)
+        }
+    
+    def _parse_json_response(self, content: str) -> Dict:
+        """解析 JSON 响应（不调用修复模型）"""
+        parsed_response = self._parse_content(content)
+        if parsed_response is None:
             # 如果都失败，返回默认结构
+            self.structured_output.record(self.PARSE_SOURCE, "default")
             return self._create_default_response(content)
-            
-        except json.JSONDecodeError as e:
-            # JSON 解析失败，返回默认结构
-            return self._create_default_response(content)
+        return parsed_response
+    
+    def _parse_content(self, content: str) -> Optional[Dict]:
+        """依次尝试结构化解析、提取 JSON 和本地修复，并记录所走的解析路径（都失败时返回 None）"""
+        parsed_response = self.structured_output.parse(content)
+        path = "structured"
+        if parsed_response is None:
+            parsed_response = self._extract_json(content)
+            path = "regex"
+        if parsed_response is None:
+            parsed_response = repair_json(content)
+            path = "repair"
+        
+        if parsed_response is not None:
+            self.structured_output.record(self.PARSE_SOURCE, path)
+        return parsed_response
+    
+    def _extract_json(self, content: str) -> Optional[Dict]:
+        """提取第一个完整的 JSON 对象（一次线性扫描，跳过代码块标记和说明文字，提取失败时返回 None）"""
+        return extract_json_object(content)
     
     def _create_default_response(self, content: str) -> Dict:
         """创建默认响应结构"""
@@ -293,12 +494,13 @@ Remember: Always output valid JSON with these three components. Be encouraging,
         
         return response
     
-    def format_response_for_display(self, response: Dict) -> str:
+    def format_response_for_display(self, response: Dict, partial: bool = False) -> str:
         """
         格式化响应以便显示
         
         Args:
             response: 响应字典
+            partial: 是否为流式输出中的部分结果（缺失的部分不显示）
             
         Returns:
             str: 格式化后的字符串
@@ -306,40 +508,60 @@ Remember: Always output valid JSON with these three components. Be encouraging,
         formatted = []
         
         # 教学点评
-        formatted.append("## 📚 教学点评 (Teaching Feedback)\n")
-        feedback = response.get("teaching_feedback", {})
-        
-        if feedback.get("grammar_corrections"):
-            formatted.append("**语法纠正 (Grammar Corrections):**")
-            for correction in feedback["grammar_corrections"]:
-                formatted.append(f"- {correction}")
-            formatted.append("")
-        
-        if feedback.get("vocabulary_suggestions"):
-            formatted.append("**词汇建议 (Vocabulary Suggestions):**")
-            for suggestion in feedback["vocabulary_suggestions"]:
-                formatted.append(f"- {suggestion}")
-            formatted.append("")
-        
-        if feedback.get("pronunciation_tips"):
-            formatted.append("**发音提示 (Pronunciation Tips):**")
-            for tip in feedback["pronunciation_tips"]:
-                formatted.append(f"- {tip}")
-            formatted.append("")
-        
-        if feedback.get("overall_comment"):
-            formatted.append(f"**总体评价 (Overall Comment):**\n{feedback['overall_comment']}\n")
+        if not partial or "teaching_feedback" in response:
+            formatted.append("## 📚 教学点评 (Teaching Feedback)\n")
+            feedback = response.get("teaching_feedback", {})
+            if not isinstance(feedback, dict):
+                feedback = {"overall_comment": str(feedback)}
+            
+            if feedback.get("grammar_corrections"):
+                formatted.append("**语法纠正 (Grammar Corrections):**")
+                for correction in feedback["grammar_corrections"]:
+                    formatted.append(f"- {correction}")
+                formatted.append("")
+            
+            if feedback.get("vocabulary_suggestions"):
+                formatted.append("**词汇建议 (Vocabulary Suggestions):**")
+                for suggestion in feedback["vocabulary_suggestions"]:
+                    formatted.append(f"- {suggestion}")
+                formatted.append("")
+            
+            if feedback.get("pronunciation_tips"):
+                formatted.append("**发音提示 (Pronunciation Tips):**")
+                for tip in feedback["pronunciation_tips"]:
+                    formatted.append(f"- {tip}")
+                formatted.append("")
+            
+            if feedback.get("overall_comment"):
+                formatted.append(f"**总体评价 (Overall Comment):**\n{feedback['overall_comment']}\n")
         
         # 例句
-        formatted.append("## 💬 例句 (Example Sentences)\n")
-        example_sentences = response.get("example_sentences", [])
-        for i, sentence in enumerate(example_sentences, 1):
-            formatted.append(f"{i}. {sentence}")
-        formatted.append("")
+        if not partial or "example_sentences" in response:
+            formatted.append("## 💬 例句 (Example Sentences)\n")
+            example_sentences = response.get("example_sentences", [])
+            for i, sentence in enumerate(example_sentences, 1):
+                formatted.append(f"{i}. {sentence}")
+            formatted.append("")
         
         # Bot 回复
-        formatted.append("## 🤖 Bot 回复 (Bot Reply)\n")
-        formatted.append(response.get("bot_reply", ""))
+        if not partial or "bot_reply" in response:
+            formatted.append(self.BOT_REPLY_HEADING)
+            formatted.append(response.get("bot_reply", ""))
         
         return "\n".join(formatted)
-
+    
+    @classmethod
+    def bot_reply_from_display(cls, formatted: str) -> Optional[str]:
+        """
+        从 format_response_for_display 的输出中取出 Bot 回复文本（用于从界面记录重建对话历史）
+        
+        Args:
+            formatted: 格式化后的显示内容
+            
+        Returns:
+            str: Bot 回复文本（不是格式化的回复，例如错误信息时为 None）
+        """
+        _, heading, reply = formatted.rpartition(cls.BOT_REPLY_HEADING)
+        if not heading:
+            return None
+        return reply.strip() or None
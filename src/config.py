@@ -52,21 +52,111 @@ class Config:
                 "model": "gpt-4o-mini",
                 "temperature": 0.7,
                 "api_key": os.getenv("OPENAI_API_KEY", ""),
-                "base_url": None
+                "base_url": None,
+                "streaming": True,
+                "stream_usage": True,
+                "structured_output": "json_mode",
+                "coalesce_requests": True
             },
             "scenarios": {
                 "enabled": ["salary_negotiation", "apartment_rental", "leave_request", "airport_checkin"]
+            },
+            "context": {
+                "max_history_tokens": 1500,
+                "tokenizer": "approximate",
+                "summarize_history": True
+            },
+            "cache": {
+                "enabled": True,
+                "backend": "memory",
+                "max_entries": 1000,
+                "ttl_seconds": 3600,
+                "sqlite_path": "cache/responses.sqlite3"
+            },
+            "connection_pool": {
+                "max_connections": 100,
+                "max_keepalive_connections": 20,
+                "keepalive_expiry": 60,
+                "timeout": 60
+            },
+            "semantic_cache": {
+                "enabled": False,
+                "threshold": 0.92,
+                "max_entries_per_scenario": 500,
+                "ngram_range": [2, 4],
+                "dimensions": 4096
+            },
+            "repair": {
+                "enabled": False,
+                "model": None
+            },
+            "scheduler": {
+                "enabled": True,
+                "requests_per_minute": 500,
+                "tokens_per_minute": 200000,
+                "max_concurrency": 32,
+                "max_queue_size": 500,
+                "max_retries": 3,
+                "backoff_base": 0.5,
+                "backoff_max": 20,
+                "expected_completion_tokens": 400
+            },
+            "routing": {
+                "backends": [],
+                "latency_window": 50,
+                "min_samples": 5,
+                "explore_ratio": 0.05,
+                "failure_threshold": 3,
+                "recovery_seconds": 30
+            },
+            "hedging": {
+                "enabled": False,
+                "percentile": 95,
+                "min_delay": 0.5,
+                "initial_delay": 3.0,
+                "window": 200,
+                "min_samples": 20,
+                "max_hedge_ratio": 0.1,
+                "alternate_backend": True
+            },
+            "tracing": {
+                "exporter": "none",
+                "path": "traces/spans.jsonl"
+            },
+            "sessions": {
+                "ttl_seconds": 1800,
+                "max_sessions": 1000,
+                "max_history_messages": 20,
+                "archive_history": False
             }
         }
     
+    def _get_section(self, section: str) -> Dict:
+        """
+        获取配置段，缺失的键使用默认值补齐（兼容旧配置文件）
+        
+        Args:
+            section: 配置段名称
+            
+        Returns:
+            dict: 配置段字典
+        """
+        merged = dict(self._get_default_config().get(section, {}))
+        merged.update(self.config.get(section) or {})
+        return merged
+    
     def get_llm_config(self) -> Dict:
         """
-        获取 LLM 配置
+        获取 LLM 配置（缺失的键使用默认值补齐；旧配置文件没有 structured_output 时为 "off"）
         
         Returns:
             dict: LLM 配置字典
         """
-        llm_config = self.config.get("llm", {})
+        llm_config = self._get_section("llm")
+        
+        # 新生成的配置文件写入 json_mode，旧配置文件保持原来不约束输出格式的行为
+        if "structured_output" not in self.config.get("llm", {}):
+            llm_config["structured_output"] = "off"
         
         # 从环境变量获取 API Key（如果配置中没有）
         if not llm_config.get("api_key"):
@@ -100,6 +190,109 @@ class Config:
         
         self.save_config()
     
+    def get_context_config(self) -> Dict:
+        """
+        获取上下文窗口配置
+        
+        Returns:
+            dict: 包含 max_history_tokens（历史 token 预算）、tokenizer
+                  （"approximate" 为离线估算，或 tiktoken 编码名）和
+                  summarize_history（是否把移出窗口的轮次合并为滚动摘要）
+        """
+        return self._get_section("context")
+    
+    def get_cache_config(self) -> Dict:
+        """
+        获取 LLM 响应缓存配置（只对首轮对话或 temperature 为 0 的请求生效）
+        
+        Returns:
+            dict: 包含 enabled、backend（memory / sqlite）、max_entries、ttl_seconds 和 sqlite_path
+        """
+        return self._get_section("cache")
+    
+    def get_connection_pool_config(self) -> Dict:
+        """
+        获取 LLM 客户端共享 HTTP 连接池配置
+        
+        Returns:
+            dict: 包含 max_connections、max_keepalive_connections、keepalive_expiry（秒）和 timeout（秒）
+        """
+        return self._get_section("connection_pool")
+    
+    def get_semantic_cache_config(self) -> Dict:
+        """
+        获取语义近似缓存配置（只对场景的首轮对话生效）
+        
+        Returns:
+            dict: 包含 enabled、threshold（最小余弦相似度）、max_entries_per_scenario、
+                  ngram_range（字符 n-gram 长度范围）和 dimensions（向量维度）
+        """
+        return self._get_section("semantic_cache")
+    
+    def get_repair_config(self) -> Dict:
+        """
+        获取 JSON 修复配置（本地修复总是开启，这里只控制本地修复失败后的模型修复）
+        
+        Returns:
+            dict: 包含 enabled（是否调用修复模型）和 model（修复模型，为 None 时使用主模型）
+        """
+        return self._get_section("repair")
+    
+    def get_scheduler_config(self) -> Dict:
+        """
+        获取 LLM 请求调度配置（所有场景和 ConversationAgent 共用一个调度器，按服务商的限额填写）
+        
+        Returns:
+            dict: 包含 enabled、requests_per_minute、tokens_per_minute、max_concurrency（为 0 时不限制）、
+                  max_queue_size（最多排队请求数）、max_retries、backoff_base 和 backoff_max（退避秒数），
+                  以及 expected_completion_tokens（预估 TPM 用量时为输出预留的 token 数）
+        """
+        return self._get_section("scheduler")
+    
+    def get_routing_config(self) -> Dict:
+        """
+        获取多后端路由配置（backends 为空时只使用 llm 段配置的单个模型）
+        
+        backends 中每一项包含 name、model、base_url、api_key（或 api_key_env：从该环境变量读取）、
+        weight（路由权重），可选 temperature（默认使用 llm 段的温度）
+        
+        Returns:
+            dict: 包含 backends、latency_window（计算 p50 的样本数）、min_samples、explore_ratio、
+                  failure_threshold（连续失败多少次后熔断）和 recovery_seconds（熔断冷却秒数）
+        """
+        return self._get_section("routing")
+    
+    def get_hedging_config(self) -> Dict:
+        """
+        获取对冲请求配置（只作用于异步调用，即 Web 界面的对话）
+        
+        Returns:
+            dict: 包含 enabled、percentile（等待时间取最近首 token 延迟的百分位）、min_delay、
+                  initial_delay（样本少于 min_samples 时的等待秒数）、window（保留的延迟样本数）、
+                  max_hedge_ratio（对冲请求占调用数的上限）和 alternate_backend（配置了多个后端时
+                  对冲请求是否发往另一个后端）
+        """
+        return self._get_section("hedging")
+    
+    def get_tracing_config(self) -> Dict:
+        """
+        获取链路追踪配置
+        
+        Returns:
+            dict: 包含 exporter（none 不追踪，jsonl 把每个 span 按一行 JSON 追加写入 path）和 path
+        """
+        return self._get_section("tracing")
+    
+    def get_session_config(self) -> Dict:
+        """
+        获取会话存储配置
+        
+        Returns:
+            dict: 包含 ttl_seconds（空闲过期秒数）、max_sessions（最大会话数）、
+                  max_history_messages（每个场景保留的消息数）和 archive_history（是否压缩归档）
+        """
+        return self._get_section("sessions")
+    
     def get_enabled_scenarios(self) -> list:
         """
         获取启用的场景列表
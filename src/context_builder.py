@@ -0,0 +1,106 @@
+"""
+上下文窗口构建
+按 token 预算从最新的一轮开始向前打包完整的对话轮次（用户消息 + 回复）
+"""
+from typing import Dict, List, Optional, Sequence, Union
+
+from src.history import HistoryMessage
+from src.llm.tokenizer import TokenCounter
+
+# 每条消息在聊天格式中的固定开销（角色标记等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+Message = Union[HistoryMessage, Dict]
+
+
+class ContextBuilder:
+    """
+    上下文窗口构建器
+    只按整轮选择历史，不会把一轮对话拆开；每条消息的 token 数只计算一次
+    """
+    
+    def __init__(self, max_history_tokens: int = 1500, token_counter: Optional[TokenCounter] = None):
+        """
+        初始化构建器
+        
+        Args:
+            max_history_tokens: 历史消息的 token 预算
+            token_counter: token 计数器（默认使用离线估算）
+        """
+        self.max_history_tokens = max_history_tokens
+        self.token_counter = token_counter or TokenCounter()
+    
+    @classmethod
+    def from_config(cls, context_config: Dict) -> "ContextBuilder":
+        """
+        根据配置创建构建器
+        
+        Args:
+            context_config: 配置中的 context 段
+            
+        Returns:
+            ContextBuilder: 构建器
+        """
+        return cls(
+            max_history_tokens=context_config.get("max_history_tokens", 1500),
+            token_counter=TokenCounter(context_config.get("tokenizer"))
+        )
+    
+    def message_tokens(self, message: Message) -> int:
+        """
+        计算单条消息的 token 数（HistoryMessage 会缓存在消息记录上）
+        
+        Args:
+            message: HistoryMessage 或 {"role": ..., "content": ...}
+            
+        Returns:
+            int: token 数（含消息固定开销）
+        """
+        if isinstance(message, HistoryMessage):
+            if message.token_count is None:
+                message.token_count = self.token_counter.count(message.content) + MESSAGE_OVERHEAD_TOKENS
+            return message.token_count
+        return self.token_counter.count(message.get("content", "")) + MESSAGE_OVERHEAD_TOKENS
+    
+    def select(self, messages: Sequence[Message]) -> List[Message]:
+        """
+        从最新的一轮开始向前选择整轮对话，直到达到 token 预算
+        
+        Args:
+            messages: 按时间顺序排列的历史消息
+            
+        Returns:
+            List[Message]: 选中的消息（按时间顺序）
+        """
+        selected: List[Message] = []
+        used = 0
+        turn: List[Message] = []
+        turn_tokens = 0
+        
+        for message in reversed(messages):
+            turn.append(message)
+            turn_tokens += self.message_tokens(message)
+            
+            # 倒序遍历时遇到用户消息，说明一整轮已收集完毕
+            if _role(message) == "user":
+                if used + turn_tokens > self.max_history_tokens:
+                    turn = []
+                    break
+                selected.extend(turn)
+                used += turn_tokens
+                turn = []
+                turn_tokens = 0
+        
+        # 最前面没有用户消息的回复（如欢迎语）也算一轮
+        if turn and used + turn_tokens <= self.max_history_tokens:
+            selected.extend(turn)
+        
+        selected.reverse()
+        return selected
+
+
+def _role(message: Message) -> str:
+    """获取消息角色"""
+    if isinstance(message, HistoryMessage):
+        return message.role
+    return message.get("role", "")
@@ -0,0 +1,236 @@
+"""
+对话历史存储
+定长环形缓冲区保存最近的消息，可选压缩归档用于导出完整对话，
+并保存较早轮次的滚动摘要
+"""
+import json
+import zlib
+from collections import deque
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+
+class HistoryMessage:
+    """单条对话消息（使用 __slots__ 减少内存占用）"""
+    
+    __slots__ = ("role", "content", "token_count", "seq")
+    
+    def __init__(self, role: str, content: str, seq: int = 0):
+        """
+        初始化消息
+        
+        Args:
+            role: 角色（user / assistant）
+            content: 消息内容（assistant 消息只保存 bot_reply 文本）
+            seq: 在整个对话中的序号（单调递增）
+        """
+        self.role = role
+        self.content = content
+        self.seq = seq
+        # token 数在第一次构建上下文时计算并缓存
+        self.token_count: Optional[int] = None
+    
+    def to_dict(self) -> Dict:
+        """转换为字典格式"""
+        return {"role": self.role, "content": self.content}
+    
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, HistoryMessage):
+            return NotImplemented
+        return self.role == other.role and self.content == other.content
+    
+    def __repr__(self) -> str:
+        return f"HistoryMessage(role={self.role!r}, content={self.content!r})"
+
+
+class ConversationHistory:
+    """
+    有界对话历史
+    只保留最近 max_messages 条消息，长对话内存占用恒定；
+    开启 archive 时，所有消息会以 zlib 压缩后追加到归档中，供导出使用
+    """
+    
+    def __init__(self, max_messages: int = 20, archive: bool = False):
+        """
+        初始化对话历史
+        
+        Args:
+            max_messages: 环形缓冲区保留的最大消息数
+            archive: 是否保存压缩归档
+        """
+        self.max_messages = max_messages
+        self._messages: deque = deque(maxlen=max_messages)
+        self._next_seq = 0
+        
+        # 滚动摘要：summary 覆盖序号 <= summary_seq 的消息；
+        # pending_summary 保存已移出缓冲区、尚未并入摘要的消息
+        self.summary = ""
+        self.summary_seq = -1
+        self.pending_summary: List[HistoryMessage] = []
+        self._archive: Optional[bytearray] = bytearray() if archive else None
+        self._compressor = zlib.compressobj() if archive else None
+    
+    @classmethod
+    def from_dicts(cls, messages: Iterable[Dict], max_messages: int = 20,
+                   archive: bool = False) -> "ConversationHistory":
+        """
+        从字典列表创建对话历史
+        
+        Args:
+            messages: [{"role": ..., "content": ...}, ...]
+            max_messages: 环形缓冲区保留的最大消息数
+            archive: 是否保存压缩归档
+            
+        Returns:
+            ConversationHistory: 对话历史
+        """
+        history = cls(max_messages=max_messages, archive=archive)
+        for msg in messages:
+            history.append(msg.get("role", ""), msg.get("content", ""))
+        return history
+    
+    def append(self, role: str, content: str) -> Optional[HistoryMessage]:
+        """
+        追加一条消息
+        
+        Args:
+            role: 角色（user / assistant）
+            content: 消息内容
+            
+        Returns:
+            HistoryMessage: 因缓冲区已满被移出的最旧消息，没有则返回 None
+        """
+        evicted = None
+        if len(self._messages) == self.max_messages and self.max_messages > 0:
+            evicted = self._messages[0]
+        
+        message = HistoryMessage(role, content, self._next_seq)
+        self._next_seq += 1
+        self._messages.append(message)
+        
+        if self._archive is not None:
+            line = json.dumps(message.to_dict(), ensure_ascii=False) + "\n"
+            self._archive += self._compressor.compress(line.encode("utf-8"))
+            self._archive += self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        
+        return evicted
+    
+    def add_turn(self, user_message: str, bot_reply: str) -> List[HistoryMessage]:
+        """
+        追加一轮对话（用户消息 + Bot 回复）
+        
+        Args:
+            user_message: 用户消息
+            bot_reply: Bot 回复文本（不保存原始 JSON）
+            
+        Returns:
+            List[HistoryMessage]: 被移出缓冲区的消息
+        """
+        evicted = []
+        for role, content in (("user", user_message), ("assistant", bot_reply)):
+            message = self.append(role, content)
+            if message is not None:
+                evicted.append(message)
+        return evicted
+    
+    def restore(self, pairs: Sequence[Tuple[Optional[str], Optional[str]]],
+                reply_of: Optional[Callable[[str], Optional[str]]] = None) -> int:
+        """
+        从界面上显示的对话记录重建历史（会话过期或被淘汰后，界面仍显示之前的对话时使用）
+        只在历史为空时重建；缓冲区只保留最近的消息，与正常追加时相同
+        
+        Args:
+            pairs: Gradio Chatbot 的对话记录 [(用户消息, 回复), ...]（任一侧为空的记录跳过）
+            reply_of: 从显示内容中取出 Bot 回复文本的函数（返回 None 时跳过该轮，为 None 时原样保存）
+            
+        Returns:
+            int: 重建的轮数
+        """
+        if self._messages or self.summary:
+            return 0
+        
+        restored = 0
+        for user_msg, bot_msg in pairs:
+            reply = reply_of(bot_msg) if reply_of is not None and bot_msg else bot_msg
+            if user_msg and reply:
+                self.add_turn(user_msg, reply)
+                restored += 1
+        return restored
+    
+    def recent(self, count: int) -> List[HistoryMessage]:
+        """
+        获取最近的若干条消息（按时间顺序）
+        
+        Args:
+            count: 消息数量
+            
+        Returns:
+            List[HistoryMessage]: 消息列表
+        """
+        if count <= 0:
+            return []
+        start = max(len(self._messages) - count, 0)
+        return list(islice(self._messages, start, None))
+    
+    def unsummarized(self) -> List[HistoryMessage]:
+        """
+        获取缓冲区中尚未并入摘要的消息
+        
+        Returns:
+            List[HistoryMessage]: 消息列表（按时间顺序）
+        """
+        return [msg for msg in self._messages if msg.seq > self.summary_seq]
+    
+    @property
+    def next_seq(self) -> int:
+        """下一条消息的序号"""
+        return self._next_seq
+    
+    def to_dicts(self) -> List[Dict]:
+        """
+        获取缓冲区中的消息（字典格式）
+        
+        Returns:
+            List[Dict]: 消息字典列表
+        """
+        return [msg.to_dict() for msg in self._messages]
+    
+    def export(self) -> List[Dict]:
+        """
+        导出完整对话（开启归档时包含已移出缓冲区的消息）
+        
+        Returns:
+            List[Dict]: 消息字典列表
+        """
+        if self._archive is None:
+            return self.to_dicts()
+        
+        data = zlib.decompressobj().decompress(bytes(self._archive)).decode("utf-8")
+        return [json.loads(line) for line in data.splitlines() if line]
+    
+    @property
+    def archive_size(self) -> int:
+        """压缩归档占用的字节数"""
+        return len(self._archive) if self._archive is not None else 0
+    
+    def clear(self):
+        """清空对话历史、摘要和归档"""
+        self._messages.clear()
+        self.summary = ""
+        self.summary_seq = self._next_seq - 1
+        self.pending_summary = []
+        if self._archive is not None:
+            self._archive = bytearray()
+            self._compressor = zlib.compressobj()
+    
+    def __len__(self) -> int:
+        return len(self._messages)
+    
+    def __iter__(self) -> Iterator[HistoryMessage]:
+        return iter(self._messages)
+    
+    def __reversed__(self) -> Iterator[HistoryMessage]:
+        return reversed(self._messages)
+    
+    def __getitem__(self, index: int) -> HistoryMessage:
+        return self._messages[index]
@@ -0,0 +1,283 @@
+"""
+每轮对话的耗时与 token 统计
+记录一轮对话的首 token 时间、LLM 调用时间、解析校验时间、格式化时间和 token 用量，
+结束时按 scenario、model 标签写入直方图和计数器（通过 /metrics 端点导出）；
+开启链路追踪时每轮对话是一个根 span，各阶段是它的子 span
+"""
+import time
+from contextlib import contextmanager
+from typing import AsyncIterator, Iterator, List, Optional, TypeVar
+
+from src.metrics import MetricsRegistry, get_metrics_registry
+from src.tracing import NOOP_SPAN, Span, Tracer, get_tracer
+
+T = TypeVar("T")
+
+# 首 token 时间和总耗时的分桶上界（秒）
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 7.5, 10.0, 15.0, 20.0, 30.0, 60.0)
+# 解析和格式化耗时的分桶上界（秒）
+PROCESSING_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+class TurnRecord:
+    """
+    一轮对话的统计数据
+    由 Gradio 处理函数或场景、ConversationAgent 的 generate_response 创建，并显式传给调用器累加 token 用量
+    """
+    
+    def __init__(self, scenario: str, model: str, span: Span = NOOP_SPAN):
+        """
+        初始化统计数据
+        
+        Args:
+            scenario: 场景名称
+            model: 模型名称
+            span: 本轮的根 span（未开启追踪时为空 span）
+        """
+        self.scenario = scenario
+        self.model = model
+        self.span = span
+        self.started = time.perf_counter()
+        self.time_to_first_token: Optional[float] = None
+        self.history_seconds = 0.0
+        self.llm_seconds = 0.0
+        self.parse_seconds = 0.0
+        self.validate_seconds = 0.0
+        self.format_seconds = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.outcome = "ok"
+        # 正在进行的阶段 span（新阶段挂在最内层的 span 下面）
+        self._spans: List[Span] = [span]
+    
+    def mark_first_token(self):
+        """记录首 token 到达时间（只记录第一次）"""
+        if self.time_to_first_token is None:
+            self.time_to_first_token = time.perf_counter() - self.started
+    
+    def add_tokens(self, prompt_tokens: int, completion_tokens: int):
+        """
+        累加 token 用量
+        
+        Args:
+            prompt_tokens: 提示词 token 数
+            completion_tokens: 输出 token 数
+        """
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+    
+    @contextmanager
+    def stage(self, name: str):
+        """
+        统计一个阶段的耗时并记录为子 span（history、llm、parse、validate 或 format）
+        
+        Args:
+            name: 阶段名称
+        """
+        span = self._spans[-1].child(name)
+        self._spans.append(span)
+        try:
+            with self.timed(name):
+                yield
+        except Exception as e:
+            span.record_error(e)
+            raise
+        finally:
+            self._spans.pop()
+            span.end()
+    
+    @contextmanager
+    def timed(self, name: str):
+        """
+        只累加一个阶段的耗时，不记录 span（用于流式输出中每个片段的处理，同一阶段多次进入时累加）
+        
+        Args:
+            name: 阶段名称
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            attribute = f"{name}_seconds"
+            setattr(self, attribute, getattr(self, attribute) + time.perf_counter() - start)
+    
+    def track(self, chunks: Iterator[T]) -> Iterator[T]:
+        """
+        统计流式输出：等待每个片段的时间计入 LLM 时间，第一个片段到达时记录首 token 时间，
+        整个流记录为一个 llm span
+        
+        Args:
+            chunks: LLM 输出片段
+            
+        Yields:
+            原样产出的片段
+        """
+        span = self._spans[-1].child("llm")
+        try:
+            iterator = iter(chunks)
+            while True:
+                with self.timed("llm"):
+                    try:
+                        chunk = next(iterator)
+                    except StopIteration:
+                        return
+                self._first_chunk(span)
+                yield chunk
+        except Exception as e:
+            span.record_error(e)
+            raise
+        finally:
+            span.end()
+    
+    async def atrack(self, chunks: AsyncIterator[T]) -> AsyncIterator[T]:
+        """
+        统计异步流式输出（同 track）
+        
+        Args:
+            chunks: LLM 输出片段
+            
+        Yields:
+            原样产出的片段
+        """
+        span = self._spans[-1].child("llm")
+        try:
+            iterator = chunks.__aiter__()
+            while True:
+                with self.timed("llm"):
+                    try:
+                        chunk = await iterator.__anext__()
+                    except StopAsyncIteration:
+                        return
+                self._first_chunk(span)
+                yield chunk
+        except Exception as e:
+            span.record_error(e)
+            raise
+        finally:
+            span.end()
+    
+    def _first_chunk(self, span: Span):
+        """第一个片段到达时记录首 token 时间"""
+        if self.time_to_first_token is None:
+            self.mark_first_token()
+            span.set_attribute("time_to_first_token_ms", round(self.time_to_first_token * 1000, 3))
+    
+    @property
+    def duration(self) -> float:
+        """从开始到现在的秒数"""
+        return time.perf_counter() - self.started
+
+
+class TurnInstrumentation:
+    """
+    每轮对话的统计入口
+    外层（Gradio 处理函数）已经开始统计时，内层的 generate_response 沿用同一条记录，只由外层写入指标
+    """
+    
+    def __init__(self, metrics: Optional[MetricsRegistry] = None, tracer: Optional[Tracer] = None):
+        """
+        初始化统计入口
+        
+        Args:
+            metrics: 指标注册表（默认使用全局注册表）
+            tracer: 链路追踪器（默认使用按配置创建的全局追踪器）
+        """
+        self.tracer = tracer or get_tracer()
+        metrics = metrics or get_metrics_registry()
+        self._turns = metrics.counter(
+            "turns_total", "对话轮数（按 scenario、model、outcome=ok/error 统计）"
+        )
+        self._duration = metrics.histogram(
+            "turn_duration_seconds", "一轮对话的总耗时（按 scenario、model 统计）", LATENCY_BUCKETS
+        )
+        self._first_token = metrics.histogram(
+            "turn_time_to_first_token_seconds", "从收到消息到 LLM 输出首个 token 的时间（按 scenario、model 统计）",
+            LATENCY_BUCKETS
+        )
+        self._llm = metrics.histogram(
+            "turn_llm_seconds", "一轮对话中等待 LLM 输出的总时间（按 scenario、model 统计）", LATENCY_BUCKETS
+        )
+        self._parse = metrics.histogram(
+            "turn_parse_seconds", "一轮对话中解析和校验 LLM 输出的时间（按 scenario、model 统计）",
+            PROCESSING_BUCKETS
+        )
+        self._format = metrics.histogram(
+            "turn_format_seconds", "一轮对话中格式化显示内容的时间（按 scenario、model 统计）", PROCESSING_BUCKETS
+        )
+        self._prompt_tokens = metrics.counter(
+            "turn_prompt_tokens_total", "对话消耗的提示词 token 数（按 scenario、model 统计）"
+        )
+        self._completion_tokens = metrics.counter(
+            "turn_completion_tokens_total", "对话消耗的输出 token 数（按 scenario、model 统计）"
+        )
+    
+    @contextmanager
+    def turn(self, scenario: str, model: str, record: Optional[TurnRecord] = None) -> Iterator[TurnRecord]:
+        """
+        统计一轮对话
+        
+        Args:
+            scenario: 场景名称
+            model: 模型名称
+            record: 外层已经创建的记录（传入时直接沿用，不重复写入指标）
+            
+        Yields:
+            TurnRecord: 本轮的统计数据
+        """
+        if record is not None:
+            yield record
+            return
+        
+        record = TurnRecord(scenario, model, self.tracer.start_span("turn", scenario=scenario, model=model))
+        try:
+            yield record
+        except Exception as e:
+            record.outcome = "error"
+            record.span.record_error(e)
+            raise
+        finally:
+            self.finish(record)
+    
+    def finish(self, record: TurnRecord):
+        """
+        把一轮对话的统计数据写入指标
+        
+        Args:
+            record: 统计数据
+        """
+        labels = {"scenario": record.scenario, "model": record.model}
+        self._turns.inc(outcome=record.outcome, **labels)
+        self._duration.observe(record.duration, **labels)
+        if record.time_to_first_token is not None:
+            self._first_token.observe(record.time_to_first_token, **labels)
+        self._llm.observe(record.llm_seconds, **labels)
+        self._parse.observe(record.parse_seconds + record.validate_seconds, **labels)
+        self._format.observe(record.format_seconds, **labels)
+        self._prompt_tokens.inc(record.prompt_tokens, **labels)
+        self._completion_tokens.inc(record.completion_tokens, **labels)
+        
+        record.span.set_attribute("outcome", record.outcome)
+        if record.outcome == "error" and record.span.status == "OK":
+            record.span.set_status("ERROR", "error response returned")
+        record.span.set_attribute("prompt_tokens", record.prompt_tokens)
+        record.span.set_attribute("completion_tokens", record.completion_tokens)
+        if record.time_to_first_token is not None:
+            record.span.set_attribute("time_to_first_token_ms", round(record.time_to_first_token * 1000, 3))
+        record.span.end()
+
+
+# 全局统计入口
+_instrumentation: Optional[TurnInstrumentation] = None
+
+
+def get_turn_instrumentation() -> TurnInstrumentation:
+    """
+    获取全局的每轮对话统计入口
+    
+    Returns:
+        TurnInstrumentation: 统计入口
+    """
+    global _instrumentation
+    if _instrumentation is None:
+        _instrumentation = TurnInstrumentation()
+    return _instrumentation
@@ -0,0 +1,35 @@
+"""
+LLM 调用相关模块
+包含客户端注册表、调用路径、请求调度、对冲请求、多后端路由、响应缓存、语义近似缓存、JSON 提取与修复、流式输出解析、结构化输出等公共组件
+"""
+import importlib
+
+# 导出名称 -> 所在子模块（首次访问时才导入，避免导入包时加载 httpx、numpy 等依赖）
+_EXPORTS = {
+    'LLMClientRegistry': '.client_registry',
+    'Hedger': '.hedging',
+    'LLMInvoker': '.invoker',
+    'JSONObjectScanner': '.json_extract',
+    'JSONRepairer': '.json_repair',
+    'PartialJSONParser': '.json_stream',
+    'LLMPool': '.pool',
+    'ResponseCache': '.response_cache',
+    'LLMScheduler': '.scheduler',
+    'SchedulerBusyError': '.scheduler',
+    'SemanticCache': '.semantic_cache',
+    'StructuredOutput': '.structured_output',
+    'TeachingResponse': '.structured_output'
+}
+
+
+def __getattr__(name):
+    """按需导入导出的类"""
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+__all__ = list(_EXPORTS)
@@ -0,0 +1,145 @@
+"""
+LLM 客户端注册表
+按 (模型, Base URL, API Key, 温度) 复用聊天模型实例，所有实例共享同一个 HTTP 连接池
+"""
+import threading
+from typing import TYPE_CHECKING, Callable, Dict, Optional, Tuple
+
+if TYPE_CHECKING:
+    import httpx
+
+ClientKey = Tuple[str, Optional[str], Optional[str], float]
+
+
+class LLMClientRegistry:
+    """
+    LLM 客户端注册表
+    相同配置的场景和智能体拿到同一个客户端；不同配置的客户端共享 keep-alive 连接池，
+    避免每个实例各自建立 TLS 连接
+    """
+    
+    def __init__(self, max_connections: int = 100, max_keepalive_connections: int = 20,
+                 keepalive_expiry: float = 60.0, timeout: float = 60.0):
+        """
+        初始化注册表
+        
+        Args:
+            max_connections: 连接池最大连接数
+            max_keepalive_connections: 最大空闲保活连接数
+            keepalive_expiry: 空闲连接保活时间（秒）
+            timeout: 请求超时时间（秒）
+        """
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self._clients: Dict[ClientKey, object] = {}
+        # HTTP 客户端在创建第一个 LLM 客户端时才建立（httpx 也在那时导入，缩短启动时间）
+        self._http_client: Optional["httpx.Client"] = None
+        self._http_async_client: Optional["httpx.AsyncClient"] = None
+        self._lock = threading.Lock()
+    
+    @property
+    def limits(self) -> "httpx.Limits":
+        """连接池限制"""
+        import httpx
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry
+        )
+    
+    @classmethod
+    def from_config(cls, pool_config: Dict) -> "LLMClientRegistry":
+        """
+        根据配置创建注册表
+        
+        Args:
+            pool_config: 配置中的 connection_pool 段
+            
+        Returns:
+            LLMClientRegistry: 注册表
+        """
+        return cls(
+            max_connections=pool_config.get("max_connections", 100),
+            max_keepalive_connections=pool_config.get("max_keepalive_connections", 20),
+            keepalive_expiry=pool_config.get("keepalive_expiry", 60.0),
+            timeout=pool_config.get("timeout", 60.0)
+        )
+    
+    @staticmethod
+    def make_key(model_name: str, temperature: float, api_key: Optional[str] = None,
+                 base_url: Optional[str] = None) -> ClientKey:
+        """
+        生成客户端键
+        
+        Args:
+            model_name: 模型名称
+            temperature: 温度参数
+            api_key: API Key
+            base_url: Base URL
+            
+        Returns:
+            tuple: (模型, Base URL, API Key, 温度)
+        """
+        return (model_name, base_url or None, api_key or None, float(temperature))
+    
+    def get(self, factory: Callable, model_name: str, temperature: float,
+            api_key: Optional[str] = None, base_url: Optional[str] = None):
+        """
+        获取共享客户端，不存在时用 factory 创建
+        
+        Args:
+            factory: 聊天模型类（如 ChatOpenAI）
+            model_name: 模型名称
+            temperature: 温度参数
+            api_key: API Key
+            base_url: Base URL
+            
+        Returns:
+            聊天模型实例
+        """
+        key = self.make_key(model_name, temperature, api_key, base_url)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                llm_kwargs = {
+                    "model": model_name,
+                    "temperature": temperature,
+                    "http_client": self._get_http_client(),
+                    "http_async_client": self._get_http_async_client()
+                }
+                if api_key:
+                    llm_kwargs["api_key"] = api_key
+                if base_url:
+                    llm_kwargs["base_url"] = base_url
+                client = factory(**llm_kwargs)
+                self._clients[key] = client
+            return client
+    
+    def discard(self, key: ClientKey):
+        """
+        从注册表移除客户端（已持有该客户端的对象不受影响，共享连接池保持打开）
+        
+        Args:
+            key: make_key 生成的客户端键
+        """
+        with self._lock:
+            self._clients.pop(key, None)
+    
+    def _get_http_client(self) -> "httpx.Client":
+        """获取共享的同步 HTTP 客户端（首次使用时创建）"""
+        if self._http_client is None:
+            import httpx
+            self._http_client = httpx.Client(limits=self.limits, timeout=self.timeout)
+        return self._http_client
+    
+    def _get_http_async_client(self) -> "httpx.AsyncClient":
+        """获取共享的异步 HTTP 客户端（首次使用时创建）"""
+        if self._http_async_client is None:
+            import httpx
+            self._http_async_client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+        return self._http_async_client
+    
+    def __len__(self) -> int:
+        return len(self._clients)
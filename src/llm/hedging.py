@@ -0,0 +1,249 @@
+"""
+对冲请求
+异步调用在按最近延迟分位数计算的等待时间内还没有拿到首个 token 时，再发起一个相同的请求
+（配置了后端池时发往另一个后端），使用先返回的结果并取消另一个，用少量额外请求削减尾延迟
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple, TypeVar
+
+from src.metrics import MetricsRegistry, get_metrics_registry
+
+T = TypeVar("T")
+
+
+class Hedger:
+    """
+    对冲请求执行器
+    每个模型分别统计非流式调用的完整响应延迟和流式调用的首个 token 延迟；对冲次数不超过调用次数的 max_hedge_ratio，
+    调用方还可以通过 can_hedge 在系统繁忙（如调度队列中有请求排队）时禁止对冲
+    """
+    
+    def __init__(self, percentile: float = 95.0, min_delay: float = 0.5, initial_delay: float = 3.0,
+                 window: int = 200, min_samples: int = 20, max_hedge_ratio: float = 0.1,
+                 alternate_backend: bool = True, metrics: Optional[MetricsRegistry] = None):
+        """
+        初始化对冲执行器
+        
+        Args:
+            percentile: 对冲等待时间取最近首 token 延迟的第几百分位
+            min_delay: 最短等待时间（秒）
+            initial_delay: 样本不足时的等待时间（秒）
+            window: 每个模型（流式和非流式分开）保留的最近延迟样本数
+            min_samples: 样本数达到该值后才按分位数计算等待时间
+            max_hedge_ratio: 对冲请求数占调用数的最大比例
+            alternate_backend: 使用后端池时是否把对冲请求发往另一个后端
+            metrics: 指标注册表（默认使用全局注册表）
+        """
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.initial_delay = initial_delay
+        self.window = window
+        self.min_samples = min_samples
+        self.max_hedge_ratio = max_hedge_ratio
+        self.alternate_backend = alternate_backend
+        # (模型名称, 是否流式) -> 最近延迟：完整响应时间与首个 token 时间不能混在一个分位数里
+        self._latencies: Dict[Tuple[str, bool], Deque[float]] = {}
+        self._lock = threading.Lock()
+        
+        metrics = metrics or get_metrics_registry()
+        self._calls = metrics.counter(
+            "llm_hedge_calls_total", "可对冲的调用次数（按 model 统计）"
+        )
+        self._fired = metrics.counter(
+            "llm_hedge_fired_total", "发出对冲请求的次数（按 model 统计）"
+        )
+        self._wins = metrics.counter(
+            "llm_hedge_wins_total", "对冲请求先于原请求返回的次数（按 model 统计）"
+        )
+    
+    @classmethod
+    def from_config(cls, hedging_config: Dict) -> Optional["Hedger"]:
+        """
+        根据对冲配置创建执行器
+        
+        Args:
+            hedging_config: 配置中的 hedging 段
+            
+        Returns:
+            Hedger: 对冲执行器，未启用时返回 None
+        """
+        if not hedging_config.get("enabled", False):
+            return None
+        return cls(
+            percentile=hedging_config.get("percentile", 95.0),
+            min_delay=hedging_config.get("min_delay", 0.5),
+            initial_delay=hedging_config.get("initial_delay", 3.0),
+            window=hedging_config.get("window", 200),
+            min_samples=hedging_config.get("min_samples", 20),
+            max_hedge_ratio=hedging_config.get("max_hedge_ratio", 0.1),
+            alternate_backend=hedging_config.get("alternate_backend", True)
+        )
+    
+    def delay(self, key: str, stream: bool = False) -> float:
+        """
+        获取发出对冲请求前的等待时间
+        
+        Args:
+            key: 模型名称
+            stream: 是否为流式调用（流式调用按首个 token 延迟计算，非流式调用按完整响应延迟计算）
+            
+        Returns:
+            float: 等待秒数
+        """
+        with self._lock:
+            samples = sorted(self._latencies.get((key, stream), ()))
+        if len(samples) < self.min_samples:
+            return self.initial_delay
+        index = min(len(samples) - 1, max(0, math.ceil(self.percentile / 100 * len(samples)) - 1))
+        return max(self.min_delay, samples[index])
+    
+    def record(self, key: str, seconds: float, stream: bool = False):
+        """
+        记录一次调用拿到首个 token（非流式调用为完整响应）的延迟
+        
+        Args:
+            key: 模型名称
+            seconds: 延迟秒数
+            stream: 是否为流式调用
+        """
+        with self._lock:
+            latencies = self._latencies.get((key, stream))
+            if latencies is None:
+                latencies = self._latencies[(key, stream)] = deque(maxlen=self.window)
+            latencies.append(seconds)
+    
+    def hedge_rate(self, key: str) -> float:
+        """
+        对冲请求数占调用数的比例
+        
+        Args:
+            key: 模型名称
+            
+        Returns:
+            float: 0 到 1 之间的比例
+        """
+        calls = self._calls.value(model=key)
+        return self._fired.value(model=key) / calls if calls else 0.0
+    
+    def win_rate(self, key: str) -> float:
+        """
+        对冲请求先返回的次数占对冲次数的比例
+        
+        Args:
+            key: 模型名称
+            
+        Returns:
+            float: 0 到 1 之间的比例
+        """
+        fired = self._fired.value(model=key)
+        return self._wins.value(model=key) / fired if fired else 0.0
+    
+    async def run(self, key: str, primary: Callable[[], Awaitable[T]], hedge: Callable[[], Awaitable[T]],
+                  can_hedge: Optional[Callable[[], bool]] = None) -> T:
+        """
+        执行可对冲的异步调用
+        
+        Args:
+            key: 模型名称
+            primary: 发起原请求的函数
+            hedge: 发起对冲请求的函数
+            can_hedge: 到达等待时间时判断是否允许对冲的函数
+            
+        Returns:
+            先成功返回的结果（两个请求都失败时抛出原请求的异常）
+        """
+        self._calls.inc(model=key)
+        start = time.perf_counter()
+        tasks = [asyncio.ensure_future(primary())]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.delay(key))
+            if not done and self._should_hedge(key, can_hedge):
+                self._fired.inc(model=key)
+                tasks.append(asyncio.ensure_future(hedge()))
+            winner = await self._first_success(tasks)
+            result = winner.result()
+            self.record(key, time.perf_counter() - start)
+            if winner is not tasks[0]:
+                self._wins.inc(model=key)
+            return result
+        finally:
+            for task in tasks:
+                await self._cancel(task)
+    
+    async def stream(self, key: str, primary: Callable[[], AsyncIterator[T]],
+                     hedge: Callable[[], AsyncIterator[T]],
+                     can_hedge: Optional[Callable[[], bool]] = None) -> AsyncIterator[T]:
+        """
+        执行可对冲的异步流式调用（等待时间内没有收到首个片段时发出对冲请求，之后只产出先到达首个片段的流）
+        
+        Args:
+            key: 模型名称
+            primary: 返回原请求片段异步迭代器的函数
+            hedge: 返回对冲请求片段异步迭代器的函数
+            can_hedge: 到达等待时间时判断是否允许对冲的函数
+            
+        Yields:
+            先到达首个片段的流的所有片段
+        """
+        self._calls.inc(model=key)
+        start = time.perf_counter()
+        streams: List[AsyncIterator[T]] = [primary()]
+        tasks = [asyncio.ensure_future(streams[0].__anext__())]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.delay(key, stream=True))
+            if not done and self._should_hedge(key, can_hedge):
+                self._fired.inc(model=key)
+                streams.append(hedge())
+                tasks.append(asyncio.ensure_future(streams[1].__anext__()))
+            winner = await self._first_success(tasks)
+            index = tasks.index(winner)
+            if index > 0:
+                self._wins.inc(model=key)
+            # 取消落后的请求，只保留胜出的流
+            for task, loser in zip(tasks, streams):
+                if task is not winner:
+                    await self._cancel(task)
+                    await loser.aclose()
+            
+            try:
+                first = winner.result()
+            except StopAsyncIteration:
+                return
+            self.record(key, time.perf_counter() - start, stream=True)
+            yield first
+            async for chunk in streams[index]:
+                yield chunk
+        finally:
+            for task, stream in zip(tasks, streams):
+                await self._cancel(task)
+                await stream.aclose()
+    
+    def _should_hedge(self, key: str, can_hedge: Optional[Callable[[], bool]]) -> bool:
+        """判断是否发出对冲请求（不超过对冲比例上限，且调用方允许）"""
+        calls = self._calls.value(model=key)
+        if self._fired.value(model=key) + 1 > calls * self.max_hedge_ratio:
+            return False
+        return can_hedge is None or can_hedge()
+    
+    @staticmethod
+    async def _first_success(tasks: List[asyncio.Future]) -> asyncio.Future:
+        """等待第一个成功完成的任务（流已结束也算成功），都失败时抛出第一个任务的异常"""
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(done, key=tasks.index):
+                error = task.exception()
+                if error is None or isinstance(error, StopAsyncIteration):
+                    return task
+        raise tasks[0].exception()
+    
+    @staticmethod
+    async def _cancel(task: asyncio.Future):
+        """取消未完成的任务并等待其结束"""
+        if not task.done():
+            task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
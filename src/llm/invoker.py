@@ -0,0 +1,461 @@
+"""
+LLM 调用路径
+ConversationAgent 与所有场景共用的调用入口，在 llm.invoke / stream 之前统一处理缓存等逻辑，
+合并同时到达的相同请求，经调度器限流后再调用 LLM（异步调用可对冲慢请求），并根据服务端返回的
+usage 元数据记录提示词 token 用量（区分命中服务端前缀缓存的部分）
+"""
+import time
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Hashable, Iterator, List, Optional, Tuple
+
+from src.instrumentation import TurnRecord
+from src.llm.hedging import Hedger
+from src.llm.pool import LLMPool
+from src.llm.response_cache import ResponseCache, make_cache_key
+from src.llm.scheduler import LLMScheduler
+from src.llm.single_flight import SingleFlight
+from src.metrics import MetricsRegistry, get_metrics_registry
+
+if TYPE_CHECKING:
+    from src.llm.semantic_cache import SemanticCache
+
+
+class LLMInvoker:
+    """
+    LLM 调用器
+    同步、异步和流式调用都经过这里，返回 LLM 输出的文本内容
+    """
+    
+    def __init__(self, response_cache: Optional[ResponseCache] = None,
+                 semantic_cache: Optional["SemanticCache"] = None, stream_usage: bool = True,
+                 coalesce: bool = True, scheduler: Optional[LLMScheduler] = None,
+                 hedger: Optional[Hedger] = None, metrics: Optional[MetricsRegistry] = None):
+        """
+        初始化调用器
+        
+        Args:
+            response_cache: 响应缓存（为 None 时不使用缓存）
+            semantic_cache: 语义近似缓存（只对传入 scenario 的首轮请求生效）
+            stream_usage: 流式调用时是否请求服务端返回 usage 元数据
+            coalesce: 是否合并同时进行的相同请求（同一模型实例、相同消息只发起一次调用）
+            scheduler: 请求调度器（限流、排队和退避重试；为 None 时直接调用）
+            hedger: 对冲请求执行器（只用于异步调用；为 None 时不对冲）
+            metrics: 指标注册表（默认使用全局注册表）
+        """
+        self.response_cache = response_cache
+        self.semantic_cache = semantic_cache
+        self.stream_usage = stream_usage
+        self.single_flight = SingleFlight() if coalesce else None
+        self.scheduler = scheduler
+        self.hedger = hedger
+        metrics = metrics or get_metrics_registry()
+        self._prompt_tokens = metrics.counter(
+            "llm_prompt_tokens_total", "提示词 token 数（按 model、cache=cached/uncached 统计；后端池调用的 model 为后端名称）"
+        )
+        self._completion_tokens = metrics.counter(
+            "llm_completion_tokens_total", "输出 token 数（按 model 统计；后端池调用的 model 为后端名称）"
+        )
+        self._coalesced = metrics.counter(
+            "llm_coalesced_requests_total", "与进行中的相同请求合并、未单独调用 LLM 的请求数（按 model 统计）"
+        )
+    
+    @classmethod
+    def from_config(cls, config) -> "LLMInvoker":
+        """
+        根据配置创建调用器
+        
+        Args:
+            config: Config 实例
+            
+        Returns:
+            LLMInvoker: 调用器
+        """
+        semantic_cache = None
+        semantic_config = config.get_semantic_cache_config()
+        if semantic_config.get("enabled"):
+            # 语义缓存依赖 NumPy，只在启用时导入
+            from src.llm.semantic_cache import SemanticCache
+            semantic_cache = SemanticCache.from_config(semantic_config)
+        
+        return cls(
+            response_cache=ResponseCache.from_config(config.get_cache_config()),
+            semantic_cache=semantic_cache,
+            stream_usage=config.get_llm_config().get("stream_usage", True),
+            coalesce=config.get_llm_config().get("coalesce_requests", True),
+            scheduler=LLMScheduler.from_config(config.get_scheduler_config()),
+            hedger=Hedger.from_config(config.get_hedging_config())
+        )
+    
+    def invoke(self, llm, messages: List, model_name: str, temperature: float,
+               scenario: Optional[str] = None, session: Optional[str] = None,
+               turn: Optional[TurnRecord] = None) -> str:
+        """
+        同步调用 LLM
+        
+        Args:
+            llm: 聊天模型
+            messages: 消息列表
+            model_name: 模型名称（用于缓存键）
+            temperature: 温度参数（用于缓存键）
+            scenario: 场景名称（传入时启用语义近似缓存）
+            session: 会话标识（调度器按会话轮流放行排队的请求）
+            turn: 本轮对话的统计数据（传入时累加实际调用的 token 用量）
+            
+        Returns:
+            str: LLM 输出内容
+        """
+        key, cached = self._lookup(llm, messages, model_name, temperature, scenario)
+        if cached is not None:
+            return cached
+        
+        tokens = self._estimate_tokens(messages)
+        
+        def request() -> str:
+            start = time.perf_counter()
+            response = llm.invoke(messages)
+            content = response.content
+            self._record_usage(self._served_by(response, model_name), getattr(response, "usage_metadata", None),
+                               tokens, turn)
+            self._store(key, llm, messages, model_name, temperature, scenario, content, time.perf_counter() - start)
+            return content
+        
+        def call() -> str:
+            if self.scheduler is None:
+                return request()
+            return self.scheduler.run(request, session, tokens)
+        
+        if self.single_flight is None:
+            return call()
+        content, shared = self.single_flight.do(self._flight_key(llm, messages, model_name, temperature), call)
+        self._record_coalesced(model_name, shared)
+        return content
+    
+    async def ainvoke(self, llm, messages: List, model_name: str, temperature: float,
+                      scenario: Optional[str] = None, session: Optional[str] = None,
+                      turn: Optional[TurnRecord] = None) -> str:
+        """
+        异步调用 LLM
+        
+        Args:
+            llm: 聊天模型
+            messages: 消息列表
+            model_name: 模型名称（用于缓存键）
+            temperature: 温度参数（用于缓存键）
+            scenario: 场景名称（传入时启用语义近似缓存）
+            session: 会话标识（调度器按会话轮流放行排队的请求）
+            turn: 本轮对话的统计数据（传入时累加实际调用的 token 用量）
+            
+        Returns:
+            str: LLM 输出内容
+        """
+        key, cached = await self._alookup(llm, messages, model_name, temperature, scenario)
+        if cached is not None:
+            return cached
+        
+        tokens = self._estimate_tokens(messages)
+        
+        async def request(target=llm) -> str:
+            start = time.perf_counter()
+            response = await target.ainvoke(messages)
+            content = response.content
+            self._record_usage(self._served_by(response, model_name), getattr(response, "usage_metadata", None),
+                               tokens, turn)
+            await self._astore(key, llm, messages, model_name, temperature, scenario, content,
+                               time.perf_counter() - start)
+            return content
+        
+        async def scheduled(target=llm) -> str:
+            if self.scheduler is None:
+                return await request(target)
+            return await self.scheduler.arun(lambda: request(target), session, tokens)
+        
+        async def call() -> str:
+            if self.hedger is None:
+                return await scheduled()
+            primary, alternate = self._hedge_targets(llm)
+            return await self.hedger.run(model_name, lambda: scheduled(primary), lambda: scheduled(alternate),
+                                         self._can_hedge)
+        
+        if self.single_flight is None:
+            return await call()
+        content, shared = await self.single_flight.ado(self._flight_key(llm, messages, model_name, temperature), call)
+        self._record_coalesced(model_name, shared)
+        return content
+    
+    def stream(self, llm, messages: List, model_name: str, temperature: float,
+               scenario: Optional[str] = None, session: Optional[str] = None,
+               turn: Optional[TurnRecord] = None) -> Iterator[str]:
+        """
+        流式调用 LLM（缓存命中时一次性产出完整内容）
+        
+        Args:
+            llm: 聊天模型
+            messages: 消息列表
+            model_name: 模型名称（用于缓存键）
+            temperature: 温度参数（用于缓存键）
+            scenario: 场景名称（传入时启用语义近似缓存）
+            session: 会话标识（调度器按会话轮流放行排队的请求）
+            turn: 本轮对话的统计数据（传入时累加实际调用的 token 用量）
+            
+        Yields:
+            str: 输出文本片段
+        """
+        key, cached = self._lookup(llm, messages, model_name, temperature, scenario)
+        if cached is not None:
+            yield cached
+            return
+        
+        tokens = self._estimate_tokens(messages)
+        
+        def request() -> Iterator[str]:
+            start = time.perf_counter()
+            parts = []
+            usage = None
+            served_by = model_name
+            for chunk in llm.stream(messages, **self._stream_kwargs()):
+                usage = self._chunk_usage(chunk) or usage
+                served_by = self._served_by(chunk, served_by)
+                if chunk.content:
+                    parts.append(chunk.content)
+                    yield chunk.content
+            self._record_usage(served_by, usage, tokens, turn)
+            self._store(key, llm, messages, model_name, temperature, scenario, "".join(parts),
+                        time.perf_counter() - start)
+        
+        def call() -> Iterator[str]:
+            if self.scheduler is None:
+                return request()
+            return self.scheduler.stream(request, session, tokens)
+        
+        if self.single_flight is None:
+            yield from call()
+            return
+        chunks, shared = self.single_flight.stream(self._flight_key(llm, messages, model_name, temperature), call)
+        self._record_coalesced(model_name, shared)
+        yield from chunks
+    
+    async def astream(self, llm, messages: List, model_name: str, temperature: float,
+                      scenario: Optional[str] = None, session: Optional[str] = None,
+                      turn: Optional[TurnRecord] = None) -> AsyncIterator[str]:
+        """
+        异步流式调用 LLM（缓存命中时一次性产出完整内容）
+        
+        Args:
+            llm: 聊天模型
+            messages: 消息列表
+            model_name: 模型名称（用于缓存键）
+            temperature: 温度参数（用于缓存键）
+            scenario: 场景名称（传入时启用语义近似缓存）
+            session: 会话标识（调度器按会话轮流放行排队的请求）
+            turn: 本轮对话的统计数据（传入时累加实际调用的 token 用量）
+            
+        Yields:
+            str: 输出文本片段
+        """
+        key, cached = await self._alookup(llm, messages, model_name, temperature, scenario)
+        if cached is not None:
+            yield cached
+            return
+        
+        tokens = self._estimate_tokens(messages)
+        
+        async def request(target=llm) -> AsyncIterator[str]:
+            start = time.perf_counter()
+            parts = []
+            usage = None
+            served_by = model_name
+            async for chunk in target.astream(messages, **self._stream_kwargs()):
+                usage = self._chunk_usage(chunk) or usage
+                served_by = self._served_by(chunk, served_by)
+                if chunk.content:
+                    parts.append(chunk.content)
+                    yield chunk.content
+            self._record_usage(served_by, usage, tokens, turn)
+            await self._astore(key, llm, messages, model_name, temperature, scenario, "".join(parts),
+                               time.perf_counter() - start)
+        
+        def scheduled(target=llm) -> AsyncIterator[str]:
+            if self.scheduler is None:
+                return request(target)
+            return self.scheduler.astream(lambda: request(target), session, tokens)
+        
+        def call() -> AsyncIterator[str]:
+            if self.hedger is None:
+                return scheduled()
+            primary, alternate = self._hedge_targets(llm, stream=True)
+            return self.hedger.stream(model_name, lambda: scheduled(primary), lambda: scheduled(alternate),
+                                      self._can_hedge)
+        
+        if self.single_flight is None:
+            chunks = call()
+        else:
+            chunks, shared = self.single_flight.astream(self._flight_key(llm, messages, model_name, temperature), call)
+            self._record_coalesced(model_name, shared)
+        async for text in chunks:
+            yield text
+    
+    def _hedge_targets(self, llm, stream: bool = False) -> Tuple[object, object]:
+        """获取原请求和对冲请求使用的模型（后端池拆分为从不同后端开始尝试的两个视图）"""
+        if self.hedger.alternate_backend and isinstance(llm, LLMPool):
+            primary, alternate = llm.split(stream)
+            if alternate is not None:
+                return primary, alternate
+        return llm, llm
+    
+    def _can_hedge(self) -> bool:
+        """调度器中已有请求排队时不再对冲，避免在过载时放大请求量"""
+        return self.scheduler is None or self.scheduler.queued == 0
+    
+    @staticmethod
+    def _flight_key(llm, messages: List, model_name: str, temperature: float) -> Hashable:
+        """请求合并键：同一个模型实例（含绑定的参数）加上与缓存键相同的模型、温度和消息"""
+        return (id(llm), make_cache_key(model_name, temperature, messages))
+    
+    def _record_coalesced(self, model_name: str, shared: bool):
+        """记录合并到进行中请求的调用"""
+        if shared:
+            self._coalesced.inc(model=model_name)
+    
+    @staticmethod
+    def _cache_target(llm) -> Tuple[Optional[Dict], Optional[str]]:
+        """
+        缓存键中区分调用目标的部分
+        
+        Args:
+            llm: 聊天模型、绑定了参数的模型或后端池
+            
+        Returns:
+            tuple: (绑定的 response_format, 后端名称：后端池为池中所有后端的名称，单个模型为 Base URL)
+        """
+        if isinstance(llm, LLMPool):
+            return llm.bind_kwargs.get("response_format"), llm.backend_names
+        binding = None
+        kwargs = getattr(llm, "kwargs", None)
+        if isinstance(kwargs, dict):
+            # bind() 返回的 RunnableBinding：绑定参数在 kwargs 中，原模型在 bound 中
+            binding = kwargs.get("response_format")
+            llm = getattr(llm, "bound", llm)
+        base_url = getattr(llm, "openai_api_base", None)
+        return binding, base_url if isinstance(base_url, str) else None
+    
+    def _cache_key(self, llm, messages: List, model_name: str, temperature: float) -> Optional[str]:
+        """生成缓存键（未启用缓存或请求不可缓存时返回 None）"""
+        if self.response_cache is None or not self.response_cache.is_cacheable(messages, temperature):
+            return None
+        return make_cache_key(model_name, temperature, messages, *self._cache_target(llm))
+    
+    def _semantic_get(self, llm, messages: List, model_name: str, temperature: float,
+                      scenario: Optional[str]) -> Optional[str]:
+        """查询语义缓存（未传入场景或未启用时返回 None）"""
+        if scenario is None or self.semantic_cache is None:
+            return None
+        return self.semantic_cache.get(scenario, messages, model_name, temperature, *self._cache_target(llm))
+    
+    def _lookup(self, llm, messages: List, model_name: str, temperature: float,
+                scenario: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+        """依次查询精确缓存和语义缓存，返回 (精确缓存键, 缓存内容)"""
+        key = self._cache_key(llm, messages, model_name, temperature)
+        if key is not None:
+            cached = self.response_cache.get(key)
+            if cached is not None:
+                return key, cached
+        return key, self._semantic_get(llm, messages, model_name, temperature, scenario)
+    
+    async def _alookup(self, llm, messages: List, model_name: str, temperature: float,
+                       scenario: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+        """异步查询缓存（磁盘缓存在工作线程中读取，不阻塞事件循环）"""
+        key = self._cache_key(llm, messages, model_name, temperature)
+        if key is not None:
+            cached = await self.response_cache.aget(key)
+            if cached is not None:
+                return key, cached
+        return key, self._semantic_get(llm, messages, model_name, temperature, scenario)
+    
+    def _store(self, key: Optional[str], llm, messages: List, model_name: str, temperature: float,
+               scenario: Optional[str], content: str, latency: float):
+        """把 LLM 输出写入已启用的缓存"""
+        if key is not None:
+            self.response_cache.set(key, content, latency)
+        self._semantic_set(llm, messages, model_name, temperature, scenario, content)
+    
+    async def _astore(self, key: Optional[str], llm, messages: List, model_name: str, temperature: float,
+                      scenario: Optional[str], content: str, latency: float):
+        """异步写入缓存（磁盘缓存在工作线程中写入，不阻塞事件循环）"""
+        if key is not None:
+            await self.response_cache.aset(key, content, latency)
+        self._semantic_set(llm, messages, model_name, temperature, scenario, content)
+    
+    def _semantic_set(self, llm, messages: List, model_name: str, temperature: float,
+                      scenario: Optional[str], content: str):
+        """写入语义缓存（未传入场景或未启用时忽略）"""
+        if scenario is not None and self.semantic_cache is not None:
+            self.semantic_cache.set(scenario, messages, model_name, temperature, content, *self._cache_target(llm))
+    
+    def _stream_kwargs(self) -> Dict:
+        """流式调用参数（开启时在最后一个片段中返回 usage 元数据）"""
+        return {"stream_usage": True} if self.stream_usage else {}
+    
+    @staticmethod
+    def _served_by(message, default: str) -> str:
+        """
+        指标标签中的模型名称：后端池调用为实际处理请求的后端名称，单个模型为配置的模型名称
+        
+        Args:
+            message: 响应消息或流式片段（后端池在 response_metadata 中记录后端名称）
+            default: 没有后端名称时使用的名称
+            
+        Returns:
+            str: 标签值
+        """
+        metadata = getattr(message, "response_metadata", None)
+        if isinstance(metadata, dict) and isinstance(metadata.get("backend"), str):
+            return metadata["backend"]
+        return default
+    
+    @staticmethod
+    def _chunk_usage(chunk) -> Optional[Dict]:
+        """读取流式片段中的 usage 元数据"""
+        usage = getattr(chunk, "usage_metadata", None)
+        return usage if isinstance(usage, dict) else None
+    
+    def _estimate_tokens(self, messages: List) -> int:
+        """预估调用的 token 用量（未使用调度器时不需要预估）"""
+        return self.scheduler.estimate_tokens(messages) if self.scheduler is not None else 0
+    
+    def _record_usage(self, model_name: str, usage: Optional[Dict], estimated_tokens: int = 0,
+                      turn: Optional[TurnRecord] = None):
+        """
+        记录 token 用量，并按实际用量修正调度器的 TPM 额度
+        
+        Args:
+            model_name: 模型名称（后端池调用为实际处理请求的后端名称）
+            usage: LangChain usage_metadata（input_tokens、output_tokens，
+                   input_token_details.cache_read 为命中服务端前缀缓存的 token 数）
+            estimated_tokens: 调度器放行时预估的 token 用量
+            turn: 本轮对话的统计数据
+        """
+        if not isinstance(usage, dict):
+            return
+        input_tokens = usage.get("input_tokens") or 0
+        output_tokens = usage.get("output_tokens") or 0
+        cached_tokens = (usage.get("input_token_details") or {}).get("cache_read") or 0
+        self._prompt_tokens.inc(cached_tokens, model=model_name, cache="cached")
+        self._prompt_tokens.inc(max(input_tokens - cached_tokens, 0), model=model_name, cache="uncached")
+        self._completion_tokens.inc(output_tokens, model=model_name)
+        if self.scheduler is not None:
+            self.scheduler.correct_tokens(estimated_tokens, input_tokens + output_tokens)
+        if turn is not None:
+            turn.add_tokens(input_tokens, output_tokens)
+    
+    def prompt_cache_ratio(self, model_name: str) -> float:
+        """
+        提示词 token 中命中服务端前缀缓存的比例
+        
+        Args:
+            model_name: 模型名称（后端池调用为后端名称）
+            
+        Returns:
+            float: 0 到 1 之间的比例，没有记录时返回 0
+        """
+        cached = self._prompt_tokens.value(model=model_name, cache="cached")
+        total = cached + self._prompt_tokens.value(model=model_name, cache="uncached")
+        return cached / total if total else 0.0
@@ -0,0 +1,141 @@
+"""
+JSON 对象提取
+在 LLM 输出中一次线性扫描找到第一个括号配平的 JSON 对象，容忍代码块标记和前面的说明文字，
+既可以直接处理完整字符串，也可以在流式输出时逐段喂入
+"""
+import json
+import re
+from typing import Any, Dict, Optional
+
+# 扫描时只需要关心的字符，其余字符由正则整段跳过：对象外只看括号和引号，字符串内只看引号和转义符
+_STRUCTURE_CHARS = re.compile(r'[{}"]')
+_STRING_CHARS = re.compile(r'["\\]')
+
+_decoder = json.JSONDecoder()
+
+
+class JSONObjectScanner:
+    """
+    增量 JSON 对象扫描器
+    
+    每次 feed 只扫描新到达的文本，整体线性：
+    - 顶层对象之前的文本（说明文字、```json 标记中的引号和括号以外的内容）直接跳过
+    - 对象内部跟踪字符串和转义，字符串中的括号不计入深度
+    - 括号配平时用 json.loads 解析，失败（如说明文字中的 "{...}"）则从该位置之后继续寻找
+    """
+    
+    def __init__(self):
+        """初始化扫描器"""
+        self.buffer = ""
+        self.result: Optional[Dict[str, Any]] = None
+        self.done = False
+        
+        self._pos = 0
+        self._start = -1
+        self._depth = 0
+        self._in_string = False
+    
+    def feed(self, chunk: str) -> Optional[Dict[str, Any]]:
+        """
+        追加一段文本并继续扫描
+        
+        Args:
+            chunk: 新到达的文本片段
+            
+        Returns:
+            dict: 找到的第一个 JSON 对象，尚未找到时返回 None
+        """
+        if chunk and not self.done:
+            self.buffer += chunk
+            self._scan()
+        return self.result
+    
+    @property
+    def pending(self) -> Optional[str]:
+        """
+        尚未闭合的对象文本（从最近一个顶层 '{' 到缓冲区末尾）
+        
+        Returns:
+            str: 未闭合的对象文本，不在对象内部时返回 None
+        """
+        if self.done or self._depth == 0:
+            return None
+        return self.buffer[self._start:]
+    
+    def _scan(self):
+        """从上次停止的位置继续扫描缓冲区"""
+        buf = self.buffer
+        end = len(buf)
+        pos = self._pos
+        
+        while not self.done:
+            pattern = _STRING_CHARS if self._in_string else _STRUCTURE_CHARS
+            match = pattern.search(buf, pos)
+            if match is None:
+                pos = end
+                break
+            pos = match.start()
+            ch = buf[pos]
+            
+            if ch == "\\":
+                if pos + 1 >= end:
+                    # 转义序列被切分在两段文本之间，等下一段到达后再处理
+                    break
+                pos += 2
+                continue
+            elif self._depth == 0:
+                # 跳过顶层对象之前的内容
+                if ch == "{":
+                    self._start = pos
+                    self._depth = 1
+            elif ch == '"':
+                self._in_string = not self._in_string
+            elif not self._in_string:
+                if ch == "{":
+                    self._depth += 1
+                elif ch == "}":
+                    self._depth -= 1
+                    if self._depth == 0:
+                        self._close(pos)
+            pos += 1
+        
+        self._pos = pos
+    
+    def _close(self, end: int):
+        """括号配平：尝试解析候选对象"""
+        try:
+            value = json.loads(self.buffer[self._start:end + 1])
+        except ValueError:
+            value = None
+        
+        if isinstance(value, dict):
+            self.result = value
+            self.done = True
+        self._start = -1
+
+
+def extract_json_object(content: str) -> Optional[Dict[str, Any]]:
+    """
+    提取文本中第一个括号配平且能解析的 JSON 对象
+    
+    Args:
+        content: LLM 响应内容
+        
+    Returns:
+        dict: JSON 对象，找不到时返回 None
+    """
+    if not content:
+        return None
+    
+    # 快速路径：第一个 '{' 处就是完整对象（最常见的情况），由 C 实现的解码器一次解析完
+    start = content.find("{")
+    if start < 0:
+        return None
+    try:
+        value, _ = _decoder.raw_decode(content, start)
+        if isinstance(value, dict):
+            return value
+    except ValueError:
+        pass
+    
+    return JSONObjectScanner().feed(content[start:])
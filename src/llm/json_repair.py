@@ -0,0 +1,290 @@
+"""
+JSON 修复
+LLM 输出的 JSON 格式错误时，先在本地修复常见问题（尾随逗号、字符串中未转义的引号和换行、
+缺少的右括号、截断的输出），本地修复失败再让便宜的修复模型只做格式整理，
+比用主模型重新生成整条回复更快也更省
+"""
+import json
+import re
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from src.llm.json_extract import extract_json_object
+from src.metrics import MetricsRegistry, get_metrics_registry
+
+if TYPE_CHECKING:
+    from src.llm.invoker import LLMInvoker
+
+# 修复模型的系统提示词（只整理格式，不改写内容）
+REPAIR_PROMPT = """You repair malformed JSON. Rewrite the user's text as a single valid JSON object with the keys "bot_reply", "teaching_feedback" (with "grammar_corrections", "vocabulary_suggestions", "pronunciation_tips" and "overall_comment") and "example_sentences". Keep the original wording, do not add new content, and output only the JSON."""
+
+_VALID_ESCAPES = set('"\\/bfnrtu')
+_CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+# 截断在字面量中间（如 "tru"、"12."）
+_TRAILING_LITERAL = re.compile(r'[-+.\w]+$')
+
+
+def _next_non_space(text: str, pos: int) -> int:
+    """返回 pos 及之后第一个非空白字符的位置"""
+    end = len(text)
+    while pos < end and text[pos].isspace():
+        pos += 1
+    return pos
+
+
+def _closes_string(text: str, pos: int) -> bool:
+    """判断 pos 处的引号是否结束字符串（否则视为字符串内容中未转义的引号）"""
+    nxt = _next_non_space(text, pos + 1)
+    if nxt >= len(text):
+        return True
+    ch = text[nxt]
+    if ch in ":}]":
+        return True
+    if ch == ",":
+        after = _next_non_space(text, nxt + 1)
+        return after >= len(text) or text[after] in '"{[}]'
+    return False
+
+
+def _strip_trailing_comma(out: List[str]):
+    """去掉输出末尾的逗号（及其后的空白）"""
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
+
+
+def _string_start(text: str, end: int) -> int:
+    """返回以 end 处引号结尾的字符串的起始引号位置"""
+    pos = end - 1
+    while pos >= 0:
+        if text[pos] == '"':
+            backslashes = 0
+            while pos - backslashes - 1 >= 0 and text[pos - backslashes - 1] == "\\":
+                backslashes += 1
+            if backslashes % 2 == 0:
+                return pos
+        pos -= 1
+    return -1
+
+
+def _complete_dangling_value(text: str, in_object: bool) -> str:
+    """补全截断处缺少的值（"key" 之后缺冒号和值、冒号之后缺值、截断在字面量中间）"""
+    text = text.rstrip()
+    if text.endswith(":"):
+        return text + " null"
+    
+    match = _TRAILING_LITERAL.search(text)
+    if match:
+        try:
+            json.loads(match.group(0))
+        except ValueError:
+            return _complete_dangling_value(text[:match.start()], in_object)
+        return text
+    
+    if in_object and text.endswith('"'):
+        start = _string_start(text, len(text) - 1)
+        before = text[:start].rstrip()
+        if before.endswith(("{", ",")):
+            # 对象中只有键没有值
+            return text + ": null"
+    return text
+
+
+def repair_json(content: str) -> Optional[Dict]:
+    """
+    在本地修复格式错误的 JSON 对象（一次线性扫描）
+    
+    修复：尾随逗号、字符串中未转义的引号、原始换行和非法转义、括号不匹配或缺失、输出被截断；
+    第一个 '{' 之前和对象结束之后的说明文字、代码块标记会被忽略
+    
+    Args:
+        content: LLM 响应内容
+        
+    Returns:
+        dict: 修复后的 JSON 对象，无法修复时返回 None
+    """
+    if not content:
+        return None
+    start = content.find("{")
+    if start < 0:
+        return None
+    
+    text = content[start:]
+    end = len(text)
+    out: List[str] = []
+    stack: List[str] = []  # 尚未闭合的容器对应的右括号
+    in_string = False
+    pos = 0
+    
+    while pos < end:
+        ch = text[pos]
+        
+        if in_string:
+            if ch == "\\":
+                if pos + 1 >= end:
+                    # 截断在转义符上
+                    pos += 1
+                    continue
+                if text[pos + 1] in _VALID_ESCAPES:
+                    out.append(text[pos:pos + 2])
+                    pos += 2
+                    continue
+                # 非法转义（如 \'）：把反斜杠本身转义
+                out.append("\\\\")
+            elif ch == '"':
+                if _closes_string(text, pos):
+                    in_string = False
+                    out.append(ch)
+                else:
+                    out.append('\\"')
+            elif ch in _CONTROL_ESCAPES:
+                out.append(_CONTROL_ESCAPES[ch])
+            elif ch < " ":
+                out.append(f"\\u{ord(ch):04x}")
+            else:
+                out.append(ch)
+            pos += 1
+            continue
+        
+        if ch == '"':
+            in_string = True
+            out.append(ch)
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            out.append(ch)
+        elif ch in "}]":
+            if ch in stack:
+                # 依次补上中间缺失的右括号，直到与当前右括号匹配
+                while True:
+                    _strip_trailing_comma(out)
+                    closer = stack.pop()
+                    out.append(closer)
+                    if closer == ch:
+                        break
+                if not stack:
+                    # 顶层对象结束，忽略之后的内容
+                    break
+            # 多余的右括号直接丢弃
+        else:
+            out.append(ch)
+        pos += 1
+    
+    # 输出被截断：闭合字符串、补全缺失的值，再补上所有右括号
+    if in_string:
+        out.append('"')
+    if stack:
+        repaired = _complete_dangling_value("".join(out), stack[-1] == "}")
+        out = list(repaired)
+        while stack:
+            _strip_trailing_comma(out)
+            out.append(stack.pop())
+    
+    try:
+        value = json.loads("".join(out))
+    except ValueError:
+        return None
+    return value if isinstance(value, dict) else None
+
+
+class JSONRepairer:
+    """
+    模型修复
+    本地修复失败时，把格式错误的输出交给修复模型重新整理为 JSON（不带对话历史，只是一次很短的调用）
+    """
+    
+    def __init__(self, llm_factory: Callable[[], object], model_name: str, temperature: float = 0.0,
+                 invoker: Optional["LLMInvoker"] = None, max_input_chars: int = 6000,
+                 metrics: Optional[MetricsRegistry] = None):
+        """
+        初始化模型修复
+        
+        Args:
+            llm_factory: 创建修复模型的可调用对象（第一次需要修复时才创建，通常是比主模型便宜的模型）
+            model_name: 修复模型名称
+            temperature: 修复模型的温度参数
+            invoker: LLM 调用器（传入时共享响应缓存和 token 用量统计）
+            max_input_chars: 发送给修复模型的最大字符数
+            metrics: 指标注册表（默认使用全局注册表）
+        """
+        self.llm_factory = llm_factory
+        self.model_name = model_name
+        self.temperature = temperature
+        self.invoker = invoker
+        self.max_input_chars = max_input_chars
+        self._llm = None
+        # 修复调用是额外的一次模型调用，且消息与主请求不同、不会命中主请求的响应缓存，单独计数便于观察成本
+        self._calls = (metrics or get_metrics_registry()).counter(
+            "llm_repair_calls_total", "修复模型调用次数（按 model、result=success/invalid/error 统计）"
+        )
+    
+    @property
+    def llm(self):
+        """修复模型（首次使用时创建）"""
+        if self._llm is None:
+            self._llm = self.llm_factory()
+        return self._llm
+    
+    def repair(self, content: str) -> Optional[Dict]:
+        """
+        调用修复模型整理格式
+        
+        Args:
+            content: 格式错误的 LLM 输出
+            
+        Returns:
+            dict: 修复后的 JSON 对象，修复失败时返回 None
+        """
+        messages = self._build_messages(content)
+        try:
+            if self.invoker is not None:
+                text = self.invoker.invoke(self.llm, messages, self.model_name, self.temperature)
+            else:
+                text = self.llm.invoke(messages).content
+        except Exception:
+            self._calls.inc(model=self.model_name, result="error")
+            return None
+        return self._parse_counted(text)
+    
+    async def arepair(self, content: str) -> Optional[Dict]:
+        """
+        异步调用修复模型整理格式
+        
+        Args:
+            content: 格式错误的 LLM 输出
+            
+        Returns:
+            dict: 修复后的 JSON 对象，修复失败时返回 None
+        """
+        messages = self._build_messages(content)
+        try:
+            if self.invoker is not None:
+                text = await self.invoker.ainvoke(self.llm, messages, self.model_name, self.temperature)
+            else:
+                text = (await self.llm.ainvoke(messages)).content
+        except Exception:
+            self._calls.inc(model=self.model_name, result="error")
+            return None
+        return self._parse_counted(text)
+    
+    def _build_messages(self, content: str) -> List:
+        """构建发送给修复模型的消息"""
+        return [
+            SystemMessage(content=REPAIR_PROMPT),
+            HumanMessage(content=content[:self.max_input_chars])
+        ]
+    
+    def _parse_counted(self, text: str) -> Optional[Dict]:
+        """解析修复模型的输出并记录调用结果"""
+        parsed = self._parse(text)
+        self._calls.inc(model=self.model_name, result="success" if parsed is not None else "invalid")
+        return parsed
+    
+    @staticmethod
+    def _parse(text: str) -> Optional[Dict]:
+        """解析修复模型的输出"""
+        parsed = extract_json_object(text)
+        if parsed is None:
+            parsed = repair_json(text)
+        return parsed
@@ -0,0 +1,169 @@
+"""
+流式 JSON 解析
+在 LLM 逐个 token 输出时增量解析顶层 JSON 对象，尽早取出已完成的字段
+"""
+import json
+from typing import Any, Dict, Optional
+
+
+class PartialJSONParser:
+    """
+    增量 JSON 解析器
+    
+    每次 feed 一段文本后，只扫描新到达的字符（整体线性），并维护：
+    - fields: 已完整生成的顶层字段（已 json.loads）
+    - partial: 正在生成中的顶层字符串字段（已解码的前缀）
+    顶层对象之前的说明文字或代码块标记会被跳过。
+    """
+    
+    def __init__(self):
+        """初始化解析器"""
+        self.buffer = ""
+        self.fields: Dict[str, Any] = {}
+        self.partial: Dict[str, str] = {}
+        self.done = False
+        
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = -1
+        self._key: Optional[str] = None
+        self._expect = "key"  # key / colon / value / comma
+        self._value_start = -1
+    
+    def feed(self, chunk: str) -> Dict[str, Any]:
+        """
+        追加一段文本并继续解析
+        
+        Args:
+            chunk: 新到达的文本片段
+            
+        Returns:
+            dict: 当前快照（已完成字段 + 进行中的字符串字段）
+        """
+        if chunk:
+            self.buffer += chunk
+            self._scan()
+        return self.snapshot()
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        获取当前解析快照
+        
+        Returns:
+            dict: 已完成字段与进行中的字符串字段合并后的字典
+        """
+        result = dict(self.partial)
+        result.update(self.fields)
+        return result
+    
+    def _scan(self):
+        """从上次停止的位置继续扫描缓冲区"""
+        buf = self.buffer
+        end = len(buf)
+        pos = self._pos
+        
+        while pos < end and not self.done:
+            ch = buf[pos]
+            
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._close_top_level_string(pos)
+                pos += 1
+                continue
+            
+            if self._depth == 0:
+                # 跳过顶层对象之前的内容
+                if ch == "{":
+                    self._depth = 1
+                    self._expect = "key"
+                pos += 1
+                continue
+            
+            if ch == '"':
+                self._in_string = True
+                self._string_start = pos
+                if self._depth == 1 and self._expect == "value":
+                    self._value_start = pos
+                    self._expect = "comma"
+            elif ch in "{[":
+                if self._depth == 1 and self._expect == "value":
+                    self._value_start = pos
+                    self._expect = "comma"
+                self._depth += 1
+            elif ch in "}]":
+                if self._depth == 1:
+                    self._finish_value(pos)
+                    self.done = True
+                self._depth -= 1
+            elif self._depth == 1:
+                if ch == ":" and self._expect == "colon":
+                    self._expect = "value"
+                elif ch == ",":
+                    self._finish_value(pos)
+                    self._expect = "key"
+                elif not ch.isspace() and self._expect == "value":
+                    # 数字、true/false/null 等标量
+                    self._value_start = pos
+                    self._expect = "comma"
+            pos += 1
+        
+        self._pos = pos
+        
+        # 暴露正在生成中的顶层字符串值
+        if self._in_string and self._depth == 1 and self._key is not None \
+                and self._value_start == self._string_start:
+            self.partial[self._key] = self._decode_partial_string(
+                buf[self._value_start + 1:pos]
+            )
+    
+    def _close_top_level_string(self, pos: int):
+        """顶层字符串结束：可能是键，也可能是字符串值"""
+        if self._expect == "key":
+            try:
+                self._key = json.loads(self.buffer[self._string_start:pos + 1])
+            except ValueError:
+                self._key = None
+            self._expect = "colon"
+    
+    def _finish_value(self, end: int):
+        """在遇到顶层 ',' 或 '}' 时完成当前字段的值"""
+        if self._key is None or self._value_start < 0:
+            return
+        
+        raw = self.buffer[self._value_start:end].strip()
+        try:
+            self.fields[self._key] = json.loads(raw)
+            self.partial.pop(self._key, None)
+        except ValueError:
+            pass
+        
+        self._key = None
+        self._value_start = -1
+    
+    @staticmethod
+    def _decode_partial_string(raw: str) -> str:
+        """解码未闭合的 JSON 字符串片段，去掉末尾不完整的转义序列"""
+        # 末尾是未完成的反斜杠转义
+        trailing = len(raw) - len(raw.rstrip("\\"))
+        if trailing % 2 == 1:
+            raw = raw[:-1]
+        
+        # 末尾是未完成的 \uXXXX
+        idx = raw.rfind("\\u")
+        if idx != -1 and len(raw) - idx < 6:
+            backslashes = len(raw[:idx]) - len(raw[:idx].rstrip("\\"))
+            if backslashes % 2 == 0:
+                raw = raw[:idx]
+        
+        try:
+            return json.loads('"' + raw + '"')
+        except ValueError:
+            return raw
@@ -0,0 +1,582 @@
+"""
+多后端路由与故障转移
+把多个 OpenAI 兼容后端（OpenAI、DeepSeek、本地 Ollama 等）组成一个后端池：优先选择近期 p50 延迟最低的后端
+（按权重折算；非流式调用比较完整响应时间，流式调用比较首个片段的到达时间），连续出错的后端由熔断器暂时摘除，调用出错时自动转到下一个后端。
+后端池对外提供与聊天模型相同的 invoke / ainvoke / stream / astream / bind 接口，
+场景、ConversationAgent 和 LLMInvoker 不需要区分单个模型和后端池
+"""
+import copy
+import os
+import random
+import statistics
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from src.metrics import MetricsRegistry, get_metrics_registry
+
+# 创建后端聊天模型的函数：(模型名称, 温度, API Key, Base URL) -> 聊天模型
+LLMFactory = Callable[[str, float, Optional[str], Optional[str]], object]
+
+# 这些 4xx 说明后端本身不可用（认证失败、模型不存在、限流等），应转到其他后端；
+# 其余 4xx 是请求本身的问题（如上下文过长），换后端也会失败
+_BACKEND_CLIENT_ERRORS = {401, 403, 404, 408, 409, 429}
+
+
+class NoBackendAvailableError(RuntimeError):
+    """所有后端都处于熔断状态"""
+
+
+def _is_request_error(error: BaseException) -> bool:
+    """判断错误是否由请求本身引起（不计入熔断，也不转到其他后端）"""
+    status = getattr(error, "status_code", None)
+    return isinstance(status, int) and 400 <= status < 500 and status not in _BACKEND_CLIENT_ERRORS
+
+
+class CircuitBreaker:
+    """
+    熔断器
+    连续失败达到阈值后断开（closed -> open），冷却时间过后放行一个试探请求（half_open），
+    试探成功恢复，失败则重新断开
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, failure_threshold: int = 3, recovery_seconds: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        初始化熔断器
+        
+        Args:
+            failure_threshold: 连续失败多少次后断开
+            recovery_seconds: 断开后多久放行试探请求（秒）
+            clock: 单调时钟（测试时可替换）
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial = False
+        self._clock = clock
+        self._lock = threading.Lock()
+    
+    def available(self) -> bool:
+        """当前是否可以向该后端发送请求（不改变状态，用于路由排序）"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self._clock() - self._opened_at < self.recovery_seconds:
+                return False
+            return not self._trial
+    
+    def start_call(self) -> bool:
+        """
+        开始一次调用（断开状态下冷却结束时转为 half_open，只放行一个试探请求）
+        
+        Returns:
+            bool: 是否放行
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self._clock() - self._opened_at < self.recovery_seconds:
+                return False
+            if self._trial:
+                return False
+            self.state = self.HALF_OPEN
+            self._trial = True
+            return True
+    
+    def record_success(self):
+        """记录调用成功"""
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial = False
+    
+    def record_failure(self) -> bool:
+        """
+        记录调用失败
+        
+        Returns:
+            bool: 本次失败是否使熔断器断开
+        """
+        with self._lock:
+            self._trial = False
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                opened = self.state != self.OPEN
+                self.state = self.OPEN
+                self._opened_at = self._clock()
+                return opened
+            return False
+    
+    def cancel_call(self):
+        """调用被调用方放弃（既不算成功也不算失败），释放试探名额"""
+        with self._lock:
+            self._trial = False
+
+
+class Backend:
+    """池中的一个后端"""
+    
+    def __init__(self, name: str, llm_factory: Callable[[], object], weight: float = 1.0,
+                 model_name: Optional[str] = None, latency_window: int = 50,
+                 breaker: Optional[CircuitBreaker] = None):
+        """
+        初始化后端
+        
+        Args:
+            name: 后端名称（用于指标标签）
+            llm_factory: 创建聊天模型的可调用对象（第一次使用时才创建）
+            weight: 路由权重（越大越优先，延迟相同时权重为 2 的后端优先于权重为 1 的后端）
+            model_name: 模型名称
+            latency_window: 计算 p50 所用的最近延迟样本数（非流式和流式调用各保留这么多）
+            breaker: 熔断器（默认使用默认参数）
+        """
+        self.name = name
+        self.weight = weight
+        self.model_name = model_name
+        self.breaker = breaker or CircuitBreaker()
+        self._llm_factory = llm_factory
+        self._llm = None
+        # 非流式调用的完整响应时间与流式调用的首个片段到达时间分开统计，
+        # 否则主要处理流式调用的后端会显得比实际快
+        self._latencies: Deque[float] = deque(maxlen=latency_window)
+        self._ttft: Deque[float] = deque(maxlen=latency_window)
+        self._lock = threading.Lock()
+    
+    @property
+    def llm(self):
+        """聊天模型（首次使用时创建）"""
+        if self._llm is None:
+            with self._lock:
+                if self._llm is None:
+                    self._llm = self._llm_factory()
+        return self._llm
+    
+    def samples(self, stream: bool = False) -> int:
+        """
+        延迟样本数
+        
+        Args:
+            stream: 是否为流式调用的样本
+            
+        Returns:
+            int: 样本数
+        """
+        return len(self._window(stream))
+    
+    def record_latency(self, seconds: float, stream: bool = False):
+        """
+        记录一次成功调用的延迟
+        
+        Args:
+            seconds: 非流式调用为完整响应时间，流式调用为首个片段的到达时间
+            stream: 是否为流式调用
+        """
+        with self._lock:
+            self._window(stream).append(seconds)
+    
+    def p50(self, stream: bool = False) -> Optional[float]:
+        """
+        最近延迟的中位数
+        
+        Args:
+            stream: 为 True 时返回流式调用首个片段到达时间的中位数
+            
+        Returns:
+            float: p50 延迟（秒），没有样本时返回 None
+        """
+        with self._lock:
+            window = self._window(stream)
+            if not window:
+                return None
+            return statistics.median(window)
+    
+    def _window(self, stream: bool) -> Deque[float]:
+        """获取对应调用方式的延迟样本"""
+        return self._ttft if stream else self._latencies
+
+
+class LLMPool:
+    """
+    LLM 后端池
+    每次调用按路由顺序依次尝试后端，直到一个后端成功；流式调用只在产出第一个片段之前转移
+    """
+    
+    def __init__(self, backends: List[Backend], min_samples: int = 5, explore_ratio: float = 0.05,
+                 metrics: Optional[MetricsRegistry] = None):
+        """
+        初始化后端池
+        
+        Args:
+            backends: 后端列表（样本不足时按列表顺序优先）
+            min_samples: 样本数少于该值的后端优先被选中，先积累延迟数据
+            explore_ratio: 随机按权重选择后端的比例（让变慢后恢复的后端重新积累延迟样本）
+            metrics: 指标注册表（默认使用全局注册表）
+        """
+        if not backends:
+            raise ValueError("LLMPool needs at least one backend")
+        self.backends = backends
+        self.min_samples = min_samples
+        self.explore_ratio = explore_ratio
+        # bind() 返回的视图与原池共享后端（包括延迟统计和熔断状态），只是调用时绑定额外参数
+        self._bind_kwargs: Dict = {}
+        self._bound: Dict[str, object] = {}
+        # split() 返回的视图固定后端尝试顺序（为 None 时每次调用重新路由）
+        self._order: Optional[List[Backend]] = None
+        
+        metrics = metrics or get_metrics_registry()
+        self._requests = metrics.counter(
+            "llm_backend_requests_total", "各后端的调用次数（按 backend、outcome=success/error 统计）"
+        )
+        self._failovers = metrics.counter(
+            "llm_backend_failovers_total", "前一个后端出错后转到该后端的次数（按 backend 统计）"
+        )
+        self._circuit_opens = metrics.counter(
+            "llm_backend_circuit_open_total", "熔断器断开次数（按 backend 统计）"
+        )
+    
+    @classmethod
+    def from_config(cls, routing_config: Dict, llm_factory: LLMFactory,
+                    temperature: float) -> Optional["LLMPool"]:
+        """
+        根据路由配置创建后端池
+        
+        Args:
+            routing_config: 配置中的 routing 段
+            llm_factory: 创建后端聊天模型的函数
+            temperature: 默认温度参数（后端可单独配置 temperature）
+            
+        Returns:
+            LLMPool: 后端池，没有配置后端时返回 None（使用 llm 段的单个模型）
+        """
+        entries = routing_config.get("backends") or []
+        if not entries:
+            return None
+        
+        backends = []
+        for index, entry in enumerate(entries):
+            model_name = entry["model"]
+            api_key = entry.get("api_key") or os.getenv(entry.get("api_key_env") or "") or None
+            backend_temperature = entry.get("temperature", temperature)
+            
+            def factory(model_name=model_name, backend_temperature=backend_temperature,
+                        api_key=api_key, base_url=entry.get("base_url")):
+                return llm_factory(model_name, backend_temperature, api_key, base_url)
+            
+            backends.append(Backend(
+                name=entry.get("name") or entry.get("provider") or f"backend_{index}",
+                llm_factory=factory,
+                weight=entry.get("weight", 1.0),
+                model_name=model_name,
+                latency_window=routing_config.get("latency_window", 50),
+                breaker=CircuitBreaker(
+                    failure_threshold=routing_config.get("failure_threshold", 3),
+                    recovery_seconds=routing_config.get("recovery_seconds", 30.0)
+                )
+            ))
+        return cls(
+            backends,
+            min_samples=routing_config.get("min_samples", 5),
+            explore_ratio=routing_config.get("explore_ratio", 0.05)
+        )
+    
+    def bind(self, **kwargs) -> "LLMPool":
+        """
+        绑定调用参数（如 response_format），与聊天模型的 bind 相同
+        
+        Args:
+            **kwargs: 绑定到每个后端的参数
+            
+        Returns:
+            LLMPool: 共享后端状态的新视图
+        """
+        view = copy.copy(self)
+        view._bind_kwargs = {**self._bind_kwargs, **kwargs}
+        view._bound = {}
+        return view
+    
+    @property
+    def bind_kwargs(self) -> Dict:
+        """绑定的调用参数"""
+        return dict(self._bind_kwargs)
+    
+    @property
+    def backend_names(self) -> str:
+        """池中所有后端的名称（逗号分隔，用于缓存键）"""
+        return ",".join(backend.name for backend in self.backends)
+    
+    def route(self, stream: bool = False) -> List[Backend]:
+        """
+        获取本次调用的后端尝试顺序
+        
+        样本不足的后端排在最前面，其余按 p50 / 权重从小到大排列；熔断中的后端不参与。
+        按 explore_ratio 的概率把一个按权重随机选中的后端提到最前面
+        
+        Args:
+            stream: 是否为流式调用（流式调用按首个片段到达时间排序，非流式调用按完整响应时间排序）
+            
+        Returns:
+            list: 后端列表
+        """
+        if self._order is not None:
+            return [backend for backend in self._order if backend.breaker.available()]
+        available = [backend for backend in self.backends if backend.breaker.available()]
+        ordered = sorted(available, key=lambda backend: self._score(backend, stream))
+        if len(ordered) > 1 and random.random() < self.explore_ratio:
+            chosen = random.choices(ordered, weights=[backend.weight for backend in ordered])[0]
+            ordered.remove(chosen)
+            ordered.insert(0, chosen)
+        return ordered
+    
+    def split(self, stream: bool = False) -> Tuple["LLMPool", Optional["LLMPool"]]:
+        """
+        按当前路由顺序拆分出原请求和对冲请求使用的两个视图
+        
+        原请求从第一个后端开始尝试，对冲请求从第二个后端开始尝试，两者都保留故障转移
+        
+        Args:
+            stream: 是否为流式调用
+            
+        Returns:
+            tuple: (原请求视图, 对冲请求视图)，只有一个可用后端时对冲请求视图为 None
+        """
+        order = self.route(stream)
+        if len(order) < 2:
+            return self, None
+        return self._pinned(order), self._pinned(order[1:] + order[:1])
+    
+    def stats(self) -> Dict[str, Dict]:
+        """
+        获取各后端的路由状态
+        
+        Returns:
+            dict: 后端名称 -> {model, weight, p50, samples, ttft_p50, ttft_samples, state}
+                （p50 为非流式调用的完整响应时间，ttft_p50 为流式调用的首个片段到达时间）
+        """
+        return {
+            backend.name: {
+                "model": backend.model_name,
+                "weight": backend.weight,
+                "p50": backend.p50(),
+                "samples": backend.samples(),
+                "ttft_p50": backend.p50(stream=True),
+                "ttft_samples": backend.samples(stream=True),
+                "state": backend.breaker.state
+            }
+            for backend in self.backends
+        }
+    
+    def invoke(self, messages: List, **kwargs):
+        """
+        同步调用（出错时转到下一个后端）
+        
+        Args:
+            messages: 消息列表
+            **kwargs: 传给聊天模型的参数
+            
+        Returns:
+            聊天模型的响应消息
+        """
+        last_error = None
+        for backend in self._candidates():
+            start = time.perf_counter()
+            finished = False
+            try:
+                response = self._client(backend).invoke(messages, **kwargs)
+                finished = True
+            except Exception as e:
+                finished = True
+                if not self._record_failure(backend, e):
+                    raise
+                last_error = e
+                continue
+            finally:
+                if not finished:
+                    backend.breaker.cancel_call()
+            self._record_success(backend, time.perf_counter() - start)
+            return self._tag(response, backend)
+        raise self._exhausted(last_error)
+    
+    async def ainvoke(self, messages: List, **kwargs):
+        """
+        异步调用（出错时转到下一个后端）
+        
+        Args:
+            messages: 消息列表
+            **kwargs: 传给聊天模型的参数
+            
+        Returns:
+            聊天模型的响应消息
+        """
+        last_error = None
+        for backend in self._candidates():
+            start = time.perf_counter()
+            finished = False
+            try:
+                response = await self._client(backend).ainvoke(messages, **kwargs)
+                finished = True
+            except Exception as e:
+                finished = True
+                if not self._record_failure(backend, e):
+                    raise
+                last_error = e
+                continue
+            finally:
+                if not finished:
+                    backend.breaker.cancel_call()
+            self._record_success(backend, time.perf_counter() - start)
+            return self._tag(response, backend)
+        raise self._exhausted(last_error)
+    
+    def stream(self, messages: List, **kwargs) -> Iterator:
+        """
+        流式调用（产出第一个片段之前出错时转到下一个后端）
+        
+        Args:
+            messages: 消息列表
+            **kwargs: 传给聊天模型的参数
+            
+        Yields:
+            聊天模型的输出片段
+        """
+        last_error = None
+        for backend in self._candidates(stream=True):
+            start = time.perf_counter()
+            started = finished = False
+            try:
+                for chunk in self._client(backend).stream(messages, **kwargs):
+                    if not started:
+                        started = True
+                        self._record_success(backend, time.perf_counter() - start, stream=True)
+                        self._tag(chunk, backend)
+                    yield chunk
+                finished = True
+            except Exception as e:
+                finished = True
+                if not self._record_failure(backend, e) or started:
+                    raise
+                last_error = e
+                continue
+            finally:
+                if not finished and not started:
+                    backend.breaker.cancel_call()
+            if not started:
+                self._record_success(backend, time.perf_counter() - start, stream=True)
+            return
+        raise self._exhausted(last_error)
+    
+    async def astream(self, messages: List, **kwargs) -> AsyncIterator:
+        """
+        异步流式调用（产出第一个片段之前出错时转到下一个后端）
+        
+        Args:
+            messages: 消息列表
+            **kwargs: 传给聊天模型的参数
+            
+        Yields:
+            聊天模型的输出片段
+        """
+        last_error = None
+        for backend in self._candidates(stream=True):
+            start = time.perf_counter()
+            started = finished = False
+            try:
+                async for chunk in self._client(backend).astream(messages, **kwargs):
+                    if not started:
+                        started = True
+                        self._record_success(backend, time.perf_counter() - start, stream=True)
+                        self._tag(chunk, backend)
+                    yield chunk
+                finished = True
+            except Exception as e:
+                finished = True
+                if not self._record_failure(backend, e) or started:
+                    raise
+                last_error = e
+                continue
+            finally:
+                if not finished and not started:
+                    backend.breaker.cancel_call()
+            if not started:
+                self._record_success(backend, time.perf_counter() - start, stream=True)
+            return
+        raise self._exhausted(last_error)
+    
+    @staticmethod
+    def _tag(message, backend: Backend):
+        """
+        在响应的 response_metadata 中记录实际处理请求的后端名称（LLMInvoker 用于指标标签）
+        
+        流式调用只标记第一个片段：片段相加时字符串元数据会被拼接
+        """
+        metadata = getattr(message, "response_metadata", None)
+        if isinstance(metadata, dict):
+            metadata["backend"] = backend.name
+        return message
+    
+    def _pinned(self, order: List[Backend]) -> "LLMPool":
+        """创建按固定顺序尝试后端的视图"""
+        view = copy.copy(self)
+        view._order = order
+        return view
+    
+    def _score(self, backend: Backend, stream: bool = False) -> float:
+        """路由排序分数（越小越优先）"""
+        p50 = backend.p50(stream)
+        if p50 is None or backend.samples(stream) < self.min_samples:
+            return 0.0
+        return p50 / max(backend.weight, 1e-6)
+    
+    def _candidates(self, stream: bool = False) -> Iterator[Backend]:
+        """按路由顺序产出熔断器放行的后端，第一个之后的后端记为故障转移"""
+        tried = False
+        for backend in self.route(stream):
+            if not backend.breaker.start_call():
+                continue
+            if tried:
+                self._failovers.inc(backend=backend.name)
+            tried = True
+            yield backend
+    
+    def _client(self, backend: Backend):
+        """获取后端的聊天模型（有绑定参数时返回绑定后的模型）"""
+        if not self._bind_kwargs:
+            return backend.llm
+        client = self._bound.get(backend.name)
+        if client is None:
+            client = self._bound[backend.name] = backend.llm.bind(**self._bind_kwargs)
+        return client
+    
+    def _record_success(self, backend: Backend, latency: float, stream: bool = False):
+        """记录成功调用和延迟（流式调用记录首个片段的到达时间）"""
+        backend.breaker.record_success()
+        backend.record_latency(latency, stream)
+        self._requests.inc(backend=backend.name, outcome="success")
+    
+    def _record_failure(self, backend: Backend, error: Exception) -> bool:
+        """
+        记录失败调用
+        
+        Returns:
+            bool: 是否应转到下一个后端（请求本身的错误不计入熔断，直接抛出）
+        """
+        self._requests.inc(backend=backend.name, outcome="error")
+        if _is_request_error(error):
+            backend.breaker.cancel_call()
+            return False
+        if backend.breaker.record_failure():
+            self._circuit_opens.inc(backend=backend.name)
+        return True
+    
+    def _exhausted(self, last_error: Optional[Exception]) -> Exception:
+        """所有后端都失败或熔断时抛出的异常"""
+        if last_error is not None:
+            return last_error
+        return NoBackendAvailableError("All LLM backends are unavailable (circuit open)")
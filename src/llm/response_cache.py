@@ -0,0 +1,312 @@
+"""
+LLM 响应缓存
+对首轮对话或 temperature 为 0 的请求缓存原始输出，支持内存 LRU 与 SQLite 两种后端
+"""
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from src.metrics import MetricsRegistry, get_metrics_registry
+
+
+def make_cache_key(model_name: str, temperature: float, messages: List,
+                   binding: Optional[Dict] = None, backend: Optional[str] = None) -> str:
+    """
+    生成缓存键（模型、温度、结构化输出绑定、后端、系统提示、裁剪后的历史和当前消息）
+    
+    Args:
+        model_name: 模型名称
+        temperature: 温度参数
+        messages: 发送给 LLM 的消息列表
+        binding: 绑定的 response_format（json_mode、json_schema 与不约束格式的输出互不复用）
+        backend: 后端名称（修改路由或 Base URL 后不复用其他后端的输出）
+        
+    Returns:
+        str: SHA-256 十六进制摘要
+    """
+    payload = json.dumps(
+        [model_name, temperature, binding, backend, [[msg.type, msg.content] for msg in messages]],
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryCacheBackend:
+    """内存 LRU 缓存后端"""
+    
+    # 读写只在内存中进行，异步调用路径中直接调用
+    blocking = False
+    
+    def __init__(self, max_entries: int = 1000):
+        """
+        初始化内存后端
+        
+        Args:
+            max_entries: 最大缓存条目数
+        """
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[str, float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        """
+        读取缓存
+        
+        Args:
+            key: 缓存键
+            
+        Returns:
+            tuple: (内容, 原始延迟秒数)，未命中或已过期时返回 None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            content, latency, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return content, latency
+    
+    def set(self, key: str, content: str, latency: float, ttl_seconds: float):
+        """
+        写入缓存
+        
+        Args:
+            key: 缓存键
+            content: LLM 原始输出
+            latency: 本次 LLM 调用耗时（秒）
+            ttl_seconds: 过期时间（秒）
+        """
+        with self._lock:
+            self._entries[key] = (content, latency, time.time() + ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """SQLite 磁盘缓存后端（多副本可共享同一文件，进程重启后仍有效）"""
+    
+    # 读写会等待磁盘，异步调用路径中放到工作线程执行
+    blocking = True
+    
+    def __init__(self, path: str = "cache/responses.sqlite3", max_entries: int = 10000):
+        """
+        初始化 SQLite 后端
+        
+        Args:
+            path: 数据库文件路径
+            max_entries: 最大缓存条目数
+        """
+        self.path = path
+        self.max_entries = max_entries
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, content TEXT NOT NULL, latency REAL NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+    
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        """
+        读取缓存
+        
+        Args:
+            key: 缓存键
+            
+        Returns:
+            tuple: (内容, 原始延迟秒数)，未命中或已过期时返回 None
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, latency, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[2] <= now:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0], row[1]
+    
+    def set(self, key: str, content: str, latency: float, ttl_seconds: float):
+        """
+        写入缓存
+        
+        Args:
+            key: 缓存键
+            content: LLM 原始输出
+            latency: 本次 LLM 调用耗时（秒）
+            ttl_seconds: 过期时间（秒）
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, content, latency, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, content, latency, now + ttl_seconds, now)
+            )
+            # 清理过期条目，并按最近访问时间淘汰超出上限的条目
+            self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+class ResponseCache:
+    """
+    LLM 响应缓存
+    只缓存确定性的请求：首轮对话（没有历史回复），或 temperature 为 0
+    """
+    
+    def __init__(self, backend=None, ttl_seconds: float = 3600,
+                 metrics: Optional[MetricsRegistry] = None):
+        """
+        初始化响应缓存
+        
+        Args:
+            backend: 缓存后端（默认内存 LRU）
+            ttl_seconds: 缓存过期时间（秒）
+            metrics: 指标注册表（默认使用全局注册表）
+        """
+        self.backend = backend if backend is not None else MemoryCacheBackend()
+        self.ttl_seconds = ttl_seconds
+        metrics = metrics or get_metrics_registry()
+        self._requests = metrics.counter(
+            "llm_cache_requests_total", "LLM 响应缓存查询次数（result=hit/miss）"
+        )
+        self._saved_seconds = metrics.counter(
+            "llm_cache_saved_seconds_total", "缓存命中节省的 LLM 调用时间（秒）"
+        )
+    
+    @classmethod
+    def from_config(cls, cache_config: Dict) -> Optional["ResponseCache"]:
+        """
+        根据配置创建响应缓存
+        
+        Args:
+            cache_config: 配置中的 cache 段
+            
+        Returns:
+            ResponseCache: 响应缓存，未启用时返回 None
+        """
+        if not cache_config.get("enabled"):
+            return None
+        
+        max_entries = cache_config.get("max_entries", 1000)
+        if cache_config.get("backend") == "sqlite":
+            backend = SQLiteCacheBackend(cache_config.get("sqlite_path", "cache/responses.sqlite3"), max_entries)
+        else:
+            backend = MemoryCacheBackend(max_entries)
+        return cls(backend, ttl_seconds=cache_config.get("ttl_seconds", 3600))
+    
+    @staticmethod
+    def is_cacheable(messages: List, temperature: float) -> bool:
+        """
+        判断请求是否可缓存
+        
+        Args:
+            messages: 发送给 LLM 的消息列表
+            temperature: 温度参数
+            
+        Returns:
+            bool: temperature 为 0，或这是首轮对话（消息中没有历史回复）
+        """
+        if temperature == 0:
+            return True
+        return not any(msg.type == "ai" for msg in messages)
+    
+    def get(self, key: str) -> Optional[str]:
+        """
+        读取缓存并记录命中指标
+        
+        Args:
+            key: 缓存键
+            
+        Returns:
+            str: 缓存的 LLM 输出，未命中时返回 None
+        """
+        entry = self.backend.get(key)
+        if entry is None:
+            self._requests.inc(result="miss")
+            return None
+        
+        content, latency = entry
+        self._requests.inc(result="hit")
+        self._saved_seconds.inc(latency)
+        return content
+    
+    def set(self, key: str, content: str, latency: float):
+        """
+        写入缓存
+        
+        Args:
+            key: 缓存键
+            content: LLM 原始输出
+            latency: 本次 LLM 调用耗时（秒）
+        """
+        if content:
+            self.backend.set(key, content, latency, self.ttl_seconds)
+    
+    async def aget(self, key: str) -> Optional[str]:
+        """
+        异步读取缓存（会阻塞的后端在工作线程中读取，不占用事件循环）
+        
+        Args:
+            key: 缓存键
+            
+        Returns:
+            str: 缓存的 LLM 输出，未命中时返回 None
+        """
+        if not getattr(self.backend, "blocking", True):
+            return self.get(key)
+        return await asyncio.to_thread(self.get, key)
+    
+    async def aset(self, key: str, content: str, latency: float):
+        """
+        异步写入缓存（会阻塞的后端在工作线程中写入，不占用事件循环）
+        
+        Args:
+            key: 缓存键
+            content: LLM 原始输出
+            latency: 本次 LLM 调用耗时（秒）
+        """
+        if not getattr(self.backend, "blocking", True):
+            self.set(key, content, latency)
+            return
+        await asyncio.to_thread(self.set, key, content, latency)
+    
+    @property
+    def hit_rate(self) -> float:
+        """缓存命中率"""
+        hits = self._requests.value(result="hit")
+        total = hits + self._requests.value(result="miss")
+        return hits / total if total else 0.0
@@ -0,0 +1,545 @@
+"""
+LLM 请求调度
+ConversationAgent 与所有场景共用的限流器：按服务商的每分钟请求数（RPM）和每分钟 token 数（TPM）
+用令牌桶放行请求，同时限制并发数；等待的请求放在有界队列中，按会话轮流放行，
+一个会话连续发送的请求不会挤占其他学生；遇到 429 等可重试错误时按带抖动的指数退避重试
+"""
+import asyncio
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, Iterator, List, Optional, TypeVar
+
+from src.llm.tokenizer import TokenCounter
+from src.metrics import MetricsRegistry, get_metrics_registry
+
+T = TypeVar("T")
+
+# 未传入会话标识的请求共用一个队列
+DEFAULT_SESSION = "default"
+
+# 可重试的错误类型名称（OpenAI SDK / httpx，按名称判断避免在这里导入它们）
+_RETRYABLE_ERRORS = {"RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError",
+                     "TimeoutException", "ConnectError", "ReadTimeout"}
+
+
+class SchedulerBusyError(RuntimeError):
+    """等待队列已满，请求被直接拒绝"""
+
+
+class TokenBucket:
+    """
+    令牌桶
+    按每分钟额度匀速补充，容量为一分钟的额度；实际用量超过预估时令牌数可以为负，之后的请求相应推迟
+    """
+    
+    def __init__(self, per_minute: float, clock: Callable[[], float] = time.monotonic):
+        """
+        初始化令牌桶
+        
+        Args:
+            per_minute: 每分钟额度
+            clock: 单调时钟（测试时可替换）
+        """
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self._clock = clock
+        self._updated = clock()
+    
+    def _refill(self):
+        """按经过的时间补充令牌"""
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+    
+    def wait_time(self, amount: float) -> float:
+        """
+        获取令牌足够前还需等待的秒数
+        
+        Args:
+            amount: 需要的令牌数（超过容量时按容量计算，避免大请求永远无法放行）
+            
+        Returns:
+            float: 等待秒数，令牌足够时为 0
+        """
+        self._refill()
+        missing = min(amount, self.capacity) - self.tokens
+        return missing / self.rate if missing > 0 else 0.0
+    
+    def consume(self, amount: float):
+        """
+        扣除令牌
+        
+        Args:
+            amount: 令牌数（可以为负，用于返还多扣的额度）
+        """
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class _Ticket:
+    """一个排队中的请求"""
+    
+    __slots__ = ("session", "tokens", "granted", "released", "event", "loop", "future")
+    
+    def __init__(self, session: str, tokens: int, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.session = session
+        self.tokens = tokens
+        self.granted = False
+        self.released = False
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+    
+    def grant(self):
+        """放行（可能在其他线程中调用）"""
+        self.granted = True
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+    
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """
+    读取错误响应中的 Retry-After 头
+    
+    Args:
+        error: 调用异常
+        
+    Returns:
+        float: 服务端要求等待的秒数，没有时返回 None
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return max(float(headers.get("retry-after")), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    判断调用异常是否值得重试（429 限流、5xx、超时和连接错误）
+    
+    Args:
+        error: 调用异常
+        
+    Returns:
+        bool: 是否可重试
+    """
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    return type(error).__name__ in _RETRYABLE_ERRORS
+
+
+def is_overloaded(error: BaseException) -> bool:
+    """
+    判断调用异常是否由负载过高引起（队列已满或重试后仍被限流），用于给出"稍后再试"的提示
+    
+    Args:
+        error: 调用异常
+        
+    Returns:
+        bool: 是否为过载错误
+    """
+    if isinstance(error, SchedulerBusyError):
+        return True
+    status = getattr(error, "status_code", None)
+    return status == 429 or type(error).__name__ == "RateLimitError"
+
+
+class LLMScheduler:
+    """
+    LLM 请求调度器
+    调用方先 acquire 一个名额（同时扣除 RPM 和预估的 TPM 额度），调用结束后 release；
+    run / arun / stream / astream 封装了名额的获取、释放和退避重试
+    """
+    
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                 max_concurrency: Optional[int] = None, max_queue_size: int = 500, max_retries: int = 3,
+                 backoff_base: float = 0.5, backoff_max: float = 20.0, expected_completion_tokens: int = 400,
+                 token_counter: Optional[TokenCounter] = None, metrics: Optional[MetricsRegistry] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        初始化调度器
+        
+        Args:
+            requests_per_minute: 每分钟请求数上限（为 None 或 0 时不限制）
+            tokens_per_minute: 每分钟 token 数上限（为 None 或 0 时不限制）
+            max_concurrency: 同时进行的请求数上限（为 None 或 0 时不限制）
+            max_queue_size: 最多排队的请求数，超过时直接拒绝（SchedulerBusyError）
+            max_retries: 可重试错误的最大重试次数
+            backoff_base: 第一次重试的退避上限（秒），之后每次翻倍
+            backoff_max: 单次退避的最大秒数
+            expected_completion_tokens: 预估 TPM 用量时为输出预留的 token 数
+            token_counter: 预估提示词 token 数的计数器（默认使用离线估算）
+            metrics: 指标注册表（默认使用全局注册表）
+            clock: 单调时钟（测试时可替换）
+        """
+        self.rpm = TokenBucket(requests_per_minute, clock) if requests_per_minute else None
+        self.tpm = TokenBucket(tokens_per_minute, clock) if tokens_per_minute else None
+        self.max_concurrency = max_concurrency or None
+        self.max_queue_size = max_queue_size
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.expected_completion_tokens = expected_completion_tokens
+        self.token_counter = token_counter or TokenCounter()
+        
+        # 会话 -> 该会话排队中的请求；放行时按会话轮流取队首
+        self._queues: "OrderedDict[str, Deque[_Ticket]]" = OrderedDict()
+        self._queued = 0
+        self._active = 0
+        self._wakeup: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+        
+        metrics = metrics or get_metrics_registry()
+        self._retries = metrics.counter(
+            "llm_scheduler_retries_total", "可重试错误后重新发起的请求数（按 error 统计）"
+        )
+        self._rejected = metrics.counter(
+            "llm_scheduler_rejected_total", "等待队列已满被直接拒绝的请求数"
+        )
+    
+    @classmethod
+    def from_config(cls, scheduler_config: Dict) -> Optional["LLMScheduler"]:
+        """
+        根据调度配置创建调度器
+        
+        Args:
+            scheduler_config: 调度配置段
+            
+        Returns:
+            LLMScheduler: 调度器，未启用时返回 None
+        """
+        if not scheduler_config.get("enabled", True):
+            return None
+        return cls(
+            requests_per_minute=scheduler_config.get("requests_per_minute"),
+            tokens_per_minute=scheduler_config.get("tokens_per_minute"),
+            max_concurrency=scheduler_config.get("max_concurrency"),
+            max_queue_size=scheduler_config.get("max_queue_size", 500),
+            max_retries=scheduler_config.get("max_retries", 3),
+            backoff_base=scheduler_config.get("backoff_base", 0.5),
+            backoff_max=scheduler_config.get("backoff_max", 20.0),
+            expected_completion_tokens=scheduler_config.get("expected_completion_tokens", 400)
+        )
+    
+    @property
+    def queued(self) -> int:
+        """排队中的请求数"""
+        return self._queued
+    
+    @property
+    def active(self) -> int:
+        """进行中的请求数"""
+        return self._active
+    
+    def estimate_tokens(self, messages: List) -> int:
+        """
+        预估一次调用的 token 用量（提示词 + 预留的输出）
+        
+        Args:
+            messages: 消息列表
+            
+        Returns:
+            int: 预估 token 数
+        """
+        prompt_tokens = sum(self.token_counter.count(message.content) for message in messages
+                            if isinstance(getattr(message, "content", None), str))
+        return prompt_tokens + self.expected_completion_tokens
+    
+    def acquire(self, session: Optional[str] = None, tokens: int = 0) -> _Ticket:
+        """
+        获取调用名额（阻塞当前线程直到放行）
+        
+        Args:
+            session: 会话标识（同一会话的请求按顺序放行，不同会话之间轮流放行）
+            tokens: 预估 token 用量
+            
+        Returns:
+            名额凭据，调用结束后传给 release
+        """
+        ticket = self._enqueue(_Ticket(session or DEFAULT_SESSION, tokens))
+        try:
+            self._dispatch()
+            ticket.event.wait()
+            return ticket
+        except BaseException:
+            self._abandon(ticket)
+            raise
+    
+    async def aacquire(self, session: Optional[str] = None, tokens: int = 0) -> _Ticket:
+        """
+        异步获取调用名额（等待时不占用事件循环）
+        
+        Args:
+            session: 会话标识
+            tokens: 预估 token 用量
+            
+        Returns:
+            名额凭据，调用结束后传给 release
+        """
+        ticket = self._enqueue(_Ticket(session or DEFAULT_SESSION, tokens, asyncio.get_running_loop()))
+        try:
+            self._dispatch()
+            await ticket.future
+            return ticket
+        except BaseException:
+            self._abandon(ticket)
+            raise
+    
+    def release(self, ticket: _Ticket):
+        """
+        释放调用名额（重复释放会被忽略）
+        
+        Args:
+            ticket: acquire 返回的名额凭据
+        """
+        with self._lock:
+            if ticket.released:
+                return
+            ticket.released = True
+            self._active -= 1
+        self._dispatch()
+    
+    def correct_tokens(self, estimated: int, actual: int):
+        """
+        按实际用量修正 TPM 额度（多扣的返还，少扣的补扣）
+        
+        Args:
+            estimated: acquire 时的预估用量
+            actual: 服务端返回的实际用量
+        """
+        if self.tpm is None:
+            return
+        with self._lock:
+            self.tpm.consume(actual - estimated)
+    
+    def backoff(self, attempt: int, error: Optional[BaseException] = None) -> float:
+        """
+        计算第 attempt 次重试前的等待秒数（full jitter：在 0 到指数上限之间随机取值，
+        避免大量被限流的请求同时重试；服务端给出 Retry-After 时至少等待该时长）
+        
+        Args:
+            attempt: 已重试次数（从 0 开始）
+            error: 触发重试的异常
+            
+        Returns:
+            float: 等待秒数
+        """
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        server_delay = retry_after(error) if error is not None else None
+        if server_delay is not None:
+            delay = max(delay, min(server_delay, self.backoff_max))
+        return delay
+    
+    def run(self, fn: Callable[[], T], session: Optional[str] = None, tokens: int = 0) -> T:
+        """
+        获取名额后调用 fn，可重试错误按退避重试
+        
+        Args:
+            fn: 实际发起调用的函数
+            session: 会话标识
+            tokens: 预估 token 用量
+            
+        Returns:
+            fn 的返回值
+        """
+        attempt = 0
+        while True:
+            ticket = self.acquire(session, tokens)
+            try:
+                return fn()
+            except Exception as e:
+                if not self._should_retry(e, attempt):
+                    raise
+                delay = self.backoff(attempt, e)
+            finally:
+                self.release(ticket)
+            attempt += 1
+            time.sleep(delay)
+    
+    async def arun(self, fn: Callable[[], Awaitable[T]], session: Optional[str] = None, tokens: int = 0) -> T:
+        """
+        异步获取名额后调用 fn，可重试错误按退避重试
+        
+        Args:
+            fn: 返回实际调用协程的函数
+            session: 会话标识
+            tokens: 预估 token 用量
+            
+        Returns:
+            fn 返回的协程的结果
+        """
+        attempt = 0
+        while True:
+            ticket = await self.aacquire(session, tokens)
+            try:
+                return await fn()
+            except Exception as e:
+                if not self._should_retry(e, attempt):
+                    raise
+                delay = self.backoff(attempt, e)
+            finally:
+                self.release(ticket)
+            attempt += 1
+            await asyncio.sleep(delay)
+    
+    def stream(self, fn: Callable[[], Iterator[T]], session: Optional[str] = None,
+               tokens: int = 0) -> Iterator[T]:
+        """
+        获取名额后迭代 fn 返回的流（流结束前一直占用名额）；
+        只有在产出第一个片段之前失败才重试，已产出的片段无法撤回
+        
+        Args:
+            fn: 返回输出片段迭代器的函数
+            session: 会话标识
+            tokens: 预估 token 用量
+            
+        Yields:
+            fn 产出的片段
+        """
+        attempt = 0
+        while True:
+            ticket = self.acquire(session, tokens)
+            started = False
+            try:
+                for chunk in fn():
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                if started or not self._should_retry(e, attempt):
+                    raise
+                delay = self.backoff(attempt, e)
+            finally:
+                self.release(ticket)
+            attempt += 1
+            time.sleep(delay)
+    
+    async def astream(self, fn: Callable[[], AsyncIterator[T]], session: Optional[str] = None,
+                      tokens: int = 0) -> AsyncIterator[T]:
+        """
+        异步获取名额后迭代 fn 返回的流；只有在产出第一个片段之前失败才重试
+        
+        Args:
+            fn: 返回输出片段异步迭代器的函数
+            session: 会话标识
+            tokens: 预估 token 用量
+            
+        Yields:
+            fn 产出的片段
+        """
+        attempt = 0
+        while True:
+            ticket = await self.aacquire(session, tokens)
+            started = False
+            try:
+                async for chunk in fn():
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                if started or not self._should_retry(e, attempt):
+                    raise
+                delay = self.backoff(attempt, e)
+            finally:
+                self.release(ticket)
+            attempt += 1
+            await asyncio.sleep(delay)
+    
+    def _should_retry(self, error: Exception, attempt: int) -> bool:
+        """判断是否重试，重试时记录指标"""
+        if attempt >= self.max_retries or not is_retryable(error):
+            return False
+        self._retries.inc(error=type(error).__name__)
+        return True
+    
+    def _enqueue(self, ticket: _Ticket) -> _Ticket:
+        """把请求放入所属会话的队列（队列已满时拒绝）"""
+        with self._lock:
+            if self._queued >= self.max_queue_size:
+                self._rejected.inc()
+                raise SchedulerBusyError(
+                    f"Too many pending LLM requests ({self._queued}), please try again in a moment"
+                )
+            self._queues.setdefault(ticket.session, deque()).append(ticket)
+            self._queued += 1
+        return ticket
+    
+    def _abandon(self, ticket: _Ticket):
+        """等待中被取消或出错：移出队列；已经放行的名额直接释放"""
+        with self._lock:
+            if not ticket.granted:
+                queue = self._queues.get(ticket.session)
+                if queue is not None and ticket in queue:
+                    queue.remove(ticket)
+                    self._queued -= 1
+                    if not queue:
+                        del self._queues[ticket.session]
+                return
+        self.release(ticket)
+    
+    def _dispatch(self):
+        """按会话轮流放行排队中的请求，直到并发数或令牌不足（令牌不足时在补充足够后重新检查）"""
+        with self._lock:
+            wait = self._grant_ready()
+            if wait is None or self._wakeup is not None:
+                return
+            self._wakeup = threading.Timer(wait, self._on_wakeup)
+            self._wakeup.daemon = True
+            self._wakeup.start()
+    
+    def _on_wakeup(self):
+        """令牌补充后重新放行"""
+        with self._lock:
+            self._wakeup = None
+        self._dispatch()
+    
+    def _grant_ready(self) -> Optional[float]:
+        """
+        放行当前可以放行的请求（调用方持有锁）
+        
+        Returns:
+            float: 令牌不足时距离补充足够还需的秒数，只受并发数限制或队列已空时返回 None（由 release 唤醒）
+        """
+        while self._queues:
+            if self.max_concurrency is not None and self._active >= self.max_concurrency:
+                return None
+            
+            session, queue = next(iter(self._queues.items()))
+            ticket = queue[0]
+            wait = 0.0
+            if self.rpm is not None:
+                wait = self.rpm.wait_time(1)
+            if self.tpm is not None:
+                wait = max(wait, self.tpm.wait_time(ticket.tokens))
+            if wait > 0:
+                return wait
+            
+            if self.rpm is not None:
+                self.rpm.consume(1)
+            if self.tpm is not None:
+                self.tpm.consume(ticket.tokens)
+            queue.popleft()
+            self._queued -= 1
+            self._active += 1
+            # 放行后该会话移到末尾，下一个名额先给其他会话
+            if queue:
+                self._queues.move_to_end(session)
+            else:
+                del self._queues[session]
+            ticket.grant()
+        return None
@@ -0,0 +1,269 @@
+"""
+语义近似缓存
+对场景的首轮用户消息做字符 n-gram 向量化，在同一场景内按余弦相似度查找近似的历史请求，
+命中时直接返回缓存的教学回复
+"""
+import re
+import threading
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.llm.response_cache import make_cache_key
+from src.metrics import MetricsRegistry, get_metrics_registry
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+class CharNgramVectorizer:
+    """
+    字符 n-gram 哈希向量化器
+    完全离线，对大小写、标点、空白和少量拼写差异不敏感
+    """
+    
+    def __init__(self, ngram_range: Sequence[int] = (2, 4), dimensions: int = 4096):
+        """
+        初始化向量化器
+        
+        Args:
+            ngram_range: n-gram 长度范围（闭区间）
+            dimensions: 哈希向量维度
+        """
+        self.ngram_sizes = tuple(range(ngram_range[0], ngram_range[1] + 1))
+        self.dimensions = dimensions
+    
+    @staticmethod
+    def normalize(text: str) -> str:
+        """
+        规范化文本（小写，标点和连续空白折叠为单个空格）
+        
+        Args:
+            text: 原始文本
+            
+        Returns:
+            str: 首尾带空格的规范化文本，用于标记词边界
+        """
+        return " " + _NON_WORD.sub(" ", text.lower()).strip() + " "
+    
+    def vectorize(self, text: str) -> Optional[np.ndarray]:
+        """
+        把文本转换为 L2 归一化的向量
+        
+        Args:
+            text: 原始文本
+            
+        Returns:
+            np.ndarray: float32 向量，文本为空时返回 None
+        """
+        normalized = self.normalize(text)
+        if not normalized.strip():
+            return None
+        indices = [
+            zlib.crc32(normalized[i:i + n].encode("utf-8")) % self.dimensions
+            for n in self.ngram_sizes
+            for i in range(len(normalized) - n + 1)
+        ]
+        
+        # 次线性词频，避免重复片段主导相似度
+        vector = np.sqrt(np.bincount(indices, minlength=self.dimensions).astype(np.float32))
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return None
+        return vector / norm
+
+
+class VectorStore:
+    """
+    单个场景的向量存储
+    向量保存在预分配的 NumPy 矩阵中，写满后按插入顺序覆盖最旧的条目
+    """
+    
+    def __init__(self, dimensions: int, max_entries: int = 500):
+        """
+        初始化向量存储
+        
+        Args:
+            dimensions: 向量维度
+            max_entries: 最大条目数
+        """
+        self.max_entries = max_entries
+        self._vectors = np.zeros((max_entries, dimensions), dtype=np.float32)
+        self._contents: List[Optional[str]] = [None] * max_entries
+        self._size = 0
+        self._next = 0
+    
+    def add(self, vector: np.ndarray, content: str):
+        """
+        添加条目
+        
+        Args:
+            vector: 归一化向量
+            content: 对应的 LLM 输出
+        """
+        self._vectors[self._next] = vector
+        self._contents[self._next] = content
+        self._next = (self._next + 1) % self.max_entries
+        self._size = min(self._size + 1, self.max_entries)
+    
+    def search(self, vector: np.ndarray) -> Tuple[Optional[str], float]:
+        """
+        查找最相似的条目
+        
+        Args:
+            vector: 归一化查询向量
+            
+        Returns:
+            tuple: (内容, 余弦相似度)，存储为空时返回 (None, 0.0)
+        """
+        if self._size == 0:
+            return None, 0.0
+        scores = self._vectors[:self._size] @ vector
+        best = int(np.argmax(scores))
+        return self._contents[best], float(scores[best])
+    
+    def __len__(self) -> int:
+        return self._size
+
+
+class SemanticCache:
+    """
+    语义近似缓存
+    只处理首轮请求（一条用户消息、没有历史回复）；同一场景、模型、温度和系统提示下
+    相似度不低于阈值的请求共用缓存回复
+    """
+    
+    def __init__(self, threshold: float = 0.92, max_entries_per_scenario: int = 500,
+                 vectorizer: Optional[CharNgramVectorizer] = None,
+                 metrics: Optional[MetricsRegistry] = None):
+        """
+        初始化语义缓存
+        
+        Args:
+            threshold: 命中所需的最小余弦相似度
+            max_entries_per_scenario: 每个场景保存的最大条目数
+            vectorizer: 向量化器（默认字符 2-4 gram）
+            metrics: 指标注册表（默认使用全局注册表）
+        """
+        self.threshold = threshold
+        self.max_entries_per_scenario = max_entries_per_scenario
+        self.vectorizer = vectorizer or CharNgramVectorizer()
+        self._stores: Dict[Tuple[str, str], VectorStore] = {}
+        self._lock = threading.Lock()
+        metrics = metrics or get_metrics_registry()
+        self._requests = metrics.counter(
+            "llm_semantic_cache_requests_total", "语义缓存查询次数（按 scenario、result=hit/miss 统计）"
+        )
+    
+    @classmethod
+    def from_config(cls, semantic_config: Dict) -> Optional["SemanticCache"]:
+        """
+        根据配置创建语义缓存
+        
+        Args:
+            semantic_config: 配置中的 semantic_cache 段
+            
+        Returns:
+            SemanticCache: 语义缓存，未启用时返回 None
+        """
+        if not semantic_config.get("enabled"):
+            return None
+        
+        vectorizer = CharNgramVectorizer(
+            ngram_range=semantic_config.get("ngram_range", (2, 4)),
+            dimensions=semantic_config.get("dimensions", 4096)
+        )
+        return cls(
+            threshold=semantic_config.get("threshold", 0.92),
+            max_entries_per_scenario=semantic_config.get("max_entries_per_scenario", 500),
+            vectorizer=vectorizer
+        )
+    
+    @staticmethod
+    def first_turn_message(messages: List) -> Optional[str]:
+        """
+        提取首轮请求的用户消息
+        
+        Args:
+            messages: 发送给 LLM 的消息列表
+            
+        Returns:
+            str: 唯一的用户消息内容，不是首轮请求时返回 None
+        """
+        human = [msg for msg in messages if msg.type == "human"]
+        if len(human) != 1 or any(msg.type == "ai" for msg in messages):
+            return None
+        return human[0].content
+    
+    def get(self, scenario: str, messages: List, model_name: str, temperature: float,
+            binding: Optional[Dict] = None, backend: Optional[str] = None) -> Optional[str]:
+        """
+        查找近似请求的缓存回复
+        
+        Args:
+            scenario: 场景名称
+            messages: 发送给 LLM 的消息列表
+            model_name: 模型名称
+            temperature: 温度参数
+            binding: 绑定的 response_format（见 make_cache_key）
+            backend: 后端名称（见 make_cache_key）
+            
+        Returns:
+            str: 缓存的 LLM 输出，未命中或不是首轮请求时返回 None
+        """
+        lookup = self._prepare(scenario, messages, model_name, temperature, binding, backend)
+        if lookup is None:
+            return None
+        
+        store_key, vector = lookup
+        with self._lock:
+            store = self._stores.get(store_key)
+            content, score = store.search(vector) if store is not None else (None, 0.0)
+        
+        if content is None or score < self.threshold:
+            self._requests.inc(scenario=scenario, result="miss")
+            return None
+        self._requests.inc(scenario=scenario, result="hit")
+        return content
+    
+    def set(self, scenario: str, messages: List, model_name: str, temperature: float, content: str,
+            binding: Optional[Dict] = None, backend: Optional[str] = None):
+        """
+        写入首轮请求的回复
+        
+        Args:
+            scenario: 场景名称
+            messages: 发送给 LLM 的消息列表
+            model_name: 模型名称
+            temperature: 温度参数
+            content: LLM 原始输出
+            binding: 绑定的 response_format（见 make_cache_key）
+            backend: 后端名称（见 make_cache_key）
+        """
+        if not content:
+            return
+        lookup = self._prepare(scenario, messages, model_name, temperature, binding, backend)
+        if lookup is None:
+            return
+        
+        store_key, vector = lookup
+        with self._lock:
+            store = self._stores.get(store_key)
+            if store is None:
+                store = VectorStore(self.vectorizer.dimensions, self.max_entries_per_scenario)
+                self._stores[store_key] = store
+            store.add(vector, content)
+    
+    def _prepare(self, scenario: str, messages: List, model_name: str, temperature: float,
+                 binding: Optional[Dict] = None,
+                 backend: Optional[str] = None) -> Optional[Tuple[Tuple[str, str], np.ndarray]]:
+        """计算存储键（场景 + 模型、温度、绑定、后端和系统提示的摘要）和查询向量"""
+        user_message = self.first_turn_message(messages)
+        if user_message is None:
+            return None
+        vector = self.vectorizer.vectorize(user_message)
+        if vector is None:
+            return None
+        
+        context = [msg for msg in messages if msg.type != "human"]
+        return (scenario, make_cache_key(model_name, temperature, context, binding, backend)), vector
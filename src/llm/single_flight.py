@@ -0,0 +1,292 @@
+"""
+请求合并（single-flight）
+相同的请求同时到达时只发起一次 LLM 调用，其余请求等待并共享同一个结果；
+流式请求的跟随者会按顺序收到发起者已产出和之后产出的所有片段。
+流式请求的发起者中途离开（如浏览器断开连接）时上游继续为其余读取者输出，所有读取者都离开后才关闭上游
+"""
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+
+class _Flight:
+    """一次进行中的同步调用"""
+    
+    def __init__(self):
+        self.done = False
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.chunks: List[str] = []
+        self.condition = threading.Condition()
+        # 流式调用：尚未离开的读取者数、上游片段迭代器（第一次读取时创建）、是否有读取者正在从上游读取
+        self.readers = 0
+        self.start: Optional[Callable[[], Iterator[str]]] = None
+        self.source: Optional[Iterator[str]] = None
+        self.pulling = False
+
+
+class _AsyncStreamFlight:
+    """一次进行中的异步流式调用"""
+    
+    def __init__(self):
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.chunks: List[str] = []
+        self.changed = asyncio.Event()
+        # 尚未离开的读取者数，以及从上游读取片段的任务
+        self.readers = 0
+        self.task: Optional[asyncio.Task] = None
+    
+    def notify(self):
+        """唤醒等待新片段的跟随者"""
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+
+def _abandoned_error() -> RuntimeError:
+    """所有读取者都离开、上游被关闭时记录的异常"""
+    return RuntimeError("The coalesced LLM request was abandoned by all of its callers")
+
+
+class SingleFlight:
+    """
+    请求合并器
+    同步调用按线程合并，异步调用只在同一个事件循环内合并；
+    每个方法都返回 (结果, 是否共享了其他请求的调用)
+    """
+    
+    def __init__(self):
+        """初始化合并器"""
+        self._calls: Dict[Hashable, _Flight] = {}
+        self._streams: Dict[Hashable, _Flight] = {}
+        self._async_calls: Dict[Tuple[int, Hashable], asyncio.Future] = {}
+        self._async_streams: Dict[Tuple[int, Hashable], _AsyncStreamFlight] = {}
+        self._lock = threading.Lock()
+    
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        同步调用（相同 key 的并发调用只执行一次 fn）
+        
+        Args:
+            key: 请求键
+            fn: 实际发起调用的函数
+            
+        Returns:
+            tuple: (调用结果, 是否共享)
+        """
+        flight, leader = self._join(self._calls, key, _Flight)
+        if not leader:
+            with flight.condition:
+                flight.condition.wait_for(lambda: flight.done)
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+        
+        try:
+            flight.result = fn()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            self._finish(self._calls, key, flight)
+        return flight.result, False
+    
+    def stream(self, key: Hashable, fn: Callable[[], Iterator[str]]) -> Tuple[Iterator[str], bool]:
+        """
+        同步流式调用（相同 key 的并发调用共享同一个流）
+        
+        Args:
+            key: 请求键
+            fn: 返回实际输出片段迭代器的函数
+            
+        Returns:
+            tuple: (片段迭代器, 是否共享)
+        """
+        flight, leader = self._join(self._streams, key, _Flight, reader=True)
+        if leader:
+            flight.start = fn
+        return self._read_stream(key, flight), not leader
+    
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        异步调用（同一事件循环内相同 key 的并发调用只执行一次 fn）
+        
+        Args:
+            key: 请求键
+            fn: 返回实际调用协程的函数
+            
+        Returns:
+            tuple: (调用结果, 是否共享)
+        """
+        loop = asyncio.get_running_loop()
+        loop_key = (id(loop), key)
+        while True:
+            future, leader = self._join(self._async_calls, loop_key, loop.create_future)
+            if leader:
+                break
+            try:
+                return await asyncio.shield(future), True
+            except asyncio.CancelledError:
+                # 发起者被取消时由当前请求重新发起，自己被取消则照常抛出
+                if not future.cancelled():
+                    raise
+        
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # 没有跟随者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                if self._async_calls.get(loop_key) is future:
+                    del self._async_calls[loop_key]
+        return result, False
+    
+    def astream(self, key: Hashable, fn: Callable[[], AsyncIterator[str]]) -> Tuple[AsyncIterator[str], bool]:
+        """
+        异步流式调用（同一事件循环内相同 key 的并发调用共享同一个流，需在事件循环中调用）
+        
+        Args:
+            key: 请求键
+            fn: 返回实际输出片段异步迭代器的函数
+            
+        Returns:
+            tuple: (片段异步迭代器, 是否共享)
+        """
+        loop = asyncio.get_running_loop()
+        loop_key = (id(loop), key)
+        flight, leader = self._join(self._async_streams, loop_key, _AsyncStreamFlight, reader=True)
+        if leader:
+            # 上游在独立任务中读取，发起者被取消或提前关闭迭代器都不会中断其余读取者
+            flight.task = loop.create_task(self._pump(loop_key, flight, fn))
+        return self._read_astream(loop_key, flight), not leader
+    
+    def in_flight(self) -> int:
+        """进行中的调用数"""
+        with self._lock:
+            return len(self._calls) + len(self._streams) + len(self._async_calls) + len(self._async_streams)
+    
+    def _join(self, flights: Dict, key: Hashable, factory: Callable, reader: bool = False):
+        """加入进行中的调用，没有时创建并成为发起者，返回 (调用, 是否为发起者)；流式调用同时登记读取者"""
+        with self._lock:
+            flight = flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = flights[key] = factory()
+            if reader:
+                flight.readers += 1
+            return flight, leader
+    
+    def _leave(self, flights: Dict, key: Hashable, flight) -> bool:
+        """
+        读取者离开流式调用
+        
+        Returns:
+            bool: 是否是最后一个读取者且上游尚未结束（此时已移除调用，由调用方关闭上游）
+        """
+        with self._lock:
+            flight.readers -= 1
+            abandoned = flight.readers == 0 and not flight.done
+            if abandoned and flights.get(key) is flight:
+                del flights[key]
+            return abandoned
+    
+    def _finish(self, flights: Dict, key: Hashable, flight: _Flight):
+        """结束同步调用：先移除（之后到达的相同请求重新发起），再唤醒跟随者"""
+        with self._lock:
+            if flights.get(key) is flight:
+                del flights[key]
+        with flight.condition:
+            flight.done = True
+            flight.condition.notify_all()
+    
+    def _read_stream(self, key: Hashable, flight: _Flight) -> Iterator[str]:
+        """读取者（发起者和跟随者相同）：依次产出片段，需要新片段且没有其他读取者在读取上游时由自己读取"""
+        index = 0
+        try:
+            while True:
+                with flight.condition:
+                    flight.condition.wait_for(
+                        lambda: flight.done or len(flight.chunks) > index or not flight.pulling
+                    )
+                    chunks = flight.chunks[index:]
+                    done = flight.done
+                    pull = not chunks and not done
+                    if pull:
+                        flight.pulling = True
+                if pull:
+                    self._pull(key, flight)
+                    continue
+                index += len(chunks)
+                yield from chunks
+                if done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+        finally:
+            if self._leave(self._streams, key, flight):
+                if flight.source is not None:
+                    flight.source.close()
+                flight.error = _abandoned_error()
+                self._finish(self._streams, key, flight)
+    
+    def _pull(self, key: Hashable, flight: _Flight):
+        """从上游读取一个片段并广播给读取者（上游结束或出错时结束调用）"""
+        try:
+            if flight.source is None:
+                flight.source = iter(flight.start())
+            chunk = next(flight.source)
+        except StopIteration:
+            self._finish(self._streams, key, flight)
+        except BaseException as e:
+            flight.error = e
+            self._finish(self._streams, key, flight)
+        else:
+            with flight.condition:
+                flight.chunks.append(chunk)
+                flight.pulling = False
+                flight.condition.notify_all()
+    
+    async def _pump(self, key: Hashable, flight: _AsyncStreamFlight, fn: Callable[[], AsyncIterator[str]]):
+        """上游读取任务：把片段广播给所有读取者，直到上游结束、出错或所有读取者都离开"""
+        try:
+            async for chunk in fn():
+                flight.chunks.append(chunk)
+                flight.notify()
+        except asyncio.CancelledError:
+            flight.error = _abandoned_error()
+        except Exception as e:
+            flight.error = e
+        finally:
+            with self._lock:
+                if self._async_streams.get(key) is flight:
+                    del self._async_streams[key]
+            flight.done = True
+            flight.notify()
+    
+    async def _read_astream(self, key: Hashable, flight: _AsyncStreamFlight) -> AsyncIterator[str]:
+        """异步读取者（发起者和跟随者相同）：依次产出上游读取任务广播的片段"""
+        index = 0
+        try:
+            while True:
+                changed = flight.changed
+                if index < len(flight.chunks):
+                    chunk = flight.chunks[index]
+                    index += 1
+                    yield chunk
+                    continue
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await changed.wait()
+        finally:
+            if self._leave(self._async_streams, key, flight):
+                flight.task.cancel()
@@ -0,0 +1,176 @@
+"""
+结构化输出
+教学回复的 Pydantic 模型，以及让模型按该模型直接输出 JSON 的 response_format 绑定。
+开启后先按模型严格校验 LLM 输出，校验失败才回退到正则提取，并统计每条解析路径的次数
+"""
+import copy
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, Field, ValidationError
+
+from src.metrics import MetricsRegistry, get_metrics_registry
+
+# off：不约束输出格式；json_mode：response_format=json_object（OpenAI、DeepSeek、Ollama 均支持）；
+# json_schema：按 TeachingResponse 的严格 JSON Schema 输出（需要服务端支持 Structured Outputs）
+STRUCTURED_OUTPUT_MODES = ("off", "json_mode", "json_schema")
+
+# 解析路径（按尝试顺序）
+PARSE_PATHS = ("structured", "regex", "repair", "model_repair", "default")
+
+
+class TeachingFeedback(BaseModel):
+    """教学点评"""
+    
+    grammar_corrections: List[str] = Field(default_factory=list)
+    vocabulary_suggestions: List[str] = Field(default_factory=list)
+    pronunciation_tips: List[str] = Field(default_factory=list)
+    overall_comment: str = ""
+
+
+class TeachingResponse(BaseModel):
+    """教学回复（bot_reply 在最前面，与提示词中的输出格式一致，便于流式输出时先显示回复）"""
+    
+    bot_reply: str
+    teaching_feedback: TeachingFeedback = Field(default_factory=TeachingFeedback)
+    example_sentences: List[str] = Field(default_factory=list)
+
+
+def _make_strict(schema: Dict):
+    """把 JSON Schema 中的每个对象改为严格模式（所有字段必填、不允许额外字段、去掉默认值）"""
+    schema.pop("default", None)
+    if schema.get("type") == "object" and "properties" in schema:
+        schema["required"] = list(schema["properties"])
+        schema["additionalProperties"] = False
+    for value in schema.values():
+        if isinstance(value, dict):
+            _make_strict(value)
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict):
+                    _make_strict(item)
+
+
+def strict_json_schema(model: type = TeachingResponse) -> Dict:
+    """
+    生成 Structured Outputs 严格模式可用的 JSON Schema
+    
+    Args:
+        model: Pydantic 模型
+        
+    Returns:
+        dict: JSON Schema
+    """
+    schema = copy.deepcopy(model.model_json_schema())
+    _make_strict(schema)
+    for definition in schema.get("$defs", {}).values():
+        _make_strict(definition)
+    return schema
+
+
+def response_format(mode: str) -> Optional[Dict]:
+    """
+    获取结构化输出模式对应的 response_format 参数
+    
+    Args:
+        mode: 结构化输出模式
+        
+    Returns:
+        dict: response_format 参数，mode 为 off 时返回 None
+    """
+    if mode == "json_mode":
+        return {"type": "json_object"}
+    if mode == "json_schema":
+        return {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "teaching_response",
+                "schema": strict_json_schema(),
+                "strict": True
+            }
+        }
+    return None
+
+
+class StructuredOutput:
+    """
+    结构化输出模式
+    绑定 response_format 后 LLM 输出仍是 JSON 文本，因此响应缓存、流式输出和 usage 统计不受影响；
+    解析时先按 TeachingResponse 严格校验，失败再由调用方回退到正则提取
+    """
+    
+    def __init__(self, mode: str = "off", metrics: Optional[MetricsRegistry] = None):
+        """
+        初始化结构化输出模式
+        
+        Args:
+            mode: 结构化输出模式（off、json_mode 或 json_schema）
+            metrics: 指标注册表（默认使用全局注册表）
+        """
+        if mode not in STRUCTURED_OUTPUT_MODES:
+            raise ValueError(f"Unknown structured output mode: {mode}")
+        self.mode = mode
+        self._response_format = response_format(mode)
+        metrics = metrics or get_metrics_registry()
+        self._parse_paths = metrics.counter(
+            "llm_response_parse_total", "响应解析次数（按 source、path=structured/regex/repair/model_repair/default 统计）"
+        )
+    
+    @property
+    def enabled(self) -> bool:
+        """是否开启结构化输出"""
+        return self._response_format is not None
+    
+    def bind(self, llm):
+        """
+        为聊天模型绑定 response_format
+        
+        Args:
+            llm: 聊天模型
+            
+        Returns:
+            绑定了 response_format 的模型（未开启时返回原模型）
+        """
+        if not self.enabled:
+            return llm
+        return llm.bind(response_format=self._response_format)
+    
+    def parse(self, content: str) -> Optional[Dict]:
+        """
+        按 TeachingResponse 严格解析 LLM 输出
+        
+        Args:
+            content: LLM 响应内容
+            
+        Returns:
+            dict: 解析后的响应字典，未开启或校验失败时返回 None
+        """
+        if not self.enabled or not content:
+            return None
+        try:
+            return TeachingResponse.model_validate_json(content).model_dump()
+        except ValidationError:
+            return None
+    
+    def record(self, source: str, path: str):
+        """
+        记录一次解析所走的路径
+        
+        Args:
+            source: 场景名称或 conversation_agent
+            path: structured（结构化解析）、regex（提取 JSON）、repair（本地修复）、
+                  model_repair（修复模型整理格式）或 default（都失败，使用默认结构）
+        """
+        self._parse_paths.inc(source=source, path=path)
+    
+    def path_counts(self, source: str) -> Dict[str, float]:
+        """
+        获取某个来源各解析路径的次数
+        
+        Args:
+            source: 场景名称或 conversation_agent
+            
+        Returns:
+            dict: 路径 -> 次数
+        """
+        return {path: self._parse_paths.value(source=source, path=path)
+                for path in PARSE_PATHS}
@@ -0,0 +1,88 @@
+"""
+Token 计数
+默认使用内置的离线估算器；配置 tiktoken 编码名且本地可用时使用 tiktoken 精确计数
+"""
+import re
+from functools import lru_cache
+from typing import Optional
+
+# 英文单词、最多3位的数字组、其他单个非空白字符（标点、中文等）
+_TOKEN_PATTERN = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]")
+
+# 长单词大约每 6 个字母拆分为一个 token
+_CHARS_PER_WORD_TOKEN = 6
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    离线估算文本的 token 数（近似 BPE 分词结果）
+    
+    Args:
+        text: 文本
+        
+    Returns:
+        int: 估算的 token 数
+    """
+    count = 0
+    for piece in _TOKEN_PATTERN.findall(text):
+        if piece[0].isalpha() and piece.isascii():
+            count += 1 + (len(piece) - 1) // _CHARS_PER_WORD_TOKEN
+        else:
+            count += 1
+    return count
+
+
+class TokenCounter:
+    """
+    Token 计数器
+    按文本缓存计数结果，重复出现的消息不会重复分词
+    """
+    
+    def __init__(self, encoding_name: Optional[str] = None, cache_size: int = 4096):
+        """
+        初始化计数器
+        
+        Args:
+            encoding_name: tiktoken 编码名（如 o200k_base）；为 None 或 "approximate" 时使用离线估算
+            cache_size: 计数结果缓存条目数
+        """
+        self.encoding_name = encoding_name
+        self._encoding = self._load_encoding(encoding_name)
+        self._count_cached = lru_cache(maxsize=cache_size)(self._count)
+    
+    @staticmethod
+    def _load_encoding(encoding_name: Optional[str]):
+        """加载 tiktoken 编码（不可用时返回 None，回退到离线估算）"""
+        if not encoding_name or encoding_name == "approximate":
+            return None
+        try:
+            import tiktoken
+            return tiktoken.get_encoding(encoding_name)
+        except Exception as e:
+            print(f"加载 tiktoken 编码 {encoding_name} 失败，使用离线估算: {e}")
+            return None
+    
+    @property
+    def is_exact(self) -> bool:
+        """是否使用 tiktoken 精确计数"""
+        return self._encoding is not None
+    
+    def count(self, text: str) -> int:
+        """
+        计算文本的 token 数
+        
+        Args:
+            text: 文本
+            
+        Returns:
+            int: token 数
+        """
+        if not text:
+            return 0
+        return self._count_cached(text)
+    
+    def _count(self, text: str) -> int:
+        """实际计数（结果由 lru_cache 缓存）"""
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return estimate_tokens(text)
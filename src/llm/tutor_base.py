@@ -0,0 +1,48 @@
+"""
+场景与 ConversationAgent 共用的部分
+出错时的回复文本，以及系统提示词前缀消息的缓存，两者的同步、异步和流式调用路径都使用这里的定义
+"""
+from typing import Optional
+
+from langchain_core.messages import SystemMessage
+
+from src.llm.scheduler import is_overloaded
+
+# 调用出错时的回复（限流重试后仍失败或排队已满时提示学生稍后再试）
+ERROR_REPLY = "I apologize, but I encountered an error. Let's continue our conversation!"
+OVERLOADED_REPLY = "Sorry, a lot of students are practicing right now. Please wait a moment and send your message again!"
+
+
+def error_reply(error: BaseException) -> str:
+    """
+    获取出错时的回复文本
+    
+    Args:
+        error: 调用出错时的异常
+        
+    Returns:
+        str: 限流或排队已满时提示稍后再试，其他错误返回通用回复
+    """
+    return OVERLOADED_REPLY if is_overloaded(error) else ERROR_REPLY
+
+
+class SystemMessageMixin:
+    """
+    系统提示词前缀消息
+    使用方需提供 system_prompt 属性
+    """
+    
+    _cached_system_message: Optional[SystemMessage] = None
+    
+    def _system_message(self) -> SystemMessage:
+        """
+        静态前缀消息（系统提示词）
+        每次调用返回内容字节相同的同一条消息，只在系统提示词被修改时重建，
+        使请求前缀稳定，便于服务端前缀缓存命中
+        
+        Returns:
+            SystemMessage: 系统提示词消息
+        """
+        if self._cached_system_message is None or self._cached_system_message.content != self.system_prompt:
+            self._cached_system_message = SystemMessage(content=self.system_prompt)
+        return self._cached_system_message
@@ -0,0 +1,297 @@
+"""
+运行指标
+进程内的计数器和直方图注册表，供缓存命中率、每轮对话耗时等性能指标使用，
+可以导出为 Prometheus 文本格式
+"""
+import math
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# 默认的直方图分桶上界（秒），覆盖从解析耗时到慢速 LLM 调用的范围
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    """把标签字典转换为可哈希的有序元组"""
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Counter:
+    """单调递增计数器（支持标签）"""
+    
+    def __init__(self, name: str, description: str = ""):
+        """
+        初始化计数器
+        
+        Args:
+            name: 指标名称
+            description: 指标说明
+        """
+        self.name = name
+        self.description = description
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, amount: float = 1.0, **labels):
+        """
+        增加计数
+        
+        Args:
+            amount: 增加量
+            **labels: 标签
+        """
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+    
+    def value(self, **labels) -> float:
+        """
+        获取计数值
+        
+        Args:
+            **labels: 标签
+            
+        Returns:
+            float: 当前值
+        """
+        return self._values.get(_label_key(labels), 0.0)
+    
+    def samples(self) -> Dict[LabelKey, float]:
+        """获取所有标签组合的当前值"""
+        with self._lock:
+            return dict(self._values)
+
+
+class HistogramSample:
+    """一组标签下的直方图观测值"""
+    
+    def __init__(self, bucket_count: int):
+        """
+        初始化观测值
+        
+        Args:
+            bucket_count: 分桶数量
+        """
+        self.buckets: List[int] = [0] * bucket_count
+        self.count = 0
+        self.sum = 0.0
+
+
+class Histogram:
+    """直方图（支持标签），记录观测值落在各分桶中的次数以及总和"""
+    
+    def __init__(self, name: str, description: str = "", buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """
+        初始化直方图
+        
+        Args:
+            name: 指标名称
+            description: 指标说明
+            buckets: 递增的分桶上界（+Inf 分桶自动包含）
+        """
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[LabelKey, HistogramSample] = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, value: float, **labels):
+        """
+        记录一个观测值
+        
+        Args:
+            value: 观测值
+            **labels: 标签
+        """
+        key = _label_key(labels)
+        with self._lock:
+            sample = self._values.get(key)
+            if sample is None:
+                sample = self._values[key] = HistogramSample(len(self.buckets))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    sample.buckets[index] += 1
+                    break
+            sample.count += 1
+            sample.sum += value
+    
+    def count(self, **labels) -> int:
+        """
+        获取观测次数
+        
+        Args:
+            **labels: 标签
+            
+        Returns:
+            int: 观测次数
+        """
+        sample = self._values.get(_label_key(labels))
+        return sample.count if sample is not None else 0
+    
+    def sum(self, **labels) -> float:
+        """
+        获取观测值总和
+        
+        Args:
+            **labels: 标签
+            
+        Returns:
+            float: 观测值总和
+        """
+        sample = self._values.get(_label_key(labels))
+        return sample.sum if sample is not None else 0.0
+    
+    def samples(self) -> Dict[LabelKey, Dict]:
+        """获取所有标签组合的累计分桶计数、观测次数和总和"""
+        with self._lock:
+            values = list(self._values.items())
+        result = {}
+        for key, sample in values:
+            cumulative = []
+            total = 0
+            for bucket in sample.buckets:
+                total += bucket
+                cumulative.append(total)
+            result[key] = {"buckets": dict(zip(self.buckets, cumulative)), "count": sample.count, "sum": sample.sum}
+        return result
+
+
+Metric = Union[Counter, Histogram]
+
+
+class MetricsRegistry:
+    """指标注册表"""
+    
+    def __init__(self):
+        """初始化注册表"""
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+    
+    def counter(self, name: str, description: str = "") -> Counter:
+        """
+        获取或创建计数器
+        
+        Args:
+            name: 指标名称
+            description: 指标说明
+            
+        Returns:
+            Counter: 计数器
+        """
+        return self._get_or_create(name, Counter, lambda: Counter(name, description))
+    
+    def histogram(self, name: str, description: str = "", buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """
+        获取或创建直方图
+        
+        Args:
+            name: 指标名称
+            description: 指标说明
+            buckets: 分桶上界（只在首次创建时生效）
+            
+        Returns:
+            Histogram: 直方图
+        """
+        return self._get_or_create(name, Histogram, lambda: Histogram(name, description, buckets))
+    
+    def get(self, name: str) -> Optional[Metric]:
+        """
+        按名称获取指标
+        
+        Args:
+            name: 指标名称
+            
+        Returns:
+            Counter | Histogram: 指标，不存在时返回 None
+        """
+        return self._metrics.get(name)
+    
+    def snapshot(self) -> Dict[str, Dict[LabelKey, Union[float, Dict]]]:
+        """
+        获取所有指标的当前值
+        
+        Returns:
+            dict: 指标名称 -> {标签: 值}（直方图的值为包含 buckets、count 和 sum 的字典）
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.samples() for metric in metrics}
+    
+    def render_prometheus(self) -> str:
+        """
+        按 Prometheus 文本格式导出所有指标
+        
+        Returns:
+            str: 供 /metrics 端点返回的文本
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            if metric.description:
+                lines.append(f"# HELP {metric.name} {_escape_help(metric.description)}")
+            if isinstance(metric, Histogram):
+                lines.append(f"# TYPE {metric.name} histogram")
+                for key, sample in sorted(metric.samples().items()):
+                    for bound, count in sample["buckets"].items():
+                        labels = _format_labels(key + (("le", _format_value(bound)),))
+                        lines.append(f"{metric.name}_bucket{labels} {count}")
+                    lines.append(f"{metric.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {sample['count']}")
+                    lines.append(f"{metric.name}_sum{_format_labels(key)} {_format_value(sample['sum'])}")
+                    lines.append(f"{metric.name}_count{_format_labels(key)} {sample['count']}")
+            else:
+                lines.append(f"# TYPE {metric.name} counter")
+                for key, value in sorted(metric.samples().items()):
+                    lines.append(f"{metric.name}{_format_labels(key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+    
+    def _get_or_create(self, name: str, kind: type, factory) -> Metric:
+        """获取已注册的指标，不存在时创建（同名指标类型不同时抛出 ValueError）"""
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory()
+            elif not isinstance(metric, kind):
+                raise ValueError(f"metric {name!r} is already registered as {type(metric).__name__}")
+            return metric
+
+
+def _escape_help(text: str) -> str:
+    """转义 HELP 行中的反斜杠和换行"""
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _format_labels(key: LabelKey) -> str:
+    """把标签元组格式化为 {name="value",...}（没有标签时返回空字符串）"""
+    if not key:
+        return ""
+    pairs = []
+    for name, value in key:
+        escaped = value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    """格式化数值（整数值不带小数部分）"""
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+# 全局指标注册表
+_registry = MetricsRegistry()
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    """
+    获取全局指标注册表
+    
+    Returns:
+        MetricsRegistry: 指标注册表
+    """
+    return _registry
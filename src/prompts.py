@@ -0,0 +1,217 @@
+"""
+提示词片段注册表
+场景和 ConversationAgent 的系统提示词由共享片段（输出要求、JSON 格式、通用规则）加各自的场景内容拼接而成，
+每个提示词只构建一次并驻留（intern），同时统计每个提示词的 token 长度，便于发现提示词膨胀
+
+查看各提示词的 token 长度：python -m src.prompts
+"""
+import sys
+import threading
+from string import Template
+from typing import Dict, Optional, Sequence, Tuple
+
+from src.llm.tokenizer import TokenCounter
+
+# 三个输出组成部分的说明（$topic：场景话题，$role：机器人扮演的角色）
+TEACHING_COMPONENTS = """**CRITICAL OUTPUT REQUIREMENTS - You MUST follow this format strictly:**
+
+Every response you generate MUST include the following three components in JSON format:
+
+1. **Teaching Feedback (教学点评)**: Constructive feedback on the learner's message: grammar corrections (if needed), vocabulary suggestions for $topic, pronunciation tips (if applicable) and an overall comment on communication effectiveness.
+
+2. **Three Example Sentences (3个英语例句)**: Exactly 3 different English sentences that are relevant to $topic, help advance the conversation, demonstrate natural usage and suit the learner's level.
+
+3. **Bot Role Reply (Bot角色回复)**: A natural response as $role that answers the learner appropriately and keeps the conversation flowing."""
+
+# JSON 输出格式（bot_reply 在最前面，便于流式输出时先显示回复）
+OUTPUT_FORMAT = """**OUTPUT FORMAT - You MUST use this exact JSON structure:**
+
+```json
+{
+    "bot_reply": "Your response as $role.",
+    "teaching_feedback": {
+        "grammar_corrections": ["correction 1", "correction 2", ...],
+        "vocabulary_suggestions": ["suggestion 1", "suggestion 2", ...],
+        "pronunciation_tips": ["tip 1", "tip 2", ...],
+        "overall_comment": "Overall feedback on the learner's message"
+    },
+    "example_sentences": [
+        "First example sentence.",
+        "Second example sentence.",
+        "Third example sentence."
+    ]
+}
+```"""
+
+# 所有场景通用的规则
+OUTPUT_RULES = """**IMPORTANT RULES:**
+- ALWAYS return exactly 3 example sentences - no more, no less
+- Format your response as valid JSON - do not include any text outside the JSON structure, and escape all strings properly
+- Put the "bot_reply" field first in the JSON object so the reply can be shown while the rest is still being written
+- If the learner's message is perfect, still provide positive feedback and example sentences"""
+
+# 默认拼接的共享片段（按顺序放在场景内容之后）
+DEFAULT_FRAGMENTS = ("teaching_components", "output_format", "output_rules")
+
+PromptKey = Tuple[str, Tuple[str, ...], str, Tuple[Tuple[str, str], ...]]
+
+
+class PromptRegistry:
+    """
+    提示词片段注册表
+    相同参数的提示词只构建一次，返回同一个驻留字符串
+    """
+    
+    def __init__(self, token_counter: Optional[TokenCounter] = None):
+        """
+        初始化注册表
+        
+        Args:
+            token_counter: token 计数器（默认使用离线估算）
+        """
+        self.token_counter = token_counter or TokenCounter()
+        self._fragments: Dict[str, str] = {}
+        self._prompts: Dict[str, str] = {}
+        self._keys: Dict[str, PromptKey] = {}
+        self._token_lengths: Dict[str, int] = {}
+        self._lock = threading.Lock()
+    
+    def register_fragment(self, name: str, text: str):
+        """
+        注册共享片段
+        
+        Args:
+            name: 片段名称
+            text: 片段内容（可包含 $role、$topic 等 string.Template 占位符）
+        """
+        with self._lock:
+            self._fragments[name] = text
+    
+    def fragment(self, name: str) -> str:
+        """
+        获取共享片段
+        
+        Args:
+            name: 片段名称
+            
+        Returns:
+            str: 片段内容（未替换占位符）
+        """
+        return self._fragments[name]
+    
+    def build(self, name: str, context: str, fragments: Sequence[str] = DEFAULT_FRAGMENTS,
+              suffix: str = "", **variables) -> str:
+        """
+        构建并驻留系统提示词
+        
+        Args:
+            name: 提示词名称（如场景名称）
+            context: 场景特定内容（角色、背景等），放在最前面
+            fragments: 依次拼接的共享片段名称
+            suffix: 放在共享片段之后的场景特定内容（场景规则、话题示例等）
+            **variables: 替换共享片段占位符的变量
+            
+        Returns:
+            str: 系统提示词，相同参数多次调用返回同一个字符串对象
+        """
+        key = (context, tuple(fragments), suffix, tuple(sorted(variables.items())))
+        with self._lock:
+            if self._keys.get(name) == key:
+                return self._prompts[name]
+            
+            parts = [context.strip()]
+            parts.extend(Template(self._fragments[fragment]).substitute(variables) for fragment in fragments)
+            if suffix:
+                parts.append(suffix.strip())
+            prompt = sys.intern("\n\n".join(parts))
+            
+            self._prompts[name] = prompt
+            self._keys[name] = key
+            self._token_lengths[name] = self.token_counter.count(prompt)
+            return prompt
+    
+    def get(self, name: str) -> Optional[str]:
+        """
+        获取已构建的提示词
+        
+        Args:
+            name: 提示词名称
+            
+        Returns:
+            str: 提示词，尚未构建时返回 None
+        """
+        return self._prompts.get(name)
+    
+    def token_lengths(self) -> Dict[str, int]:
+        """
+        获取每个已构建提示词的 token 长度
+        
+        Returns:
+            dict: 提示词名称 -> token 数
+        """
+        with self._lock:
+            return dict(self._token_lengths)
+    
+    def fragment_token_lengths(self) -> Dict[str, int]:
+        """
+        获取每个共享片段（未替换占位符）的 token 长度
+        
+        Returns:
+            dict: 片段名称 -> token 数
+        """
+        with self._lock:
+            fragments = dict(self._fragments)
+        return {name: self.token_counter.count(text) for name, text in fragments.items()}
+
+
+def _create_default_registry() -> PromptRegistry:
+    """创建注册了默认共享片段的注册表"""
+    registry = PromptRegistry()
+    registry.register_fragment("teaching_components", TEACHING_COMPONENTS)
+    registry.register_fragment("output_format", OUTPUT_FORMAT)
+    registry.register_fragment("output_rules", OUTPUT_RULES)
+    return registry
+
+
+# 全局提示词注册表
+_registry = _create_default_registry()
+
+
+def get_prompt_registry() -> PromptRegistry:
+    """
+    获取全局提示词注册表
+    
+    Returns:
+        PromptRegistry: 提示词注册表
+    """
+    return _registry
+
+
+def build_all_prompts() -> Dict[str, int]:
+    """
+    构建所有场景和 ConversationAgent 的系统提示词
+    
+    Returns:
+        dict: 提示词名称 -> token 数
+    """
+    import importlib
+    from src.agents.conversation_agent import build_agent_system_prompt
+    from src.scenario_manager import ScenarioManager
+    
+    for path in ScenarioManager.SCENARIO_CLASSES.values():
+        importlib.import_module(path.partition(":")[0]).build_system_prompt()
+    build_agent_system_prompt()
+    return get_prompt_registry().token_lengths()
+
+
+if __name__ == "__main__":
+    # 以 python -m 运行时本文件是 __main__，需从 src.prompts 取场景实际使用的注册表
+    from src.prompts import build_all_prompts as _build_all, get_prompt_registry as _get_registry
+    
+    lengths = _build_all()
+    print("共享片段:")
+    for name, tokens in _get_registry().fragment_token_lengths().items():
+        print(f"  {name:<24}{tokens:>6} tokens")
+    print("系统提示词:")
+    for name, tokens in lengths.items():
+        print(f"  {name:<24}{tokens:>6} tokens")
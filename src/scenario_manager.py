@@ -1,66 +1,101 @@
 """
 场景管理器
-管理所有场景的创建和切换
+管理所有场景和 ConversationAgent 的创建和切换（按需创建，更新 LLM 配置时一起失效）
 """
-from typing import Dict, Optional, Type
-import sys
-from pathlib import Path
-
-# 添加项目根目录到路径
-project_root = Path(__file__).parent.parent
-sys.path.insert(0, str(project_root))
+import importlib
+import threading
+from typing import TYPE_CHECKING, Callable, Dict, Optional, Union
 
 from src.config import get_config
-from src.scenarios import (
-    BaseScenario,
-    SalaryNegotiationScenario,
-    ApartmentRentalScenario,
-    LeaveRequestScenario,
-    AirportCheckinScenario
-)
+from src.context_builder import ContextBuilder
+from src.llm.client_registry import ClientKey, LLMClientRegistry
+from src.llm.invoker import LLMInvoker
+from src.llm.pool import LLMPool
+
+if TYPE_CHECKING:
+    from src.agents.conversation_agent import ConversationAgent
+    from src.scenarios import BaseScenario
+
+# 场景工厂：场景类本身、返回场景实例的可调用对象，或 "模块:类名" 形式的导入路径
+ScenarioFactory = Union[str, Callable[..., "BaseScenario"]]
+
+
+def _import_object(path: str):
+    """
+    按 "模块:名称" 导入对象
+    
+    Args:
+        path: 导入路径
+        
+    Returns:
+        导入的对象
+    """
+    module_name, _, attr = path.partition(":")
+    return getattr(importlib.import_module(module_name), attr)
 
 
 class ScenarioManager:
     """场景管理器"""
     
-    # 场景类映射
-    SCENARIO_CLASSES: Dict[str, Type[BaseScenario]] = {
-        "salary_negotiation": SalaryNegotiationScenario,
-        "apartment_rental": ApartmentRentalScenario,
-        "leave_request": LeaveRequestScenario,
-        "airport_checkin": AirportCheckinScenario
+    # 场景类映射（导入路径，首次创建场景时才导入场景模块和 LangChain）
+    SCENARIO_CLASSES: Dict[str, str] = {
+        "salary_negotiation": "src.scenarios.salary_negotiation_scenario:SalaryNegotiationScenario",
+        "apartment_rental": "src.scenarios.apartment_rental_scenario:ApartmentRentalScenario",
+        "leave_request": "src.scenarios.leave_request_scenario:LeaveRequestScenario",
+        "airport_checkin": "src.scenarios.airport_checkin_scenario:AirportCheckinScenario"
     }
     
     def __init__(self, config_path: str = "config.json"):
         """
-        初始化场景管理器
+        初始化场景管理器（只注册场景工厂，场景实例在首次获取时创建）
         
         Args:
             config_path: 配置文件路径
         """
         self.config = get_config(config_path)
-        self.scenarios: Dict[str, BaseScenario] = {}
-        self._initialize_scenarios()
+        self.scenarios: Dict[str, "BaseScenario"] = {}
+        # 场景工厂：场景名称 -> 接收 LLM 配置等参数并返回场景实例的可调用对象（或其导入路径）
+        self._factories: Dict[str, ScenarioFactory] = dict(self.SCENARIO_CLASSES)
+        # 每个已创建场景所用的 LLM 客户端键（用于更新配置时判断是否需要重建）
+        self._client_keys: Dict[str, ClientKey] = {}
+        # ConversationAgent 与场景共享调用器、客户端和后端池，同样在首次获取时创建
+        self._conversation_agent: Optional["ConversationAgent"] = None
+        self._agent_client_key: Optional[ClientKey] = None
+        self._lock = threading.Lock()
+        # 所有场景共享一个上下文构建器（共享 token 计数缓存）
+        context_config = self.config.get_context_config()
+        self.context_builder = ContextBuilder.from_config(context_config)
+        self.summarize_history = context_config.get("summarize_history", True)
+        # 所有场景共享一个 LLM 调用器（共享响应缓存和请求调度器，ConversationAgent 也使用同一个调用器）
+        self.invoker = LLMInvoker.from_config(self.config)
+        self.scheduler = self.invoker.scheduler
+        # 本地修复 JSON 失败时是否调用修复模型（默认关闭，每次修复都是一次额外的模型调用；
+        # 修复模型为 None 时使用主模型，开启时建议配置更便宜的修复模型）
+        repair_config = self.config.get_repair_config()
+        self.model_repair = repair_config.get("enabled", False)
+        self.repair_model = repair_config.get("model")
+        # 所有场景共享 LLM 客户端和 HTTP 连接池
+        self.llm_registry = LLMClientRegistry.from_config(self.config.get_connection_pool_config())
+        # 配置了多个后端时所有场景共享一个后端池（共享延迟统计和熔断状态）
+        self.llm_pool = self._create_pool()
     
-    def _initialize_scenarios(self):
-        """初始化所有启用的场景"""
-        llm_config = self.config.get_llm_config()
-        enabled_scenarios = self.config.get_enabled_scenarios()
+    def register_scenario(self, scenario_name: str, factory: ScenarioFactory):
+        """
+        注册场景工厂（已创建的同名场景会在下次获取时按新工厂重建）
         
-        for scenario_name in enabled_scenarios:
-            if scenario_name in self.SCENARIO_CLASSES:
-                scenario_class = self.SCENARIO_CLASSES[scenario_name]
-                scenario = scenario_class(
-                    model_name=llm_config.get("model", "gpt-4o-mini"),
-                    temperature=llm_config.get("temperature", 0.7),
-                    api_key=llm_config.get("api_key"),
-                    base_url=llm_config.get("base_url")
-                )
-                self.scenarios[scenario_name] = scenario
+        Args:
+            scenario_name: 场景名称
+            factory: 场景类或返回场景实例的可调用对象，接收 model_name、temperature、
+                     api_key、base_url 等关键字参数；也可以是 "模块:类名" 形式的导入路径
+        """
+        with self._lock:
+            self._factories[scenario_name] = factory
+            self.scenarios.pop(scenario_name, None)
+            self._client_keys.pop(scenario_name, None)
     
-    def get_scenario(self, scenario_name: str) -> Optional[BaseScenario]:
+    def get_scenario(self, scenario_name: str) -> Optional["BaseScenario"]:
         """
-        获取场景实例
+        获取场景实例（首次获取时创建）
         
         Args:
             scenario_name: 场景名称
@@ -69,23 +104,73 @@ class ScenarioManager:
             BaseScenario: 场景实例，如果不存在则返回 None
         """
         # 如果场景已存在，直接返回
-        if scenario_name in self.scenarios:
-            return self.scenarios[scenario_name]
+        scenario = self.scenarios.get(scenario_name)
+        if scenario is not None:
+            return scenario
         
-        # 如果场景类存在但未初始化，创建实例
-        if scenario_name in self.SCENARIO_CLASSES:
+        with self._lock:
+            # 加锁后再检查一次，避免并发请求重复创建
+            scenario = self.scenarios.get(scenario_name)
+            if scenario is not None:
+                return scenario
+            
+            factory = self._factories.get(scenario_name)
+            if factory is None:
+                return None
+            if isinstance(factory, str):
+                factory = self._factories[scenario_name] = _import_object(factory)
+            
             llm_config = self.config.get_llm_config()
-            scenario_class = self.SCENARIO_CLASSES[scenario_name]
-            scenario = scenario_class(
+            scenario = factory(
                 model_name=llm_config.get("model", "gpt-4o-mini"),
                 temperature=llm_config.get("temperature", 0.7),
                 api_key=llm_config.get("api_key"),
-                base_url=llm_config.get("base_url")
+                base_url=llm_config.get("base_url"),
+                context_builder=self.context_builder,
+                summarize_history=self.summarize_history,
+                invoker=self.invoker,
+                llm_registry=self.llm_registry,
+                structured_output=llm_config.get("structured_output", "off"),
+                model_repair=self.model_repair,
+                repair_model=self.repair_model,
+                llm_pool=self.llm_pool
             )
             self.scenarios[scenario_name] = scenario
+            self._client_keys[scenario_name] = self._client_key(llm_config)
             return scenario
+    
+    def get_conversation_agent(self) -> "ConversationAgent":
+        """
+        获取 ConversationAgent（首次获取时导入并创建，更新 LLM 配置后按新配置重建）
+        
+        Returns:
+            ConversationAgent: 对话教学智能体
+        """
+        agent = self._conversation_agent
+        if agent is not None:
+            return agent
         
-        return None
+        with self._lock:
+            if self._conversation_agent is not None:
+                return self._conversation_agent
+            
+            from src.agents.conversation_agent import ConversationAgent
+            llm_config = self.config.get_llm_config()
+            self._conversation_agent = ConversationAgent(
+                model_name=llm_config.get("model", "gpt-4o-mini"),
+                temperature=llm_config.get("temperature", 0.7),
+                api_key=llm_config.get("api_key"),
+                base_url=llm_config.get("base_url"),
+                context_builder=self.context_builder,
+                invoker=self.invoker,
+                llm_registry=self.llm_registry,
+                structured_output=llm_config.get("structured_output", "off"),
+                model_repair=self.model_repair,
+                repair_model=self.repair_model,
+                llm_pool=self.llm_pool
+            )
+            self._agent_client_key = self._client_key(llm_config)
+            return self._conversation_agent
     
     def list_scenarios(self) -> list:
         """
@@ -94,7 +179,7 @@ class ScenarioManager:
         Returns:
             list: 场景名称列表
         """
-        return list(self.SCENARIO_CLASSES.keys())
+        return list(self._factories.keys())
     
     def list_enabled_scenarios(self) -> list:
         """
@@ -108,7 +193,7 @@ class ScenarioManager:
     def update_llm_config(self, provider: str, model: str, temperature: float = 0.7,
                           api_key: Optional[str] = None, base_url: Optional[str] = None):
         """
-        更新 LLM 配置并重新初始化所有场景
+        更新 LLM 配置，只让客户端配置发生变化的已创建场景和 ConversationAgent 失效（下次获取时重建）
         
         Args:
             provider: 提供商
@@ -117,8 +202,48 @@ class ScenarioManager:
             api_key: API Key
             base_url: Base URL
         """
+        old_temperature = self.config.get_llm_config().get("temperature", 0.7)
         self.config.set_llm_config(provider, model, temperature, api_key, base_url)
-        # 重新初始化所有场景
-        self.scenarios.clear()
-        self._initialize_scenarios()
-
+        new_key = self._client_key(self.config.get_llm_config())
+        
+        with self._lock:
+            # 温度变化时按新温度重建后端池（此时所有场景和 ConversationAgent 的客户端键都会变化，重建时改用新的后端池）
+            if self.llm_pool is not None and temperature != old_temperature:
+                self.llm_pool = self._create_pool()
+            old_keys = set()
+            stale = [name for name, key in self._client_keys.items() if key != new_key]
+            for scenario_name in stale:
+                del self.scenarios[scenario_name]
+                old_keys.add(self._client_keys.pop(scenario_name))
+            if self._agent_client_key is not None and self._agent_client_key != new_key:
+                self._conversation_agent = None
+                old_keys.add(self._agent_client_key)
+                self._agent_client_key = None
+            # 没有场景或 ConversationAgent 再使用的旧客户端从注册表移除
+            for old_key in old_keys:
+                if old_key not in self._client_keys.values() and old_key != self._agent_client_key:
+                    self.llm_registry.discard(old_key)
+    
+    def _create_pool(self) -> Optional[LLMPool]:
+        """根据 routing 配置创建后端池（没有配置后端时返回 None）"""
+        return LLMPool.from_config(
+            self.config.get_routing_config(),
+            self._create_backend_llm,
+            self.config.get_llm_config().get("temperature", 0.7)
+        )
+    
+    def _create_backend_llm(self, model_name: str, temperature: float, api_key: Optional[str],
+                            base_url: Optional[str]):
+        """创建后端池中的聊天模型（第一次调用该后端时才导入 LangChain）"""
+        from langchain_openai import ChatOpenAI
+        return self.llm_registry.get(ChatOpenAI, model_name, temperature, api_key, base_url)
+    
+    @staticmethod
+    def _client_key(llm_config: Dict) -> ClientKey:
+        """根据 LLM 配置生成客户端键"""
+        return LLMClientRegistry.make_key(
+            llm_config.get("model", "gpt-4o-mini"),
+            llm_config.get("temperature", 0.7),
+            llm_config.get("api_key"),
+            llm_config.get("base_url")
+        )
@@ -2,17 +2,26 @@
 场景模块
 包含所有场景实现
 """
-from .base_scenario import BaseScenario
-from .salary_negotiation_scenario import SalaryNegotiationScenario
-from .apartment_rental_scenario import ApartmentRentalScenario
-from .leave_request_scenario import LeaveRequestScenario
-from .airport_checkin_scenario import AirportCheckinScenario
+import importlib
 
-__all__ = [
-    'BaseScenario',
-    'SalaryNegotiationScenario',
-    'ApartmentRentalScenario',
-    'LeaveRequestScenario',
-    'AirportCheckinScenario'
-]
+# 导出名称 -> 所在子模块（首次访问时才导入，避免启动时加载 LangChain）
+_EXPORTS = {
+    'BaseScenario': '.base_scenario',
+    'SalaryNegotiationScenario': '.salary_negotiation_scenario',
+    'ApartmentRentalScenario': '.apartment_rental_scenario',
+    'LeaveRequestScenario': '.leave_request_scenario',
+    'AirportCheckinScenario': '.airport_checkin_scenario'
+}
 
+
+def __getattr__(name):
+    """按需导入导出的类"""
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+__all__ = list(_EXPORTS)
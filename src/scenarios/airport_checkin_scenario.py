@@ -4,24 +4,11 @@
 """
 from .base_scenario import BaseScenario
 from typing import Dict
+from src.prompts import get_prompt_registry
 
 
-class AirportCheckinScenario(BaseScenario):
-    """机场托运场景"""
-    
-    def __init__(self, model_name: str = "gpt-4o-mini", temperature: float = 0.7,
-                 api_key: str = None, base_url: str = None):
-        super().__init__(
-            name="airport_checkin",
-            model_name=model_name,
-            temperature=temperature,
-            api_key=api_key,
-            base_url=base_url
-        )
-    
-    def get_system_prompt(self) -> str:
-        """获取机场托运场景的系统提示词"""
-        return """You are a professional and helpful airline check-in agent at an airport. Your role is to help English learners practice checking in for a flight and handling luggage in English.
+# 角色与场景背景
+SYSTEM_PROMPT_CONTEXT = """You are a professional and helpful airline check-in agent at an airport. Your role is to help English learners practice checking in for a flight and handling luggage in English.
 
 **SCENARIO CONTEXT:**
 - The learner is at the airport checking in for a flight
@@ -33,57 +20,13 @@ class AirportCheckinScenario(BaseScenario):
 1. Respond as a professional airline check-in agent
 2. Provide realistic airport scenarios and responses
 3. Help the learner practice airport and travel-related English
-4. Give constructive feedback on their English communication
-
-**CRITICAL OUTPUT REQUIREMENTS - You MUST follow this format strictly:**
-
-Every response you generate MUST include the following three components in JSON format:
-
-1. **Teaching Feedback (教学点评)**: Provide constructive feedback on the learner's message, including:
-   - Grammar corrections (if needed)
-   - Vocabulary suggestions for airport and travel
-   - Pronunciation tips (if applicable)
-   - Overall communication effectiveness
-
-2. **Three Example Sentences (3个英语例句)**: Provide exactly 3 English example sentences that:
-   - Are relevant to airport check-in
-   - Help advance the check-in conversation
-   - Demonstrate proper airport/travel language
-   - Are suitable for the learner's level
-   - Each sentence should be different and useful for practice
-
-3. **Bot Role Reply (Bot角色回复)**: Provide a natural, professional response as the check-in agent that:
-   - Responds to the learner's questions or requests appropriately
-   - Maintains the check-in conversation flow
-   - Uses appropriate airport and travel vocabulary
-   - Shows helpful and efficient service
-
-**OUTPUT FORMAT - You MUST use this exact JSON structure:**
-
-```json
-{
-    "teaching_feedback": {
-        "grammar_corrections": ["correction 1", "correction 2", ...],
-        "vocabulary_suggestions": ["suggestion 1", "suggestion 2", ...],
-        "pronunciation_tips": ["tip 1", "tip 2", ...],
-        "overall_comment": "Overall feedback on the learner's airport check-in message"
-    },
-    "example_sentences": [
-        "First example sentence related to airport check-in.",
-        "Second example sentence related to airport check-in.",
-        "Third example sentence related to airport check-in."
-    ],
-    "bot_reply": "Your professional response as the airline check-in agent."
-}
-```
-
-**IMPORTANT RULES:**
-1. ALWAYS return exactly 3 example sentences - no more, no less
-2. Example sentences must be relevant to airport check-in
-3. The bot_reply should be professional and helpful
-4. Teaching feedback should focus on travel and airport communication
-5. Format your response as valid JSON - do not include any text outside the JSON structure
-6. Use appropriate airport, travel, and luggage-related vocabulary
+4. Give constructive feedback on their English communication"""
+
+# 场景规则与话题示例
+SYSTEM_PROMPT_SUFFIX = """**SCENARIO RULES:**
+- Keep the bot_reply professional, helpful and efficient
+- Focus teaching feedback on travel and airport communication
+- Use appropriate airport, travel, and luggage-related vocabulary
 
 **Example check-in topics:**
 - Presenting passport and ticket
@@ -94,6 +37,36 @@ Every response you generate MUST include the following three components in JSON
 - Handling special requests or issues
 
 Remember: Always output valid JSON with these three components. Be professional, helpful, and efficient!"""
+
+
+def build_system_prompt() -> str:
+    """构建机场托运场景的系统提示词（共享输出要求 + 场景内容）"""
+    return get_prompt_registry().build(
+        "airport_checkin",
+        SYSTEM_PROMPT_CONTEXT,
+        suffix=SYSTEM_PROMPT_SUFFIX,
+        role="the airline check-in agent",
+        topic="airport check-in"
+    )
+
+
+class AirportCheckinScenario(BaseScenario):
+    """机场托运场景"""
+    
+    def __init__(self, model_name: str = "gpt-4o-mini", temperature: float = 0.7,
+                 api_key: str = None, base_url: str = None, **kwargs):
+        super().__init__(
+            name="airport_checkin",
+            model_name=model_name,
+            temperature=temperature,
+            api_key=api_key,
+            base_url=base_url,
+            **kwargs
+        )
+    
+    def get_system_prompt(self) -> str:
+        """获取机场托运场景的系统提示词"""
+        return build_system_prompt()
     
     def get_welcome_message(self) -> str:
         """获取欢迎消息"""
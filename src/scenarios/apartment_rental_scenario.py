@@ -4,24 +4,11 @@
 """
 from .base_scenario import BaseScenario
 from typing import Dict
+from src.prompts import get_prompt_registry
 
 
-class ApartmentRentalScenario(BaseScenario):
-    """租房场景"""
-    
-    def __init__(self, model_name: str = "gpt-4o-mini", temperature: float = 0.7,
-                 api_key: str = None, base_url: str = None):
-        super().__init__(
-            name="apartment_rental",
-            model_name=model_name,
-            temperature=temperature,
-            api_key=api_key,
-            base_url=base_url
-        )
-    
-    def get_system_prompt(self) -> str:
-        """获取租房场景的系统提示词"""
-        return """You are a friendly and professional landlord or property manager in an apartment rental scenario. Your role is to help English learners practice renting an apartment in English.
+# 角色与场景背景
+SYSTEM_PROMPT_CONTEXT = """You are a friendly and professional landlord or property manager in an apartment rental scenario. Your role is to help English learners practice renting an apartment in English.
 
 **SCENARIO CONTEXT:**
 - The learner is looking to rent an apartment
@@ -33,57 +20,13 @@ class ApartmentRentalScenario(BaseScenario):
 1. Respond as a professional landlord/property manager
 2. Provide realistic rental scenarios and responses
 3. Help the learner practice rental-related English
-4. Give constructive feedback on their English communication
-
-**CRITICAL OUTPUT REQUIREMENTS - You MUST follow this format strictly:**
-
-Every response you generate MUST include the following three components in JSON format:
-
-1. **Teaching Feedback (教学点评)**: Provide constructive feedback on the learner's message, including:
-   - Grammar corrections (if needed)
-   - Vocabulary suggestions for apartment rental
-   - Pronunciation tips (if applicable)
-   - Overall communication effectiveness
-
-2. **Three Example Sentences (3个英语例句)**: Provide exactly 3 English example sentences that:
-   - Are relevant to apartment rental
-   - Help advance the rental conversation
-   - Demonstrate proper rental-related language
-   - Are suitable for the learner's level
-   - Each sentence should be different and useful for practice
-
-3. **Bot Role Reply (Bot角色回复)**: Provide a natural, friendly response as the landlord/property manager that:
-   - Responds to the learner's questions or statements appropriately
-   - Maintains the rental conversation flow
-   - Uses appropriate rental-related vocabulary
-   - Shows helpful and professional behavior
-
-**OUTPUT FORMAT - You MUST use this exact JSON structure:**
-
-```json
-{
-    "teaching_feedback": {
-        "grammar_corrections": ["correction 1", "correction 2", ...],
-        "vocabulary_suggestions": ["suggestion 1", "suggestion 2", ...],
-        "pronunciation_tips": ["tip 1", "tip 2", ...],
-        "overall_comment": "Overall feedback on the learner's rental message"
-    },
-    "example_sentences": [
-        "First example sentence related to apartment rental.",
-        "Second example sentence related to apartment rental.",
-        "Third example sentence related to apartment rental."
-    ],
-    "bot_reply": "Your friendly response as the landlord/property manager."
-}
-```
-
-**IMPORTANT RULES:**
-1. ALWAYS return exactly 3 example sentences - no more, no less
-2. Example sentences must be relevant to apartment rental
-3. The bot_reply should be friendly and helpful
-4. Teaching feedback should focus on rental-related communication
-5. Format your response as valid JSON - do not include any text outside the JSON structure
-6. Use appropriate rental and housing vocabulary
+4. Give constructive feedback on their English communication"""
+
+# 场景规则与话题示例
+SYSTEM_PROMPT_SUFFIX = """**SCENARIO RULES:**
+- Keep the bot_reply friendly and helpful
+- Focus teaching feedback on rental-related communication
+- Use appropriate rental and housing vocabulary
 
 **Example rental topics:**
 - Asking about apartment availability
@@ -94,6 +37,36 @@ Every response you generate MUST include the following three components in JSON
 - Asking about utilities and maintenance
 
 Remember: Always output valid JSON with these three components. Be friendly, helpful, and realistic!"""
+
+
+def build_system_prompt() -> str:
+    """构建租房场景的系统提示词（共享输出要求 + 场景内容）"""
+    return get_prompt_registry().build(
+        "apartment_rental",
+        SYSTEM_PROMPT_CONTEXT,
+        suffix=SYSTEM_PROMPT_SUFFIX,
+        role="the landlord/property manager",
+        topic="apartment rental"
+    )
+
+
+class ApartmentRentalScenario(BaseScenario):
+    """租房场景"""
+    
+    def __init__(self, model_name: str = "gpt-4o-mini", temperature: float = 0.7,
+                 api_key: str = None, base_url: str = None, **kwargs):
+        super().__init__(
+            name="apartment_rental",
+            model_name=model_name,
+            temperature=temperature,
+            api_key=api_key,
+            base_url=base_url,
+            **kwargs
+        )
+    
+    def get_system_prompt(self) -> str:
+        """获取租房场景的系统提示词"""
+        return build_system_prompt()
     
     def get_welcome_message(self) -> str:
         """获取欢迎消息"""
@@ -3,25 +3,36 @@
 所有场景都应该继承此类
 """
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Dict, Iterator, List, Optional
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-import sys
-from pathlib import Path
 
-# 添加项目根目录到路径
-project_root = Path(__file__).parent.parent.parent
-sys.path.insert(0, str(project_root))
+from src.context_builder import ContextBuilder
+from src.history import ConversationHistory
+from src.instrumentation import TurnRecord, get_turn_instrumentation
+from src.llm.client_registry import LLMClientRegistry
+from src.llm.invoker import LLMInvoker
+from src.llm.json_extract import extract_json_object
+from src.llm.json_repair import JSONRepairer, repair_json
+from src.llm.json_stream import PartialJSONParser
+from src.llm.pool import LLMPool
+from src.llm.structured_output import StructuredOutput
+from src.llm.tutor_base import SystemMessageMixin, error_reply
+from src.summarizer import ConversationSummarizer
 
 
-class BaseScenario(ABC):
+class BaseScenario(SystemMessageMixin, ABC):
     """
     场景基类
     定义了场景的基本接口和行为
     """
     
     def __init__(self, name: str, model_name: str = "gpt-4o-mini", temperature: float = 0.7, 
-                 api_key: Optional[str] = None, base_url: Optional[str] = None):
+                 api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 context_builder: Optional[ContextBuilder] = None, summarize_history: bool = False,
+                 invoker: Optional[LLMInvoker] = None, llm_registry: Optional[LLMClientRegistry] = None,
+                 structured_output: str = "off", model_repair: bool = False,
+                 repair_model: Optional[str] = None, llm_pool: Optional[LLMPool] = None):
         """
         初始化场景
         
@@ -31,12 +42,59 @@ class BaseScenario(ABC):
             temperature: 温度参数
             api_key: API Key
             base_url: Base URL（用于 DeepSeek、Ollama 等）
+            context_builder: 上下文窗口构建器（按 token 预算选择历史）
+            summarize_history: 是否把移出上下文窗口的较早轮次合并为滚动摘要
+            invoker: LLM 调用器（处理响应缓存等，可在多个场景间共享）
+            llm_registry: LLM 客户端注册表（传入时复用相同配置的客户端和共享连接池）
+            structured_output: 结构化输出模式（off、json_mode 或 json_schema，开启后正则提取只作为回退）
+            model_repair: 本地修复 JSON 失败时是否调用修复模型整理格式
+            repair_model: 修复模型名称（为 None 时使用主模型）
+            llm_pool: 多后端池（传入时按延迟路由到多个后端并自动故障转移，不再创建单个模型）
         """
         self.name = name
         self.model_name = model_name
         self.temperature = temperature
         
-        # 初始化 LLM
+        # 初始化 LLM（配置了多后端池时使用后端池）
+        if llm_pool is not None:
+            self.llm = llm_pool
+        else:
+            self.llm = self._create_llm(model_name, temperature, api_key, base_url, llm_registry)
+        self.invoker = invoker or LLMInvoker()
+        
+        # 生成回复时使用绑定了 response_format 的模型（摘要等其他调用仍使用原模型）
+        self.structured_output = StructuredOutput(structured_output)
+        self.response_llm = self.structured_output.bind(self.llm)
+        
+        # 本地修复 JSON 失败时由修复模型整理格式（修复模型在第一次需要时才创建）
+        self.repairer: Optional[JSONRepairer] = None
+        if model_repair:
+            repair_model = repair_model or model_name
+            self.repairer = JSONRepairer(
+                lambda: self._create_llm(repair_model, 0.0, api_key, base_url, llm_registry),
+                repair_model,
+                invoker=self.invoker
+            )
+        
+        self.context_builder = context_builder or ContextBuilder()
+        self.summarizer = ConversationSummarizer(
+            name, invoker=self.invoker, model_name=model_name, temperature=temperature
+        ) if summarize_history else None
+        self.instrumentation = get_turn_instrumentation()
+        
+        # 获取场景特定的系统提示词
+        self.system_prompt = self.get_system_prompt()
+        
+        # 默认对话历史（未按会话传入历史时使用；多用户场景应由会话存储提供各自的历史）
+        self.conversation_history = ConversationHistory()
+    
+    @staticmethod
+    def _create_llm(model_name: str, temperature: float, api_key: Optional[str], base_url: Optional[str],
+                    llm_registry: Optional[LLMClientRegistry]):
+        """创建聊天模型（传入注册表时复用相同配置的客户端）"""
+        if llm_registry is not None:
+            return llm_registry.get(ChatOpenAI, model_name, temperature, api_key, base_url)
+        
         llm_kwargs = {
             "model": model_name,
             "temperature": temperature
@@ -47,13 +105,19 @@ class BaseScenario(ABC):
         if base_url:
             llm_kwargs["base_url"] = base_url
         
-        self.llm = ChatOpenAI(**llm_kwargs)
-        
-        # 获取场景特定的系统提示词
-        self.system_prompt = self.get_system_prompt()
-        
-        # 对话历史
-        self.conversation_history: List[Dict] = []
+        return ChatOpenAI(**llm_kwargs)
+    
+    @property
+    def conversation_history(self) -> ConversationHistory:
+        """默认对话历史"""
+        return self._conversation_history
+    
+    @conversation_history.setter
+    def conversation_history(self, value):
+        """设置默认对话历史（兼容直接赋值字典列表）"""
+        if not isinstance(value, ConversationHistory):
+            value = ConversationHistory.from_dicts(value)
+        self._conversation_history = value
     
     @abstractmethod
     def get_system_prompt(self) -> str:
@@ -75,62 +139,274 @@ class BaseScenario(ABC):
         """
         pass
     
-    def generate_response(self, user_message: str) -> Dict:
+    def generate_response(self, user_message: str, conversation_history: Optional[ConversationHistory] = None,
+                          session_id: Optional[str] = None, turn: Optional[TurnRecord] = None) -> Dict:
         """
         生成场景回复
         
         Args:
             user_message: 用户消息
+            conversation_history: 会话自己的对话历史（可选，默认使用场景实例上的历史）
+            session_id: 会话标识（请求调度器按会话轮流放行排队的请求）
+            turn: 外层（Gradio 处理函数）已经开始的本轮统计（为 None 时单独统计本轮）
             
         Returns:
             dict: 包含教学点评、例句和Bot回复的字典
         """
-        # 构建消息列表
-        messages = [SystemMessage(content=self.system_prompt)]
+        with self.instrumentation.turn(self.name, self.model_name, turn) as record:
+            with record.stage("history"):
+                history = self._resolve_history(conversation_history)
+                if self.summarizer is not None:
+                    self.summarizer.update(self.llm, history, self.context_builder, session=session_id, turn=record)
+                messages = self._build_messages(user_message, history)
+            
+            # 调用 LLM
+            try:
+                with record.stage("llm"):
+                    content = self.invoker.invoke(self.response_llm, messages, self.model_name, self.temperature,
+                                                  scenario=self.name, session=session_id, turn=record)
+                record.mark_first_token()
+                with record.stage("parse"):
+                    return self._handle_content(user_message, content, history)
+            except Exception as e:
+                record.outcome = "error"
+                return self._create_error_response(e)
+    
+    async def agenerate_response(self, user_message: str,
+                                 conversation_history: Optional[ConversationHistory] = None,
+                                 session_id: Optional[str] = None,
+                                 turn: Optional[TurnRecord] = None) -> Dict:
+        """
+        异步生成场景回复（基于 ainvoke，不占用工作线程）
         
-        # 添加对话历史
-        for msg in self.conversation_history[-5:]:  # 只保留最近5轮对话
-            if msg.get("role") == "user":
-                messages.append(HumanMessage(content=msg.get("content", "")))
-            elif msg.get("role") == "assistant":
-                messages.append(AIMessage(content=msg.get("content", "")))
+        Args:
+            user_message: 用户消息
+            conversation_history: 会话自己的对话历史（可选，默认使用场景实例上的历史）
+            session_id: 会话标识（请求调度器按会话轮流放行排队的请求）
+            turn: 外层（Gradio 处理函数）已经开始的本轮统计（为 None 时单独统计本轮）
+            
+        Returns:
+            dict: 包含教学点评、例句和Bot回复的字典
+        """
+        with self.instrumentation.turn(self.name, self.model_name, turn) as record:
+            with record.stage("history"):
+                history = self._resolve_history(conversation_history)
+                if self.summarizer is not None:
+                    await self.summarizer.aupdate(self.llm, history, self.context_builder,
+                                                  session=session_id, turn=record)
+                messages = self._build_messages(user_message, history)
+            
+            # 异步调用 LLM
+            try:
+                with record.stage("llm"):
+                    content = await self.invoker.ainvoke(self.response_llm, messages, self.model_name,
+                                                         self.temperature, scenario=self.name, session=session_id,
+                                                         turn=record)
+                record.mark_first_token()
+                with record.stage("parse"):
+                    return await self._ahandle_content(user_message, content, history)
+            except Exception as e:
+                record.outcome = "error"
+                return self._create_error_response(e)
+    
+    def stream_response(self, user_message: str,
+                        conversation_history: Optional[ConversationHistory] = None,
+                        session_id: Optional[str] = None,
+                        turn: Optional[TurnRecord] = None) -> Iterator[Dict]:
+        """
+        流式生成场景回复
         
-        # 添加当前用户消息
-        messages.append(HumanMessage(content=user_message))
+        先产出逐步增长的 bot_reply，teaching_feedback 和 example_sentences
+        生成完毕后再补充，最后产出完整解析后的回复并更新对话历史。
         
-        # 调用 LLM
-        try:
-            response = self.llm.invoke(messages)
-            content = response.content
+        Args:
+            user_message: 用户消息
+            conversation_history: 会话自己的对话历史（可选，默认使用场景实例上的历史）
+            session_id: 会话标识（请求调度器按会话轮流放行排队的请求）
+            turn: 外层（Gradio 处理函数）已经开始的本轮统计（为 None 时单独统计本轮）
             
-            # 解析响应（场景特定的解析逻辑）
-            parsed_response = self._parse_response(content)
+        Yields:
+            dict: 部分解析结果，最后一项为完整回复
+        """
+        with self.instrumentation.turn(self.name, self.model_name, turn) as record:
+            with record.stage("history"):
+                history = self._resolve_history(conversation_history)
+                if self.summarizer is not None:
+                    self.summarizer.update(self.llm, history, self.context_builder, session=session_id, turn=record)
+                messages = self._build_messages(user_message, history)
+            parser = PartialJSONParser()
+            last_snapshot = None
             
-            # 更新对话历史
-            self.conversation_history.append({"role": "user", "content": user_message})
-            self.conversation_history.append({"role": "assistant", "content": content})
+            try:
+                chunks = self.invoker.stream(self.response_llm, messages, self.model_name, self.temperature,
+                                             scenario=self.name, session=session_id, turn=record)
+                for text in record.track(chunks):
+                    with record.timed("parse"):
+                        snapshot = parser.feed(text)
+                    if snapshot and snapshot != last_snapshot:
+                        last_snapshot = snapshot
+                        yield snapshot
+                with record.stage("parse"):
+                    response = self._handle_content(user_message, parser.buffer, history)
+                yield response
+            except Exception as e:
+                record.outcome = "error"
+                yield self._create_error_response(e)
+    
+    async def astream_response(self, user_message: str,
+                               conversation_history: Optional[ConversationHistory] = None,
+                               session_id: Optional[str] = None,
+                               turn: Optional[TurnRecord] = None) -> AsyncIterator[Dict]:
+        """
+        异步流式生成场景回复（基于 astream）
+        
+        Args:
+            user_message: 用户消息
+            conversation_history: 会话自己的对话历史（可选，默认使用场景实例上的历史）
+            session_id: 会话标识（请求调度器按会话轮流放行排队的请求）
+            turn: 外层（Gradio 处理函数）已经开始的本轮统计（为 None 时单独统计本轮）
             
-            return parsed_response
+        Yields:
+            dict: 部分解析结果，最后一项为完整回复
+        """
+        with self.instrumentation.turn(self.name, self.model_name, turn) as record:
+            with record.stage("history"):
+                history = self._resolve_history(conversation_history)
+                if self.summarizer is not None:
+                    await self.summarizer.aupdate(self.llm, history, self.context_builder,
+                                                  session=session_id, turn=record)
+                messages = self._build_messages(user_message, history)
+            parser = PartialJSONParser()
+            last_snapshot = None
             
-        except Exception as e:
-            return {
-                "teaching_feedback": {
-                    "grammar_corrections": [],
-                    "vocabulary_suggestions": [],
-                    "pronunciation_tips": [],
-                    "overall_comment": f"Error: {str(e)}"
-                },
-                "example_sentences": [
-                    "Let's continue our conversation.",
-                    "I'm here to help you practice English.",
-                    "What would you like to say next?"
-                ],
-                "bot_reply": "I apologize, but I encountered an error. Let's continue our conversation!"
-            }
+            try:
+                chunks = self.invoker.astream(self.response_llm, messages, self.model_name, self.temperature,
+                                              scenario=self.name, session=session_id, turn=record)
+                async for text in record.atrack(chunks):
+                    with record.timed("parse"):
+                        snapshot = parser.feed(text)
+                    if snapshot and snapshot != last_snapshot:
+                        last_snapshot = snapshot
+                        yield snapshot
+                with record.stage("parse"):
+                    response = await self._ahandle_content(user_message, parser.buffer, history)
+                yield response
+            except Exception as e:
+                record.outcome = "error"
+                yield self._create_error_response(e)
+    
+    def _resolve_history(self, conversation_history: Optional[ConversationHistory]) -> ConversationHistory:
+        """返回本次请求使用的对话历史（未传入时使用场景实例上的历史）"""
+        if conversation_history is None:
+            return self.conversation_history
+        return conversation_history
+    
+    def _build_messages(self, user_message: str, conversation_history: ConversationHistory) -> List:
+        """
+        构建发送给 LLM 的消息列表
+        
+        Args:
+            user_message: 用户消息
+            conversation_history: 对话历史
+            
+        Returns:
+            list: LangChain 消息列表
+        """
+        # 静态前缀（系统提示词）固定放在最前面，之后才是会变化的摘要、历史和当前消息
+        messages = [self._system_message()]
+        
+        # 较早轮次的滚动摘要作为简短的系统补充
+        if conversation_history.summary:
+            messages.append(SystemMessage(
+                content=f"Summary of the earlier conversation:\n{conversation_history.summary}"
+            ))
+        
+        # 添加对话历史（按 token 预算选择尚未并入摘要的完整轮次）
+        for msg in self.context_builder.select(conversation_history.unsummarized()):
+            if msg.role == "user":
+                messages.append(HumanMessage(content=msg.content))
+            elif msg.role == "assistant":
+                messages.append(AIMessage(content=msg.content))
+        
+        # 添加当前用户消息
+        messages.append(HumanMessage(content=user_message))
+        return messages
+    
+    def _handle_content(self, user_message: str, content: str, conversation_history: ConversationHistory) -> Dict:
+        """
+        解析 LLM 输出并更新对话历史
+        
+        Args:
+            user_message: 用户消息
+            content: LLM 响应内容
+            conversation_history: 需要更新的对话历史
+            
+        Returns:
+            dict: 解析后的响应字典
+        """
+        parsed_response = self._parse_content(content)
+        if parsed_response is None and self.repairer is not None:
+            parsed_response = self._record_model_repair(self.repairer.repair(content))
+        return self._finish_turn(user_message, content, parsed_response, conversation_history)
+    
+    async def _ahandle_content(self, user_message: str, content: str,
+                               conversation_history: ConversationHistory) -> Dict:
+        """
+        解析 LLM 输出并更新对话历史（需要模型修复时异步调用修复模型）
+        
+        Args:
+            user_message: 用户消息
+            content: LLM 响应内容
+            conversation_history: 需要更新的对话历史
+            
+        Returns:
+            dict: 解析后的响应字典
+        """
+        parsed_response = self._parse_content(content)
+        if parsed_response is None and self.repairer is not None:
+            parsed_response = self._record_model_repair(await self.repairer.arepair(content))
+        return self._finish_turn(user_message, content, parsed_response, conversation_history)
+    
+    def _finish_turn(self, user_message: str, content: str, parsed_response: Optional[Dict],
+                     conversation_history: ConversationHistory) -> Dict:
+        """所有解析方式都失败时使用默认结构，然后更新对话历史"""
+        if parsed_response is None:
+            self.structured_output.record(self.name, "default")
+            parsed_response = self._create_default_response(content)
+        
+        # 更新对话历史（assistant 只保存 bot_reply 文本，不保存原始 JSON）
+        evicted = conversation_history.add_turn(user_message, parsed_response.get("bot_reply", ""))
+        if self.summarizer is not None:
+            self.summarizer.track_evicted(conversation_history, evicted)
+        
+        return parsed_response
+    
+    def _record_model_repair(self, parsed_response: Optional[Dict]) -> Optional[Dict]:
+        """记录模型修复成功"""
+        if parsed_response is not None:
+            self.structured_output.record(self.name, "model_repair")
+        return parsed_response
+    
+    def _create_error_response(self, error: Exception) -> Dict:
+        """创建出错时的默认响应（限流或排队已满时提示稍后再试）"""
+        return {
+            "teaching_feedback": {
+                "grammar_corrections": [],
+                "vocabulary_suggestions": [],
+                "pronunciation_tips": [],
+                "overall_comment": f"Error: {str(error)}"
+            },
+            "example_sentences": [
+                "Let's continue our conversation.",
+                "I'm here to help you practice English.",
+                "What would you like to say next?"
+            ],
+            "bot_reply": error_reply(error)
+        }
     
     def _parse_response(self, content: str) -> Dict:
         """
-        解析响应内容（子类可以重写此方法）
+        解析响应内容（不调用修复模型）
         
         Args:
             content: LLM 响应内容
@@ -138,23 +414,37 @@ class BaseScenario(ABC):
         Returns:
             dict: 解析后的响应字典
         """
-        # 默认实现：尝试解析 JSON
-        import json
-        import re
-        
-        try:
-            if "```json" in content:
-                json_match = re.search(r'```json\s*(.*?)\s*```', content, re.DOTALL)
-                if json_match:
-                    return json.loads(json_match.group(1))
-            elif content.strip().startswith('{'):
-                json_match = re.search(r'\{.*\}', content, re.DOTALL)
-                if json_match:
-                    return json.loads(json_match.group(0))
-        except:
-            pass
-        
-        # 如果解析失败，返回默认结构
+        parsed_response = self._parse_content(content)
+        if parsed_response is None:
+            self.structured_output.record(self.name, "default")
+            parsed_response = self._create_default_response(content)
+        return parsed_response
+    
+    def _parse_content(self, content: str) -> Optional[Dict]:
+        """
+        依次尝试结构化解析、提取 JSON 和本地修复，并记录所走的解析路径
+        
+        Args:
+            content: LLM 响应内容
+            
+        Returns:
+            dict: 解析后的响应字典，都失败时返回 None
+        """
+        parsed_response = self.structured_output.parse(content)
+        path = "structured"
+        if parsed_response is None:
+            parsed_response = self._extract_json(content)
+            path = "regex"
+        if parsed_response is None:
+            parsed_response = repair_json(content)
+            path = "repair"
+        
+        if parsed_response is not None:
+            self.structured_output.record(self.name, path)
+        return parsed_response
+    
+    def _create_default_response(self, content: str) -> Dict:
+        """解析失败时的默认结构"""
         return {
             "teaching_feedback": {
                 "grammar_corrections": [],
@@ -170,9 +460,21 @@ class BaseScenario(ABC):
             "bot_reply": content[:500] if content else "Let's continue our conversation!"
         }
     
+    def _extract_json(self, content: str) -> Optional[Dict]:
+        """
+        从响应内容中提取第一个完整的 JSON 对象（一次线性扫描，跳过代码块标记和说明文字）
+        
+        Args:
+            content: LLM 响应内容
+            
+        Returns:
+            dict: 提取到的 JSON 对象，提取失败时返回 None
+        """
+        return extract_json_object(content)
+    
     def reset_conversation(self):
         """重置对话历史"""
-        self.conversation_history = []
+        self.conversation_history.clear()
     
     def get_conversation_history(self) -> List[Dict]:
         """
@@ -181,5 +483,5 @@ class BaseScenario(ABC):
         Returns:
             List[Dict]: 对话历史列表
         """
-        return self.conversation_history.copy()
+        return self.conversation_history.to_dicts()
 
@@ -4,24 +4,11 @@
 """
 from .base_scenario import BaseScenario
 from typing import Dict
+from src.prompts import get_prompt_registry
 
 
-class LeaveRequestScenario(BaseScenario):
-    """单位请假场景"""
-    
-    def __init__(self, model_name: str = "gpt-4o-mini", temperature: float = 0.7,
-                 api_key: str = None, base_url: str = None):
-        super().__init__(
-            name="leave_request",
-            model_name=model_name,
-            temperature=temperature,
-            api_key=api_key,
-            base_url=base_url
-        )
-    
-    def get_system_prompt(self) -> str:
-        """获取单位请假场景的系统提示词"""
-        return """You are a professional and understanding manager or supervisor in a workplace leave request scenario. Your role is to help English learners practice requesting time off from work in English.
+# 角色与场景背景
+SYSTEM_PROMPT_CONTEXT = """You are a professional and understanding manager or supervisor in a workplace leave request scenario. Your role is to help English learners practice requesting time off from work in English.
 
 **SCENARIO CONTEXT:**
 - The learner needs to request time off from work
@@ -33,57 +20,13 @@ class LeaveRequestScenario(BaseScenario):
 1. Respond as a professional manager/supervisor
 2. Provide realistic workplace scenarios and responses
 3. Help the learner practice professional leave request language
-4. Give constructive feedback on their English communication
-
-**CRITICAL OUTPUT REQUIREMENTS - You MUST follow this format strictly:**
-
-Every response you generate MUST include the following three components in JSON format:
-
-1. **Teaching Feedback (教学点评)**: Provide constructive feedback on the learner's message, including:
-   - Grammar corrections (if needed)
-   - Professional vocabulary suggestions for workplace communication
-   - Pronunciation tips (if applicable)
-   - Overall communication effectiveness in a professional context
-
-2. **Three Example Sentences (3个英语例句)**: Provide exactly 3 English example sentences that:
-   - Are relevant to requesting leave from work
-   - Help advance the leave request conversation
-   - Demonstrate professional workplace language
-   - Are suitable for the learner's level
-   - Each sentence should be different and useful for practice
-
-3. **Bot Role Reply (Bot角色回复)**: Provide a natural, professional response as the manager/supervisor that:
-   - Responds to the learner's leave request appropriately
-   - Maintains the professional conversation flow
-   - Uses appropriate workplace language
-   - Shows understanding and professionalism
-
-**OUTPUT FORMAT - You MUST use this exact JSON structure:**
-
-```json
-{
-    "teaching_feedback": {
-        "grammar_corrections": ["correction 1", "correction 2", ...],
-        "vocabulary_suggestions": ["suggestion 1", "suggestion 2", ...],
-        "pronunciation_tips": ["tip 1", "tip 2", ...],
-        "overall_comment": "Overall feedback on the learner's leave request message"
-    },
-    "example_sentences": [
-        "First example sentence related to requesting leave.",
-        "Second example sentence related to requesting leave.",
-        "Third example sentence related to requesting leave."
-    ],
-    "bot_reply": "Your professional response as the manager/supervisor."
-}
-```
-
-**IMPORTANT RULES:**
-1. ALWAYS return exactly 3 example sentences - no more, no less
-2. Example sentences must be relevant to requesting leave
-3. The bot_reply should be professional and understanding
-4. Teaching feedback should focus on professional workplace communication
-5. Format your response as valid JSON - do not include any text outside the JSON structure
-6. Use appropriate workplace and leave-related vocabulary
+4. Give constructive feedback on their English communication"""
+
+# 场景规则与话题示例
+SYSTEM_PROMPT_SUFFIX = """**SCENARIO RULES:**
+- Keep the bot_reply professional and understanding
+- Focus teaching feedback on professional workplace communication
+- Use appropriate workplace and leave-related vocabulary
 
 **Example leave request topics:**
 - Requesting vacation time
@@ -94,6 +37,36 @@ Every response you generate MUST include the following three components in JSON
 - Discussing work coverage during absence
 
 Remember: Always output valid JSON with these three components. Be professional, understanding, and helpful!"""
+
+
+def build_system_prompt() -> str:
+    """构建单位请假场景的系统提示词（共享输出要求 + 场景内容）"""
+    return get_prompt_registry().build(
+        "leave_request",
+        SYSTEM_PROMPT_CONTEXT,
+        suffix=SYSTEM_PROMPT_SUFFIX,
+        role="the manager/supervisor",
+        topic="requesting leave from work"
+    )
+
+
+class LeaveRequestScenario(BaseScenario):
+    """单位请假场景"""
+    
+    def __init__(self, model_name: str = "gpt-4o-mini", temperature: float = 0.7,
+                 api_key: str = None, base_url: str = None, **kwargs):
+        super().__init__(
+            name="leave_request",
+            model_name=model_name,
+            temperature=temperature,
+            api_key=api_key,
+            base_url=base_url,
+            **kwargs
+        )
+    
+    def get_system_prompt(self) -> str:
+        """获取单位请假场景的系统提示词"""
+        return build_system_prompt()
     
     def get_welcome_message(self) -> str:
         """获取欢迎消息"""
@@ -4,24 +4,11 @@
 """
 from .base_scenario import BaseScenario
 from typing import Dict
+from src.prompts import get_prompt_registry
 
 
-class SalaryNegotiationScenario(BaseScenario):
-    """薪酬谈判场景"""
-    
-    def __init__(self, model_name: str = "gpt-4o-mini", temperature: float = 0.7,
-                 api_key: str = None, base_url: str = None):
-        super().__init__(
-            name="salary_negotiation",
-            model_name=model_name,
-            temperature=temperature,
-            api_key=api_key,
-            base_url=base_url
-        )
-    
-    def get_system_prompt(self) -> str:
-        """获取薪酬谈判场景的系统提示词"""
-        return """You are an experienced HR manager or recruiter in a salary negotiation scenario. Your role is to help English learners practice negotiating their salary in a professional setting.
+# 角色与场景背景
+SYSTEM_PROMPT_CONTEXT = """You are an experienced HR manager or recruiter in a salary negotiation scenario. Your role is to help English learners practice negotiating their salary in a professional setting.
 
 **SCENARIO CONTEXT:**
 - The learner is negotiating their salary for a new job position
@@ -33,57 +20,13 @@ class SalaryNegotiationScenario(BaseScenario):
 1. Respond as a professional HR manager/recruiter
 2. Provide realistic negotiation scenarios and responses
 3. Help the learner practice professional negotiation language
-4. Give constructive feedback on their English communication
-
-**CRITICAL OUTPUT REQUIREMENTS - You MUST follow this format strictly:**
-
-Every response you generate MUST include the following three components in JSON format:
-
-1. **Teaching Feedback (教学点评)**: Provide constructive feedback on the learner's message, including:
-   - Grammar corrections (if needed)
-   - Professional vocabulary suggestions for salary negotiation
-   - Pronunciation tips (if applicable)
-   - Overall communication effectiveness in a professional context
-
-2. **Three Example Sentences (3个英语例句)**: Provide exactly 3 English example sentences that:
-   - Are relevant to salary negotiation
-   - Help advance the negotiation conversation
-   - Demonstrate professional negotiation language
-   - Are suitable for the learner's level
-   - Each sentence should be different and useful for practice
-
-3. **Bot Role Reply (Bot角色回复)**: Provide a natural, professional response as the HR manager/recruiter that:
-   - Responds to the learner's negotiation point appropriately
-   - Maintains the negotiation conversation flow
-   - Uses professional business language
-   - Shows realistic negotiation behavior
-
-**OUTPUT FORMAT - You MUST use this exact JSON structure:**
-
-```json
-{
-    "teaching_feedback": {
-        "grammar_corrections": ["correction 1", "correction 2", ...],
-        "vocabulary_suggestions": ["suggestion 1", "suggestion 2", ...],
-        "pronunciation_tips": ["tip 1", "tip 2", ...],
-        "overall_comment": "Overall feedback on the learner's negotiation message"
-    },
-    "example_sentences": [
-        "First example sentence related to salary negotiation.",
-        "Second example sentence related to salary negotiation.",
-        "Third example sentence related to salary negotiation."
-    ],
-    "bot_reply": "Your professional response as the HR manager/recruiter in the negotiation."
-}
-```
-
-**IMPORTANT RULES:**
-1. ALWAYS return exactly 3 example sentences - no more, no less
-2. Example sentences must be relevant to salary negotiation
-3. The bot_reply should be professional and realistic
-4. Teaching feedback should focus on professional communication skills
-5. Format your response as valid JSON - do not include any text outside the JSON structure
-6. Use appropriate business and negotiation vocabulary
+4. Give constructive feedback on their English communication"""
+
+# 场景规则与话题示例
+SYSTEM_PROMPT_SUFFIX = """**SCENARIO RULES:**
+- Keep the bot_reply professional and realistic, showing realistic negotiation behavior
+- Focus teaching feedback on professional communication skills
+- Use appropriate business and negotiation vocabulary
 
 **Example negotiation topics:**
 - Discussing salary expectations
@@ -93,6 +36,36 @@ Every response you generate MUST include the following three components in JSON
 - Discussing career growth opportunities
 
 Remember: Always output valid JSON with these three components. Be professional, helpful, and realistic!"""
+
+
+def build_system_prompt() -> str:
+    """构建薪酬谈判场景的系统提示词（共享输出要求 + 场景内容）"""
+    return get_prompt_registry().build(
+        "salary_negotiation",
+        SYSTEM_PROMPT_CONTEXT,
+        suffix=SYSTEM_PROMPT_SUFFIX,
+        role="the HR manager/recruiter",
+        topic="salary negotiation"
+    )
+
+
+class SalaryNegotiationScenario(BaseScenario):
+    """薪酬谈判场景"""
+    
+    def __init__(self, model_name: str = "gpt-4o-mini", temperature: float = 0.7,
+                 api_key: str = None, base_url: str = None, **kwargs):
+        super().__init__(
+            name="salary_negotiation",
+            model_name=model_name,
+            temperature=temperature,
+            api_key=api_key,
+            base_url=base_url,
+            **kwargs
+        )
+    
+    def get_system_prompt(self) -> str:
+        """获取薪酬谈判场景的系统提示词"""
+        return build_system_prompt()
     
     def get_welcome_message(self) -> str:
         """获取欢迎消息"""
@@ -0,0 +1,188 @@
+"""
+会话状态存储
+按 Gradio 会话保存每个用户自己的对话历史，场景与 LLM 对象在所有会话之间共享
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+from src.history import ConversationHistory
+
+
+class SessionState:
+    """单个会话的轻量状态（只保存历史，不持有场景或 LLM 对象）"""
+    
+    __slots__ = ("session_id", "scenario_histories", "last_access",
+                 "max_history_messages", "archive_history")
+    
+    def __init__(self, session_id: str, max_history_messages: int = 20, archive_history: bool = False):
+        """
+        初始化会话状态
+        
+        Args:
+            session_id: 会话 ID
+            max_history_messages: 每个场景历史保留的最大消息数
+            archive_history: 是否为导出保存压缩归档
+        """
+        self.session_id = session_id
+        self.scenario_histories: Dict[str, ConversationHistory] = {}
+        self.last_access = time.monotonic()
+        self.max_history_messages = max_history_messages
+        self.archive_history = archive_history
+    
+    def get_history(self, scenario_name: str) -> ConversationHistory:
+        """
+        获取指定场景的对话历史（不存在时创建）
+        
+        Args:
+            scenario_name: 场景名称
+            
+        Returns:
+            ConversationHistory: 该会话在此场景下的对话历史
+        """
+        history = self.scenario_histories.get(scenario_name)
+        if history is None:
+            history = ConversationHistory(
+                max_messages=self.max_history_messages,
+                archive=self.archive_history
+            )
+            self.scenario_histories[scenario_name] = history
+        return history
+    
+    def reset_history(self, scenario_name: str):
+        """
+        重置指定场景的对话历史
+        
+        Args:
+            scenario_name: 场景名称
+        """
+        self.scenario_histories.pop(scenario_name, None)
+
+
+class SessionStore:
+    """
+    会话状态存储
+    按最近访问顺序保存会话，空闲超过 TTL 的会话过期，数量超过上限时淘汰最久未访问的会话（LRU）
+    """
+    
+    def __init__(self, ttl_seconds: float = 1800, max_sessions: int = 1000,
+                 max_history_messages: int = 20, archive_history: bool = False):
+        """
+        初始化会话存储
+        
+        Args:
+            ttl_seconds: 会话空闲过期时间（秒）
+            max_sessions: 最多保留的会话数量
+            max_history_messages: 每个场景历史保留的最大消息数
+            archive_history: 是否为导出保存压缩归档
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_history_messages = max_history_messages
+        self.archive_history = archive_history
+        self._sessions: "OrderedDict[str, SessionState]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, session_id: str) -> SessionState:
+        """
+        获取会话状态（不存在或已过期时新建）
+        
+        Args:
+            session_id: 会话 ID
+            
+        Returns:
+            SessionState: 会话状态
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            
+            state = self._sessions.get(session_id)
+            if state is None:
+                state = SessionState(
+                    session_id,
+                    max_history_messages=self.max_history_messages,
+                    archive_history=self.archive_history
+                )
+                self._sessions[session_id] = state
+                # 超过上限时淘汰最久未访问的会话
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session_id)
+            
+            state.last_access = now
+            return state
+    
+    def get_history(self, session_id: str, scenario_name: str,
+                    visible_history: Optional[Sequence[Tuple[Optional[str], Optional[str]]]] = None,
+                    reply_of: Optional[Callable[[str], Optional[str]]] = None) -> ConversationHistory:
+        """
+        获取会话在指定场景下的对话历史
+        会话过期或被淘汰后保存的历史为空，而界面上仍显示之前的对话时，从显示的记录重建一次，
+        避免下一轮在没有任何上下文的情况下发给模型
+        
+        Args:
+            session_id: 会话 ID
+            scenario_name: 场景名称
+            visible_history: 界面上显示的对话记录（Gradio Chatbot 格式，可选）
+            reply_of: 从显示内容中取出 Bot 回复文本的函数（见 ConversationHistory.restore）
+            
+        Returns:
+            ConversationHistory: 对话历史
+        """
+        history = self.get(session_id).get_history(scenario_name)
+        if visible_history and not history:
+            history.restore(visible_history, reply_of)
+        return history
+    
+    def reset_history(self, session_id: str, scenario_name: str):
+        """
+        重置会话在指定场景下的对话历史
+        
+        Args:
+            session_id: 会话 ID
+            scenario_name: 场景名称
+        """
+        self.get(session_id).reset_history(scenario_name)
+    
+    def remove(self, session_id: str) -> Optional[SessionState]:
+        """
+        删除会话（例如浏览器断开连接时）
+        
+        Args:
+            session_id: 会话 ID
+            
+        Returns:
+            SessionState: 被删除的会话状态，不存在时返回 None
+        """
+        with self._lock:
+            return self._sessions.pop(session_id, None)
+    
+    def cleanup(self) -> int:
+        """
+        清理所有已过期的会话
+        
+        Returns:
+            int: 清理的会话数量
+        """
+        with self._lock:
+            return self._evict_expired(time.monotonic())
+    
+    def __len__(self) -> int:
+        return len(self._sessions)
+    
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+    
+    def _evict_expired(self, now: float) -> int:
+        """淘汰过期会话（按访问顺序排列，只需从最旧的一端检查）"""
+        evicted = 0
+        while self._sessions:
+            session_id, state = next(iter(self._sessions.items()))
+            if now - state.last_access < self.ttl_seconds:
+                break
+            del self._sessions[session_id]
+            evicted += 1
+        return evicted
@@ -0,0 +1,170 @@
+"""
+滚动摘要
+把移出上下文窗口的较早轮次增量合并到一段简短摘要中，只在有轮次被移出时才调用 LLM
+"""
+from typing import TYPE_CHECKING, List, Optional
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from src.context_builder import ContextBuilder
+from src.history import ConversationHistory, HistoryMessage
+from src.instrumentation import TurnRecord
+
+if TYPE_CHECKING:
+    from src.llm.invoker import LLMInvoker
+
+
+class ConversationSummarizer:
+    """
+    对话摘要器
+    本身不保存状态，摘要和进度保存在每个会话的 ConversationHistory 上
+    """
+    
+    def __init__(self, scenario_name: str = "", max_summary_words: int = 150,
+                 invoker: Optional["LLMInvoker"] = None, model_name: str = "", temperature: float = 0.0,
+                 max_pending_messages: int = 40):
+        """
+        初始化摘要器
+        
+        Args:
+            scenario_name: 场景名称（写入摘要提示词）
+            max_summary_words: 摘要最大词数
+            invoker: LLM 调用器（传入时摘要请求同样经过调度器限流，并计入本轮 token 用量）
+            model_name: 摘要模型名称（用于缓存键和指标）
+            temperature: 摘要模型温度（用于缓存键）
+            max_pending_messages: 等待并入摘要的已移出消息上限（超出时丢弃最旧的消息）
+        """
+        self.scenario_name = scenario_name
+        self.max_summary_words = max_summary_words
+        self.invoker = invoker
+        self.model_name = model_name
+        self.temperature = temperature
+        self.max_pending_messages = max_pending_messages
+    
+    def track_evicted(self, history: ConversationHistory, evicted: List[HistoryMessage]):
+        """
+        记录被环形缓冲区移出、尚未并入摘要的消息
+        摘要请求持续失败时只保留最近 max_pending_messages 条，避免摘要提示词无限增长
+        
+        Args:
+            history: 对话历史
+            evicted: 被移出的消息
+        """
+        pending = history.pending_summary
+        pending.extend(msg for msg in evicted if msg.seq > history.summary_seq)
+        overflow = len(pending) - self.max_pending_messages
+        if overflow > 0:
+            del pending[:overflow]
+    
+    def collect_evicted(self, history: ConversationHistory, context_builder: ContextBuilder) -> List[HistoryMessage]:
+        """
+        找出需要并入摘要的消息（已移出缓冲区的，以及超出上下文窗口的）
+        
+        Args:
+            history: 对话历史
+            context_builder: 上下文窗口构建器
+            
+        Returns:
+            List[HistoryMessage]: 需要并入摘要的消息（按时间顺序）
+        """
+        candidates = history.unsummarized()
+        window = context_builder.select(candidates)
+        window_start = window[0].seq if window else history.next_seq
+        
+        evicted = list(history.pending_summary)
+        evicted.extend(msg for msg in candidates if msg.seq < window_start)
+        return evicted
+    
+    def update(self, llm, history: ConversationHistory, context_builder: ContextBuilder,
+               session: Optional[str] = None, turn: Optional[TurnRecord] = None) -> bool:
+        """
+        如有轮次被移出，更新滚动摘要
+        
+        Args:
+            llm: 用于生成摘要的聊天模型
+            history: 对话历史
+            context_builder: 上下文窗口构建器
+            session: 会话标识（调度器按会话轮流放行排队的请求）
+            turn: 本轮对话的统计数据（摘要调用的 token 用量计入本轮）
+            
+        Returns:
+            bool: 摘要是否被更新
+        """
+        evicted = self.collect_evicted(history, context_builder)
+        if not evicted:
+            return False
+        
+        messages = self._build_messages(history.summary, evicted)
+        try:
+            if self.invoker is not None:
+                summary = self.invoker.invoke(llm, messages, self.model_name, self.temperature,
+                                              session=session, turn=turn)
+            else:
+                summary = llm.invoke(messages).content
+        except Exception as e:
+            print(f"更新对话摘要失败: {e}")
+            return False
+        
+        self._apply(history, evicted, summary)
+        return True
+    
+    async def aupdate(self, llm, history: ConversationHistory, context_builder: ContextBuilder,
+                      session: Optional[str] = None, turn: Optional[TurnRecord] = None) -> bool:
+        """
+        异步更新滚动摘要
+        
+        Args:
+            llm: 用于生成摘要的聊天模型
+            history: 对话历史
+            context_builder: 上下文窗口构建器
+            session: 会话标识（调度器按会话轮流放行排队的请求）
+            turn: 本轮对话的统计数据（摘要调用的 token 用量计入本轮）
+            
+        Returns:
+            bool: 摘要是否被更新
+        """
+        evicted = self.collect_evicted(history, context_builder)
+        if not evicted:
+            return False
+        
+        messages = self._build_messages(history.summary, evicted)
+        try:
+            if self.invoker is not None:
+                summary = await self.invoker.ainvoke(llm, messages, self.model_name, self.temperature,
+                                                     session=session, turn=turn)
+            else:
+                summary = (await llm.ainvoke(messages)).content
+        except Exception as e:
+            print(f"更新对话摘要失败: {e}")
+            return False
+        
+        self._apply(history, evicted, summary)
+        return True
+    
+    def _build_messages(self, previous_summary: str, evicted: List[HistoryMessage]) -> List:
+        """构建摘要请求"""
+        scenario = f" in the {self.scenario_name.replace('_', ' ')} scenario" if self.scenario_name else ""
+        instructions = (
+            f"You maintain a running summary of an English practice role-play{scenario}. "
+            "Merge the new turns into the current summary. Keep concrete facts, numbers, "
+            "offers, agreements and open questions, plus any mistakes the learner keeps repeating. "
+            f"Reply with the updated summary only, in at most {self.max_summary_words} words."
+        )
+        
+        lines = []
+        for msg in evicted:
+            speaker = "Learner" if msg.role == "user" else "Tutor"
+            lines.append(f"{speaker}: {msg.content}")
+        
+        body = (
+            f"Current summary:\n{previous_summary or '(none)'}\n\n"
+            "New turns:\n" + "\n".join(lines)
+        )
+        return [SystemMessage(content=instructions), HumanMessage(content=body)]
+    
+    @staticmethod
+    def _apply(history: ConversationHistory, evicted: List[HistoryMessage], summary: str):
+        """保存新的摘要并推进摘要进度"""
+        history.summary = (summary or "").strip()
+        history.summary_seq = max(history.summary_seq, evicted[-1].seq)
+        history.pending_summary = []
@@ -0,0 +1,287 @@
+"""
+链路追踪
+每轮对话一个根 span，历史组装、LLM 调用、JSON 解析、格式校验和格式化显示各一个子 span。
+字段沿用 OpenTelemetry（OTLP JSON）的命名；默认不导出（no-op），可配置为把结束的 span
+按 JSON Lines 写入本地文件，用于把延迟变化定位到具体阶段
+"""
+import atexit
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Optional
+
+from src.config import get_config
+
+
+class Span:
+    """一个计时区间"""
+    
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None,
+                 attributes: Optional[Dict] = None, exporter: Optional["SpanExporter"] = None):
+        """
+        初始化 span 并开始计时
+        
+        Args:
+            name: span 名称
+            trace_id: 所属链路标识（32 位十六进制）
+            parent_id: 父 span 标识（根 span 为 None）
+            attributes: 属性
+            exporter: 结束时写入的导出器
+        """
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes: Dict = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.status = "OK"
+        self.status_message = ""
+        self._exporter = exporter
+    
+    def child(self, name: str, **attributes) -> "Span":
+        """
+        开始一个子 span
+        
+        Args:
+            name: span 名称
+            **attributes: 属性
+            
+        Returns:
+            Span: 子 span
+        """
+        return Span(name, self.trace_id, self.span_id, attributes, self._exporter)
+    
+    def set_attribute(self, key: str, value):
+        """设置属性"""
+        self.attributes[key] = value
+    
+    def record_error(self, error: BaseException):
+        """把 span 标记为出错"""
+        self.set_status("ERROR", f"{type(error).__name__}: {error}")
+    
+    def set_status(self, code: str, message: str = ""):
+        """
+        设置状态
+        
+        Args:
+            code: OK 或 ERROR
+            message: 状态说明
+        """
+        self.status = code
+        self.status_message = message
+    
+    def end(self):
+        """结束计时并导出（重复调用时忽略）"""
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if self._exporter is not None:
+            self._exporter.export(self)
+    
+    def to_dict(self) -> Dict:
+        """
+        转换为 OTLP JSON 风格的字典
+        
+        Returns:
+            dict: span 数据
+        """
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": end_ns,
+            "durationMs": round((end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "status": {"code": self.status, "message": self.status_message}
+        }
+
+
+class _NoopSpan(Span):
+    """未开启追踪时使用的 span（不计时、不导出，子 span 也是它自己）"""
+    
+    def __init__(self):
+        """初始化空 span"""
+        self.name = ""
+        self.trace_id = ""
+        self.span_id = ""
+        self.parent_id = None
+        self.attributes = {}
+        self.start_ns = 0
+        self.end_ns = 0
+        self.status = "OK"
+        self.status_message = ""
+        self._exporter = None
+    
+    def child(self, name: str, **attributes) -> "Span":
+        return self
+    
+    def set_attribute(self, key: str, value):
+        pass
+    
+    def record_error(self, error: BaseException):
+        pass
+    
+    def set_status(self, code: str, message: str = ""):
+        pass
+    
+    def end(self):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class SpanExporter(ABC):
+    """span 导出器接口"""
+    
+    @abstractmethod
+    def export(self, span: Span):
+        """
+        导出一个已结束的 span（在结束 span 的线程上调用，可能是事件循环线程，不应阻塞）
+        
+        Args:
+            span: 已结束的 span
+        """
+        pass
+    
+    def flush(self):
+        """等待已导出的 span 全部写出"""
+        pass
+    
+    def close(self):
+        """写出剩余的 span 并释放资源"""
+        pass
+
+
+class JSONLinesExporter(SpanExporter):
+    """
+    把 span 按 JSON Lines 追加写入本地文件（每个 span 一行）
+    export 只把序列化后的行放入队列，由后台线程持有文件句柄写入，异步处理函数中结束 span 时不做文件 I/O
+    """
+    
+    def __init__(self, path: str):
+        """
+        初始化导出器并启动写入线程
+        
+        Args:
+            path: 输出文件路径（目录不存在时自动创建）
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop, name="span-exporter", daemon=True)
+        self._writer.start()
+        # 进程退出前写出队列中剩余的 span
+        atexit.register(self.close)
+    
+    def export(self, span: Span):
+        if self._closed:
+            return
+        self._queue.put(json.dumps(span.to_dict(), ensure_ascii=False, default=str))
+    
+    def flush(self):
+        """等待队列中的 span 全部写入文件"""
+        self._queue.join()
+    
+    def close(self):
+        """写出剩余的 span，停止写入线程并关闭文件（重复调用时忽略）"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._queue.put(None)
+        self._writer.join()
+    
+    def _write_loop(self):
+        """写入线程：队列为空时才 flush，连续结束的多个 span 合并为一次系统调用"""
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                line = self._queue.get()
+                try:
+                    if line is None:
+                        return
+                    f.write(line + "\n")
+                    if self._queue.empty():
+                        f.flush()
+                finally:
+                    self._queue.task_done()
+
+
+class Tracer:
+    """
+    追踪器
+    没有导出器时 start_span 返回共享的空 span，几乎没有开销
+    """
+    
+    def __init__(self, exporter: Optional[SpanExporter] = None):
+        """
+        初始化追踪器
+        
+        Args:
+            exporter: span 导出器（为 None 时不追踪）
+        """
+        self.exporter = exporter
+    
+    @classmethod
+    def from_config(cls, tracing_config: Dict) -> "Tracer":
+        """
+        根据追踪配置创建追踪器
+        
+        Args:
+            tracing_config: 配置中的 tracing 段
+            
+        Returns:
+            Tracer: 追踪器（exporter 为 none 时不追踪）
+        """
+        if tracing_config.get("exporter", "none") == "jsonl":
+            return cls(JSONLinesExporter(tracing_config.get("path") or "traces/spans.jsonl"))
+        return cls()
+    
+    @property
+    def enabled(self) -> bool:
+        """是否开启追踪"""
+        return self.exporter is not None
+    
+    def start_span(self, name: str, **attributes) -> Span:
+        """
+        开始一条新链路的根 span
+        
+        Args:
+            name: span 名称
+            **attributes: 属性
+            
+        Returns:
+            Span: 根 span（未开启追踪时为空 span）
+        """
+        if self.exporter is None:
+            return NOOP_SPAN
+        return Span(name, secrets.token_hex(16), None, attributes, self.exporter)
+
+
+# 全局追踪器（第一次使用时按配置创建）
+_tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Tracer:
+    """
+    获取全局追踪器
+    
+    Returns:
+        Tracer: 追踪器
+    """
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer.from_config(get_config().get_tracing_config())
+    return _tracer
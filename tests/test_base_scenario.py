@@ -1,8 +1,16 @@
 """
 测试场景基类
 """
+import asyncio
+import threading
+import time
 import unittest
-from unittest.mock import Mock, patch, MagicMock
+from unittest.mock import Mock, patch, MagicMock, AsyncMock
+from src.context_builder import ContextBuilder
+from src.history import ConversationHistory
+from src.llm.invoker import LLMInvoker
+from src.llm.scheduler import LLMScheduler
+from src.llm.tutor_base import OVERLOADED_REPLY
 from src.scenarios.base_scenario import BaseScenario
 
 
@@ -102,6 +110,222 @@ class TestBaseScenario(unittest.TestCase):
         self.assertIn("bot_reply", response)
         self.assertEqual(len(response["example_sentences"]), 3)
     
+    @patch('src.scenarios.base_scenario.ChatOpenAI')
+    def test_generate_response_overloaded(self, mock_llm_class):
+        """测试排队已满时提示稍后再试，而不是笼统的出错回复"""
+        mock_llm_class.return_value = MagicMock()
+        scheduler = LLMScheduler(max_concurrency=1, max_queue_size=1)
+        scenario = MockScenario(name="test", invoker=LLMInvoker(scheduler=scheduler))
+        
+        # 一个请求正在进行，另一个请求占满等待队列
+        holder = scheduler.acquire("session_2")
+        waiter = threading.Thread(target=lambda: scheduler.release(scheduler.acquire("session_3")))
+        waiter.start()
+        while scheduler.queued == 0:
+            time.sleep(0.001)
+        
+        response = scenario.generate_response("Hello", ConversationHistory(), session_id="session_1")
+        scheduler.release(holder)
+        waiter.join()
+        
+        self.assertEqual(response["bot_reply"], OVERLOADED_REPLY)
+        mock_llm_class.return_value.invoke.assert_not_called()
+    
+    @patch('src.scenarios.base_scenario.ChatOpenAI')
+    def test_generate_response_with_session_history(self, mock_llm_class):
+        """测试使用会话自己的历史时不修改场景实例上的历史"""
+        mock_response = MagicMock()
+        mock_response.content = '{"teaching_feedback": {"overall_comment": "Good"}, "example_sentences": ["s1", "s2", "s3"], "bot_reply": "Hello"}'
+        
+        mock_llm_instance = MagicMock()
+        mock_llm_instance.invoke.return_value = mock_response
+        mock_llm_class.return_value = mock_llm_instance
+        
+        scenario = MockScenario(name="test")
+        session_a = ConversationHistory.from_dicts([{"role": "user", "content": "I am user A"}])
+        session_b = ConversationHistory()
+        
+        scenario.generate_response("Hello", session_a)
+        scenario.generate_response("Hi", session_b)
+        
+        self.assertEqual(len(session_a), 3)
+        self.assertEqual(len(session_b), 2)
+        self.assertEqual(len(scenario.conversation_history), 0)
+        
+        # 会话 B 的请求中不应包含会话 A 的历史
+        messages = mock_llm_instance.invoke.call_args[0][0]
+        self.assertEqual(len(messages), 2)
+        self.assertEqual(messages[-1].content, "Hi")
+    
+    @patch('src.scenarios.base_scenario.ChatOpenAI')
+    def test_history_stores_bot_reply_only(self, mock_llm_class):
+        """测试历史中的 assistant 消息只保存 bot_reply，而不是原始 JSON"""
+        mock_response = MagicMock()
+        mock_response.content = '{"teaching_feedback": {"overall_comment": "Good"}, "example_sentences": ["s1", "s2", "s3"], "bot_reply": "Hello"}'
+        
+        mock_llm_instance = MagicMock()
+        mock_llm_instance.invoke.return_value = mock_response
+        mock_llm_class.return_value = mock_llm_instance
+        
+        scenario = MockScenario(name="test")
+        scenario.generate_response("Hi")
+        scenario.generate_response("How are you?")
+        
+        self.assertEqual(scenario.get_conversation_history()[1], {"role": "assistant", "content": "Hello"})
+        
+        # 第二次请求中的历史消息是 bot_reply 文本
+        messages = mock_llm_instance.invoke.call_args[0][0]
+        self.assertEqual(messages[2].content, "Hello")
+    
+    @patch('src.scenarios.base_scenario.ChatOpenAI')
+    def test_history_packed_by_token_budget(self, mock_llm_class):
+        """测试历史按 token 预算选择完整轮次"""
+        mock_response = MagicMock()
+        mock_response.content = '{"bot_reply": "ok"}'
+        
+        mock_llm_instance = MagicMock()
+        mock_llm_instance.invoke.return_value = mock_response
+        mock_llm_class.return_value = mock_llm_instance
+        
+        scenario = MockScenario(name="test", context_builder=ContextBuilder(max_history_tokens=40))
+        history = ConversationHistory()
+        history.add_turn("word " * 100, "long turn")
+        history.add_turn("short one", "reply one")
+        history.add_turn("short two", "reply two")
+        
+        scenario.generate_response("Hello", history)
+        
+        # 系统提示 + 两个短轮次 + 当前消息，过长的旧轮次被整体丢弃
+        messages = mock_llm_instance.invoke.call_args[0][0]
+        self.assertEqual([m.content for m in messages[1:]],
+                         ["short one", "reply one", "short two", "reply two", "Hello"])
+    
+    @patch('src.scenarios.base_scenario.ChatOpenAI')
+    def test_summary_injected_after_system_prompt(self, mock_llm_class):
+        """测试滚动摘要作为系统补充放在系统提示之后，且已摘要的轮次不再发送"""
+        mock_llm_instance = MagicMock()
+        mock_llm_instance.invoke.side_effect = [
+            MagicMock(content="They discussed the base salary."),
+            MagicMock(content='{"bot_reply": "ok"}')
+        ]
+        mock_llm_class.return_value = mock_llm_instance
+        
+        scenario = MockScenario(name="test", context_builder=ContextBuilder(max_history_tokens=30),
+                                summarize_history=True)
+        history = ConversationHistory()
+        history.add_turn("What is the base salary for this role?", "It is ninety thousand.")
+        history.add_turn("short", "reply")
+        
+        scenario.generate_response("Hello", history)
+        
+        messages = mock_llm_instance.invoke.call_args[0][0]
+        self.assertEqual(messages[0].content, scenario.system_prompt)
+        self.assertIn("They discussed the base salary.", messages[1].content)
+        self.assertEqual([m.content for m in messages[2:]], ["short", "reply", "Hello"])
+    
+    def test_static_prefix_identical_across_turns(self):
+        """测试系统提示词始终是第一条消息，且不同轮次之间字节相同"""
+        history = ConversationHistory()
+        first = self.scenario._build_messages("Hello", history)
+        history.add_turn("Hello", "Hi there")
+        history.summary = "They greeted each other."
+        second = self.scenario._build_messages("How are you?", history)
+        
+        self.assertIs(first[0], second[0])
+        self.assertEqual(first[0].content.encode("utf-8"), self.scenario.system_prompt.encode("utf-8"))
+        
+        # 修改系统提示词后重建前缀
+        self.scenario.system_prompt = "Updated prompt"
+        self.assertEqual(self.scenario._build_messages("Hello", history)[0].content, "Updated prompt")
+    
+    @patch('src.scenarios.base_scenario.ChatOpenAI')
+    def test_agenerate_response_success(self, mock_llm_class):
+        """测试异步生成回复（成功情况）"""
+        mock_response = MagicMock()
+        mock_response.content = '{"teaching_feedback": {"overall_comment": "Good"}, "example_sentences": ["s1", "s2", "s3"], "bot_reply": "Hello"}'
+        
+        mock_llm_instance = MagicMock()
+        mock_llm_instance.ainvoke = AsyncMock(return_value=mock_response)
+        mock_llm_class.return_value = mock_llm_instance
+        
+        scenario = MockScenario(name="test")
+        response = asyncio.run(scenario.agenerate_response("Hello"))
+        
+        self.assertEqual(response["bot_reply"], "Hello")
+        mock_llm_instance.ainvoke.assert_awaited_once()
+        mock_llm_instance.invoke.assert_not_called()
+        self.assertEqual(len(scenario.conversation_history), 2)
+    
+    @patch('src.scenarios.base_scenario.ChatOpenAI')
+    def test_agenerate_response_error(self, mock_llm_class):
+        """测试异步生成回复（错误情况）"""
+        mock_llm_instance = MagicMock()
+        mock_llm_instance.ainvoke = AsyncMock(side_effect=Exception("API Error"))
+        mock_llm_class.return_value = mock_llm_instance
+        
+        scenario = MockScenario(name="test")
+        response = asyncio.run(scenario.agenerate_response("Hello"))
+        
+        self.assertIn("API Error", response["teaching_feedback"]["overall_comment"])
+        self.assertEqual(len(response["example_sentences"]), 3)
+        self.assertEqual(len(scenario.conversation_history), 0)
+    
+    @patch('src.scenarios.base_scenario.ChatOpenAI')
+    def test_stream_response(self, mock_llm_class):
+        """测试流式生成回复"""
+        content = '{"bot_reply": "Hello there", "teaching_feedback": {"overall_comment": "Good"}, "example_sentences": ["s1", "s2", "s3"]}'
+        chunks = [MagicMock(content=content[i:i + 10]) for i in range(0, len(content), 10)]
+        
+        mock_llm_instance = MagicMock()
+        mock_llm_instance.stream.return_value = iter(chunks)
+        mock_llm_class.return_value = mock_llm_instance
+        
+        scenario = MockScenario(name="test")
+        updates = list(scenario.stream_response("Hello"))
+        
+        # bot_reply 应先于其他字段出现
+        first_with_reply = next(u for u in updates if "bot_reply" in u)
+        self.assertNotIn("teaching_feedback", first_with_reply)
+        self.assertEqual(updates[-1]["bot_reply"], "Hello there")
+        self.assertEqual(updates[-1]["example_sentences"], ["s1", "s2", "s3"])
+        self.assertEqual(len(scenario.conversation_history), 2)
+    
+    @patch('src.scenarios.base_scenario.ChatOpenAI')
+    def test_astream_response(self, mock_llm_class):
+        """测试异步流式生成回复"""
+        content = '{"bot_reply": "Hello there", "teaching_feedback": {"overall_comment": "Good"}, "example_sentences": ["s1", "s2", "s3"]}'
+        
+        async def fake_astream(messages, **kwargs):
+            for i in range(0, len(content), 10):
+                yield MagicMock(content=content[i:i + 10])
+        
+        mock_llm_instance = MagicMock()
+        mock_llm_instance.astream = fake_astream
+        mock_llm_class.return_value = mock_llm_instance
+        
+        scenario = MockScenario(name="test")
+        
+        async def collect():
+            return [update async for update in scenario.astream_response("Hello")]
+        
+        updates = asyncio.run(collect())
+        self.assertGreater(len(updates), 1)
+        self.assertEqual(updates[-1]["bot_reply"], "Hello there")
+        self.assertEqual(len(scenario.conversation_history), 2)
+    
+    @patch('src.scenarios.base_scenario.ChatOpenAI')
+    def test_stream_response_error(self, mock_llm_class):
+        """测试流式生成回复（错误情况）"""
+        mock_llm_instance = MagicMock()
+        mock_llm_instance.stream.side_effect = Exception("API Error")
+        mock_llm_class.return_value = mock_llm_instance
+        
+        scenario = MockScenario(name="test")
+        updates = list(scenario.stream_response("Hello"))
+        
+        self.assertEqual(len(updates), 1)
+        self.assertIn("API Error", updates[0]["teaching_feedback"]["overall_comment"])
+    
     def test_parse_response_json(self):
         """测试解析 JSON 响应"""
         json_content = '{"teaching_feedback": {"overall_comment": "Good"}, "example_sentences": ["s1", "s2", "s3"], "bot_reply": "Hello"}'
@@ -118,6 +342,73 @@ class TestBaseScenario(unittest.TestCase):
         
         self.assertIn("teaching_feedback", response)
         self.assertIn("example_sentences", response)
+    
+    @patch('src.scenarios.base_scenario.ChatOpenAI')
+    def test_structured_output_with_regex_fallback(self, mock_llm_class):
+        """测试结构化输出模式：绑定 response_format，校验失败时回退到正则提取并统计路径"""
+        structured_llm = MagicMock()
+        structured_llm.invoke.side_effect = [
+            MagicMock(content='{"bot_reply": "Hello", "example_sentences": ["s1", "s2", "s3"]}'),
+            MagicMock(content='```json\n{"bot_reply": "Hi again"}\n```'),
+            MagicMock(content="Plain text reply.")
+        ]
+        mock_llm_class.return_value.bind.return_value = structured_llm
+        
+        scenario = MockScenario(name="structured_test", structured_output="json_mode")
+        mock_llm_class.return_value.bind.assert_called_once_with(response_format={"type": "json_object"})
+        self.assertIs(scenario.response_llm, structured_llm)
+        before = scenario.structured_output.path_counts("structured_test")
+        
+        first = scenario.generate_response("Hello")
+        self.assertEqual(first["bot_reply"], "Hello")
+        self.assertEqual(first["teaching_feedback"]["overall_comment"], "")
+        self.assertEqual(scenario.generate_response("Hi")["bot_reply"], "Hi again")
+        self.assertEqual(scenario.generate_response("Hey")["bot_reply"], "Plain text reply.")
+        
+        after = scenario.structured_output.path_counts("structured_test")
+        self.assertEqual({path: after[path] - before[path] for path in after},
+                         {"structured": 1, "regex": 1, "repair": 0, "model_repair": 0, "default": 1})
+        mock_llm_class.return_value.invoke.assert_not_called()
+    
+    @patch('src.scenarios.base_scenario.ChatOpenAI')
+    def test_local_repair(self, mock_llm_class):
+        """测试格式错误的 JSON 先在本地修复，不调用修复模型"""
+        mock_llm_class.return_value.invoke.return_value = MagicMock(
+            content='```json\n{"bot_reply": "She said "hi" to me", "example_sentences": ["s1", "s2", "s3",],'
+        )
+        scenario = MockScenario(name="local_repair_test", model_repair=True)
+        
+        response = scenario.generate_response("Hello")
+        
+        self.assertEqual(response["bot_reply"], 'She said "hi" to me')
+        self.assertEqual(response["example_sentences"], ["s1", "s2", "s3"])
+        self.assertEqual(mock_llm_class.return_value.invoke.call_count, 1)
+        self.assertEqual(scenario.structured_output.path_counts("local_repair_test")["repair"], 1)
+    
+    @patch('src.scenarios.base_scenario.ChatOpenAI')
+    def test_model_repair(self, mock_llm_class):
+        """测试本地修复失败时调用修复模型（修复模型按需创建，温度为 0）"""
+        main_llm = MagicMock()
+        main_llm.ainvoke = AsyncMock(return_value=MagicMock(content="Sure, let's talk about the rent."))
+        repair_llm = MagicMock()
+        repair_llm.ainvoke = AsyncMock(return_value=MagicMock(
+            content='{"bot_reply": "Sure, let\'s talk about the rent.", "example_sentences": ["s1", "s2", "s3"]}'
+        ))
+        mock_llm_class.side_effect = [main_llm, repair_llm]
+        
+        scenario = MockScenario(name="model_repair_test", model_repair=True, repair_model="cheap-model")
+        self.assertEqual(mock_llm_class.call_count, 1)
+        
+        history = ConversationHistory()
+        response = asyncio.run(scenario.agenerate_response("Hello", history))
+        
+        self.assertEqual(response["example_sentences"], ["s1", "s2", "s3"])
+        self.assertEqual(mock_llm_class.call_args.kwargs["model"], "cheap-model")
+        self.assertEqual(mock_llm_class.call_args.kwargs["temperature"], 0.0)
+        repair_messages = repair_llm.ainvoke.call_args.args[0]
+        self.assertEqual(repair_messages[-1].content, "Sure, let's talk about the rent.")
+        self.assertEqual(history.to_dicts()[-1]["content"], "Sure, let's talk about the rent.")
+        self.assertEqual(scenario.structured_output.path_counts("model_repair_test")["model_repair"], 1)
 
 
 if __name__ == '__main__':
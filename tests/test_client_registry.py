@@ -0,0 +1,60 @@
+"""
+测试 LLM 客户端注册表
+"""
+import unittest
+from unittest.mock import MagicMock
+from src.llm.client_registry import LLMClientRegistry
+
+
+class TestLLMClientRegistry(unittest.TestCase):
+    """测试 LLM 客户端注册表"""
+    
+    def setUp(self):
+        """设置测试环境"""
+        self.registry = LLMClientRegistry(max_connections=10, max_keepalive_connections=5)
+        self.factory = MagicMock(side_effect=lambda **kwargs: MagicMock(kwargs=kwargs))
+    
+    def test_same_config_shares_client(self):
+        """测试相同配置复用同一个客户端"""
+        first = self.registry.get(self.factory, "gpt-4o-mini", 0.7, "key", "https://api.example.com/v1")
+        second = self.registry.get(self.factory, "gpt-4o-mini", 0.7, "key", "https://api.example.com/v1")
+        
+        self.assertIs(first, second)
+        self.assertEqual(self.factory.call_count, 1)
+        self.assertEqual(len(self.registry), 1)
+    
+    def test_different_config_creates_client(self):
+        """测试模型、温度、API Key 或 Base URL 不同时创建新客户端"""
+        base = self.registry.get(self.factory, "gpt-4o-mini", 0.7, "key", None)
+        self.assertIsNot(base, self.registry.get(self.factory, "gpt-4o", 0.7, "key", None))
+        self.assertIsNot(base, self.registry.get(self.factory, "gpt-4o-mini", 0.2, "key", None))
+        self.assertIsNot(base, self.registry.get(self.factory, "gpt-4o-mini", 0.7, "other", None))
+        self.assertIsNot(base, self.registry.get(self.factory, "gpt-4o-mini", 0.7, "key", "http://localhost"))
+        self.assertEqual(len(self.registry), 5)
+    
+    def test_clients_share_connection_pool(self):
+        """测试所有客户端共享同一个 HTTP 连接池"""
+        first = self.registry.get(self.factory, "gpt-4o-mini", 0.7)
+        second = self.registry.get(self.factory, "deepseek-chat", 0.7, "key", "https://api.deepseek.com/v1")
+        
+        self.assertIs(first.kwargs["http_client"], second.kwargs["http_client"])
+        self.assertIs(first.kwargs["http_async_client"], second.kwargs["http_async_client"])
+        self.assertNotIn("api_key", first.kwargs)
+        self.assertEqual(second.kwargs["base_url"], "https://api.deepseek.com/v1")
+    
+    def test_empty_credentials_normalized(self):
+        """测试空字符串与 None 视为相同配置"""
+        self.assertEqual(
+            LLMClientRegistry.make_key("m", 1, "", ""),
+            LLMClientRegistry.make_key("m", 1.0, None, None)
+        )
+    
+    def test_from_config(self):
+        """测试根据配置创建注册表"""
+        registry = LLMClientRegistry.from_config({"max_connections": 7, "timeout": 5})
+        self.assertEqual(registry.limits.max_connections, 7)
+        self.assertEqual(registry.timeout, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -80,6 +80,23 @@ class TestConfig(unittest.TestCase):
             # 这个测试主要验证逻辑存在
             pass
     
+    def test_get_llm_config_structured_output(self):
+        """测试新生成的配置文件使用 json_mode"""
+        self.assertEqual(self.config.get_llm_config()["structured_output"], "json_mode")
+    
+    @patch.dict(os.environ, {"OPENAI_API_KEY": "env_key"})
+    def test_get_llm_config_legacy_file(self):
+        """测试旧配置文件缺失的 LLM 配置项使用默认值（structured_output 保持 off），API Key 为空时从环境变量获取"""
+        with open(self.config_path, 'w', encoding='utf-8') as f:
+            json.dump({"llm": {"model": "deepseek-chat", "api_key": ""}}, f)
+        
+        llm_config = Config(self.config_path).get_llm_config()
+        self.assertEqual(llm_config["model"], "deepseek-chat")
+        self.assertEqual(llm_config["api_key"], "env_key")
+        self.assertTrue(llm_config["streaming"])
+        self.assertEqual(llm_config["structured_output"], "off")
+        self.assertTrue(llm_config["coalesce_requests"])
+    
     def test_set_llm_config(self):
         """测试设置 LLM 配置"""
         self.config.set_llm_config(
@@ -97,6 +114,22 @@ class TestConfig(unittest.TestCase):
         self.assertEqual(llm_config["api_key"], "test_key")
         self.assertEqual(llm_config["base_url"], "https://api.deepseek.com/v1")
     
+    def test_get_session_config(self):
+        """测试获取会话存储配置（旧配置文件缺失时使用默认值）"""
+        with open(self.config_path, 'w', encoding='utf-8') as f:
+            json.dump({"llm": {}, "sessions": {"max_sessions": 10}}, f)
+        
+        config = Config(self.config_path)
+        session_config = config.get_session_config()
+        self.assertEqual(session_config["max_sessions"], 10)
+        self.assertEqual(session_config["ttl_seconds"], 1800)
+    
+    def test_get_repair_config_disabled_by_default(self):
+        """测试模型修复默认关闭（每次修复都是一次额外的模型调用）"""
+        repair_config = self.config.get_repair_config()
+        self.assertFalse(repair_config["enabled"])
+        self.assertIsNone(repair_config["model"])
+    
     def test_get_enabled_scenarios(self):
         """测试获取启用的场景"""
         scenarios = self.config.get_enabled_scenarios()
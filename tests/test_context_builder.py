@@ -0,0 +1,81 @@
+"""
+测试上下文窗口构建
+"""
+import unittest
+from src.context_builder import ContextBuilder, MESSAGE_OVERHEAD_TOKENS
+from src.history import ConversationHistory
+from src.llm.tokenizer import TokenCounter
+
+
+class FixedCounter(TokenCounter):
+    """每个单词计 1 个 token 的计数器"""
+    
+    def _count(self, text):
+        return len(text.split())
+
+
+class TestContextBuilder(unittest.TestCase):
+    """测试上下文窗口构建器"""
+    
+    def setUp(self):
+        """设置测试环境"""
+        self.history = ConversationHistory()
+        self.history.add_turn("one two three", "four five")        # 5 + 4*2 = 13
+        self.history.add_turn("six", "seven")                      # 2 + 4*2 = 10
+        self.history.add_turn("eight nine", "ten eleven twelve")   # 5 + 4*2 = 13
+    
+    def test_packs_newest_turns_within_budget(self):
+        """测试从最新一轮开始打包，超出预算时停止"""
+        builder = ContextBuilder(max_history_tokens=25, token_counter=FixedCounter())
+        selected = builder.select(self.history)
+        
+        self.assertEqual([m.content for m in selected],
+                         ["six", "seven", "eight nine", "ten eleven twelve"])
+    
+    def test_never_splits_a_turn(self):
+        """测试不会只选入半轮对话"""
+        builder = ContextBuilder(max_history_tokens=20, token_counter=FixedCounter())
+        selected = builder.select(self.history)
+        
+        self.assertEqual([m.role for m in selected], ["user", "assistant"])
+        self.assertEqual(selected[0].content, "eight nine")
+    
+    def test_budget_too_small(self):
+        """测试预算不足一轮时不选择任何历史"""
+        builder = ContextBuilder(max_history_tokens=5, token_counter=FixedCounter())
+        self.assertEqual(builder.select(self.history), [])
+    
+    def test_all_history_fits(self):
+        """测试预算充足时选择全部历史"""
+        builder = ContextBuilder(max_history_tokens=1000, token_counter=FixedCounter())
+        self.assertEqual(len(builder.select(self.history)), 6)
+    
+    def test_token_count_cached_on_message(self):
+        """测试消息的 token 数缓存在消息记录上"""
+        builder = ContextBuilder(token_counter=FixedCounter())
+        builder.select(self.history)
+        
+        self.assertEqual(self.history[0].token_count, 3 + MESSAGE_OVERHEAD_TOKENS)
+    
+    def test_dict_messages(self):
+        """测试支持字典格式的历史，以及开头没有用户消息的回复"""
+        history = [
+            {"role": "assistant", "content": "welcome"},
+            {"role": "user", "content": "hi"},
+            {"role": "assistant", "content": "hello there"}
+        ]
+        builder = ContextBuilder(max_history_tokens=1000, token_counter=FixedCounter())
+        self.assertEqual(builder.select(history), history)
+        
+        builder = ContextBuilder(max_history_tokens=15, token_counter=FixedCounter())
+        self.assertEqual(builder.select(history), history[1:])
+    
+    def test_from_config(self):
+        """测试根据配置创建"""
+        builder = ContextBuilder.from_config({"max_history_tokens": 300, "tokenizer": "approximate"})
+        self.assertEqual(builder.max_history_tokens, 300)
+        self.assertFalse(builder.token_counter.is_exact)
+
+
+if __name__ == '__main__':
+    unittest.main()
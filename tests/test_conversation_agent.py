@@ -1,9 +1,13 @@
 """
 测试 ConversationAgent
 """
+import asyncio
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 from src.agents.conversation_agent import ConversationAgent
+from src.context_builder import ContextBuilder
+from src.history import ConversationHistory
+from src.llm.client_registry import LLMClientRegistry
 
 
 class TestConversationAgent(unittest.TestCase):
@@ -56,6 +60,98 @@ class TestConversationAgent(unittest.TestCase):
         self.assertIn("example_sentences", response)
         self.assertIn("bot_reply", response)
     
+    @patch('src.agents.conversation_agent.ChatOpenAI')
+    @patch('src.agents.conversation_agent.get_config')
+    def test_agenerate_response(self, mock_get_config, mock_llm_class):
+        """测试异步生成回复"""
+        # 模拟配置
+        mock_config = MagicMock()
+        mock_config.get_llm_config.return_value = {
+            "model": "gpt-4o-mini",
+            "temperature": 0.7,
+            "api_key": "test_key"
+        }
+        mock_config.get_context_config.return_value = {"max_history_tokens": 1500}
+        mock_get_config.return_value = mock_config
+        
+        # 模拟 LLM 异步响应
+        mock_response = MagicMock()
+        mock_response.content = '{"teaching_feedback": {"overall_comment": "Good"}, "example_sentences": ["s1", "s2", "s3"], "bot_reply": "Hello"}'
+        
+        mock_llm_instance = MagicMock()
+        mock_llm_instance.ainvoke = AsyncMock(return_value=mock_response)
+        mock_llm_class.return_value = mock_llm_instance
+        
+        agent = ConversationAgent()
+        history = [
+            {"role": "user", "content": "Hi"},
+            {"role": "assistant", "content": "Hello there"}
+        ]
+        response = asyncio.run(agent.agenerate_response("Hello", history))
+        
+        self.assertEqual(response["bot_reply"], "Hello")
+        mock_llm_instance.ainvoke.assert_awaited_once()
+        mock_llm_instance.invoke.assert_not_called()
+        
+        # 消息列表应包含系统提示、历史和当前消息
+        messages = mock_llm_instance.ainvoke.call_args[0][0]
+        self.assertEqual(len(messages), 4)
+        self.assertEqual(messages[-1].content, "Hello")
+    
+    @patch('src.agents.conversation_agent.ChatOpenAI')
+    @patch('src.agents.conversation_agent.get_config')
+    def test_stream_response(self, mock_get_config, mock_llm_class):
+        """测试流式生成回复"""
+        # 模拟配置
+        mock_config = MagicMock()
+        mock_config.get_llm_config.return_value = {
+            "model": "gpt-4o-mini",
+            "temperature": 0.7,
+            "api_key": "test_key"
+        }
+        mock_get_config.return_value = mock_config
+        
+        # 模拟 LLM 流式响应
+        content = '{"bot_reply": "Hello", "teaching_feedback": {"overall_comment": "Good"}, "example_sentences": ["s1", "s2"]}'
+        chunks = [MagicMock(content=content[i:i + 8]) for i in range(0, len(content), 8)]
+        
+        mock_llm_instance = MagicMock()
+        mock_llm_instance.stream.return_value = iter(chunks)
+        mock_llm_class.return_value = mock_llm_instance
+        
+        agent = ConversationAgent()
+        updates = list(agent.stream_response("Hello"))
+        
+        self.assertEqual(updates[0], {"bot_reply": "H"})
+        # 最后一项经过验证，补齐为3个例句
+        self.assertEqual(updates[-1]["bot_reply"], "Hello")
+        self.assertEqual(len(updates[-1]["example_sentences"]), 3)
+    
+    @patch('src.agents.conversation_agent.ChatOpenAI')
+    @patch('src.agents.conversation_agent.get_config')
+    def test_format_partial_response_for_display(self, mock_get_config, mock_llm_class):
+        """测试格式化流式输出中的部分结果"""
+        mock_get_config.return_value = MagicMock()
+        mock_get_config.return_value.get_llm_config.return_value = {}
+        
+        agent = ConversationAgent()
+        
+        formatted = agent.format_response_for_display({"bot_reply": "Hi"}, partial=True)
+        self.assertIn("Bot 回复", formatted)
+        self.assertNotIn("教学点评", formatted)
+        self.assertNotIn("例句", formatted)
+        
+        # 完整结果的部分格式化与普通格式化一致
+        response = {
+            "teaching_feedback": {"overall_comment": "Good"},
+            "example_sentences": ["s1", "s2", "s3"],
+            "bot_reply": "Hi"
+        }
+        self.assertEqual(
+            agent.format_response_for_display(response, partial=True),
+            agent.format_response_for_display(response)
+        )
+    
     @patch('src.agents.conversation_agent.ChatOpenAI')
     @patch('src.agents.conversation_agent.get_config')
     def test_reflect(self, mock_get_config, mock_llm_class):
@@ -109,6 +205,27 @@ class TestConversationAgent(unittest.TestCase):
         self.assertIn("teaching_feedback", validated)
         self.assertIn("bot_reply", validated)
     
+    @patch('src.agents.conversation_agent.ChatOpenAI')
+    @patch('src.agents.conversation_agent.get_config')
+    def test_shared_llm_registry(self, mock_get_config, mock_llm_class):
+        """测试传入客户端注册表时复用相同配置的客户端"""
+        mock_config = MagicMock()
+        mock_config.get_llm_config.return_value = {
+            "model": "gpt-4o-mini",
+            "temperature": 0.7,
+            "api_key": "test_key"
+        }
+        mock_config.get_context_config.return_value = {"max_history_tokens": 1500}
+        mock_get_config.return_value = mock_config
+        
+        registry = LLMClientRegistry()
+        first = ConversationAgent(llm_registry=registry)
+        second = ConversationAgent(llm_registry=registry)
+        
+        self.assertIs(first.llm, second.llm)
+        mock_llm_class.assert_called_once()
+        self.assertIn("http_client", mock_llm_class.call_args.kwargs)
+    
     @patch('src.agents.conversation_agent.ChatOpenAI')
     @patch('src.agents.conversation_agent.get_config')
     def test_format_response_for_display(self, mock_get_config, mock_llm_class):
@@ -141,6 +258,86 @@ class TestConversationAgent(unittest.TestCase):
         self.assertIn("Bot 回复", formatted)
         self.assertIn("s1", formatted)
         self.assertIn("Hello!", formatted)
+        
+        # 从显示内容中取回 Bot 回复（用于会话过期后从界面记录重建历史）
+        self.assertEqual(ConversationAgent.bot_reply_from_display(formatted), "Hello!")
+        self.assertIsNone(ConversationAgent.bot_reply_from_display("错误: API Error"))
+    
+    @patch('src.agents.conversation_agent.ChatOpenAI')
+    @patch('src.agents.conversation_agent.get_config')
+    def test_structured_output_from_config(self, mock_get_config, mock_llm_class):
+        """测试从配置开启结构化输出，校验通过时不走正则提取"""
+        mock_config = MagicMock()
+        mock_config.get_llm_config.return_value = {
+            "model": "gpt-4o-mini",
+            "temperature": 0.7,
+            "api_key": "test_key",
+            "structured_output": "json_schema"
+        }
+        mock_get_config.return_value = mock_config
+        structured_llm = MagicMock()
+        structured_llm.invoke.return_value = MagicMock(
+            content='{"bot_reply": "Hello", "teaching_feedback": {"overall_comment": "Good"}, "example_sentences": ["s1", "s2", "s3"]}'
+        )
+        mock_llm_class.return_value.bind.return_value = structured_llm
+        
+        agent = ConversationAgent()
+        response_format = mock_llm_class.return_value.bind.call_args.kwargs["response_format"]
+        self.assertEqual(response_format["type"], "json_schema")
+        before = agent.structured_output.path_counts(agent.PARSE_SOURCE)
+        
+        with patch.object(agent, '_extract_json') as mock_extract:
+            response = agent.generate_response("Hello")
+        
+        mock_extract.assert_not_called()
+        self.assertEqual(response["bot_reply"], "Hello")
+        self.assertEqual(response["example_sentences"], ["s1", "s2", "s3"])
+        after = agent.structured_output.path_counts(agent.PARSE_SOURCE)
+        self.assertEqual(after["structured"] - before["structured"], 1)
+        self.assertEqual(after["regex"], before["regex"])
+
+
+    @patch('src.agents.conversation_agent.ChatOpenAI')
+    @patch('src.agents.conversation_agent.get_config')
+    def test_session_history_mirror(self, mock_get_config, mock_llm_class):
+        """测试传入 ConversationHistory 时每轮只追加用户消息和 bot_reply，下一轮的提示词不含格式化内容"""
+        mock_config = MagicMock()
+        mock_config.get_llm_config.return_value = {
+            "model": "gpt-4o-mini",
+            "temperature": 0.7,
+            "api_key": "test_key"
+        }
+        mock_get_config.return_value = mock_config
+        
+        content = '{"bot_reply": "Hello", "teaching_feedback": {"overall_comment": "Good"}, "example_sentences": ["s1", "s2", "s3"]}'
+        mock_llm_instance = MagicMock()
+        mock_llm_instance.invoke.return_value = MagicMock(content=content)
+        mock_llm_instance.stream.return_value = iter([MagicMock(content=content)])
+        mock_llm_class.return_value = mock_llm_instance
+        
+        agent = ConversationAgent(context_builder=ContextBuilder())
+        history = ConversationHistory()
+        agent.generate_response("Hi", history)
+        list(agent.stream_response("How are you?", history))
+        self.assertEqual(history.to_dicts(), [
+            {"role": "user", "content": "Hi"},
+            {"role": "assistant", "content": "Hello"},
+            {"role": "user", "content": "How are you?"},
+            {"role": "assistant", "content": "Hello"}
+        ])
+        
+        agent.generate_response("Bye", history)
+        messages = mock_llm_instance.invoke.call_args[0][0]
+        self.assertEqual([m.content for m in messages[1:]], ["Hi", "Hello", "How are you?", "Hello", "Bye"])
+        
+        # 出错的轮次不写入历史；字典列表形式的历史不被修改
+        mock_llm_instance.invoke.side_effect = Exception("API Error")
+        agent.generate_response("Again", history)
+        self.assertEqual(len(history), 6)
+        plain = [{"role": "user", "content": "Hi"}]
+        mock_llm_instance.invoke.side_effect = None
+        agent.generate_response("Hello", plain)
+        self.assertEqual(len(plain), 1)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,223 @@
+"""
+测试对冲请求
+"""
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+from langchain_core.messages import HumanMessage
+from src.llm.hedging import Hedger
+from src.llm.invoker import LLMInvoker
+from src.llm.pool import Backend, LLMPool
+from src.metrics import MetricsRegistry
+
+
+async def reply_after(seconds, value, calls=None):
+    """等待指定秒数后返回结果"""
+    if calls is not None:
+        calls.append(value)
+    await asyncio.sleep(seconds)
+    return value
+
+
+class TestHedger(unittest.TestCase):
+    """测试对冲执行器"""
+    
+    def setUp(self):
+        """设置测试环境"""
+        self.metrics = MetricsRegistry()
+    
+    def make_hedger(self, **kwargs):
+        kwargs.setdefault("initial_delay", 0.02)
+        kwargs.setdefault("max_hedge_ratio", 1.0)
+        return Hedger(metrics=self.metrics, **kwargs)
+    
+    def test_delay_from_percentile(self):
+        """测试样本不足时使用初始等待时间，之后取分位数且不低于最短等待时间"""
+        hedger = self.make_hedger(percentile=90, min_delay=0.05, initial_delay=2.0, min_samples=10)
+        for latency in range(1, 10):
+            hedger.record("m", latency / 10)
+        self.assertEqual(hedger.delay("m"), 2.0)
+        
+        hedger.record("m", 1.0)
+        self.assertAlmostEqual(hedger.delay("m"), 0.9)
+        self.assertEqual(hedger.delay("other"), 2.0)
+        
+        fast = self.make_hedger(min_delay=0.05, min_samples=1)
+        fast.record("m", 0.001)
+        self.assertEqual(fast.delay("m"), 0.05)
+    
+    def test_stream_and_invoke_delays_kept_apart(self):
+        """测试流式调用的首 token 延迟和非流式调用的完整延迟分开统计，互不影响对方的等待时间"""
+        hedger = self.make_hedger(min_delay=0.0, initial_delay=2.0, min_samples=1)
+        
+        async def reply():
+            await asyncio.sleep(0.05)
+            return "reply"
+        
+        async def chunks():
+            yield "a"
+            await asyncio.sleep(0.05)
+            yield "b"
+        
+        async def main():
+            await hedger.run("m", reply, reply)
+            self.assertEqual(hedger.delay("m", stream=True), 2.0)
+            self.assertEqual([chunk async for chunk in hedger.stream("m", chunks, chunks)], ["a", "b"])
+        
+        asyncio.run(main())
+        self.assertGreaterEqual(hedger.delay("m"), 0.05)
+        self.assertLess(hedger.delay("m", stream=True), 0.05)
+    
+    def test_fast_primary_not_hedged(self):
+        """测试原请求在等待时间内返回时不发出对冲请求"""
+        hedger = self.make_hedger(initial_delay=1.0)
+        hedge = MagicMock()
+        result = asyncio.run(hedger.run("m", lambda: reply_after(0, "primary"), hedge))
+        self.assertEqual(result, "primary")
+        hedge.assert_not_called()
+        self.assertEqual(hedger.hedge_rate("m"), 0.0)
+    
+    def test_slow_primary_hedged_and_cancelled(self):
+        """测试原请求超过等待时间时发出对冲请求，先返回的胜出并取消另一个"""
+        hedger = self.make_hedger()
+        cancelled = []
+        
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+        
+        result = asyncio.run(hedger.run("m", slow, lambda: reply_after(0, "hedge")))
+        self.assertEqual(result, "hedge")
+        self.assertEqual(cancelled, [True])
+        self.assertEqual(hedger.hedge_rate("m"), 1.0)
+        self.assertEqual(hedger.win_rate("m"), 1.0)
+        self.assertEqual(self.metrics.get("llm_hedge_wins_total").value(model="m"), 1)
+        
+        # 对冲请求发出后原请求先返回，不计入对冲胜出
+        result = asyncio.run(hedger.run("m", lambda: reply_after(0.04, "primary"),
+                                        lambda: reply_after(10, "hedge")))
+        self.assertEqual(result, "primary")
+        self.assertEqual(self.metrics.get("llm_hedge_fired_total").value(model="m"), 2)
+        self.assertEqual(hedger.win_rate("m"), 0.5)
+    
+    def test_failed_leg_falls_back_to_other(self):
+        """测试一个请求失败时等待另一个，两个都失败时抛出原请求的异常"""
+        hedger = self.make_hedger()
+        
+        async def fail_later(error):
+            await asyncio.sleep(0.04)
+            raise error
+        
+        result = asyncio.run(hedger.run("m", lambda: fail_later(ValueError("primary")),
+                                        lambda: reply_after(0.1, "hedge")))
+        self.assertEqual(result, "hedge")
+        
+        with self.assertRaisesRegex(ValueError, "primary"):
+            asyncio.run(hedger.run("m", lambda: fail_later(ValueError("primary")),
+                                   lambda: fail_later(ValueError("hedge"))))
+    
+    def test_hedge_budget_and_can_hedge(self):
+        """测试对冲比例上限，以及调用方不允许时不对冲"""
+        hedger = self.make_hedger(max_hedge_ratio=0.5)
+        calls = []
+        
+        async def run_twice():
+            for _ in range(2):
+                await hedger.run("m", lambda: reply_after(0.04, "primary"),
+                                 lambda: reply_after(0, "hedge", calls))
+        
+        asyncio.run(run_twice())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(hedger.hedge_rate("m"), 0.5)
+        
+        busy = self.make_hedger()
+        result = asyncio.run(busy.run("x", lambda: reply_after(0.04, "primary"),
+                                      lambda: reply_after(0, "hedge", calls), can_hedge=lambda: False))
+        self.assertEqual(result, "primary")
+        self.assertEqual(len(calls), 1)
+    
+    def test_stream_hedged_on_first_chunk(self):
+        """测试流式调用在首个片段迟到时对冲，产出胜出的流并关闭落后的流"""
+        hedger = self.make_hedger()
+        closed = []
+        
+        async def slow_stream():
+            try:
+                await asyncio.sleep(10)
+                yield "late"
+            finally:
+                closed.append("primary")
+        
+        async def fast_stream():
+            yield "a"
+            yield "b"
+        
+        async def collect():
+            return [chunk async for chunk in hedger.stream("m", slow_stream, fast_stream)]
+        
+        self.assertEqual(asyncio.run(collect()), ["a", "b"])
+        self.assertEqual(closed, ["primary"])
+        self.assertEqual(hedger.win_rate("m"), 1.0)
+    
+    def test_from_config(self):
+        """测试根据配置创建对冲执行器"""
+        self.assertIsNone(Hedger.from_config({"enabled": False}))
+        hedger = Hedger.from_config({"enabled": True, "percentile": 99, "alternate_backend": False})
+        self.assertEqual(hedger.percentile, 99)
+        self.assertFalse(hedger.alternate_backend)
+
+
+class TestInvokerHedging(unittest.TestCase):
+    """测试调用器对冲异步调用"""
+    
+    def setUp(self):
+        """设置测试环境"""
+        self.metrics = MetricsRegistry()
+        self.hedger = Hedger(initial_delay=0.02, max_hedge_ratio=1.0, metrics=self.metrics)
+        self.invoker = LLMInvoker(hedger=self.hedger, metrics=self.metrics)
+        self.messages = [HumanMessage(content="Hello")]
+    
+    def test_hedge_sent_to_second_backend(self):
+        """测试使用后端池时对冲请求发往路由顺序中的下一个后端"""
+        async def slow_reply(messages):
+            return await reply_after(10, MagicMock(content="slow"))
+        
+        slow = MagicMock()
+        slow.ainvoke = AsyncMock(side_effect=slow_reply)
+        fast = MagicMock()
+        fast.ainvoke = AsyncMock(return_value=MagicMock(content="fast"))
+        pool = LLMPool([Backend("primary", lambda: slow), Backend("secondary", lambda: fast)],
+                       explore_ratio=0.0, metrics=self.metrics)
+        
+        content = asyncio.run(self.invoker.ainvoke(pool, self.messages, "m", 0.7))
+        self.assertEqual(content, "fast")
+        slow.ainvoke.assert_called_once()
+        fast.ainvoke.assert_called_once()
+        self.assertEqual(self.metrics.get("llm_hedge_wins_total").value(model="m"), 1)
+    
+    def test_astream_hedged_with_same_model(self):
+        """测试单个模型时对冲请求发往同一个模型"""
+        calls = []
+        
+        async def chunks(messages, **kwargs):
+            calls.append(1)
+            if len(calls) == 1:
+                await asyncio.sleep(10)
+            yield MagicMock(content="hi", usage_metadata=None)
+        
+        llm = MagicMock()
+        llm.astream.side_effect = chunks
+        
+        async def collect():
+            return [text async for text in self.invoker.astream(llm, self.messages, "m", 0.7)]
+        
+        self.assertEqual(asyncio.run(collect()), ["hi"])
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.hedger.hedge_rate("m"), 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
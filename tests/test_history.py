@@ -0,0 +1,101 @@
+"""
+测试对话历史存储
+"""
+import unittest
+from src.history import ConversationHistory, HistoryMessage
+
+
+class TestConversationHistory(unittest.TestCase):
+    """测试有界对话历史"""
+    
+    def test_append_and_recent(self):
+        """测试追加消息和获取最近消息"""
+        history = ConversationHistory()
+        history.add_turn("Hi", "Hello!")
+        history.append("user", "How are you?")
+        
+        self.assertEqual(len(history), 3)
+        recent = history.recent(2)
+        self.assertEqual([m.role for m in recent], ["assistant", "user"])
+        self.assertEqual(recent[-1].content, "How are you?")
+        self.assertEqual(history.recent(0), [])
+        self.assertEqual(len(history.recent(10)), 3)
+    
+    def test_bounded_capacity(self):
+        """测试超过容量时丢弃最旧的消息"""
+        history = ConversationHistory(max_messages=4)
+        evicted = []
+        for i in range(5):
+            evicted.extend(history.add_turn(f"user {i}", f"bot {i}"))
+        
+        self.assertEqual(len(history), 4)
+        self.assertEqual(history[0].content, "user 3")
+        self.assertEqual(len(evicted), 6)
+        self.assertEqual(evicted[0], HistoryMessage("user", "user 0"))
+    
+    def test_message_uses_slots(self):
+        """测试消息记录使用 __slots__"""
+        message = HistoryMessage("user", "hi")
+        self.assertFalse(hasattr(message, "__dict__"))
+    
+    def test_from_dicts_and_to_dicts(self):
+        """测试字典格式的转换"""
+        messages = [
+            {"role": "user", "content": "Hi"},
+            {"role": "assistant", "content": "Hello"}
+        ]
+        history = ConversationHistory.from_dicts(messages)
+        
+        self.assertEqual(history.to_dicts(), messages)
+    
+    def test_export_without_archive(self):
+        """测试未开启归档时只导出缓冲区内的消息"""
+        history = ConversationHistory(max_messages=2)
+        history.add_turn("a", "b")
+        history.add_turn("c", "d")
+        
+        self.assertEqual(history.archive_size, 0)
+        self.assertEqual([m["content"] for m in history.export()], ["c", "d"])
+    
+    def test_export_with_archive(self):
+        """测试开启归档时导出完整对话（包括已移出缓冲区的消息）"""
+        history = ConversationHistory(max_messages=2, archive=True)
+        for i in range(10):
+            history.add_turn(f"用户 {i}", f"bot {i}")
+        
+        exported = history.export()
+        self.assertEqual(len(history), 2)
+        self.assertEqual(len(exported), 20)
+        self.assertEqual(exported[0], {"role": "user", "content": "用户 0"})
+        self.assertEqual(exported[-1], {"role": "assistant", "content": "bot 9"})
+    
+    def test_clear(self):
+        """测试清空历史和归档"""
+        history = ConversationHistory(archive=True)
+        history.add_turn("a", "b")
+        history.clear()
+        
+        self.assertEqual(len(history), 0)
+        self.assertEqual(history.export(), [])
+        history.add_turn("c", "d")
+        self.assertEqual(len(history.export()), 2)
+    
+    def test_restore(self):
+        """测试从界面对话记录重建历史：跳过不完整的轮次，只保留最近的消息，已有历史时不重建"""
+        pairs = [("Welcome!", None), ("q0", "R: a0"), ("q1", "错误: API Error"), ("q2", "R: a2"), ("q3", "R: a3")]
+        reply_of = lambda text: text[3:] if text.startswith("R: ") else None
+        history = ConversationHistory(max_messages=4)
+        
+        self.assertEqual(history.restore(pairs, reply_of), 3)
+        self.assertEqual(history.to_dicts(), [
+            {"role": "user", "content": "q2"},
+            {"role": "assistant", "content": "a2"},
+            {"role": "user", "content": "q3"},
+            {"role": "assistant", "content": "a3"}
+        ])
+        self.assertEqual(history.restore(pairs, reply_of), 0)
+        self.assertEqual(len(history), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+"""
+测试热点路径微基准
+只检查每个用例都能运行、基线覆盖所有用例以及回退判断，不测量耗时
+"""
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from benchmarks import hot_path
+from src.config import Config
+
+
+class TestHotPathBenchmark(unittest.TestCase):
+    """测试热点路径微基准"""
+    
+    @classmethod
+    def setUpClass(cls):
+        """构造用例（使用默认配置，不读取本地配置文件）"""
+        with tempfile.TemporaryDirectory() as directory:
+            config = Config(os.path.join(directory, "config.json"))
+        with patch('src.agents.conversation_agent.get_config', return_value=config):
+            cls.cases = hot_path.build_cases()
+    
+    def test_cases_run(self):
+        """测试每个用例都能正常调用"""
+        names = [name for name, _ in self.cases]
+        self.assertEqual(len(names), len(set(names)))
+        for name, func in self.cases:
+            with self.subTest(case=name):
+                self.assertIsNotNone(func())
+    
+    def test_baseline_covers_cases(self):
+        """测试基线文件包含所有用例（新增用例后需要重新记录基线）"""
+        baseline = hot_path.load_baseline(hot_path.BASELINE_PATH)
+        self.assertIsNotNone(baseline)
+        self.assertEqual(set(baseline["results"]), {name for name, _ in self.cases})
+    
+    def test_legacy_chat_pairs_to_dicts(self):
+        """测试旧路径的 Gradio 对话记录转换跳过空的一侧"""
+        pairs = [("Welcome!", None), ("Hi", "Hello"), (None, "Bye")]
+        self.assertEqual(hot_path.chat_pairs_to_dicts(pairs), [
+            {"role": "user", "content": "Welcome!"},
+            {"role": "user", "content": "Hi"},
+            {"role": "assistant", "content": "Hello"},
+            {"role": "assistant", "content": "Bye"}
+        ])
+    
+    def test_compare(self):
+        """测试超过允许倍数的用例标记为回退"""
+        baseline = {"results": {"a": {"us": 10.0}, "b": {"us": 10.0}}}
+        results = {"a": {"us": 12.0}, "b": {"us": 20.0}, "c": {"us": 1.0}}
+        rows = {row["case"]: row for row in hot_path.compare(results, baseline, 1.5)}
+        self.assertFalse(rows["a"]["regressed"])
+        self.assertTrue(rows["b"]["regressed"])
+        self.assertIsNone(rows["c"]["ratio"])
+        self.assertFalse(rows["c"]["regressed"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+"""
+启动导入时间测试
+用 python -X importtime 检查启动路径上的模块是否提前加载了重量级依赖（每次运行都检查），
+并检查导入时间是否超出预算（计时检查耗时且受机器负载影响，默认跳过，
+设置环境变量 IMPORT_TIME_TESTS=1 开启，CI 中在单独的任务里运行）
+
+导入时间预算是相对值：模块导入时间除以同一台机器上参考模块（标准库 asyncio）的导入时间，
+不同机器之间可以比较；超过记录值的 max_ratio 倍视为回退
+
+重新记录基线：python tests/test_import_time.py --record
+"""
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from typing import Dict, Set, Tuple
+
+PROJECT_ROOT = Path(__file__).parent.parent
+BUDGET_PATH = Path(__file__).parent / "import_time_budget.json"
+
+# 每个模块计时的次数（取最小值以减少噪声）
+RUNS = 3
+
+# 是否运行计时检查
+TIMING_ENABLED = os.getenv("IMPORT_TIME_TESTS") == "1"
+
+
+def measure_import(module: str) -> Tuple[float, Set[str]]:
+    """
+    在独立进程中测量模块的导入时间
+    
+    Args:
+        module: 模块名称
+        
+    Returns:
+        tuple: (累计导入时间毫秒数, 导入过程中加载的所有模块名)
+    """
+    env = dict(os.environ, PYTHONPATH=str(PROJECT_ROOT))
+    # 在临时目录中运行，避免 app 在项目目录下生成 config.json
+    with tempfile.TemporaryDirectory() as cwd:
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=cwd, env=env, capture_output=True, text=True, check=True
+        )
+    
+    cumulative_us = None
+    loaded = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        loaded.add(name.strip())
+        if name.strip() == module:
+            cumulative_us = int(cumulative)
+    
+    if cumulative_us is None:
+        raise RuntimeError(f"未找到 {module} 的导入时间:\n{result.stderr[-2000:]}")
+    return cumulative_us / 1000, loaded
+
+
+def measure_best(module: str) -> float:
+    """多次测量并返回最短的导入时间（毫秒）"""
+    return min(measure_import(module)[0] for _ in range(RUNS))
+
+
+def measure_ratio(module: str, reference_ms: float) -> float:
+    """测量模块导入时间相对参考模块导入时间的倍数"""
+    return measure_best(module) / reference_ms
+
+
+def load_budgets() -> Dict:
+    """读取导入时间预算"""
+    with open(BUDGET_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def module_available(module: str) -> bool:
+    """检查第三方依赖是否已安装"""
+    return importlib.util.find_spec(module) is not None
+
+
+class TestEagerImports(unittest.TestCase):
+    """测试启动路径不提前加载重量级依赖（只看加载了哪些模块，不计时）"""
+    
+    @classmethod
+    def setUpClass(cls):
+        """读取预算配置"""
+        cls.budgets = load_budgets()["modules"]
+    
+    def check_module(self, module: str):
+        """检查单个模块导入时没有加载禁止提前加载的依赖"""
+        _, loaded = measure_import(module)
+        eager = sorted(set(self.budgets[module].get("forbidden", [])) & loaded)
+        self.assertEqual(eager, [], f"{module} 在导入时加载了 {eager}")
+    
+    def test_config_import(self):
+        """测试配置模块导入时不加载 LangChain、NumPy 和 httpx"""
+        self.check_module("src.config")
+    
+    def test_session_store_import(self):
+        """测试会话存储模块导入时不加载 LangChain、NumPy 和 httpx"""
+        self.check_module("src.session_store")
+    
+    def test_scenario_manager_import(self):
+        """测试场景管理器导入时不加载 LangChain、场景模块、NumPy 和 httpx"""
+        self.check_module("src.scenario_manager")
+    
+    @unittest.skipUnless(module_available("gradio"), "gradio 未安装")
+    def test_app_import(self):
+        """测试应用入口导入时不加载 LangChain 和场景模块"""
+        self.check_module("app")
+
+
+@unittest.skipUnless(TIMING_ENABLED, "导入计时检查默认跳过，设置 IMPORT_TIME_TESTS=1 开启")
+class TestImportTime(unittest.TestCase):
+    """测试启动路径的导入时间（相对参考模块）"""
+    
+    @classmethod
+    def setUpClass(cls):
+        """读取预算配置并测量参考模块"""
+        budgets = load_budgets()
+        cls.budgets = budgets["modules"]
+        cls.max_ratio = budgets["max_ratio"]
+        cls.min_ratio = budgets.get("min_ratio", 0.0)
+        cls.reference_ms = measure_best(budgets["reference_module"])
+    
+    def check_module(self, module: str):
+        """检查单个模块的相对导入时间没有超过记录值的 max_ratio 倍（导入很快的模块至少允许 min_ratio 倍，避免噪声误报）"""
+        recorded = self.budgets[module]["recorded_ratio"]
+        allowed = max(recorded * self.max_ratio, self.min_ratio)
+        ratio = measure_ratio(module, self.reference_ms)
+        self.assertLessEqual(
+            ratio, allowed,
+            f"{module} 导入耗时是参考模块的 {ratio:.2f} 倍，记录值 {recorded} 倍，允许 {allowed:.2f} 倍"
+        )
+    
+    def test_config_import(self):
+        """测试配置模块的导入时间"""
+        self.check_module("src.config")
+    
+    def test_session_store_import(self):
+        """测试会话存储模块的导入时间"""
+        self.check_module("src.session_store")
+    
+    def test_scenario_manager_import(self):
+        """测试场景管理器的导入时间"""
+        self.check_module("src.scenario_manager")
+    
+    @unittest.skipUnless(module_available("gradio"), "gradio 未安装")
+    def test_app_import(self):
+        """测试应用入口的导入时间"""
+        self.check_module("app")
+
+
+def record():
+    """测量所有模块并把相对参考模块的倍数写入预算文件的 recorded_ratio 字段"""
+    budgets = load_budgets()
+    reference_ms = measure_best(budgets["reference_module"])
+    print(f"{budgets['reference_module']}: {reference_ms:.1f}ms（参考）")
+    for module, budget in budgets["modules"].items():
+        if module == "app" and not module_available("gradio"):
+            continue
+        ratio = measure_ratio(module, reference_ms)
+        budget["recorded_ratio"] = round(ratio, 3)
+        print(f"{module}: {ratio * reference_ms:.1f}ms，参考模块的 {ratio:.3f} 倍")
+    
+    with open(BUDGET_PATH, "w", encoding="utf-8") as f:
+        json.dump(budgets, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+
+if __name__ == '__main__':
+    if "--record" in sys.argv:
+        record()
+    else:
+        unittest.main()
@@ -0,0 +1,155 @@
+"""
+测试每轮对话的耗时与 token 统计
+"""
+import asyncio
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+from src.instrumentation import TurnInstrumentation, TurnRecord
+from src.metrics import MetricsRegistry
+from src.scenarios.base_scenario import BaseScenario
+
+RESPONSE = '{"teaching_feedback": {"overall_comment": "Good"}, "example_sentences": ["s1", "s2", "s3"], "bot_reply": "Hi"}'
+USAGE = {"input_tokens": 120, "output_tokens": 30}
+
+
+class MockScenario(BaseScenario):
+    """测试用的模拟场景"""
+    
+    def get_system_prompt(self):
+        return "You are a test scenario agent."
+    
+    def get_welcome_message(self):
+        return "Welcome!"
+
+
+class TestTurnRecord(unittest.TestCase):
+    """测试单轮统计数据"""
+    
+    def test_stage_accumulates(self):
+        """测试同一阶段多次进入时累加耗时"""
+        record = TurnRecord("s", "m")
+        for _ in range(2):
+            with record.stage("parse"):
+                time.sleep(0.01)
+        self.assertGreaterEqual(record.parse_seconds, 0.02)
+        self.assertEqual(record.llm_seconds, 0.0)
+    
+    def test_track_stream(self):
+        """测试流式输出计入 LLM 时间，首个片段到达时记录首 token 时间"""
+        record = TurnRecord("s", "m")
+        
+        def chunks():
+            time.sleep(0.02)
+            yield "a"
+            yield "b"
+        
+        self.assertEqual(list(record.track(chunks())), ["a", "b"])
+        self.assertGreaterEqual(record.time_to_first_token, 0.02)
+        self.assertGreaterEqual(record.llm_seconds, 0.02)
+        
+        async def achunks():
+            await asyncio.sleep(0.01)
+            yield "c"
+        
+        async def collect(turn):
+            return [chunk async for chunk in turn.atrack(achunks())]
+        
+        other = TurnRecord("s", "m")
+        self.assertEqual(asyncio.run(collect(other)), ["c"])
+        self.assertIsNotNone(other.time_to_first_token)
+
+
+class TestTurnInstrumentation(unittest.TestCase):
+    """测试统计入口"""
+    
+    def setUp(self):
+        """设置测试环境"""
+        self.metrics = MetricsRegistry()
+        self.instrumentation = TurnInstrumentation(self.metrics)
+    
+    def test_turn_written_once(self):
+        """测试结束时写入指标，内层沿用外层记录时不重复写入"""
+        with self.instrumentation.turn("leave_request", "gpt-4o-mini") as outer:
+            with self.instrumentation.turn("leave_request", "gpt-4o-mini", outer) as inner:
+                self.assertIs(inner, outer)
+                inner.add_tokens(100, 20)
+                inner.mark_first_token()
+        
+        labels = {"scenario": "leave_request", "model": "gpt-4o-mini"}
+        self.assertEqual(self.metrics.get("turns_total").value(outcome="ok", **labels), 1)
+        self.assertEqual(self.metrics.get("turn_duration_seconds").count(**labels), 1)
+        self.assertEqual(self.metrics.get("turn_time_to_first_token_seconds").count(**labels), 1)
+        self.assertEqual(self.metrics.get("turn_prompt_tokens_total").value(**labels), 100)
+        self.assertEqual(self.metrics.get("turn_completion_tokens_total").value(**labels), 20)
+    
+    def test_error_outcome(self):
+        """测试抛出异常的轮次记为 error"""
+        with self.assertRaises(ValueError):
+            with self.instrumentation.turn("s", "m"):
+                raise ValueError("boom")
+        self.assertEqual(self.metrics.get("turns_total").value(scenario="s", model="m", outcome="error"), 1)
+
+
+class TestScenarioInstrumentation(unittest.TestCase):
+    """测试场景生成回复时的统计"""
+    
+    def setUp(self):
+        """设置测试环境"""
+        self.metrics = MetricsRegistry()
+        self.labels = {"scenario": "test", "model": "gpt-4o-mini"}
+    
+    def make_scenario(self, llm):
+        with patch('src.scenarios.base_scenario.ChatOpenAI', return_value=llm):
+            scenario = MockScenario(name="test", model_name="gpt-4o-mini")
+        scenario.instrumentation = TurnInstrumentation(self.metrics)
+        return scenario
+    
+    def test_generate_response_recorded(self):
+        """测试同步生成回复记录 LLM、解析时间和 token 用量"""
+        llm = MagicMock()
+        llm.invoke.return_value = MagicMock(content=RESPONSE, usage_metadata=USAGE)
+        scenario = self.make_scenario(llm)
+        
+        self.assertEqual(scenario.generate_response("Hello")["bot_reply"], "Hi")
+        self.assertEqual(self.metrics.get("turns_total").value(outcome="ok", **self.labels), 1)
+        self.assertEqual(self.metrics.get("turn_llm_seconds").count(**self.labels), 1)
+        self.assertEqual(self.metrics.get("turn_parse_seconds").count(**self.labels), 1)
+        self.assertEqual(self.metrics.get("turn_prompt_tokens_total").value(**self.labels), 120)
+        self.assertEqual(self.metrics.get("turn_completion_tokens_total").value(**self.labels), 30)
+    
+    def test_astream_response_with_outer_turn(self):
+        """测试外层传入的记录由外层写入，场景内只累加首 token 时间和 token 用量"""
+        async def fake_astream(messages, **kwargs):
+            yield MagicMock(content=RESPONSE[:40], usage_metadata=None)
+            yield MagicMock(content=RESPONSE[40:], usage_metadata=USAGE)
+        
+        llm = MagicMock()
+        llm.astream = fake_astream
+        scenario = self.make_scenario(llm)
+        
+        async def collect(turn):
+            return [update async for update in scenario.astream_response("Hello", turn=turn)]
+        
+        instrumentation = TurnInstrumentation(self.metrics)
+        with instrumentation.turn("test", "gpt-4o-mini") as turn:
+            updates = asyncio.run(collect(turn))
+            self.assertEqual(self.metrics.get("turns_total").value(outcome="ok", **self.labels), 0)
+        self.assertEqual(updates[-1]["bot_reply"], "Hi")
+        self.assertIsNotNone(turn.time_to_first_token)
+        self.assertEqual(turn.completion_tokens, 30)
+        self.assertEqual(self.metrics.get("turns_total").value(outcome="ok", **self.labels), 1)
+        self.assertEqual(self.metrics.get("turn_time_to_first_token_seconds").count(**self.labels), 1)
+    
+    def test_error_recorded(self):
+        """测试 LLM 出错的轮次记为 error"""
+        llm = MagicMock()
+        llm.invoke.side_effect = Exception("API Error")
+        scenario = self.make_scenario(llm)
+        
+        scenario.generate_response("Hello")
+        self.assertEqual(self.metrics.get("turns_total").value(outcome="error", **self.labels), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
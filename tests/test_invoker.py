@@ -0,0 +1,212 @@
+"""
+测试 LLM 调用路径
+"""
+import asyncio
+import unittest
+from unittest.mock import MagicMock, AsyncMock
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, SystemMessage
+from src.llm.invoker import LLMInvoker
+from src.llm.pool import Backend, LLMPool
+from src.llm.response_cache import MemoryCacheBackend, ResponseCache
+from src.llm.semantic_cache import SemanticCache
+from src.metrics import MetricsRegistry
+
+
+def make_stream(content, size=5):
+    """把内容切分为流式片段"""
+    return [MagicMock(content=content[i:i + size]) for i in range(0, len(content), size)]
+
+
+class TestLLMInvoker(unittest.TestCase):
+    """测试 LLM 调用器"""
+    
+    def setUp(self):
+        """设置测试环境"""
+        self.cache = ResponseCache(MemoryCacheBackend(), metrics=MetricsRegistry())
+        self.invoker = LLMInvoker(response_cache=self.cache)
+        self.first_turn = [SystemMessage(content="system"), HumanMessage(content="Hello")]
+        self.later_turn = [SystemMessage(content="system"), HumanMessage(content="Hi"),
+                           AIMessage(content="Hello"), HumanMessage(content="How are you?")]
+        self.llm = MagicMock()
+        self.llm.invoke.return_value = MagicMock(content="reply")
+    
+    def test_invoke_without_cache(self):
+        """测试未配置缓存时直接调用 LLM"""
+        invoker = LLMInvoker()
+        self.assertEqual(invoker.invoke(self.llm, self.first_turn, "m", 0.7), "reply")
+        self.assertEqual(invoker.invoke(self.llm, self.first_turn, "m", 0.7), "reply")
+        self.assertEqual(self.llm.invoke.call_count, 2)
+    
+    def test_first_turn_cached(self):
+        """测试首轮请求命中缓存后不再调用 LLM"""
+        self.invoker.invoke(self.llm, self.first_turn, "m", 0.7)
+        self.assertEqual(self.invoker.invoke(self.llm, self.first_turn, "m", 0.7), "reply")
+        self.assertEqual(self.llm.invoke.call_count, 1)
+    
+    def test_later_turn_not_cached(self):
+        """测试非首轮且 temperature 不为 0 的请求不缓存"""
+        self.invoker.invoke(self.llm, self.later_turn, "m", 0.7)
+        self.invoker.invoke(self.llm, self.later_turn, "m", 0.7)
+        self.assertEqual(self.llm.invoke.call_count, 2)
+        
+        # temperature 为 0 时可缓存
+        self.invoker.invoke(self.llm, self.later_turn, "m", 0)
+        self.invoker.invoke(self.llm, self.later_turn, "m", 0)
+        self.assertEqual(self.llm.invoke.call_count, 3)
+    
+    def test_ainvoke_cached(self):
+        """测试异步调用使用缓存"""
+        llm = MagicMock()
+        llm.ainvoke = AsyncMock(return_value=MagicMock(content="reply"))
+        
+        async def run():
+            first = await self.invoker.ainvoke(llm, self.first_turn, "m", 0.7)
+            second = await self.invoker.ainvoke(llm, self.first_turn, "m", 0.7)
+            return first, second
+        
+        self.assertEqual(asyncio.run(run()), ("reply", "reply"))
+        llm.ainvoke.assert_awaited_once()
+    
+    def test_cache_separates_structured_output_and_backend(self):
+        """测试绑定了 response_format 的模型和不同 Base URL 的模型不复用其他调用方的缓存"""
+        json_llm = MagicMock(kwargs={"response_format": {"type": "json_object"}})
+        json_llm.invoke.return_value = MagicMock(content='{"bot_reply": "reply"}')
+        other_backend = MagicMock(openai_api_base="http://localhost:11434/v1")
+        other_backend.invoke.return_value = MagicMock(content="local reply")
+        
+        self.assertEqual(self.invoker.invoke(self.llm, self.first_turn, "m", 0.7), "reply")
+        self.assertEqual(self.invoker.invoke(json_llm, self.first_turn, "m", 0.7), '{"bot_reply": "reply"}')
+        self.assertEqual(self.invoker.invoke(other_backend, self.first_turn, "m", 0.7), "local reply")
+        self.assertEqual(self.invoker.invoke(json_llm, self.first_turn, "m", 0.7), '{"bot_reply": "reply"}')
+        json_llm.invoke.assert_called_once()
+    
+    def test_stream_populates_cache(self):
+        """测试流式输出结束后写入缓存，命中时一次性产出"""
+        self.llm.stream.return_value = iter(make_stream("streamed reply"))
+        
+        chunks = list(self.invoker.stream(self.llm, self.first_turn, "m", 0.7))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual("".join(chunks), "streamed reply")
+        
+        self.assertEqual(list(self.invoker.stream(self.llm, self.first_turn, "m", 0.7)), ["streamed reply"])
+        self.llm.stream.assert_called_once()
+        # 同步与流式调用共享缓存
+        self.assertEqual(self.invoker.invoke(self.llm, self.first_turn, "m", 0.7), "streamed reply")
+        self.llm.invoke.assert_not_called()
+    
+    def test_astream_populates_cache(self):
+        """测试异步流式输出使用缓存"""
+        calls = []
+        
+        async def fake_astream(messages, **kwargs):
+            calls.append(messages)
+            for chunk in make_stream("async reply"):
+                yield chunk
+        
+        self.llm.astream = fake_astream
+        
+        async def collect():
+            return [text async for text in self.invoker.astream(self.llm, self.first_turn, "m", 0.7)]
+        
+        self.assertEqual("".join(asyncio.run(collect())), "async reply")
+        self.assertEqual(asyncio.run(collect()), ["async reply"])
+        self.assertEqual(len(calls), 1)
+    
+    def test_usage_recorded_with_cached_tokens(self):
+        """测试根据 usage 元数据记录命中和未命中服务端前缀缓存的 token"""
+        metrics = MetricsRegistry()
+        invoker = LLMInvoker(metrics=metrics)
+        self.llm.invoke.return_value = AIMessage(content="reply", usage_metadata={
+            "input_tokens": 1200, "output_tokens": 80, "total_tokens": 1280,
+            "input_token_details": {"cache_read": 1024}
+        })
+        
+        invoker.invoke(self.llm, self.later_turn, "m", 0.7)
+        
+        prompt_tokens = metrics.get("llm_prompt_tokens_total")
+        self.assertEqual(prompt_tokens.value(model="m", cache="cached"), 1024)
+        self.assertEqual(prompt_tokens.value(model="m", cache="uncached"), 176)
+        self.assertEqual(metrics.get("llm_completion_tokens_total").value(model="m"), 80)
+        self.assertAlmostEqual(invoker.prompt_cache_ratio("m"), 1024 / 1200)
+    
+    def test_usage_labelled_with_serving_backend(self):
+        """测试后端池调用的 token 用量按实际处理请求的后端记录，而不是配置的模型名称"""
+        metrics = MetricsRegistry()
+        invoker = LLMInvoker(metrics=metrics)
+        usage = {"input_tokens": 10, "output_tokens": 2, "total_tokens": 12}
+        llm = MagicMock()
+        llm.invoke.return_value = AIMessage(content="reply", usage_metadata=usage)
+        llm.stream.side_effect = lambda *args, **kwargs: iter([
+            AIMessageChunk(content="a"), AIMessageChunk(content="", usage_metadata=usage)
+        ])
+        pool = LLMPool([Backend("deepseek", lambda: llm)], metrics=metrics)
+        
+        invoker.invoke(pool, self.later_turn, "gpt-4o-mini", 0.7)
+        list(invoker.stream(pool, self.later_turn, "gpt-4o-mini", 0.7))
+        completion_tokens = metrics.get("llm_completion_tokens_total")
+        self.assertEqual(completion_tokens.value(model="deepseek"), 4)
+        self.assertEqual(completion_tokens.value(model="gpt-4o-mini"), 0)
+    
+    def test_stream_requests_usage(self):
+        """测试流式调用请求 usage 元数据并从最后一个片段读取"""
+        metrics = MetricsRegistry()
+        invoker = LLMInvoker(metrics=metrics)
+        chunks = [AIMessageChunk(content="a"), AIMessageChunk(content="b"),
+                  AIMessageChunk(content="", usage_metadata={
+                      "input_tokens": 50, "output_tokens": 2, "total_tokens": 52
+                  })]
+        self.llm.stream.return_value = iter(chunks)
+        
+        self.assertEqual("".join(invoker.stream(self.llm, self.later_turn, "m", 0.7)), "ab")
+        self.assertEqual(self.llm.stream.call_args.kwargs, {"stream_usage": True})
+        prompt_tokens = metrics.get("llm_prompt_tokens_total")
+        self.assertEqual(prompt_tokens.value(model="m", cache="uncached"), 50)
+        self.assertEqual(prompt_tokens.value(model="m", cache="cached"), 0)
+        
+        # 关闭 stream_usage 时不传额外参数
+        self.llm.stream.return_value = iter(chunks)
+        list(LLMInvoker(stream_usage=False, metrics=metrics).stream(self.llm, self.later_turn, "m", 0.7))
+        self.assertEqual(self.llm.stream.call_args.kwargs, {})
+    
+    def test_semantic_cache_for_scenarios(self):
+        """测试传入场景名称时使用语义近似缓存"""
+        invoker = LLMInvoker(semantic_cache=SemanticCache(threshold=0.75, metrics=MetricsRegistry()))
+        invoker.invoke(self.llm, [SystemMessage(content="s"), HumanMessage(content="Hello, I would like to check in")],
+                       "m", 0.7, scenario="hotel")
+        
+        near = [SystemMessage(content="s"), HumanMessage(content="hello, I'd like to check in please")]
+        self.assertEqual(invoker.invoke(self.llm, near, "m", 0.7, scenario="hotel"), "reply")
+        self.assertEqual(self.llm.invoke.call_count, 1)
+        
+        # 未传入场景名称（如自由对话）时不使用语义缓存
+        invoker.invoke(self.llm, near, "m", 0.7)
+        self.assertEqual(self.llm.invoke.call_count, 2)
+    
+    def test_from_config(self):
+        """测试根据配置创建调用器"""
+        config = MagicMock()
+        config.get_llm_config.return_value = {"stream_usage": False}
+        config.get_cache_config.return_value = {"enabled": False}
+        config.get_semantic_cache_config.return_value = {"enabled": False}
+        config.get_scheduler_config.return_value = {"enabled": False}
+        config.get_hedging_config.return_value = {"enabled": False}
+        invoker = LLMInvoker.from_config(config)
+        self.assertIsNone(invoker.response_cache)
+        self.assertIsNone(invoker.semantic_cache)
+        self.assertIsNone(invoker.scheduler)
+        self.assertIsNone(invoker.hedger)
+        self.assertFalse(invoker.stream_usage)
+        
+        config.get_cache_config.return_value = {"enabled": True}
+        config.get_semantic_cache_config.return_value = {"enabled": True}
+        config.get_scheduler_config.return_value = {"enabled": True, "requests_per_minute": 500}
+        config.get_hedging_config.return_value = {"enabled": True, "percentile": 99}
+        invoker = LLMInvoker.from_config(config)
+        self.assertIsNotNone(invoker.response_cache)
+        self.assertIsNotNone(invoker.semantic_cache)
+        self.assertEqual(invoker.scheduler.rpm.capacity, 500)
+        self.assertEqual(invoker.hedger.percentile, 99)
+
+
+if __name__ == '__main__':
+    unittest.main()
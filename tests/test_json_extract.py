@@ -0,0 +1,86 @@
+"""
+测试 JSON 对象提取
+"""
+import json
+import time
+import unittest
+from src.llm.json_extract import JSONObjectScanner, extract_json_object
+
+
+RESPONSE = {
+    "bot_reply": "Hello {friend}! Say \"hi\" \\ wave.",
+    "teaching_feedback": {"overall_comment": "Good", "grammar_corrections": []},
+    "example_sentences": ["s1", "s2", "s3"]
+}
+RESPONSE_TEXT = json.dumps(RESPONSE)
+
+
+class TestExtractJSONObject(unittest.TestCase):
+    """测试从完整字符串中提取 JSON 对象"""
+    
+    def test_plain_object(self):
+        """测试纯 JSON"""
+        self.assertEqual(extract_json_object(RESPONSE_TEXT), RESPONSE)
+    
+    def test_code_fence_and_prose(self):
+        """测试代码块标记和前后说明文字"""
+        for content in (f"```json\n{RESPONSE_TEXT}\n```",
+                        f"```\n{RESPONSE_TEXT}\n```",
+                        f"Sure! Here is the JSON:\n\n{RESPONSE_TEXT}\n\nLet me know {{if}} you need more."):
+            self.assertEqual(extract_json_object(content), RESPONSE)
+    
+    def test_skips_unparseable_braces(self):
+        """测试跳过说明文字中配平但不是 JSON 的花括号"""
+        content = f"Use {{placeholders}} like {{name}}. Answer: {RESPONSE_TEXT}"
+        self.assertEqual(extract_json_object(content), RESPONSE)
+    
+    def test_not_found(self):
+        """测试找不到对象"""
+        self.assertIsNone(extract_json_object(""))
+        self.assertIsNone(extract_json_object("Just a plain reply."))
+        self.assertIsNone(extract_json_object('{"bot_reply": "truncated'))
+        self.assertIsNone(extract_json_object("[1, 2, 3]"))
+    
+    def test_adversarial_input_is_linear(self):
+        """测试大量未闭合花括号的输入不会触发回溯（原正则在此输入上为平方复杂度）"""
+        content = "{" + "{ " * 200000
+        started = time.perf_counter()
+        self.assertIsNone(extract_json_object(content))
+        self.assertLess(time.perf_counter() - started, 2.0)
+
+
+class TestJSONObjectScanner(unittest.TestCase):
+    """测试增量扫描"""
+    
+    def test_feed_token_stream(self):
+        """测试逐个字符喂入（字符串、转义序列被切分在任意位置）"""
+        scanner = JSONObjectScanner()
+        content = f"```json\n{RESPONSE_TEXT}\n```"
+        results = [scanner.feed(ch) for ch in content]
+        
+        self.assertEqual(results[-1], RESPONSE)
+        # 对象闭合时立即得到结果
+        closing = content.index(RESPONSE_TEXT) + len(RESPONSE_TEXT) - 1
+        self.assertIsNone(results[closing - 1])
+        self.assertEqual(results[closing], RESPONSE)
+        self.assertTrue(scanner.done)
+    
+    def test_pending(self):
+        """测试未闭合的对象文本"""
+        scanner = JSONObjectScanner()
+        self.assertIsNone(scanner.pending)
+        scanner.feed('Answer: {"bot_reply": "Hi"')
+        self.assertEqual(scanner.pending, '{"bot_reply": "Hi"')
+        scanner.feed("}")
+        self.assertIsNone(scanner.pending)
+        self.assertEqual(scanner.result, {"bot_reply": "Hi"})
+    
+    def test_ignores_input_after_result(self):
+        """测试找到对象后忽略后续文本"""
+        scanner = JSONObjectScanner()
+        scanner.feed('{"a": 1} {"b": 2}')
+        self.assertEqual(scanner.feed('{"c": 3}'), {"a": 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+"""
+测试 JSON 修复
+"""
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+from src.llm.json_repair import JSONRepairer, repair_json
+from src.metrics import MetricsRegistry
+
+
+class TestRepairJSON(unittest.TestCase):
+    """测试本地修复"""
+    
+    def test_trailing_commas(self):
+        """测试去掉尾随逗号"""
+        self.assertEqual(repair_json('{"a": [1, 2,], "b": {"c": 1,},}'), {"a": [1, 2], "b": {"c": 1}})
+    
+    def test_unescaped_quotes(self):
+        """测试字符串中未转义的引号"""
+        self.assertEqual(repair_json('{"bot_reply": "He said "yes", then left", "n": 1}'),
+                         {"bot_reply": 'He said "yes", then left', "n": 1})
+    
+    def test_raw_control_characters_and_invalid_escapes(self):
+        """测试字符串中的原始换行和非法转义"""
+        self.assertEqual(repair_json('{"a": "line 1\nline 2\tend", "b": "it\\\'s"}'),
+                         {"a": "line 1\nline 2\tend", "b": "it\\'s"})
+    
+    def test_missing_closing_brackets(self):
+        """测试缺少或错配的右括号"""
+        self.assertEqual(repair_json('{"a": ["x", "y"}'), {"a": ["x", "y"]})
+        self.assertEqual(repair_json('{"a": {"b": 1}'), {"a": {"b": 1}})
+    
+    def test_truncated_output(self):
+        """测试输出被截断在字符串、键、冒号或字面量中间"""
+        self.assertEqual(repair_json('{"bot_reply": "Hello", "teaching_feedback": {"overall_comment": "Go'),
+                         {"bot_reply": "Hello", "teaching_feedback": {"overall_comment": "Go"}})
+        self.assertEqual(repair_json('{"bot_reply": "Hello", "example_sentences": ["a", "b"'),
+                         {"bot_reply": "Hello", "example_sentences": ["a", "b"]})
+        self.assertEqual(repair_json('{"bot_reply": "Hello", "teaching'), {"bot_reply": "Hello", "teaching": None})
+        self.assertEqual(repair_json('{"bot_reply": "Hello", "done":'), {"bot_reply": "Hello", "done": None})
+        self.assertEqual(repair_json('{"bot_reply": "Hello", "done": tr'), {"bot_reply": "Hello", "done": None})
+        self.assertEqual(repair_json('{"bot_reply": "Hi\\'), {"bot_reply": "Hi"})
+    
+    def test_ignores_surrounding_text(self):
+        """测试忽略代码块标记和对象前后的说明文字"""
+        self.assertEqual(repair_json('Here you go:\n```json\n{"a": 1,}\n```\nThanks {x}'), {"a": 1})
+    
+    def test_unrepairable(self):
+        """测试无法修复的输入"""
+        self.assertIsNone(repair_json(""))
+        self.assertIsNone(repair_json("Just a plain reply."))
+        self.assertIsNone(repair_json('{"a": 1 2}'))
+
+
+class TestJSONRepairer(unittest.TestCase):
+    """测试模型修复"""
+    
+    def test_repair_creates_llm_on_demand(self):
+        """测试修复模型在第一次修复时才创建"""
+        llm = MagicMock()
+        llm.invoke.return_value = MagicMock(content='```json\n{"bot_reply": "Hi"}\n```')
+        factory = MagicMock(return_value=llm)
+        repairer = JSONRepairer(factory, "cheap-model")
+        
+        factory.assert_not_called()
+        self.assertEqual(repairer.repair("bot_reply: Hi"), {"bot_reply": "Hi"})
+        self.assertEqual(repairer.repair("bot_reply: Hi"), {"bot_reply": "Hi"})
+        factory.assert_called_once()
+        self.assertEqual(llm.invoke.call_args.args[0][-1].content, "bot_reply: Hi")
+    
+    def test_repair_through_invoker(self):
+        """测试传入调用器时经由调用器调用修复模型"""
+        invoker = MagicMock()
+        invoker.invoke.return_value = '{"bot_reply": "Hi",}'
+        repairer = JSONRepairer(MagicMock, "cheap-model", invoker=invoker, max_input_chars=5)
+        
+        self.assertEqual(repairer.repair("bot_reply: Hi"), {"bot_reply": "Hi"})
+        args = invoker.invoke.call_args.args
+        self.assertEqual(args[1][-1].content, "bot_r")
+        self.assertEqual(args[2:], ("cheap-model", 0.0))
+    
+    def test_arepair(self):
+        """测试异步修复"""
+        llm = MagicMock()
+        llm.ainvoke = AsyncMock(return_value=MagicMock(content='{"bot_reply": "Hi"}'))
+        repairer = JSONRepairer(lambda: llm, "cheap-model")
+        
+        self.assertEqual(asyncio.run(repairer.arepair("bot_reply: Hi")), {"bot_reply": "Hi"})
+    
+    def test_repair_failure(self):
+        """测试修复模型出错或仍然输出无效内容时返回 None"""
+        llm = MagicMock()
+        llm.invoke.side_effect = Exception("API Error")
+        self.assertIsNone(JSONRepairer(lambda: llm, "cheap-model").repair("bad"))
+        
+        llm.invoke.side_effect = None
+        llm.invoke.return_value = MagicMock(content="I cannot help with that.")
+        self.assertIsNone(JSONRepairer(lambda: llm, "cheap-model").repair("bad"))
+    
+    def test_repair_calls_counted(self):
+        """测试修复调用按模型和结果单独计数"""
+        metrics = MetricsRegistry()
+        llm = MagicMock()
+        repairer = JSONRepairer(lambda: llm, "cheap-model", metrics=metrics)
+        llm.invoke.return_value = MagicMock(content='{"bot_reply": "Hi"}')
+        repairer.repair("bot_reply: Hi")
+        llm.invoke.return_value = MagicMock(content="I cannot help with that.")
+        repairer.repair("bad")
+        llm.invoke.side_effect = Exception("API Error")
+        repairer.repair("bad")
+        
+        calls = metrics.get("llm_repair_calls_total")
+        for result in ("success", "invalid", "error"):
+            self.assertEqual(calls.value(model="cheap-model", result=result), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+"""
+测试流式 JSON 解析
+"""
+import json
+import unittest
+from src.llm.json_stream import PartialJSONParser
+
+
+SAMPLE_RESPONSE = {
+    "bot_reply": "Sure, \"welcome\" aboard! Café is on the left.",
+    "teaching_feedback": {
+        "grammar_corrections": ["Use 'an' before vowels, e.g. {an apple}"],
+        "vocabulary_suggestions": [],
+        "pronunciation_tips": [],
+        "overall_comment": "Good job!"
+    },
+    "example_sentences": ["s1", "s2", "s3"]
+}
+
+
+class TestPartialJSONParser(unittest.TestCase):
+    """测试增量 JSON 解析器"""
+    
+    def test_parse_complete_string(self):
+        """测试一次性输入完整 JSON"""
+        parser = PartialJSONParser()
+        snapshot = parser.feed(json.dumps(SAMPLE_RESPONSE))
+        
+        self.assertTrue(parser.done)
+        self.assertEqual(snapshot, SAMPLE_RESPONSE)
+    
+    def test_parse_char_by_char(self):
+        """测试逐字符输入，结果与一次性解析一致"""
+        parser = PartialJSONParser()
+        for ch in json.dumps(SAMPLE_RESPONSE):
+            parser.feed(ch)
+        
+        self.assertTrue(parser.done)
+        self.assertEqual(parser.snapshot(), SAMPLE_RESPONSE)
+    
+    def test_bot_reply_streams_before_other_fields(self):
+        """测试 bot_reply 在生成过程中即可获得部分内容"""
+        text = json.dumps(SAMPLE_RESPONSE)
+        cut = text.index("aboard")
+        
+        parser = PartialJSONParser()
+        snapshot = parser.feed(text[:cut])
+        
+        self.assertEqual(snapshot, {"bot_reply": 'Sure, "welcome" '})
+        self.assertNotIn("teaching_feedback", snapshot)
+    
+    def test_field_available_once_finished(self):
+        """测试字段生成完毕后立即可用，后续字段尚未出现"""
+        text = json.dumps(SAMPLE_RESPONSE)
+        cut = text.index('"example_sentences"')
+        
+        parser = PartialJSONParser()
+        snapshot = parser.feed(text[:cut])
+        
+        self.assertEqual(snapshot["teaching_feedback"], SAMPLE_RESPONSE["teaching_feedback"])
+        self.assertNotIn("example_sentences", snapshot)
+        self.assertFalse(parser.done)
+    
+    def test_skips_leading_prose_and_code_fence(self):
+        """测试跳过 JSON 之前的说明文字和代码块标记"""
+        text = "Here is my answer:\n```json\n" + json.dumps(SAMPLE_RESPONSE) + "\n```"
+        parser = PartialJSONParser()
+        for i in range(0, len(text), 7):
+            parser.feed(text[i:i + 7])
+        
+        self.assertEqual(parser.snapshot(), SAMPLE_RESPONSE)
+        self.assertEqual(parser.buffer, text)
+    
+    def test_incomplete_escape_sequence(self):
+        """测试字符串末尾不完整的转义序列不会产生乱码"""
+        parser = PartialJSONParser()
+        snapshot = parser.feed('{"bot_reply": "Caf\\u00')
+        self.assertEqual(snapshot["bot_reply"], "Caf")
+        
+        snapshot = parser.feed('e9 \\')
+        self.assertEqual(snapshot["bot_reply"], "Café ")
+        
+        snapshot = parser.feed('"ok\\""}')
+        self.assertEqual(snapshot["bot_reply"], 'Café "ok"')
+        self.assertTrue(parser.done)
+    
+    def test_scalar_values(self):
+        """测试数字、布尔值等标量字段"""
+        parser = PartialJSONParser()
+        snapshot = parser.feed('{"score": 8.5, "ok": true, "note": null}')
+        self.assertEqual(snapshot, {"score": 8.5, "ok": True, "note": None})
+
+
+if __name__ == '__main__':
+    unittest.main()
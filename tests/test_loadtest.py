@@ -0,0 +1,111 @@
+"""
+测试负载测试使用的模拟 OpenAI 兼容服务和负载测试脚本
+"""
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import httpx
+
+from benchmarks.fake_openai import TEACHING_RESPONSE, FakeOpenAIServer, LatencyDistribution
+from benchmarks.loadtest import percentile
+
+PROJECT_ROOT = Path(__file__).parent.parent
+REQUEST = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "Hello there"}]}
+
+
+class TestLatencyDistribution(unittest.TestCase):
+    """测试延迟分布"""
+    
+    def test_parse_and_sample(self):
+        """测试解析分布描述并抽样"""
+        rng = random.Random(0)
+        self.assertEqual(LatencyDistribution.parse("fixed:0.5").sample(rng), 0.5)
+        uniform = LatencyDistribution.parse("uniform:0.1,0.2")
+        self.assertTrue(all(0.1 <= uniform.sample(rng) <= 0.2 for _ in range(100)))
+        self.assertTrue(all(LatencyDistribution.parse("normal:0,1").sample(rng) >= 0 for _ in range(100)))
+        self.assertEqual(str(LatencyDistribution.parse("lognormal:0.8,0.5")), "lognormal:0.8,0.5")
+        
+        with self.assertRaises(ValueError):
+            LatencyDistribution.parse("pareto:1")
+        with self.assertRaises(ValueError):
+            LatencyDistribution.parse("uniform:1")
+    
+    def test_percentile(self):
+        """测试最近秩法百分位数"""
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([3.0], 95), 3.0)
+        self.assertIsNone(percentile([], 50))
+
+
+class TestFakeOpenAIServer(unittest.TestCase):
+    """测试模拟服务"""
+    
+    def test_completion(self):
+        """测试非流式请求返回教学回复和 token 用量"""
+        with FakeOpenAIServer() as server:
+            response = httpx.post(f"{server.base_url}/chat/completions", json=REQUEST)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(json.loads(body["choices"][0]["message"]["content"]), TEACHING_RESPONSE)
+        self.assertGreater(body["usage"]["completion_tokens"], 0)
+        self.assertEqual(server.stats["requests"], 1)
+    
+    def test_stream(self):
+        """测试流式请求按片段输出，最后附带 token 用量"""
+        request = dict(REQUEST, stream=True, stream_options={"include_usage": True})
+        with FakeOpenAIServer(tokens_per_second=1000) as server:
+            with httpx.stream("POST", f"{server.base_url}/chat/completions", json=request) as response:
+                events = [line[len("data: "):] for line in response.iter_lines() if line.startswith("data: ")]
+        
+        self.assertEqual(events[-1], "[DONE]")
+        chunks = [json.loads(event) for event in events[:-1]]
+        content = "".join(chunk["choices"][0]["delta"].get("content", "") for chunk in chunks if chunk["choices"])
+        self.assertEqual(json.loads(content), TEACHING_RESPONSE)
+        self.assertGreater(chunks[-1]["usage"]["completion_tokens"], 1)
+        self.assertEqual(server.stats["streams"], 1)
+    
+    def test_errors_and_malformed(self):
+        """测试按比例返回错误状态码和非法 JSON"""
+        with FakeOpenAIServer(error_rate=1.0, error_status=503) as server:
+            self.assertEqual(httpx.post(f"{server.base_url}/chat/completions", json=REQUEST).status_code, 503)
+        self.assertEqual(server.stats["errors"], 1)
+        
+        with FakeOpenAIServer(malformed_rate=1.0) as server:
+            content = httpx.post(f"{server.base_url}/chat/completions", json=REQUEST).json()
+        with self.assertRaises(json.JSONDecodeError):
+            json.loads(content["choices"][0]["message"]["content"])
+        self.assertEqual(server.stats["malformed"], 1)
+
+
+class TestLoadTest(unittest.TestCase):
+    """测试负载测试脚本"""
+    
+    def test_run(self):
+        """测试在独立进程中通过 app 的处理函数完成对话并输出报告"""
+        env = dict(os.environ, PYTHONPATH=str(PROJECT_ROOT))
+        # 在临时目录中运行，避免 app 在项目目录下生成 config.json
+        with tempfile.TemporaryDirectory() as cwd:
+            result = subprocess.run(
+                [sys.executable, "-m", "benchmarks.loadtest", "--learners", "4", "--turns", "2",
+                 "--mode", "mixed", "--latency", "fixed:0", "--tokens-per-second", "0", "--json"],
+                cwd=cwd, env=env, capture_output=True, text=True, timeout=120
+            )
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+        report = json.loads(result.stdout[result.stdout.index("{"):])
+        self.assertEqual(report["turns"], 8)
+        self.assertEqual(report["errors"], 0)
+        self.assertGreater(report["turns_per_second"], 0)
+        self.assertLessEqual(report["latency_ms"]["p50"], report["latency_ms"]["p99"])
+        self.assertGreaterEqual(report["server"]["requests"], 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+"""
+测试运行指标
+"""
+import unittest
+from src.metrics import MetricsRegistry, get_metrics_registry
+
+
+class TestMetrics(unittest.TestCase):
+    """测试指标注册表"""
+    
+    def test_counter_with_labels(self):
+        """测试带标签的计数器"""
+        registry = MetricsRegistry()
+        counter = registry.counter("requests_total", "requests")
+        counter.inc(result="hit")
+        counter.inc(2, result="hit")
+        counter.inc(result="miss")
+        
+        self.assertEqual(counter.value(result="hit"), 3)
+        self.assertEqual(counter.value(result="miss"), 1)
+        self.assertEqual(counter.value(result="other"), 0)
+    
+    def test_counter_get_or_create(self):
+        """测试同名计数器只创建一次"""
+        registry = MetricsRegistry()
+        self.assertIs(registry.counter("a"), registry.counter("a"))
+        self.assertIsNone(registry.get("b"))
+    
+    def test_snapshot(self):
+        """测试获取所有指标的快照"""
+        registry = MetricsRegistry()
+        registry.counter("a").inc(5)
+        
+        self.assertEqual(registry.snapshot(), {"a": {(): 5.0}})
+    
+    def test_histogram(self):
+        """测试直方图按分桶累计观测值"""
+        registry = MetricsRegistry()
+        histogram = registry.histogram("latency_seconds", "latency", buckets=(0.1, 1.0))
+        histogram.observe(0.05, model="m")
+        histogram.observe(0.5, model="m")
+        histogram.observe(5, model="m")
+        
+        self.assertIs(registry.histogram("latency_seconds"), histogram)
+        self.assertEqual(histogram.count(model="m"), 3)
+        self.assertAlmostEqual(histogram.sum(model="m"), 5.55)
+        sample = registry.snapshot()["latency_seconds"][(("model", "m"),)]
+        self.assertEqual(sample["buckets"], {0.1: 1, 1.0: 2})
+        
+        with self.assertRaises(ValueError):
+            registry.counter("latency_seconds")
+    
+    def test_render_prometheus(self):
+        """测试导出 Prometheus 文本格式"""
+        registry = MetricsRegistry()
+        registry.counter("requests_total", "requests").inc(2, result='say "hi"')
+        registry.histogram("latency_seconds", buckets=(0.5,)).observe(0.25)
+        
+        text = registry.render_prometheus()
+        self.assertIn("# HELP requests_total requests\n# TYPE requests_total counter\n", text)
+        self.assertIn('requests_total{result="say \\"hi\\""} 2\n', text)
+        self.assertIn('latency_seconds_bucket{le="0.5"} 1\n', text)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 1\n', text)
+        self.assertIn("latency_seconds_sum 0.25\nlatency_seconds_count 1\n", text)
+    
+    def test_global_registry(self):
+        """测试全局注册表为单例"""
+        self.assertIs(get_metrics_registry(), get_metrics_registry())
+
+
+if __name__ == '__main__':
+    unittest.main()
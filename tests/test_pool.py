@@ -0,0 +1,246 @@
+"""
+测试多后端路由与故障转移
+"""
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+from src.config import Config
+from src.llm.pool import Backend, CircuitBreaker, LLMPool, NoBackendAvailableError
+from src.metrics import MetricsRegistry
+from src.scenario_manager import ScenarioManager
+
+
+class APIError(Exception):
+    """模拟 OpenAI SDK 带状态码的错误"""
+    
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def make_backend(name, llm, weight=1.0, latencies=(), clock=None):
+    """创建使用给定模型和延迟样本的后端"""
+    breaker = CircuitBreaker(failure_threshold=2, recovery_seconds=10, clock=clock) if clock else None
+    backend = Backend(name, lambda: llm, weight=weight, model_name=name, breaker=breaker)
+    for latency in latencies:
+        backend.record_latency(latency)
+    return backend
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """测试熔断器"""
+    
+    def test_open_half_open_and_recover(self):
+        """测试连续失败后断开，冷却后只放行一个试探请求"""
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=2, recovery_seconds=10, clock=lambda: now[0])
+        self.assertFalse(breaker.record_failure())
+        self.assertTrue(breaker.record_failure())
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.available())
+        self.assertFalse(breaker.start_call())
+        
+        now[0] = 10
+        self.assertTrue(breaker.available())
+        self.assertTrue(breaker.start_call())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(breaker.start_call())
+        
+        # 试探失败重新断开，冷却后试探成功恢复
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        now[0] = 20
+        self.assertTrue(breaker.start_call())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(breaker.failures, 0)
+    
+    def test_cancelled_trial_released(self):
+        """测试试探请求被放弃时释放试探名额"""
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=1, recovery_seconds=1, clock=lambda: now[0])
+        breaker.record_failure()
+        now[0] = 1
+        self.assertTrue(breaker.start_call())
+        breaker.cancel_call()
+        self.assertTrue(breaker.start_call())
+
+
+class TestLLMPool(unittest.TestCase):
+    """测试后端池"""
+    
+    def setUp(self):
+        """设置测试环境"""
+        self.metrics = MetricsRegistry()
+        self.now = [0.0]
+    
+    def make_pool(self, *backends, **kwargs):
+        kwargs.setdefault("explore_ratio", 0.0)
+        kwargs.setdefault("min_samples", 3)
+        return LLMPool(list(backends), metrics=self.metrics, **kwargs)
+    
+    def test_route_prefers_lowest_weighted_p50(self):
+        """测试按 p50 / 权重排序，样本不足的后端优先，熔断中的后端不参与"""
+        slow = make_backend("openai", MagicMock(), latencies=[2.0, 2.0, 2.0])
+        fast = make_backend("deepseek", MagicMock(), latencies=[0.5, 0.6, 5.0])
+        heavy = make_backend("ollama", MagicMock(), weight=2.0, latencies=[1.8, 1.8, 1.8])
+        pool = self.make_pool(slow, fast, heavy)
+        self.assertEqual([b.name for b in pool.route()], ["deepseek", "ollama", "openai"])
+        
+        fresh = make_backend("new", MagicMock(), latencies=[9.0])
+        pool = self.make_pool(slow, fast, fresh)
+        self.assertEqual(pool.route()[0].name, "new")
+        
+        for _ in range(3):
+            fast.breaker.record_failure()
+        self.assertNotIn("deepseek", [b.name for b in pool.route()])
+    
+    def test_invoke_fails_over(self):
+        """测试后端出错时转到下一个后端，连续出错后熔断"""
+        broken = MagicMock()
+        broken.invoke.side_effect = APIError(503)
+        healthy = MagicMock()
+        healthy.invoke.return_value = MagicMock(content="reply")
+        pool = self.make_pool(make_backend("primary", broken, clock=lambda: self.now[0]),
+                              make_backend("secondary", healthy))
+        
+        for _ in range(3):
+            self.assertEqual(pool.invoke(["msg"]).content, "reply")
+        
+        # 连续两次失败后熔断，第三次直接使用备用后端
+        self.assertEqual(broken.invoke.call_count, 2)
+        self.assertEqual(pool.stats()["primary"]["state"], CircuitBreaker.OPEN)
+        self.assertEqual(pool.stats()["secondary"]["samples"], 3)
+        self.assertEqual(self.metrics.get("llm_backend_failovers_total").value(backend="secondary"), 2)
+        self.assertEqual(self.metrics.get("llm_backend_circuit_open_total").value(backend="primary"), 1)
+    
+    def test_request_error_not_failed_over(self):
+        """测试请求本身的错误（如 400）直接抛出，不转移也不计入熔断"""
+        bad = MagicMock()
+        bad.invoke.side_effect = APIError(400)
+        other = MagicMock()
+        primary = make_backend("primary", bad)
+        pool = self.make_pool(primary, make_backend("secondary", other))
+        
+        with self.assertRaises(APIError):
+            pool.invoke(["msg"])
+        other.invoke.assert_not_called()
+        self.assertEqual(primary.breaker.failures, 0)
+    
+    def test_all_backends_open(self):
+        """测试所有后端都熔断时抛出 NoBackendAvailableError"""
+        backend = make_backend("only", MagicMock(), clock=lambda: self.now[0])
+        backend.breaker.record_failure()
+        backend.breaker.record_failure()
+        with self.assertRaises(NoBackendAvailableError):
+            self.make_pool(backend).invoke(["msg"])
+    
+    def test_stream_fails_over_before_first_chunk(self):
+        """测试流式调用只在第一个片段之前转移"""
+        broken = MagicMock()
+        broken.stream.side_effect = APIError(502)
+        healthy = MagicMock()
+        healthy.stream.return_value = iter([MagicMock(content="a"), MagicMock(content="b")])
+        pool = self.make_pool(make_backend("primary", broken), make_backend("secondary", healthy))
+        self.assertEqual([chunk.content for chunk in pool.stream(["msg"], stream_usage=True)], ["a", "b"])
+        healthy.stream.assert_called_once_with(["msg"], stream_usage=True)
+        
+        def fail_midway(*args, **kwargs):
+            yield MagicMock(content="a")
+            raise APIError(502)
+        
+        midway = MagicMock()
+        midway.stream.side_effect = fail_midway
+        spare = MagicMock()
+        pool = self.make_pool(make_backend("midway", midway), make_backend("spare", spare))
+        with self.assertRaises(APIError):
+            list(pool.stream(["msg"]))
+        spare.stream.assert_not_called()
+    
+    def test_async_calls_and_bind(self):
+        """测试异步调用，以及 bind 返回共享后端状态的视图"""
+        llm = MagicMock()
+        bound = MagicMock()
+        bound.ainvoke = AsyncMock(return_value=MagicMock(content="json"))
+        llm.bind.return_value = bound
+        backend = make_backend("primary", llm)
+        pool = self.make_pool(backend)
+        
+        view = pool.bind(response_format={"type": "json_object"})
+        self.assertEqual(asyncio.run(view.ainvoke(["msg"])).content, "json")
+        llm.bind.assert_called_once_with(response_format={"type": "json_object"})
+        self.assertIs(view.backends, pool.backends)
+        self.assertEqual(backend.samples(), 1)
+        
+        async def chunks():
+            yield MagicMock(content="x")
+        
+        bound.astream.side_effect = lambda *args, **kwargs: chunks()
+        
+        async def collect():
+            return [chunk.content async for chunk in view.astream(["msg"])]
+        
+        self.assertEqual(asyncio.run(collect()), ["x"])
+        self.assertEqual(llm.bind.call_count, 1)
+        self.assertEqual(backend.samples(stream=True), 1)
+    
+    def test_stream_and_invoke_latencies_kept_apart(self):
+        """测试流式调用的首 token 延迟与非流式调用的完整延迟分开统计，路由按调用方式使用对应的样本"""
+        streamer = make_backend("streamer", MagicMock(), latencies=[3.0] * 5)
+        other = make_backend("other", MagicMock(), latencies=[2.0] * 5)
+        for _ in range(5):
+            streamer.record_latency(0.2, stream=True)
+            other.record_latency(0.5, stream=True)
+        pool = self.make_pool(streamer, other)
+        
+        self.assertEqual(streamer.p50(), 3.0)
+        self.assertEqual(streamer.p50(stream=True), 0.2)
+        self.assertEqual([b.name for b in pool.route()], ["other", "streamer"])
+        self.assertEqual([b.name for b in pool.route(stream=True)], ["streamer", "other"])
+        self.assertEqual(pool.stats()["streamer"]["ttft_samples"], 5)
+        
+        streamer.llm.stream.return_value = iter([MagicMock(content="x")])
+        list(pool.stream(["msg"]))
+        self.assertEqual(streamer.samples(), 5)
+        self.assertEqual(streamer.samples(stream=True), 6)
+    
+    def test_from_config(self):
+        """测试根据配置创建后端池"""
+        self.assertIsNone(LLMPool.from_config({"backends": []}, MagicMock(), 0.7))
+        
+        factory = MagicMock()
+        with patch.dict("os.environ", {"DEEPSEEK_TEST_KEY": "sk-test"}):
+            pool = LLMPool.from_config({"backends": [
+                {"name": "openai", "model": "gpt-4o-mini", "api_key": "sk-openai"},
+                {"name": "deepseek", "model": "deepseek-chat", "api_key_env": "DEEPSEEK_TEST_KEY",
+                 "base_url": "https://api.deepseek.com/v1", "weight": 2, "temperature": 0.3}
+            ], "failure_threshold": 5}, factory, 0.7)
+            self.assertEqual([b.name for b in pool.backends], ["openai", "deepseek"])
+            self.assertEqual(pool.backends[1].breaker.failure_threshold, 5)
+            factory.assert_not_called()
+            
+            pool.backends[1].llm
+            factory.assert_called_once_with("deepseek-chat", 0.3, "sk-test", "https://api.deepseek.com/v1")
+
+
+class TestScenarioManagerPool(unittest.TestCase):
+    """测试场景通过后端池调用"""
+    
+    @patch('src.scenarios.base_scenario.ChatOpenAI')
+    def test_scenarios_share_pool(self, mock_llm_class):
+        """测试配置了后端时所有场景共享同一个后端池，不再创建单个模型"""
+        routing = {"backends": [{"name": "openai", "model": "gpt-4o-mini"},
+                                {"name": "ollama", "model": "llama3.2", "base_url": "http://localhost:11434/v1"}]}
+        with patch.object(Config, "get_routing_config", return_value=routing):
+            manager = ScenarioManager()
+        salary = manager.get_scenario("salary_negotiation")
+        leave = manager.get_scenario("leave_request")
+        
+        self.assertIsInstance(manager.llm_pool, LLMPool)
+        self.assertIs(salary.llm, manager.llm_pool)
+        self.assertIs(leave.llm, manager.llm_pool)
+        mock_llm_class.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
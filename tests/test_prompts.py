@@ -0,0 +1,98 @@
+"""
+测试提示词片段注册表
+"""
+import unittest
+from unittest.mock import patch
+from src.prompts import OUTPUT_FORMAT, OUTPUT_RULES, PromptRegistry, build_all_prompts, get_prompt_registry
+
+# 每个系统提示词的 token 预算（超出说明提示词膨胀，需要先评估再调整预算）
+PROMPT_TOKEN_BUDGET = 950
+
+
+class TestPromptRegistry(unittest.TestCase):
+    """测试提示词注册表"""
+    
+    def setUp(self):
+        """设置测试环境"""
+        self.registry = PromptRegistry()
+        self.registry.register_fragment("format", "Reply as $role about $topic.")
+        self.registry.register_fragment("rules", "Always return JSON.")
+    
+    def test_build_concatenates_fragments(self):
+        """测试按顺序拼接场景内容、共享片段和后缀"""
+        prompt = self.registry.build("hotel", "You are a receptionist.", ("format", "rules"),
+                                     suffix="Be polite.", role="the receptionist", topic="hotel check-in")
+        
+        self.assertEqual(
+            prompt,
+            "You are a receptionist.\n\nReply as the receptionist about hotel check-in.\n\n"
+            "Always return JSON.\n\nBe polite."
+        )
+        self.assertIs(self.registry.get("hotel"), prompt)
+    
+    def test_build_is_interned(self):
+        """测试相同参数多次构建返回同一个字符串对象"""
+        first = self.registry.build("hotel", "Context", ("format",), role="r", topic="t")
+        second = self.registry.build("hotel", "Context", ("format",), role="r", topic="t")
+        self.assertIs(first, second)
+        
+        # 参数变化时重新构建
+        third = self.registry.build("hotel", "Context", ("format",), role="r2", topic="t")
+        self.assertNotEqual(third, first)
+        self.assertEqual(self.registry.get("hotel"), third)
+    
+    def test_missing_variable(self):
+        """测试缺少占位符变量时报错"""
+        with self.assertRaises(KeyError):
+            self.registry.build("hotel", "Context", ("format",), role="r")
+    
+    def test_token_lengths(self):
+        """测试统计提示词和片段的 token 长度"""
+        self.registry.build("short", "Hi", ("rules",))
+        self.registry.build("long", "Hi " * 50, ("rules",))
+        
+        lengths = self.registry.token_lengths()
+        self.assertGreater(lengths["long"], lengths["short"])
+        self.assertEqual(set(self.registry.fragment_token_lengths()), {"format", "rules"})
+
+
+class TestSystemPrompts(unittest.TestCase):
+    """测试场景和 ConversationAgent 的系统提示词"""
+    
+    @classmethod
+    def setUpClass(cls):
+        """构建所有系统提示词"""
+        cls.lengths = build_all_prompts()
+        cls.registry = get_prompt_registry()
+    
+    def test_all_prompts_share_fragments(self):
+        """测试所有系统提示词都包含共享的输出格式和规则"""
+        self.assertEqual(
+            set(self.lengths),
+            {"salary_negotiation", "apartment_rental", "leave_request", "airport_checkin", "conversation_agent"}
+        )
+        for name in self.lengths:
+            prompt = self.registry.get(name)
+            self.assertIn(OUTPUT_RULES, prompt, name)
+            self.assertIn(OUTPUT_FORMAT.split("\n")[0], prompt, name)
+            self.assertNotIn("$role", prompt, name)
+            self.assertNotIn("$topic", prompt, name)
+    
+    def test_prompt_token_budget(self):
+        """测试每个系统提示词都在 token 预算之内"""
+        for name, tokens in self.lengths.items():
+            self.assertLessEqual(tokens, PROMPT_TOKEN_BUDGET, f"{name} 提示词 {tokens} tokens 超出预算")
+    
+    @patch('src.scenarios.base_scenario.ChatOpenAI')
+    def test_scenario_instances_share_prompt(self, mock_llm_class):
+        """测试同一场景的多个实例共用同一个提示词字符串"""
+        from src.scenarios import SalaryNegotiationScenario
+        
+        first = SalaryNegotiationScenario()
+        second = SalaryNegotiationScenario()
+        self.assertIs(first.system_prompt, second.system_prompt)
+        self.assertIs(first.system_prompt, self.registry.get("salary_negotiation"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+"""
+测试 LLM 响应缓存
+"""
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from src.llm.response_cache import (
+    MemoryCacheBackend,
+    ResponseCache,
+    SQLiteCacheBackend,
+    make_cache_key
+)
+from src.metrics import MetricsRegistry
+
+
+class TestResponseCache(unittest.TestCase):
+    """测试响应缓存"""
+    
+    def setUp(self):
+        """设置测试环境"""
+        self.metrics = MetricsRegistry()
+        self.messages = [SystemMessage(content="system"), HumanMessage(content="Hello")]
+    
+    def test_cache_key(self):
+        """测试缓存键包含模型、温度和消息内容"""
+        key = make_cache_key("gpt-4o-mini", 0.7, self.messages)
+        
+        self.assertEqual(key, make_cache_key("gpt-4o-mini", 0.7, list(self.messages)))
+        self.assertNotEqual(key, make_cache_key("gpt-4o", 0.7, self.messages))
+        self.assertNotEqual(key, make_cache_key("gpt-4o-mini", 0.0, self.messages))
+        self.assertNotEqual(key, make_cache_key("gpt-4o-mini", 0.7, [HumanMessage(content="Hello")]))
+        
+        # 结构化输出绑定和后端不同的请求互不复用
+        json_mode = make_cache_key("gpt-4o-mini", 0.7, self.messages, {"type": "json_object"})
+        self.assertNotEqual(key, json_mode)
+        self.assertNotEqual(json_mode, make_cache_key("gpt-4o-mini", 0.7, self.messages, {"type": "json_schema"}))
+        self.assertNotEqual(key, make_cache_key("gpt-4o-mini", 0.7, self.messages, backend="openai"))
+    
+    def test_is_cacheable(self):
+        """测试只有首轮对话或 temperature 为 0 时可缓存"""
+        with_history = [SystemMessage(content="s"), HumanMessage(content="a"),
+                        AIMessage(content="b"), HumanMessage(content="c")]
+        
+        self.assertTrue(ResponseCache.is_cacheable(self.messages, 0.7))
+        self.assertFalse(ResponseCache.is_cacheable(with_history, 0.7))
+        self.assertTrue(ResponseCache.is_cacheable(with_history, 0))
+    
+    def test_hit_and_miss_metrics(self):
+        """测试命中率和节省时间指标"""
+        cache = ResponseCache(MemoryCacheBackend(), metrics=self.metrics)
+        
+        self.assertIsNone(cache.get("k"))
+        cache.set("k", "content", latency=1.5)
+        self.assertEqual(cache.get("k"), "content")
+        
+        self.assertEqual(cache.hit_rate, 0.5)
+        self.assertEqual(self.metrics.get("llm_cache_saved_seconds_total").value(), 1.5)
+    
+    def test_empty_content_not_cached(self):
+        """测试空输出不写入缓存"""
+        cache = ResponseCache(MemoryCacheBackend(), metrics=self.metrics)
+        cache.set("k", "", latency=1.0)
+        self.assertIsNone(cache.get("k"))
+    
+    def test_memory_backend_lru(self):
+        """测试内存后端的 LRU 淘汰"""
+        backend = MemoryCacheBackend(max_entries=2)
+        backend.set("a", "1", 0.1, 60)
+        backend.set("b", "2", 0.1, 60)
+        backend.get("a")
+        backend.set("c", "3", 0.1, 60)
+        
+        self.assertEqual(len(backend), 2)
+        self.assertIsNone(backend.get("b"))
+        self.assertEqual(backend.get("a"), ("1", 0.1))
+    
+    @patch('src.llm.response_cache.time.time')
+    def test_memory_backend_ttl(self, mock_time):
+        """测试内存后端的过期时间"""
+        backend = MemoryCacheBackend()
+        mock_time.return_value = 100
+        backend.set("a", "1", 0.1, ttl_seconds=10)
+        
+        mock_time.return_value = 105
+        self.assertIsNotNone(backend.get("a"))
+        mock_time.return_value = 111
+        self.assertIsNone(backend.get("a"))
+    
+    def test_sqlite_backend(self):
+        """测试 SQLite 后端的读写、过期和容量限制"""
+        temp_dir = tempfile.mkdtemp()
+        path = os.path.join(temp_dir, "sub", "cache.sqlite3")
+        try:
+            backend = SQLiteCacheBackend(path, max_entries=2)
+            backend.set("a", "1", 0.5, 60)
+            self.assertEqual(backend.get("a"), ("1", 0.5))
+            
+            backend.set("b", "2", 0.5, -1)
+            self.assertIsNone(backend.get("b"))
+            
+            backend.set("c", "3", 0.5, 60)
+            backend.set("d", "4", 0.5, 60)
+            self.assertEqual(len(backend), 2)
+            
+            # 重新打开后数据仍然存在
+            reopened = SQLiteCacheBackend(path)
+            self.assertEqual(reopened.get("d"), ("4", 0.5))
+            backend._conn.close()
+            reopened._conn.close()
+        finally:
+            import shutil
+            shutil.rmtree(temp_dir)
+    
+    def test_async_access_off_event_loop(self):
+        """测试异步读写时 SQLite 后端在工作线程中执行，内存后端直接执行"""
+        sqlite_cache = ResponseCache(SQLiteCacheBackend(":memory:"), metrics=self.metrics)
+        memory_cache = ResponseCache(MemoryCacheBackend(), metrics=self.metrics)
+        
+        async def run(cache):
+            await cache.aset("k", "content", 0.5)
+            return await cache.aget("k"), await cache.aget("missing")
+        
+        with patch('src.llm.response_cache.asyncio.to_thread', wraps=asyncio.to_thread) as to_thread:
+            self.assertEqual(asyncio.run(run(sqlite_cache)), ("content", None))
+            self.assertEqual(to_thread.call_count, 3)
+            self.assertEqual(asyncio.run(run(memory_cache)), ("content", None))
+            self.assertEqual(to_thread.call_count, 3)
+        sqlite_cache.backend._conn.close()
+    
+    def test_from_config(self):
+        """测试根据配置创建缓存"""
+        self.assertIsNone(ResponseCache.from_config({"enabled": False}))
+        
+        cache = ResponseCache.from_config({"enabled": True, "backend": "memory", "ttl_seconds": 5})
+        self.assertIsInstance(cache.backend, MemoryCacheBackend)
+        self.assertEqual(cache.ttl_seconds, 5)
+        
+        cache = ResponseCache.from_config({"enabled": True, "backend": "sqlite", "sqlite_path": ":memory:"})
+        self.assertIsInstance(cache.backend, SQLiteCacheBackend)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -92,6 +92,104 @@ class TestScenarioManager(unittest.TestCase):
         self.assertIsNotNone(scenario)
         self.assertEqual(scenario.name, "leave_request")
     
+    @patch('src.scenarios.base_scenario.ChatOpenAI')
+    def test_scenarios_created_on_demand(self, mock_llm_class):
+        """测试初始化时不创建场景，首次获取时才创建并缓存"""
+        manager = ScenarioManager(self.config_path)
+        self.assertEqual(manager.scenarios, {})
+        mock_llm_class.assert_not_called()
+        
+        scenario = manager.get_scenario("apartment_rental")
+        self.assertIs(manager.get_scenario("apartment_rental"), scenario)
+        self.assertEqual(list(manager.scenarios), ["apartment_rental"])
+        mock_llm_class.assert_called_once()
+    
+    @patch('src.scenarios.base_scenario.ChatOpenAI')
+    def test_update_llm_config_invalidates_affected_scenarios(self, mock_llm_class):
+        """测试更新配置时只重建客户端配置发生变化的场景"""
+        manager = ScenarioManager(self.config_path)
+        scenario = manager.get_scenario("salary_negotiation")
+        llm_config = manager.config.get_llm_config()
+        
+        # 只修改提供商名称，客户端配置不变，场景保留
+        manager.update_llm_config(provider="custom", model=llm_config["model"],
+                                  temperature=llm_config["temperature"],
+                                  api_key=llm_config.get("api_key"), base_url=llm_config.get("base_url"))
+        self.assertIs(manager.get_scenario("salary_negotiation"), scenario)
+        
+        # 修改模型后场景失效，下次获取时按新配置重建
+        manager.update_llm_config(provider="openai", model="gpt-4o", temperature=llm_config["temperature"])
+        self.assertNotIn("salary_negotiation", manager.scenarios)
+        rebuilt = manager.get_scenario("salary_negotiation")
+        self.assertIsNot(rebuilt, scenario)
+        self.assertEqual(rebuilt.model_name, "gpt-4o")
+        self.assertEqual(len(manager.llm_registry), 1)
+    
+    @patch('src.agents.conversation_agent.ChatOpenAI')
+    def test_update_llm_config_rebuilds_conversation_agent(self, mock_llm_class):
+        """测试 ConversationAgent 由管理器按需创建，更新配置后改用新的客户端和后端池"""
+        mock_llm_class.side_effect = lambda **kwargs: MagicMock(kwargs=kwargs)
+        manager = ScenarioManager(self.config_path)
+        temperature = manager.config.get_llm_config()["temperature"]
+        agent = manager.get_conversation_agent()
+        self.assertIs(manager.get_conversation_agent(), agent)
+        self.assertIs(agent.invoker, manager.invoker)
+        self.assertEqual(agent.llm.kwargs["temperature"], temperature)
+        
+        manager.update_llm_config(provider="openai", model="gpt-4o", temperature=temperature + 0.05)
+        rebuilt = manager.get_conversation_agent()
+        self.assertIsNot(rebuilt, agent)
+        self.assertEqual(rebuilt.llm.kwargs["temperature"], temperature + 0.05)
+        self.assertEqual(len(manager.llm_registry), 1)
+        
+        # 配置了后端池时，温度变化后重建的 ConversationAgent 使用新的后端池
+        manager.llm_pool = MagicMock()
+        with patch.object(manager, "_create_pool", return_value=MagicMock()) as create_pool:
+            manager.get_conversation_agent()
+            manager.update_llm_config(provider="openai", model="gpt-4o", temperature=temperature + 0.1)
+            self.assertIs(manager.get_conversation_agent().llm, create_pool.return_value)
+    
+    @patch('src.scenarios.base_scenario.ChatOpenAI')
+    def test_register_scenario(self, mock_llm_class):
+        """测试注册自定义场景工厂"""
+        manager = ScenarioManager(self.config_path)
+        factory = MagicMock(return_value=MagicMock(name="custom_scenario"))
+        manager.register_scenario("custom", factory)
+        
+        self.assertIn("custom", manager.list_scenarios())
+        factory.assert_not_called()
+        self.assertIs(manager.get_scenario("custom"), factory.return_value)
+        self.assertEqual(factory.call_args.kwargs["model_name"], manager.config.get_llm_config()["model"])
+        self.assertIs(factory.call_args.kwargs["invoker"], manager.invoker)
+    
+    @patch('src.scenarios.base_scenario.ChatOpenAI')
+    def test_scenarios_share_invoker(self, mock_llm_class):
+        """测试所有场景共享同一个 LLM 调用器（共享响应缓存）"""
+        manager = ScenarioManager(self.config_path)
+        
+        salary = manager.get_scenario("salary_negotiation")
+        leave = manager.get_scenario("leave_request")
+        self.assertIs(salary.invoker, manager.invoker)
+        self.assertIs(leave.invoker, manager.invoker)
+    
+    @patch('src.scenarios.base_scenario.ChatOpenAI')
+    def test_scenarios_share_llm_client(self, mock_llm_class):
+        """测试相同 LLM 配置的场景共享同一个客户端和连接池"""
+        mock_llm_class.side_effect = lambda **kwargs: MagicMock(kwargs=kwargs)
+        manager = ScenarioManager(self.config_path)
+        
+        salary = manager.get_scenario("salary_negotiation")
+        leave = manager.get_scenario("leave_request")
+        self.assertIs(salary.llm, leave.llm)
+        self.assertEqual(mock_llm_class.call_count, 1)
+        
+        # 更新配置后使用新的客户端，但仍共享连接池
+        manager.update_llm_config(provider="deepseek", model="deepseek-chat", temperature=0.9)
+        updated = manager.get_scenario("salary_negotiation")
+        self.assertIsNot(updated.llm, salary.llm)
+        self.assertEqual(updated.llm.kwargs["model"], "deepseek-chat")
+        self.assertIs(updated.llm.kwargs["http_client"], salary.llm.kwargs["http_client"])
+    
     @patch('src.scenarios.base_scenario.ChatOpenAI')
     def test_update_llm_config(self, mock_llm_class):
         """测试更新 LLM 配置"""
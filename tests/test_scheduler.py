@@ -0,0 +1,232 @@
+"""
+测试 LLM 请求调度
+"""
+import asyncio
+import time
+import unittest
+from unittest.mock import MagicMock
+from langchain_core.messages import HumanMessage, SystemMessage
+from src.llm.invoker import LLMInvoker
+from src.llm.scheduler import LLMScheduler, SchedulerBusyError, TokenBucket, is_retryable
+from src.metrics import MetricsRegistry
+
+
+class RateLimitError(Exception):
+    """模拟 OpenAI SDK 的 429 错误"""
+    
+    status_code = 429
+
+
+class TestTokenBucket(unittest.TestCase):
+    """测试令牌桶"""
+    
+    def test_refill_and_wait_time(self):
+        """测试按时间补充令牌并计算等待时间"""
+        now = [0.0]
+        bucket = TokenBucket(60, clock=lambda: now[0])
+        self.assertEqual(bucket.wait_time(60), 0.0)
+        
+        bucket.consume(60)
+        self.assertAlmostEqual(bucket.wait_time(1), 1.0)
+        now[0] = 0.5
+        self.assertAlmostEqual(bucket.wait_time(1), 0.5)
+        now[0] = 1000
+        self.assertEqual(bucket.tokens if bucket.wait_time(1) == 0 else None, 60)
+    
+    def test_oversized_request_and_refund(self):
+        """测试超过容量的请求按容量等待，返还的额度不超过容量"""
+        now = [0.0]
+        bucket = TokenBucket(100, clock=lambda: now[0])
+        self.assertEqual(bucket.wait_time(500), 0.0)
+        bucket.consume(150)
+        self.assertAlmostEqual(bucket.wait_time(100), 150 * 60 / 100)
+        bucket.consume(-1000)
+        self.assertEqual(bucket.tokens, 100)
+
+
+class TestLLMScheduler(unittest.TestCase):
+    """测试调度器"""
+    
+    def setUp(self):
+        """设置测试环境"""
+        self.metrics = MetricsRegistry()
+    
+    def make_scheduler(self, **kwargs):
+        kwargs.setdefault("backoff_base", 0.001)
+        return LLMScheduler(metrics=self.metrics, **kwargs)
+    
+    def test_sessions_served_round_robin(self):
+        """测试排队的请求按会话轮流放行"""
+        scheduler = self.make_scheduler(max_concurrency=1)
+        order = []
+        
+        async def worker(name, session):
+            ticket = await scheduler.aacquire(session)
+            order.append(name)
+            scheduler.release(ticket)
+        
+        async def main():
+            holder = await scheduler.aacquire("other")
+            tasks = [asyncio.create_task(worker(name, session))
+                     for name, session in (("a1", "a"), ("a2", "a"), ("a3", "a"), ("b1", "b"))]
+            await asyncio.sleep(0)
+            self.assertEqual(scheduler.queued, 4)
+            scheduler.release(holder)
+            await asyncio.gather(*tasks)
+        
+        asyncio.run(main())
+        self.assertEqual(order, ["a1", "b1", "a2", "a3"])
+        self.assertEqual(scheduler.active, 0)
+    
+    def test_queue_full_rejects(self):
+        """测试等待队列已满时直接拒绝，取消等待的请求会移出队列"""
+        scheduler = self.make_scheduler(max_concurrency=1, max_queue_size=1)
+        
+        async def main():
+            holder = await scheduler.aacquire()
+            waiter = asyncio.create_task(scheduler.aacquire())
+            await asyncio.sleep(0)
+            with self.assertRaises(SchedulerBusyError):
+                await scheduler.aacquire()
+            
+            waiter.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiter
+            self.assertEqual(scheduler.queued, 0)
+            scheduler.release(holder)
+        
+        asyncio.run(main())
+        self.assertEqual(self.metrics.get("llm_scheduler_rejected_total").value(), 1)
+        self.assertEqual(scheduler.active, 0)
+    
+    def test_waits_for_rate_limit_refill(self):
+        """测试 RPM 额度用完后等令牌补充再放行"""
+        scheduler = self.make_scheduler(requests_per_minute=6000)
+        scheduler.rpm.tokens = 0
+        
+        start = time.perf_counter()
+        ticket = scheduler.acquire()
+        self.assertGreaterEqual(time.perf_counter() - start, 0.005)
+        scheduler.release(ticket)
+    
+    def test_tpm_corrected_by_actual_usage(self):
+        """测试按实际 token 用量修正 TPM 额度"""
+        now = [0.0]
+        scheduler = self.make_scheduler(tokens_per_minute=1000, clock=lambda: now[0])
+        ticket = scheduler.acquire(tokens=400)
+        scheduler.release(ticket)
+        self.assertEqual(scheduler.tpm.tokens, 600)
+        
+        scheduler.correct_tokens(400, 100)
+        self.assertEqual(scheduler.tpm.tokens, 900)
+    
+    def test_run_retries_rate_limit(self):
+        """测试 429 按退避重试，其他错误直接抛出"""
+        scheduler = self.make_scheduler(max_retries=2)
+        calls = []
+        
+        def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise RateLimitError("429 Too Many Requests")
+            return "reply"
+        
+        self.assertEqual(scheduler.run(flaky, "s"), "reply")
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(self.metrics.get("llm_scheduler_retries_total").value(error="RateLimitError"), 2)
+        
+        # 重试次数用完后抛出最后一次的错误
+        def always_limited():
+            calls.append(1)
+            raise RateLimitError("429 Too Many Requests")
+        
+        calls.clear()
+        with self.assertRaises(RateLimitError):
+            scheduler.run(always_limited, "s")
+        self.assertEqual(len(calls), 3)
+        
+        def broken():
+            raise ValueError("bad request")
+        
+        with self.assertRaises(ValueError):
+            scheduler.run(broken)
+        self.assertEqual(scheduler.active, 0)
+    
+    def test_stream_retries_only_before_first_chunk(self):
+        """测试流式调用只在产出第一个片段前重试"""
+        scheduler = self.make_scheduler()
+        attempts = []
+        
+        async def fail_then_stream():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise RateLimitError("429")
+            yield "a"
+            yield "b"
+        
+        async def collect(fn):
+            return [chunk async for chunk in scheduler.astream(fn)]
+        
+        self.assertEqual(asyncio.run(collect(fail_then_stream)), ["a", "b"])
+        self.assertEqual(len(attempts), 2)
+        
+        def fail_midway():
+            attempts.append(1)
+            yield "a"
+            raise RateLimitError("429")
+        
+        attempts.clear()
+        with self.assertRaises(RateLimitError):
+            list(scheduler.stream(fail_midway))
+        self.assertEqual(len(attempts), 1)
+        self.assertEqual(scheduler.active, 0)
+    
+    def test_is_retryable(self):
+        """测试可重试错误的判断"""
+        self.assertTrue(is_retryable(RateLimitError()))
+        server_error = Exception()
+        server_error.status_code = 503
+        self.assertTrue(is_retryable(server_error))
+        bad_request = Exception()
+        bad_request.status_code = 400
+        self.assertFalse(is_retryable(bad_request))
+        self.assertFalse(is_retryable(ValueError()))
+    
+    def test_from_config(self):
+        """测试根据配置创建调度器"""
+        self.assertIsNone(LLMScheduler.from_config({"enabled": False}))
+        scheduler = LLMScheduler.from_config({"requests_per_minute": 100, "max_concurrency": 0})
+        self.assertEqual(scheduler.rpm.capacity, 100)
+        self.assertIsNone(scheduler.tpm)
+        self.assertIsNone(scheduler.max_concurrency)
+
+
+class TestInvokerScheduling(unittest.TestCase):
+    """测试调用器经过调度器调用 LLM"""
+    
+    def setUp(self):
+        """设置测试环境"""
+        self.metrics = MetricsRegistry()
+        self.scheduler = LLMScheduler(tokens_per_minute=100000, backoff_base=0.001, metrics=self.metrics,
+                                      clock=lambda: 0.0)
+        self.invoker = LLMInvoker(scheduler=self.scheduler, metrics=self.metrics)
+        self.messages = [SystemMessage(content="You are a tutor."), HumanMessage(content="Hello")]
+    
+    def test_invoke_retried_and_usage_corrected(self):
+        """测试 429 后重试成功，并按实际用量返还预估的 TPM 额度"""
+        llm = MagicMock()
+        llm.invoke.side_effect = [
+            RateLimitError("429"),
+            MagicMock(content="reply", usage_metadata={"input_tokens": 10, "output_tokens": 5})
+        ]
+        
+        self.assertEqual(self.invoker.invoke(llm, self.messages, "m", 0.7, session="s1"), "reply")
+        self.assertEqual(llm.invoke.call_count, 2)
+        # 两次放行各扣一次预估用量，成功的一次按实际 15 个 token 修正
+        estimate = self.scheduler.estimate_tokens(self.messages)
+        self.assertAlmostEqual(self.scheduler.tpm.tokens, 100000 - estimate - 15)
+        self.assertEqual(self.scheduler.active, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
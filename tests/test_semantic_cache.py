@@ -0,0 +1,116 @@
+"""
+测试语义近似缓存
+"""
+import unittest
+import numpy as np
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from src.llm.semantic_cache import CharNgramVectorizer, SemanticCache, VectorStore
+from src.metrics import MetricsRegistry
+
+
+def first_turn(user_message, system_prompt="hotel check-in"):
+    """构造首轮请求的消息列表"""
+    return [SystemMessage(content=system_prompt), HumanMessage(content=user_message)]
+
+
+class TestCharNgramVectorizer(unittest.TestCase):
+    """测试字符 n-gram 向量化器"""
+    
+    def setUp(self):
+        """设置测试环境"""
+        self.vectorizer = CharNgramVectorizer()
+    
+    def test_vector_is_normalized(self):
+        """测试向量为单位长度"""
+        vector = self.vectorizer.vectorize("Hello, I would like to check in")
+        self.assertEqual(vector.shape, (4096,))
+        self.assertAlmostEqual(float(np.linalg.norm(vector)), 1.0, places=5)
+    
+    def test_case_and_punctuation_ignored(self):
+        """测试大小写和标点不影响向量"""
+        a = self.vectorizer.vectorize("Hello, I would like to check in!")
+        b = self.vectorizer.vectorize("hello i would like to check in")
+        self.assertAlmostEqual(float(a @ b), 1.0, places=5)
+    
+    def test_similarity_ordering(self):
+        """测试近似句子的相似度高于无关句子"""
+        base = self.vectorizer.vectorize("Hello, I would like to check in")
+        near = self.vectorizer.vectorize("Hello, I'd like to check in please")
+        far = self.vectorizer.vectorize("Can I ask for a raise?")
+        self.assertGreater(float(base @ near), float(base @ far))
+    
+    def test_empty_text(self):
+        """测试空文本返回 None"""
+        self.assertIsNone(self.vectorizer.vectorize("  ?! "))
+
+
+class TestVectorStore(unittest.TestCase):
+    """测试向量存储"""
+    
+    def test_search_and_overwrite_oldest(self):
+        """测试查找最相似条目，写满后覆盖最旧条目"""
+        store = VectorStore(dimensions=2, max_entries=2)
+        self.assertEqual(store.search(np.array([1, 0], dtype=np.float32)), (None, 0.0))
+        
+        store.add(np.array([1, 0], dtype=np.float32), "x")
+        store.add(np.array([0, 1], dtype=np.float32), "y")
+        self.assertEqual(store.search(np.array([0, 1], dtype=np.float32))[0], "y")
+        
+        store.add(np.array([0.6, 0.8], dtype=np.float32), "z")
+        self.assertEqual(len(store), 2)
+        content, score = store.search(np.array([1, 0], dtype=np.float32))
+        self.assertEqual(content, "z")
+        self.assertAlmostEqual(score, 0.6, places=5)
+
+
+class TestSemanticCache(unittest.TestCase):
+    """测试语义近似缓存"""
+    
+    def setUp(self):
+        """设置测试环境"""
+        self.metrics = MetricsRegistry()
+        self.cache = SemanticCache(threshold=0.75, metrics=self.metrics)
+        self.cache.set("hotel", first_turn("Hello, I would like to check in"), "m", 0.7, "cached reply")
+    
+    def test_near_duplicate_hit(self):
+        """测试近似的首轮消息命中缓存"""
+        content = self.cache.get("hotel", first_turn("hello, I'd like to check in please"), "m", 0.7)
+        self.assertEqual(content, "cached reply")
+        counter = self.metrics.get("llm_semantic_cache_requests_total")
+        self.assertEqual(counter.value(scenario="hotel", result="hit"), 1)
+    
+    def test_dissimilar_miss(self):
+        """测试相似度低于阈值时未命中"""
+        self.assertIsNone(self.cache.get("hotel", first_turn("Where is the gym?"), "m", 0.7))
+        counter = self.metrics.get("llm_semantic_cache_requests_total")
+        self.assertEqual(counter.value(scenario="hotel", result="miss"), 1)
+    
+    def test_isolated_by_scenario_and_context(self):
+        """测试不同场景、模型或系统提示之间不共享缓存"""
+        message = "Hello, I would like to check in"
+        self.assertIsNone(self.cache.get("leave", first_turn(message), "m", 0.7))
+        self.assertIsNone(self.cache.get("hotel", first_turn(message), "other-model", 0.7))
+        self.assertIsNone(self.cache.get("hotel", first_turn(message, "new prompt"), "m", 0.7))
+        self.assertEqual(self.cache.get("hotel", first_turn(message), "m", 0.7), "cached reply")
+    
+    def test_later_turns_ignored(self):
+        """测试非首轮请求既不查询也不写入"""
+        messages = [SystemMessage(content="hotel check-in"), HumanMessage(content="Hi"),
+                    AIMessage(content="Welcome"), HumanMessage(content="Hello, I would like to check in")]
+        self.assertIsNone(self.cache.get("hotel", messages, "m", 0.7))
+        self.cache.set("hotel", messages, "m", 0.7, "later reply")
+        counter = self.metrics.get("llm_semantic_cache_requests_total")
+        self.assertEqual(counter.value(scenario="hotel", result="miss"), 0)
+        self.assertIsNone(self.cache.get("hotel", first_turn("Hi"), "m", 0.7))
+    
+    def test_from_config(self):
+        """测试根据配置创建语义缓存"""
+        self.assertIsNone(SemanticCache.from_config({"enabled": False}))
+        
+        cache = SemanticCache.from_config({"enabled": True, "threshold": 0.8, "dimensions": 512})
+        self.assertEqual(cache.threshold, 0.8)
+        self.assertEqual(cache.vectorizer.dimensions, 512)
+
+
+if __name__ == '__main__':
+    unittest.main()
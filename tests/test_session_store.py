@@ -0,0 +1,115 @@
+"""
+测试会话状态存储
+"""
+import unittest
+from unittest.mock import patch
+from src.history import ConversationHistory
+from src.session_store import SessionState, SessionStore
+
+
+class TestSessionStore(unittest.TestCase):
+    """测试会话状态存储"""
+    
+    def test_sessions_are_isolated(self):
+        """测试不同会话的历史互不影响"""
+        store = SessionStore()
+        history_a = store.get_history("session-a", "airport_checkin")
+        history_b = store.get_history("session-b", "airport_checkin")
+        
+        history_a.append("user", "hello")
+        
+        self.assertEqual(len(history_a), 1)
+        self.assertEqual(len(history_b), 0)
+        self.assertIs(store.get_history("session-a", "airport_checkin"), history_a)
+    
+    def test_history_settings(self):
+        """测试会话历史使用存储配置的容量和归档设置"""
+        store = SessionStore(max_history_messages=4, archive_history=True)
+        history = store.get_history("s", "airport_checkin")
+        
+        self.assertIsInstance(history, ConversationHistory)
+        self.assertEqual(history.max_messages, 4)
+        history.add_turn("hi", "hello")
+        self.assertGreater(history.archive_size, 0)
+    
+    def test_histories_are_per_scenario(self):
+        """测试同一会话的不同场景分别保存历史"""
+        store = SessionStore()
+        store.get_history("s", "airport_checkin").append("user", "hi")
+        
+        self.assertEqual(len(store.get_history("s", "leave_request")), 0)
+    
+    def test_reset_history(self):
+        """测试重置会话在某个场景下的历史"""
+        store = SessionStore()
+        store.get_history("s", "airport_checkin").append("user", "hi")
+        store.reset_history("s", "airport_checkin")
+        
+        self.assertEqual(len(store.get_history("s", "airport_checkin")), 0)
+    
+    def test_lru_eviction(self):
+        """测试超过最大会话数时淘汰最久未访问的会话"""
+        store = SessionStore(max_sessions=2)
+        store.get("a")
+        store.get("b")
+        store.get("a")  # a 变为最近访问
+        store.get("c")
+        
+        self.assertEqual(len(store), 2)
+        self.assertIn("a", store)
+        self.assertNotIn("b", store)
+        self.assertIn("c", store)
+    
+    @patch('src.session_store.time.monotonic')
+    def test_ttl_expiration(self, mock_monotonic):
+        """测试空闲超过 TTL 的会话被淘汰"""
+        store = SessionStore(ttl_seconds=60)
+        
+        mock_monotonic.return_value = 0
+        store.get_history("old", "airport_checkin").append("user", "hi")
+        
+        mock_monotonic.return_value = 30
+        store.get("recent")
+        
+        mock_monotonic.return_value = 70
+        self.assertEqual(store.cleanup(), 1)
+        self.assertNotIn("old", store)
+        self.assertIn("recent", store)
+        
+        # 过期会话再次访问时重新创建，历史为空
+        self.assertEqual(len(store.get_history("old", "airport_checkin")), 0)
+    
+    @patch('src.session_store.time.monotonic')
+    def test_expired_session_restored_from_visible_history(self, mock_monotonic):
+        """测试会话过期后界面上仍显示之前的对话时，从界面记录重建一次历史"""
+        store = SessionStore(ttl_seconds=60)
+        visible = [("Welcome!", None), ("hi", "hello"), ("offer?", "90k")]
+        
+        mock_monotonic.return_value = 0
+        history = store.get_history("s1", "free_chat")
+        history.add_turn("hi", "hello")
+        
+        # 会话未过期时不会用界面记录覆盖已保存的历史
+        self.assertEqual(len(store.get_history("s1", "free_chat", visible)), 2)
+        
+        mock_monotonic.return_value = 120
+        restored = store.get_history("s1", "free_chat", visible)
+        self.assertIsNot(restored, history)
+        self.assertEqual([m.content for m in restored], ["hi", "hello", "offer?", "90k"])
+        
+        # 只重建一次：之后照常追加
+        restored.add_turn("counter", "95k")
+        self.assertEqual(len(store.get_history("s1", "free_chat", visible)), 6)
+    
+    def test_remove(self):
+        """测试删除会话"""
+        store = SessionStore()
+        store.get("a")
+        
+        self.assertIsInstance(store.remove("a"), SessionState)
+        self.assertIsNone(store.remove("a"))
+        self.assertEqual(len(store), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,314 @@
+"""
+测试请求合并
+"""
+import asyncio
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+from langchain_core.messages import HumanMessage, SystemMessage
+from src.llm.invoker import LLMInvoker
+from src.llm.single_flight import SingleFlight
+from src.metrics import MetricsRegistry
+
+
+class TestSingleFlight(unittest.TestCase):
+    """测试请求合并器"""
+    
+    def setUp(self):
+        """设置测试环境"""
+        self.flight = SingleFlight()
+    
+    def run_threads(self, target, count):
+        """并发运行 count 个线程并返回各自的结果"""
+        results = [None] * count
+        
+        def worker(index):
+            results[index] = target()
+        
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+    
+    def test_do_coalesces_concurrent_calls(self):
+        """测试同时进行的相同同步调用只执行一次"""
+        calls = []
+        
+        def call():
+            calls.append(1)
+            time.sleep(0.1)
+            return "reply"
+        
+        results = self.run_threads(lambda: self.flight.do("key", call), 5)
+        
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([result[0] for result in results], ["reply"] * 5)
+        self.assertEqual(sorted(result[1] for result in results), [False] + [True] * 4)
+        self.assertEqual(self.flight.in_flight(), 0)
+        
+        # 调用结束后相同请求重新发起
+        self.assertEqual(self.flight.do("key", call), ("reply", False))
+        self.assertEqual(len(calls), 2)
+    
+    def test_do_shares_errors(self):
+        """测试发起者出错时跟随者收到同一个异常"""
+        def call():
+            time.sleep(0.1)
+            raise ValueError("API Error")
+        
+        def attempt():
+            try:
+                self.flight.do("key", call)
+            except ValueError as e:
+                return str(e)
+        
+        self.assertEqual(self.run_threads(attempt, 3), ["API Error"] * 3)
+    
+    def test_stream_shares_chunks(self):
+        """测试跟随者按顺序收到发起者的全部片段"""
+        def chunks():
+            for chunk in ["a", "b", "c"]:
+                time.sleep(0.03)
+                yield chunk
+        
+        def consume():
+            iterator, shared = self.flight.stream("key", chunks)
+            return "".join(iterator), shared
+        
+        results = self.run_threads(consume, 4)
+        
+        self.assertEqual([result[0] for result in results], ["abc"] * 4)
+        self.assertEqual(sum(result[1] for result in results), 3)
+    
+    def test_stream_leader_leaves_early(self):
+        """测试发起者中途离开时跟随者接着读取上游，仍然收到完整内容"""
+        leader, _ = self.flight.stream("key", lambda: iter(["a", "b", "c"]))
+        follower, shared = self.flight.stream("key", lambda: iter(["x"]))
+        
+        self.assertTrue(shared)
+        self.assertEqual(next(leader), "a")
+        leader.close()
+        self.assertEqual("".join(follower), "abc")
+        self.assertEqual(self.flight.in_flight(), 0)
+    
+    def test_stream_closed_when_all_readers_leave(self):
+        """测试所有读取者都离开后关闭上游，之后的相同请求重新发起"""
+        closed = []
+        
+        def chunks():
+            try:
+                yield "a"
+                yield "b"
+            finally:
+                closed.append(1)
+        
+        leader, _ = self.flight.stream("key", chunks)
+        follower, _ = self.flight.stream("key", chunks)
+        self.assertEqual(next(leader), "a")
+        self.assertEqual(next(follower), "a")
+        leader.close()
+        self.assertEqual(closed, [])
+        follower.close()
+        self.assertEqual(closed, [1])
+        
+        iterator, shared = self.flight.stream("key", lambda: iter(["c"]))
+        self.assertFalse(shared)
+        self.assertEqual("".join(iterator), "c")
+    
+    def test_ado_coalesces_concurrent_calls(self):
+        """测试同一事件循环内同时进行的相同异步调用只执行一次"""
+        calls = []
+        
+        async def call():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "reply"
+        
+        async def main():
+            return await asyncio.gather(*(self.flight.ado("key", call) for _ in range(5)))
+        
+        results = asyncio.run(main())
+        
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results.count(("reply", True)), 4)
+        self.assertEqual(self.flight.in_flight(), 0)
+    
+    def test_ado_leader_cancelled(self):
+        """测试发起者被取消时跟随者重新发起调用"""
+        calls = []
+        
+        async def call():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "reply"
+        
+        async def main():
+            leader = asyncio.create_task(self.flight.ado("key", call))
+            await asyncio.sleep(0)
+            follower = asyncio.create_task(self.flight.ado("key", call))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            return await follower
+        
+        self.assertEqual(asyncio.run(main()), ("reply", False))
+        self.assertEqual(len(calls), 2)
+    
+    def test_astream_shares_chunks(self):
+        """测试异步流式调用共享片段（包括跟随者加入前已产出的片段）"""
+        calls = []
+        
+        async def chunks():
+            calls.append(1)
+            for chunk in ["a", "b", "c"]:
+                await asyncio.sleep(0.01)
+                yield chunk
+        
+        async def consume(delay):
+            await asyncio.sleep(delay)
+            iterator, shared = self.flight.astream("key", chunks)
+            return "".join([chunk async for chunk in iterator]), shared
+        
+        async def main():
+            return await asyncio.gather(consume(0), consume(0.015), consume(0.015))
+        
+        results = asyncio.run(main())
+        
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [("abc", False), ("abc", True), ("abc", True)])
+    
+    def test_astream_leader_leaves_early(self):
+        """测试异步发起者读取一个片段后关闭迭代器或被取消，跟随者仍然收到完整内容"""
+        async def chunks():
+            for index in range(3):
+                await asyncio.sleep(0.01)
+                yield f"c{index}"
+        
+        async def follow():
+            iterator, shared = self.flight.astream("key", chunks)
+            return "".join([chunk async for chunk in iterator]), shared
+        
+        async def close_early():
+            leader, _ = self.flight.astream("key", chunks)
+            follower = asyncio.create_task(follow())
+            await asyncio.sleep(0)
+            self.assertEqual(await leader.__anext__(), "c0")
+            await leader.aclose()
+            return await follower
+        
+        async def cancel_early():
+            async def lead():
+                iterator, _ = self.flight.astream("key", chunks)
+                async for _ in iterator:
+                    await asyncio.sleep(1)
+            
+            leader = asyncio.create_task(lead())
+            await asyncio.sleep(0)
+            follower = asyncio.create_task(follow())
+            await asyncio.sleep(0.015)
+            leader.cancel()
+            return await follower
+        
+        self.assertEqual(asyncio.run(close_early()), ("c0c1c2", True))
+        self.assertEqual(asyncio.run(cancel_early()), ("c0c1c2", True))
+        self.assertEqual(self.flight.in_flight(), 0)
+    
+    def test_astream_cancelled_when_all_readers_leave(self):
+        """测试所有异步读取者都离开后取消上游读取任务"""
+        cancelled = []
+        
+        async def chunks():
+            try:
+                yield "a"
+                await asyncio.sleep(1)
+                yield "b"
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+        
+        async def main():
+            iterator, _ = self.flight.astream("key", chunks)
+            self.assertEqual(await iterator.__anext__(), "a")
+            await iterator.aclose()
+            await asyncio.sleep(0)
+        
+        asyncio.run(main())
+        self.assertEqual(cancelled, [1])
+        self.assertEqual(self.flight.in_flight(), 0)
+
+
+class TestInvokerCoalescing(unittest.TestCase):
+    """测试调用器合并相同请求"""
+    
+    def setUp(self):
+        """设置测试环境"""
+        self.metrics = MetricsRegistry()
+        self.messages = [SystemMessage(content="system"), HumanMessage(content="Hello")]
+    
+    def test_concurrent_ainvoke(self):
+        """测试同时到达的相同请求只调用一次 LLM，不同消息或不同模型实例不合并"""
+        invoker = LLMInvoker(metrics=self.metrics)
+        llm = MagicMock()
+        
+        async def ainvoke(messages):
+            await asyncio.sleep(0.05)
+            return MagicMock(content=messages[-1].content.upper())
+        
+        llm.ainvoke.side_effect = ainvoke
+        other = [SystemMessage(content="system"), HumanMessage(content="Bye")]
+        
+        async def main():
+            return await asyncio.gather(
+                *(invoker.ainvoke(llm, self.messages, "m", 0.7) for _ in range(3)),
+                invoker.ainvoke(llm, other, "m", 0.7)
+            )
+        
+        self.assertEqual(asyncio.run(main()), ["HELLO", "HELLO", "HELLO", "BYE"])
+        self.assertEqual(llm.ainvoke.call_count, 2)
+        self.assertEqual(self.metrics.get("llm_coalesced_requests_total").value(model="m"), 2)
+    
+    def test_concurrent_astream(self):
+        """测试同时到达的相同流式请求共享一次调用"""
+        invoker = LLMInvoker(metrics=self.metrics)
+        llm = MagicMock()
+        
+        async def astream(messages, **kwargs):
+            for text in ["Hel", "lo"]:
+                await asyncio.sleep(0.01)
+                yield MagicMock(content=text, usage_metadata=None)
+        
+        llm.astream.side_effect = astream
+        
+        async def consume():
+            return "".join([text async for text in invoker.astream(llm, self.messages, "m", 0.7)])
+        
+        async def main():
+            return await asyncio.gather(consume(), consume())
+        
+        self.assertEqual(asyncio.run(main()), ["Hello", "Hello"])
+        self.assertEqual(llm.astream.call_count, 1)
+    
+    def test_coalescing_disabled(self):
+        """测试关闭合并时每个请求都调用 LLM"""
+        invoker = LLMInvoker(coalesce=False, metrics=self.metrics)
+        llm = MagicMock()
+        
+        def slow_invoke(messages):
+            time.sleep(0.05)
+            return MagicMock(content="reply", usage_metadata=None)
+        
+        llm.invoke.side_effect = slow_invoke
+        threads = [threading.Thread(target=invoker.invoke, args=(llm, self.messages, "m", 0.7)) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertIsNone(invoker.single_flight)
+        self.assertEqual(llm.invoke.call_count, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
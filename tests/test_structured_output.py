@@ -0,0 +1,87 @@
+"""
+测试结构化输出
+"""
+import unittest
+from unittest.mock import MagicMock
+from src.llm.structured_output import StructuredOutput, TeachingResponse, response_format, strict_json_schema
+from src.metrics import MetricsRegistry
+
+
+VALID_CONTENT = '{"bot_reply": "Hello", "teaching_feedback": {"overall_comment": "Good"}, "example_sentences": ["s1", "s2", "s3"]}'
+
+
+class TestStructuredOutput(unittest.TestCase):
+    """测试结构化输出模式"""
+    
+    def setUp(self):
+        """设置测试环境"""
+        self.metrics = MetricsRegistry()
+    
+    def test_response_format(self):
+        """测试各模式对应的 response_format 参数"""
+        self.assertIsNone(response_format("off"))
+        self.assertEqual(response_format("json_mode"), {"type": "json_object"})
+        
+        json_schema = response_format("json_schema")["json_schema"]
+        self.assertTrue(json_schema["strict"])
+        self.assertEqual(list(json_schema["schema"]["properties"])[0], "bot_reply")
+    
+    def test_strict_json_schema(self):
+        """测试严格模式 Schema 中所有对象的字段必填且不允许额外字段"""
+        schema = strict_json_schema()
+        feedback = schema["$defs"]["TeachingFeedback"]
+        
+        self.assertEqual(schema["required"], ["bot_reply", "teaching_feedback", "example_sentences"])
+        self.assertFalse(schema["additionalProperties"])
+        self.assertEqual(feedback["required"], list(feedback["properties"]))
+        self.assertFalse(feedback["additionalProperties"])
+        self.assertNotIn("default", str(schema))
+        # 不修改 Pydantic 缓存的原始 Schema
+        self.assertNotIn("additionalProperties", TeachingResponse.model_json_schema())
+    
+    def test_bind(self):
+        """测试只有开启时才绑定 response_format"""
+        llm = MagicMock()
+        
+        self.assertIs(StructuredOutput("off", metrics=self.metrics).bind(llm), llm)
+        self.assertIs(StructuredOutput("json_mode", metrics=self.metrics).bind(llm), llm.bind.return_value)
+        llm.bind.assert_called_once_with(response_format={"type": "json_object"})
+    
+    def test_parse(self):
+        """测试按 TeachingResponse 严格解析，缺少字段时补齐默认值"""
+        structured = StructuredOutput("json_mode", metrics=self.metrics)
+        
+        response = structured.parse(VALID_CONTENT)
+        self.assertEqual(response["bot_reply"], "Hello")
+        self.assertEqual(response["teaching_feedback"]["grammar_corrections"], [])
+        self.assertEqual(response["example_sentences"], ["s1", "s2", "s3"])
+        
+        # 代码块、缺少 bot_reply、非 JSON 都交给正则回退
+        self.assertIsNone(structured.parse(f"```json\n{VALID_CONTENT}\n```"))
+        self.assertIsNone(structured.parse('{"teaching_feedback": {}}'))
+        self.assertIsNone(structured.parse("Hello there"))
+        self.assertIsNone(structured.parse(""))
+    
+    def test_parse_disabled(self):
+        """测试未开启时不做结构化解析"""
+        self.assertIsNone(StructuredOutput("off", metrics=self.metrics).parse(VALID_CONTENT))
+    
+    def test_record_path(self):
+        """测试按来源统计解析路径"""
+        structured = StructuredOutput("json_mode", metrics=self.metrics)
+        structured.record("salary_negotiation", "structured")
+        structured.record("salary_negotiation", "structured")
+        structured.record("salary_negotiation", "regex")
+        
+        self.assertEqual(structured.path_counts("salary_negotiation"),
+                         {"structured": 2, "regex": 1, "repair": 0, "model_repair": 0, "default": 0})
+        self.assertEqual(structured.path_counts("leave_request")["structured"], 0)
+    
+    def test_unknown_mode(self):
+        """测试未知模式"""
+        with self.assertRaises(ValueError):
+            StructuredOutput("function_calling", metrics=self.metrics)
+
+
+if __name__ == '__main__':
+    unittest.main()
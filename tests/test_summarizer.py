@@ -0,0 +1,154 @@
+"""
+测试滚动摘要
+"""
+import asyncio
+import unittest
+from unittest.mock import MagicMock, AsyncMock
+from src.context_builder import ContextBuilder
+from src.history import ConversationHistory
+from src.llm.tokenizer import TokenCounter
+from src.summarizer import ConversationSummarizer
+
+
+class WordCounter(TokenCounter):
+    """每个单词计 1 个 token 的计数器"""
+    
+    def _count(self, text):
+        return len(text.split())
+
+
+class TestConversationSummarizer(unittest.TestCase):
+    """测试对话摘要器"""
+    
+    def setUp(self):
+        """设置测试环境"""
+        # 每轮 2 个单词 + 2 * 4 开销 = 10 tokens，预算只容纳 2 轮
+        self.builder = ContextBuilder(max_history_tokens=20, token_counter=WordCounter())
+        self.summarizer = ConversationSummarizer("salary_negotiation")
+        self.llm = MagicMock()
+        self.llm.invoke.return_value = MagicMock(content=" Offer is 90k. ")
+    
+    def test_no_update_when_window_fits(self):
+        """测试历史都在窗口内时不调用 LLM"""
+        history = ConversationHistory()
+        history.add_turn("hi", "hello")
+        history.add_turn("offer", "90k")
+        
+        self.assertFalse(self.summarizer.update(self.llm, history, self.builder))
+        self.llm.invoke.assert_not_called()
+    
+    def test_folds_turns_outside_window(self):
+        """测试超出窗口的轮次被合并到摘要中，且只合并一次"""
+        history = ConversationHistory()
+        history.add_turn("hi", "hello")
+        history.add_turn("offer", "90k")
+        history.add_turn("counter", "95k")
+        
+        self.assertTrue(self.summarizer.update(self.llm, history, self.builder))
+        self.assertEqual(history.summary, "Offer is 90k.")
+        self.assertEqual(history.summary_seq, 1)
+        self.assertEqual([m.content for m in history.unsummarized()], ["offer", "90k", "counter", "95k"])
+        
+        # 提示词中包含被移出的轮次和场景名
+        messages = self.llm.invoke.call_args[0][0]
+        self.assertIn("salary negotiation", messages[0].content)
+        self.assertIn("Learner: hi\nTutor: hello", messages[1].content)
+        
+        # 没有新的轮次被移出时不再调用
+        self.assertFalse(self.summarizer.update(self.llm, history, self.builder))
+        self.assertEqual(self.llm.invoke.call_count, 1)
+    
+    def test_incremental_update_includes_previous_summary(self):
+        """测试增量更新时带上之前的摘要"""
+        history = ConversationHistory()
+        history.summary = "Earlier: asked about salary."
+        history.add_turn("hi", "hello")
+        history.add_turn("offer", "90k")
+        history.add_turn("counter", "95k")
+        
+        self.summarizer.update(self.llm, history, self.builder)
+        
+        body = self.llm.invoke.call_args[0][0][1].content
+        self.assertIn("Earlier: asked about salary.", body)
+    
+    def test_tracks_ring_buffer_evictions(self):
+        """测试被环形缓冲区移出的消息也会并入摘要"""
+        history = ConversationHistory(max_messages=2)
+        evicted = history.add_turn("hi", "hello")
+        evicted += history.add_turn("offer", "90k")
+        self.summarizer.track_evicted(history, evicted)
+        
+        self.assertEqual(len(history.pending_summary), 2)
+        self.assertTrue(self.summarizer.update(self.llm, history, self.builder))
+        self.assertEqual(history.pending_summary, [])
+        self.assertIn("Learner: hi", self.llm.invoke.call_args[0][0][1].content)
+    
+    def test_failed_update_keeps_state(self):
+        """测试摘要请求失败时不推进进度"""
+        self.llm.invoke.side_effect = Exception("API Error")
+        history = ConversationHistory()
+        for i in range(3):
+            history.add_turn(f"q{i}", f"a{i}")
+        
+        self.assertFalse(self.summarizer.update(self.llm, history, self.builder))
+        self.assertEqual(history.summary, "")
+        self.assertEqual(history.summary_seq, -1)
+    
+    def test_repeated_failures_cap_pending(self):
+        """测试摘要请求持续失败时，待合并的消息数量有上限，只保留最近的消息"""
+        self.llm.invoke.side_effect = Exception("API Error")
+        summarizer = ConversationSummarizer(max_pending_messages=6)
+        history = ConversationHistory(max_messages=2)
+        for i in range(20):
+            summarizer.track_evicted(history, history.add_turn(f"q{i}", f"a{i}"))
+            self.assertFalse(summarizer.update(self.llm, history, self.builder))
+            self.assertLessEqual(len(history.pending_summary), 6)
+        
+        self.assertEqual([m.content for m in history.pending_summary], ["q16", "a16", "q17", "a17", "q18", "a18"])
+        body = self.llm.invoke.call_args[0][0][1].content
+        self.assertNotIn("q15", body)
+        
+        # 恢复后一次合并剩余的消息
+        self.llm.invoke.side_effect = None
+        self.assertTrue(summarizer.update(self.llm, history, self.builder))
+        self.assertEqual(history.pending_summary, [])
+    
+    def test_aupdate(self):
+        """测试异步更新摘要"""
+        llm = MagicMock()
+        llm.ainvoke = AsyncMock(return_value=MagicMock(content="summary"))
+        history = ConversationHistory()
+        for i in range(3):
+            history.add_turn(f"q{i}", f"a{i}")
+        
+        self.assertTrue(asyncio.run(self.summarizer.aupdate(llm, history, self.builder)))
+        self.assertEqual(history.summary, "summary")
+    
+    def test_update_through_invoker(self):
+        """测试传入调用器时摘要请求经过调用器（限流、token 统计），并带上会话和本轮统计"""
+        invoker = MagicMock()
+        invoker.invoke.return_value = "via invoker"
+        invoker.ainvoke = AsyncMock(return_value="via ainvoke")
+        summarizer = ConversationSummarizer("salary_negotiation", invoker=invoker,
+                                            model_name="gpt-4o-mini", temperature=0.7)
+        turn = MagicMock()
+        history = ConversationHistory()
+        for i in range(3):
+            history.add_turn(f"q{i}", f"a{i}")
+        
+        self.assertTrue(summarizer.update(self.llm, history, self.builder, session="s1", turn=turn))
+        self.assertEqual(history.summary, "via invoker")
+        self.llm.invoke.assert_not_called()
+        args, kwargs = invoker.invoke.call_args
+        self.assertIs(args[0], self.llm)
+        self.assertEqual(args[2:], ("gpt-4o-mini", 0.7))
+        self.assertEqual(kwargs, {"session": "s1", "turn": turn})
+        
+        history.add_turn("q3", "a3")
+        self.assertTrue(asyncio.run(summarizer.aupdate(self.llm, history, self.builder, session="s1", turn=turn)))
+        self.assertEqual(history.summary, "via ainvoke")
+        self.assertEqual(invoker.ainvoke.call_args[1], {"session": "s1", "turn": turn})
+
+
+if __name__ == '__main__':
+    unittest.main()
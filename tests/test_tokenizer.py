@@ -0,0 +1,58 @@
+"""
+测试 token 计数
+"""
+import unittest
+from unittest.mock import patch, MagicMock
+from src.llm.tokenizer import TokenCounter, estimate_tokens
+
+
+class TestTokenizer(unittest.TestCase):
+    """测试 token 计数"""
+    
+    def test_estimate_tokens(self):
+        """测试离线估算"""
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("Hello, world!"), 4)
+        # 长单词按长度拆分
+        self.assertEqual(estimate_tokens("internationalization"), 4)
+        # 数字按3位一组
+        self.assertEqual(estimate_tokens("1234567"), 3)
+        # 中文每个字符一个 token
+        self.assertEqual(estimate_tokens("你好"), 2)
+    
+    def test_counter_defaults_to_estimate(self):
+        """测试默认使用离线估算"""
+        counter = TokenCounter()
+        self.assertFalse(counter.is_exact)
+        self.assertEqual(counter.count("Hello, world!"), 4)
+        self.assertEqual(counter.count(""), 0)
+    
+    def test_counter_caches_results(self):
+        """测试计数结果被缓存"""
+        with patch('src.llm.tokenizer.estimate_tokens', return_value=7) as mock_estimate:
+            counter = TokenCounter()
+            self.assertEqual(counter.count("same text"), 7)
+            self.assertEqual(counter.count("same text"), 7)
+            mock_estimate.assert_called_once_with("same text")
+    
+    def test_counter_uses_tiktoken_when_available(self):
+        """测试配置编码名时使用 tiktoken"""
+        mock_encoding = MagicMock()
+        mock_encoding.encode.return_value = [1, 2, 3]
+        with patch('tiktoken.get_encoding', return_value=mock_encoding):
+            counter = TokenCounter("o200k_base")
+        
+        self.assertTrue(counter.is_exact)
+        self.assertEqual(counter.count("anything"), 3)
+    
+    def test_counter_falls_back_when_encoding_unavailable(self):
+        """测试 tiktoken 编码无法加载（如离线）时回退到估算"""
+        with patch('tiktoken.get_encoding', side_effect=OSError("offline")):
+            counter = TokenCounter("o200k_base")
+        
+        self.assertFalse(counter.is_exact)
+        self.assertEqual(counter.count("Hello"), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+"""
+测试链路追踪
+"""
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+from src.agents.conversation_agent import ConversationAgent
+from src.instrumentation import TurnInstrumentation
+from src.metrics import MetricsRegistry
+from src.tracing import NOOP_SPAN, SpanExporter, Tracer
+
+RESPONSE = '{"teaching_feedback": {"overall_comment": "Good"}, "example_sentences": ["s1", "s2", "s3"], "bot_reply": "Hi"}'
+
+
+class MemoryExporter(SpanExporter):
+    """把结束的 span 保存在列表中"""
+    
+    def __init__(self):
+        self.spans = []
+    
+    def export(self, span):
+        self.spans.append(span.to_dict())
+    
+    def by_name(self):
+        return {span["name"]: span for span in self.spans}
+
+
+class TestTracer(unittest.TestCase):
+    """测试追踪器"""
+    
+    def test_noop_by_default(self):
+        """测试没有导出器时返回共享的空 span"""
+        tracer = Tracer()
+        self.assertFalse(tracer.enabled)
+        span = tracer.start_span("turn", scenario="s")
+        self.assertIs(span, NOOP_SPAN)
+        self.assertIs(span.child("llm"), NOOP_SPAN)
+        span.set_attribute("k", "v")
+        span.end()
+        self.assertEqual(NOOP_SPAN.attributes, {})
+    
+    def test_child_spans_share_trace(self):
+        """测试子 span 属于同一条链路并指向父 span"""
+        exporter = MemoryExporter()
+        root = Tracer(exporter).start_span("turn", scenario="s")
+        child = root.child("llm")
+        child.record_error(ValueError("boom"))
+        child.end()
+        child.end()
+        root.end()
+        
+        self.assertEqual([span["name"] for span in exporter.spans], ["llm", "turn"])
+        llm, turn = exporter.spans
+        self.assertEqual(llm["traceId"], turn["traceId"])
+        self.assertEqual(len(turn["traceId"]), 32)
+        self.assertEqual(llm["parentSpanId"], turn["spanId"])
+        self.assertEqual(turn["parentSpanId"], "")
+        self.assertEqual(llm["status"], {"code": "ERROR", "message": "ValueError: boom"})
+        self.assertEqual(turn["attributes"], {"scenario": "s"})
+        self.assertGreaterEqual(turn["endTimeUnixNano"], turn["startTimeUnixNano"])
+    
+    def test_jsonl_exporter(self):
+        """测试按 JSON Lines 写入本地文件"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "traces", "spans.jsonl")
+            tracer = Tracer.from_config({"exporter": "jsonl", "path": path})
+            for name in ("a", "b"):
+                tracer.start_span(name, note="练习").end()
+            tracer.exporter.flush()
+            
+            with open(path, encoding="utf-8") as f:
+                lines = [json.loads(line) for line in f]
+            self.assertEqual([line["name"] for line in lines], ["a", "b"])
+            self.assertEqual(lines[0]["attributes"], {"note": "练习"})
+            
+            # 关闭时写出剩余的 span，之后导出的 span 被忽略
+            tracer.start_span("c").end()
+            tracer.exporter.close()
+            tracer.exporter.close()
+            tracer.start_span("d").end()
+            with open(path, encoding="utf-8") as f:
+                self.assertEqual([json.loads(line)["name"] for line in f], ["a", "b", "c"])
+        
+        with self.assertRaises(TypeError):
+            SpanExporter()
+        
+        self.assertFalse(Tracer.from_config({"exporter": "none"}).enabled)
+
+
+class TestTurnTracing(unittest.TestCase):
+    """测试每轮对话的 span"""
+    
+    def setUp(self):
+        """设置测试环境"""
+        self.exporter = MemoryExporter()
+        self.instrumentation = TurnInstrumentation(MetricsRegistry(), Tracer(self.exporter))
+    
+    def make_agent(self, llm):
+        config = MagicMock()
+        config.get_llm_config.return_value = {"model": "gpt-4o-mini", "temperature": 0.7, "api_key": "test_key"}
+        with patch('src.agents.conversation_agent.get_config', return_value=config), \
+                patch('src.agents.conversation_agent.ChatOpenAI', return_value=llm):
+            agent = ConversationAgent()
+        agent.instrumentation = self.instrumentation
+        return agent
+    
+    def test_agent_turn_stages(self):
+        """测试一轮对话产生根 span 以及历史组装、LLM、解析、校验子 span"""
+        llm = MagicMock()
+        llm.invoke.return_value = MagicMock(content=RESPONSE, usage_metadata={"input_tokens": 50, "output_tokens": 9})
+        agent = self.make_agent(llm)
+        
+        agent.generate_response("Hello")
+        spans = self.exporter.by_name()
+        self.assertEqual(set(spans), {"turn", "history", "llm", "parse", "validate"})
+        root = spans["turn"]
+        for name in ("history", "llm", "parse", "validate"):
+            self.assertEqual(spans[name]["parentSpanId"], root["spanId"])
+            self.assertEqual(spans[name]["traceId"], root["traceId"])
+        self.assertEqual(root["attributes"]["scenario"], "conversation_agent")
+        self.assertEqual(root["attributes"]["completion_tokens"], 9)
+        self.assertEqual(root["status"]["code"], "OK")
+    
+    def test_stream_with_format_stage(self):
+        """测试流式输出只记录一个 llm span，外层的格式化阶段也挂在同一根 span 下"""
+        async def fake_astream(messages, **kwargs):
+            for i in range(0, len(RESPONSE), 20):
+                yield MagicMock(content=RESPONSE[i:i + 20], usage_metadata=None)
+        
+        llm = MagicMock()
+        llm.astream = fake_astream
+        agent = self.make_agent(llm)
+        
+        async def handler():
+            with self.instrumentation.turn("conversation_agent", "gpt-4o-mini") as turn:
+                async for partial in agent.astream_response("Hello", turn=turn):
+                    with turn.stage("format"):
+                        agent.format_response_for_display(partial, partial=True)
+        
+        asyncio.run(handler())
+        names = [span["name"] for span in self.exporter.spans]
+        self.assertEqual(names.count("llm"), 1)
+        self.assertEqual(names.count("turn"), 1)
+        self.assertGreater(names.count("format"), 1)
+        root = self.exporter.by_name()["turn"]
+        self.assertIn("time_to_first_token_ms", self.exporter.by_name()["llm"]["attributes"])
+        self.assertTrue(all(span["traceId"] == root["traceId"] for span in self.exporter.spans))
+    
+    def test_error_turn(self):
+        """测试 LLM 出错时 llm span 和根 span 都标记为出错"""
+        llm = MagicMock()
+        llm.invoke.side_effect = RuntimeError("API Error")
+        agent = self.make_agent(llm)
+        
+        agent.generate_response("Hello")
+        spans = self.exporter.by_name()
+        self.assertEqual(spans["llm"]["status"]["code"], "ERROR")
+        self.assertEqual(spans["turn"]["status"]["code"], "ERROR")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+"""
+测试场景与 ConversationAgent 共用的部分
+"""
+import unittest
+from src.llm.scheduler import SchedulerBusyError
+from src.llm.tutor_base import ERROR_REPLY, OVERLOADED_REPLY, SystemMessageMixin, error_reply
+
+
+class Prompted(SystemMessageMixin):
+    """提供 system_prompt 的测试类"""
+    
+    def __init__(self, system_prompt):
+        self.system_prompt = system_prompt
+
+
+class TestTutorBase(unittest.TestCase):
+    """测试出错回复和系统提示词前缀消息"""
+    
+    def test_error_reply(self):
+        """测试排队已满时提示稍后再试，其他错误返回通用回复"""
+        self.assertEqual(error_reply(SchedulerBusyError("queue full")), OVERLOADED_REPLY)
+        self.assertEqual(error_reply(ValueError("bad")), ERROR_REPLY)
+    
+    def test_system_message_reused_until_prompt_changes(self):
+        """测试系统提示词不变时返回同一条消息，修改后重建"""
+        first, second = Prompted("a"), Prompted("b")
+        message = first._system_message()
+        self.assertIs(first._system_message(), message)
+        self.assertEqual(second._system_message().content, "b")
+        
+        first.system_prompt = "c"
+        self.assertEqual(first._system_message().content, "c")
+        self.assertIsNot(first._system_message(), message)
+
+
+if __name__ == '__main__':
+    unittest.main()